@@ -20,74 +20,262 @@
 #  <https://www.gnu.org/licenses/>.
 
 import zarro_boogs_tools.cli
-import zarro_boogs_tools.inference
-import zarro_boogs_tools.list
-import zarro_boogs_tools.package
+from zarro_boogs_tools import stats
 
+import argparse
+import contextlib
+import itertools
+import json
 import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
-import nattka.package
-from pkgcore.ebuild.profiles import OnDiskProfile
+# Only the modules needed for parsing command-line arguments are imported
+# eagerly, so '--help', '--version' and argument errors are reported without
+# waiting for nattka and pkgcore to be imported
+if TYPE_CHECKING:
+    from zarro_boogs_tools.session import Session
 
 
 def main(program_name: str, args: list[str]) -> int:
     opts = zarro_boogs_tools.cli.parse_args(args)
+    if opts.connect is not None:
+        from zarro_boogs_tools import client
+        return client.main(program_name, opts.connect,
+                           client.strip_connect_option(args))
+    if opts.subcommand == 'serve':
+        from zarro_boogs_tools import server
+        return server.serve(program_name, opts.socket)
+    return run_subcommand(program_name, opts)
+
+
+def run_subcommand(
+        program_name: str,
+        opts: argparse.Namespace,
+        session: Optional['Session'] = None
+) -> int:
+    if not opts.stats and opts.stats_file is None and \
+            opts.metrics_file is None:
+        return run_subcommand_without_stats(program_name, opts, session)
+
+    collector = stats.enable()
+    try:
+        status = run_subcommand_without_stats(program_name, opts, session)
+    finally:
+        stats.disable()
+    report = collector.get_report()
+    if opts.stats:
+        print(stats.format_report(report), end='', file=sys.stderr)
+    if opts.stats_file is not None:
+        try:
+            with open(opts.stats_file, 'w') as stats_file:
+                json.dump(report, stats_file, indent=2)
+        except OSError as e:
+            print(f"{program_name}: {opts.stats_file}: {e.strerror}",
+                  file=sys.stderr)
+            return status or 1
+    if opts.metrics_file is not None:
+        from zarro_boogs_tools import metrics
+        from zarro_boogs_tools.formats import MetricsFormat
+        metrics_format = None if opts.metrics_format is None \
+            else MetricsFormat(opts.metrics_format)
+        try:
+            metrics.write_metrics_file(
+                opts.metrics_file, collector, metrics_format)
+        except OSError as e:
+            print(f"{program_name}: {opts.metrics_file}: {e.strerror}",
+                  file=sys.stderr)
+            return status or 1
+    return status
+
+
+def run_subcommand_without_stats(
+        program_name: str,
+        opts: argparse.Namespace,
+        session: Optional['Session'] = None
+) -> int:
+    import zarro_boogs_tools.list
+    import zarro_boogs_tools.monitor
+    import zarro_boogs_tools.package
+    import zarro_boogs_tools.profiling
+    import zarro_boogs_tools.portage
+    import zarro_boogs_tools.rdeps
+    import zarro_boogs_tools.session
+    from zarro_boogs_tools.formats import ProfileFormat
+    from zarro_boogs_tools.pkgcore.restriction import PREPROCESS_CACHE
+
+    from nattka.bugzilla import BugCategory
+
+    if session is None:
+        session = zarro_boogs_tools.session.Session()
     repo_path = opts.repo
     portage_config_path = opts.portage_config  # 'None' OK
     match_keyword = opts.match_keyword
-    keyword_change_type = opts.keyword_change_type
+    if opts.keyword_change_type is None:
+        keyword_change_type = None
+    else:
+        keyword_change_type = BugCategory[opts.keyword_change_type]
 
-    domain, repo = nattka.package.find_repository(
-        repo_path, portage_config_path)
+    # The system's Portage configuration is only loaded when settings have to
+    # be auto-detected from it, since building a pkgcore domain is expensive
     if portage_config_path is None:
-        portage_config_path = Path(domain.config_dir)
-    arch = domain.arch
-    system_profile = domain.profile
+        portage_config_root = \
+            zarro_boogs_tools.portage.find_portage_config_root()
+        if portage_config_root is not None:
+            portage_config_path = Path(portage_config_root)
+    needs_domain = portage_config_path is None or \
+        (hasattr(opts, 'profile') and opts.profile is None) or \
+        (opts.subcommand == 'ls-nattka' and not opts.arch)
+    with stats.phase('load repository'):
+        repo_state = session.get_repository_state(
+            repo_path, portage_config_path, needs_domain)
+    repo = repo_state.repo
+    stats.add_cache('best versions', repo_state.cache)
+    stats.add_cache('preprocessed restrictions', PREPROCESS_CACHE)
+    if repo_state.domain is not None:
+        if portage_config_path is None:
+            portage_config_path = Path(repo_state.domain.config_dir)
+        system_profile = repo_state.domain.profile
+    else:
+        system_profile = None
 
     # Options commonly recognized by more than one subcommand but are not
     # always mandatory or recognized
     subcommand = opts.subcommand
     main_packages = list()
-    if hasattr(opts, 'atoms'):
-        for atom_str in opts.atoms:
-            atom_obj = \
-                zarro_boogs_tools.package.get_atom_obj_from_str(atom_str)
-            check_result = \
-                zarro_boogs_tools.package.check_atom_obj_for_keywording(
-                    atom_obj)
-            if check_result is not None:
-                print(f"{program_name}: {atom_str}: {check_result}",
-                      file=sys.stderr)
-                return 1
-            main_package = zarro_boogs_tools.package.get_best_version(
-                atom_obj, repo)
-            if main_package is None:
-                print(f"{program_name}: {atom_obj}: "
-                      f"Could not find a matching package for atom",
-                      file=sys.stderr)
-                return 3
-            main_packages.append(main_package)
+    batch = getattr(opts, 'from_file', None) is not None
+    if hasattr(opts, 'atoms') and not batch:
+        with stats.phase('select main packages'):
+            for atom_str in opts.atoms:
+                atom_obj = \
+                    zarro_boogs_tools.package.get_atom_obj_from_str(atom_str)
+                check_result = \
+                    zarro_boogs_tools.package.check_atom_obj_for_keywording(
+                        atom_obj)
+                if check_result is not None:
+                    print(f"{program_name}: {atom_str}: {check_result}",
+                          file=sys.stderr)
+                    return 1
+                main_package = zarro_boogs_tools.package.get_best_version(
+                    atom_obj, repo, cache=repo_state.cache)
+                if main_package is None:
+                    print(f"{program_name}: {atom_obj}: "
+                          f"Could not find a matching package for atom",
+                          file=sys.stderr)
+                    return 3
+                main_packages.append(main_package)
 
-    if subcommand == 'ls':
+    if hasattr(opts, 'profile'):
         if opts.profile is None:
             profile = system_profile
         else:
-            profile = None
-            for repo_profile in repo.profiles.profiles:
-                if opts.profile == repo_profile.path:
-                    profile = OnDiskProfile(
-                        repo_profile.base, repo_profile.path)
-                    break
+            with stats.phase('load profile'):
+                profile = repo_state.get_profile(opts.profile)
             if profile is None:
                 print(f"{program_name}: Unknown profile: {opts.profile}",
                       file=sys.stderr)
                 return 1
+    else:
+        profile = None
+
+    if opts.no_cache:
+        dep_cache = None
+    else:
+        with stats.phase('load persistent cache'):
+            dep_cache = repo_state.dep_cache
+        stats.add_cache('persistent dependencies', dep_cache)
+
+    if subcommand == 'ls':
         clean = opts.clean
         ls_file_formats = opts.ls_file_formats
-        return zarro_boogs_tools.list.main(
-            portage_config_path, repo, main_packages, profile,
-            keyword_change_type, match_keyword, clean, ls_file_formats)
+        jobs = opts.jobs
+        if jobs < 1:
+            print(f"{program_name}: Invalid number of jobs: {jobs}",
+                  file=sys.stderr)
+            return 1
+        if opts.max_time is not None and opts.max_time <= 0 or \
+                opts.max_packages is not None and opts.max_packages < 1:
+            print(f"{program_name}: Budgets must be positive",
+                  file=sys.stderr)
+            return 1
+        progress_printer = None
+        if opts.progress:
+            progress_printer = zarro_boogs_tools.monitor.ProgressPrinter()
+        monitor = None
+        if opts.max_time is not None or opts.max_packages is not None or \
+                progress_printer is not None:
+            monitor = zarro_boogs_tools.monitor.ResolutionMonitor(
+                opts.max_time, opts.max_packages, progress_printer)
+        if opts.profile_out is not None:
+            # Find out if the profile can be written before resolving
+            try:
+                open(opts.profile_out, 'wb').close()
+            except OSError as e:
+                print(f"{program_name}: {opts.profile_out}: {e.strerror}",
+                      file=sys.stderr)
+                return 1
+            profile_format = None if opts.profile_format is None \
+                else ProfileFormat(opts.profile_format)
+            recording = zarro_boogs_tools.profiling.record_profile(
+                opts.profile_out, profile_format)
+        else:
+            recording = contextlib.nullcontext()
+        if batch:
+            if clean:
+                print(f"{program_name}: Packages to clean files for cannot "
+                      f"be read from a file", file=sys.stderr)
+                return 1
+            if opts.from_file == '-':
+                atoms_file = sys.stdin
+            else:
+                try:
+                    atoms_file = open(opts.from_file)
+                except OSError as e:
+                    print(f"{program_name}: {opts.from_file}: {e.strerror}",
+                          file=sys.stderr)
+                    return 1
+            try:
+                with recording:
+                    status = zarro_boogs_tools.list.main_batch(
+                        portage_config_path, repo,
+                        itertools.chain(
+                            opts.atoms,
+                            zarro_boogs_tools.list.iter_atom_strs(
+                                atoms_file)),
+                        profile, keyword_change_type, match_keyword,
+                        ls_file_formats, jobs, dep_cache,
+                        repo_state.keyword_index, repo_state.cache, monitor)
+            finally:
+                if atoms_file is not sys.stdin:
+                    atoms_file.close()
+                if progress_printer is not None:
+                    progress_printer.clear()
+            with stats.phase('save caches'):
+                repo_state.save()
+            return status
+        try:
+            with recording:
+                status = zarro_boogs_tools.list.main(
+                    portage_config_path, repo, main_packages, profile,
+                    keyword_change_type, match_keyword, clean,
+                    ls_file_formats, jobs, dep_cache,
+                    repo_state.keyword_index, opts.stream, repo_state.cache,
+                    monitor)
+        finally:
+            if progress_printer is not None:
+                progress_printer.clear()
+        with stats.phase('save caches'):
+            repo_state.save()
+        return status
+
+    if subcommand == 'rdeps':
+        status = zarro_boogs_tools.rdeps.main(
+            repo, main_packages, profile, opts.arch, keyword_change_type,
+            match_keyword, dep_cache, repo_state.keyword_index,
+            repo_state.cache, repo_state.rdep_indexes)
+        with stats.phase('save caches'):
+            repo_state.save()
+        return status
 
     if subcommand == 'ls-nattka':
         print(f"{program_name}: {subcommand}: "
@@ -0,0 +1,576 @@
+#  zarro-boogs-tools Benchmark Suite Entry Point
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.bench.differential import \
+    DEFAULT_CASES, DEFAULT_MAX_PACKAGES, ENGINES, DifferentialCase, \
+    format_failure, run_differential
+from zarro_boogs_tools.bench.history import \
+    DEFAULT_THRESHOLD, append_to_history, compare_entries, create_entry, \
+    find_entry, format_comparisons, format_entry_summary, \
+    get_machine_fingerprint, get_unmatched_metrics, read_history
+from zarro_boogs_tools.bench.memory import \
+    DEFAULT_MEMORY_SIZES, DEFAULT_TOP_ALLOCATIONS, format_memory_results, \
+    measure_memory_in_new_process, run_memory_suite
+from zarro_boogs_tools.bench.replay import \
+    format_replay, read_corpus, replay_corpus, summarize_replay
+from zarro_boogs_tools.bench.startup import \
+    DEFAULT_STARTUP_REPEAT, format_startup_result, run_startup_benchmark
+from zarro_boogs_tools.bench.suite import \
+    BENCHMARKS, DEFAULT_REPEAT, DEFAULT_SIZES, format_results, run_suite
+from zarro_boogs_tools.depcache import get_cache_dir
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+from nattka.bugzilla import BugCategory
+
+"""The exit status when a metric has regressed compared to the baseline."""
+REGRESSION_EXIT_STATUS = 3
+
+
+def parse_args(args: list[str], prog: str) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description=f"""
+        Run benchmarks of package list making, record the results in a
+        history file, and compare them with the results of a previous run.
+        The exit status is {REGRESSION_EXIT_STATUS} if a metric has regressed
+        compared to the baseline.
+        """
+    )
+
+    parser_history_file = argparse.ArgumentParser(add_help=False)
+    parser_history_file.add_argument(
+        '--history',
+        metavar='FILE',
+        type=Path,
+        default=get_cache_dir() / 'bench-history.json',
+        help="the benchmark history file (default: %(default)s)"
+    )
+
+    parser_threshold = argparse.ArgumentParser(add_help=False)
+    parser_threshold.add_argument(
+        '--threshold',
+        metavar='FRACTION',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="""
+        regard an increase of a metric by no more than FRACTION of the
+        baseline as noise; times measured by more than one run also have to
+        increase by more than the variation between the runs; increases of
+        operation counts are never regarded as noise (default: %(default)s)
+        """
+    )
+
+    parser_record = argparse.ArgumentParser(
+        add_help=False, parents=[parser_history_file, parser_threshold])
+    parser_record.add_argument(
+        '--label',
+        help="""
+        record the results with LABEL, like the name of a Git commit, which
+        can be used to choose them as a baseline later
+        """
+    )
+    parser_record.add_argument(
+        '--no-record',
+        help="do not record the results in the benchmark history file",
+        action='store_true'
+    )
+    parser_record.add_argument(
+        '--baseline',
+        metavar='REF',
+        help="""
+        compare the results with the ones recorded in the benchmark history
+        file and chosen by REF, which is 'latest' for the latest results of
+        the same subcommand recorded on this machine, an index of the
+        results in the history
+        file, like '-1' for the latest results, or a label
+        """
+    )
+    subparsers = parser.add_subparsers(
+        dest='subcommand',
+        required=True,
+        title="available subcommands"
+    )
+
+    parser_synthetic = subparsers.add_parser(
+        'synthetic',
+        parents=[parser_record],
+        help="run benchmarks on synthetic ebuild repositories",
+        description="""
+        Run benchmarks on synthetic ebuild repositories of different sizes.
+        """
+    )
+    parser_synthetic.add_argument(
+        '-n', '--packages',
+        metavar='N',
+        type=int,
+        action='append',
+        help="""
+        benchmark a synthetic repository with N packages; can be repeated
+        (default: {})
+        """.format(', '.join(map(str, DEFAULT_SIZES)))
+    )
+    parser_synthetic.add_argument(
+        '-b', '--benchmark',
+        choices=list(BENCHMARKS),
+        action='append',
+        help="run the specified benchmark; can be repeated (default: all)"
+    )
+    parser_synthetic.add_argument(
+        '--repeat',
+        metavar='N',
+        type=int,
+        default=DEFAULT_REPEAT,
+        help="run each benchmark N times (default: %(default)s)"
+    )
+    parser_synthetic.add_argument(
+        '--work-dir',
+        metavar='DIR',
+        type=Path,
+        default=get_cache_dir() / 'bench',
+        help="""
+        keep generated repositories in DIR, where they are reused by later
+        runs (default: %(default)s)
+        """
+    )
+
+    parser_replay = subparsers.add_parser(
+        'replay',
+        parents=[parser_record],
+        help="replay recorded requests on a repository snapshot",
+        description="""
+        Replay recorded keywording and stabilization requests on a snapshot
+        of an ebuild repository, and report percentiles of the time taken by
+        the requests and the sizes of their package lists.
+        """
+    )
+    parser_replay.add_argument(
+        'corpus',
+        type=Path,
+        help="""
+        the file listing the requests, each of which is a JSON object on its
+        own line with keys 'atoms', 'profile', and optionally 'arch',
+        'keyword_change_type', 'match_keyword' and 'id'
+        """
+    )
+    parser_replay.add_argument(
+        '-r', '--repo',
+        metavar='DIR',
+        type=Path,
+        required=True,
+        help="replay the requests on the ebuild repository in DIR"
+    )
+    parser_replay.add_argument(
+        '--repeat',
+        metavar='N',
+        type=int,
+        default=1,
+        help="replay the whole corpus N times (default: %(default)s)"
+    )
+    parser_replay.add_argument(
+        '--warm',
+        help="""
+        keep caches between requests like the 'serve' subcommand of zbt does,
+        instead of loading the repository again and starting every request
+        with new caches like separate runs of zbt do; loading the repository
+        is not included in the latencies
+        """,
+        action='store_true'
+    )
+
+    parser_memory = subparsers.add_parser(
+        'memory',
+        parents=[parser_record],
+        help="measure the memory used by each phase of package list making",
+        description="""
+        Measure the peak memory allocated, the memory retained and the peak
+        resident set size of each phase of making package lists, and the
+        source lines that allocated the most memory retained by each phase.
+        Every repository is measured in a new process.  By default, synthetic
+        repositories are measured; if '-r' is specified, the repository in
+        DIR is measured instead, unless '-n' is also specified.
+        """
+    )
+    parser_memory.add_argument(
+        'atoms',
+        nargs='*',
+        help="""
+        atoms of the main packages to make package lists for in the
+        repository specified with '-r'
+        """
+    )
+    parser_memory.add_argument(
+        '-n', '--packages',
+        metavar='N',
+        type=int,
+        action='append',
+        help="""
+        measure a synthetic repository with N packages; can be repeated
+        (default: {})
+        """.format(', '.join(map(str, DEFAULT_MEMORY_SIZES)))
+    )
+    parser_memory.add_argument(
+        '-r', '--repo',
+        metavar='DIR',
+        type=Path,
+        help="""
+        measure the ebuild repository in DIR, like one of the fixture
+        repositories used by the unit tests
+        """
+    )
+    parser_memory.add_argument(
+        '-p', '--profile',
+        help="""
+        the profile to make package lists for in the repository specified
+        with '-r'
+        """
+    )
+    group_keyword_change_type = \
+        parser_memory.add_mutually_exclusive_group()
+    group_keyword_change_type.add_argument(
+        '-k', '--keyword',
+        help="target the testing keyword ('~arch') with '-r'",
+        dest='keyword_change_type',
+        action='store_const',
+        const=BugCategory.KEYWORDREQ
+    )
+    group_keyword_change_type.add_argument(
+        '-s', '--stable',
+        help="target the stable keyword ('arch') with '-r'",
+        dest='keyword_change_type',
+        action='store_const',
+        const=BugCategory.STABLEREQ
+    )
+    parser_memory.add_argument(
+        '--top',
+        metavar='N',
+        type=int,
+        default=DEFAULT_TOP_ALLOCATIONS,
+        help="""
+        report N source lines for each phase (default: %(default)s)
+        """
+    )
+    parser_memory.add_argument(
+        '--work-dir',
+        metavar='DIR',
+        type=Path,
+        default=get_cache_dir() / 'bench',
+        help="""
+        keep generated repositories in DIR, where they are reused by later
+        runs (default: %(default)s)
+        """
+    )
+
+    parser_startup = subparsers.add_parser(
+        'startup',
+        parents=[parser_record],
+        help="measure the time it takes to start zbt",
+        description="""
+        Measure the time it takes to start zbt and print its version in a new
+        process, which includes importing the modules imported at startup.
+        """
+    )
+    parser_startup.add_argument(
+        '--repeat',
+        metavar='N',
+        type=int,
+        default=DEFAULT_STARTUP_REPEAT,
+        help="start zbt N times (default: %(default)s)"
+    )
+
+    parser_differential = subparsers.add_parser(
+        'differential',
+        help="compare resolution engines with the reference implementation",
+        description="""
+        Generate random ebuild repositories and requests, make package lists
+        for them with the reference implementation and with the engines, and
+        report every case an engine makes different package lists on, shrunk
+        to a minimal case where the engine still disagrees.  The results are
+        not recorded in the benchmark history file.
+        """
+    )
+    parser_differential.add_argument(
+        '-n', '--cases',
+        metavar='N',
+        type=int,
+        default=DEFAULT_CASES,
+        help="run N cases (default: %(default)s)"
+    )
+    parser_differential.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help="""
+        the seed of the first case; the other cases use the following seeds
+        (default: %(default)s)
+        """
+    )
+    parser_differential.add_argument(
+        '-e', '--engine',
+        choices=list(ENGINES),
+        action='append',
+        help="compare the specified engine; can be repeated (default: all)"
+    )
+    parser_differential.add_argument(
+        '--max-packages',
+        metavar='N',
+        type=int,
+        default=DEFAULT_MAX_PACKAGES,
+        help="""
+        generate repositories with at most N packages (default: %(default)s)
+        """
+    )
+    parser_differential.add_argument(
+        '--no-shrink',
+        help="report the cases engines disagree on without shrinking them",
+        action='store_true'
+    )
+    parser_differential.add_argument(
+        '-o', '--output',
+        metavar='DIR',
+        type=Path,
+        help="""
+        write the repository of every case an engine disagrees on, and the
+        case in JSON, to a directory in DIR
+        """
+    )
+
+    parser_history = subparsers.add_parser(
+        'history',
+        parents=[parser_history_file],
+        help="list the results in the benchmark history file",
+        description="""
+        List the results in the benchmark history file with their indexes,
+        the times they were recorded, their labels, the versions of this
+        program they were measured with, the fingerprint IDs of the machines
+        they were measured on, and the subcommands that measured them.
+        """
+    )
+
+    parser_compare = subparsers.add_parser(
+        'compare',
+        parents=[parser_history_file, parser_threshold],
+        help="compare results in the benchmark history file",
+        description="""
+        Compare results in the benchmark history file.  See the '--baseline'
+        option of the other subcommands for the format of BASELINE and
+        CURRENT.
+        """
+    )
+    parser_compare.add_argument(
+        'baseline',
+        metavar='BASELINE',
+        help="the results to compare with"
+    )
+    parser_compare.add_argument(
+        'current',
+        metavar='CURRENT',
+        nargs='?',
+        default='-1',
+        help="the results to compare (default: %(default)s)"
+    )
+
+    return parser.parse_args(args)
+
+
+def compare_with_baseline(
+        program_name: str,
+        baseline: dict[str, Any],
+        current: dict[str, Any],
+        threshold: float
+) -> int:
+    if baseline['machine']['id'] != current['machine']['id']:
+        print(f"{program_name}: Warning: Comparing with results measured on "
+              f"a different machine", file=sys.stderr)
+    comparisons = compare_entries(baseline, current, threshold)
+    if not comparisons:
+        print(f"{program_name}: The baseline does not have any metric of "
+              f"the results to compare", file=sys.stderr)
+        return 1
+    unmatched = get_unmatched_metrics(baseline, current)
+    if unmatched:
+        print(f"{program_name}: Warning: {len(unmatched)} metrics are not "
+              f"in the baseline and are not compared:", file=sys.stderr)
+        for name in unmatched:
+            print(f"  {name}", file=sys.stderr)
+    print(format_comparisons(comparisons), end='')
+    if any(comparison['regression'] for comparison in comparisons):
+        return REGRESSION_EXIT_STATUS
+    return 0
+
+
+def run_benchmarks(
+        program_name: str,
+        opts: argparse.Namespace
+) -> tuple[int, Optional[list[dict[str, Any]]]]:
+    if opts.subcommand == 'synthetic':
+        sizes = opts.packages or DEFAULT_SIZES
+        names = opts.benchmark or list(BENCHMARKS)
+        results = run_suite(opts.work_dir, sizes, names, opts.repeat)
+        print(format_results(results), end='')
+        return 0, results
+
+    if opts.subcommand == 'replay':
+        try:
+            requests = read_corpus(opts.corpus)
+        except OSError as e:
+            print(f"{program_name}: {opts.corpus}: {e.strerror}",
+                  file=sys.stderr)
+            return 1, None
+        except ValueError as e:
+            print(f"{program_name}: {e}", file=sys.stderr)
+            return 1, None
+        records = replay_corpus(opts.repo, requests, opts.repeat, opts.warm)
+        summary = summarize_replay(records)
+        print(format_replay(records, summary), end='')
+        return 0 if summary['errors'] == 0 else 1, [summary]
+
+    if opts.subcommand == 'startup':
+        result = run_startup_benchmark(opts.repeat)
+        print(format_startup_result(result), end='')
+        return 0, [result]
+
+    if opts.repo is not None and (opts.profile is None or not opts.atoms):
+        print(f"{program_name}: A profile and atoms must be specified "
+              f"for the repository", file=sys.stderr)
+        return 1, None
+    results = list()
+    if opts.repo is not None:
+        try:
+            results.append(measure_memory_in_new_process(
+                opts.repo, opts.profile, opts.atoms,
+                opts.keyword_change_type, opts.top))
+        except ValueError as e:
+            print(f"{program_name}: {e}", file=sys.stderr)
+            return 1, None
+    if opts.repo is None or opts.packages:
+        results.extend(run_memory_suite(
+            opts.work_dir, opts.packages or DEFAULT_MEMORY_SIZES, opts.top))
+    print(format_memory_results(results), end='')
+    return 0, results
+
+
+def run_differential_subcommand(
+        program_name: str,
+        opts: argparse.Namespace
+) -> int:
+    failures = run_differential(
+        range(opts.seed, opts.seed + opts.cases),
+        opts.engine or list(ENGINES), opts.max_packages, not opts.no_shrink)
+    for failure in failures:
+        print(format_failure(failure))
+        if opts.output is None:
+            continue
+        engine = failure['engine'].replace(' ', '-')
+        path = opts.output / f"case-{failure['seed']}-{engine}"
+        try:
+            DifferentialCase(**failure['case']).write(path / 'repo')
+            with open(path / 'case.json', 'w') as case_file:
+                json.dump(failure, case_file, indent=2)
+        except OSError as e:
+            print(f"{program_name}: {path}: {e.strerror}", file=sys.stderr)
+            return 1
+        print(f"Case written to {path}")
+        print()
+    print(f"{opts.cases} cases run, {len(failures)} disagreements found")
+    return 0 if not failures else 1
+
+
+def main(program_name: str, args: list[str]) -> int:
+    opts = parse_args(args, program_name)
+    if getattr(opts, 'repeat', 1) < 1:
+        print(f"{program_name}: Invalid number of runs: {opts.repeat}",
+              file=sys.stderr)
+        return 1
+
+    if opts.subcommand == 'differential':
+        return run_differential_subcommand(program_name, opts)
+
+    try:
+        entries = read_history(opts.history)
+    except OSError as e:
+        print(f"{program_name}: {opts.history}: {e.strerror}",
+              file=sys.stderr)
+        return 1
+    except ValueError as e:
+        print(f"{program_name}: {e}", file=sys.stderr)
+        return 1
+
+    if opts.subcommand == 'history':
+        for index, entry in enumerate(entries):
+            print(format_entry_summary(index, entry))
+        return 0
+
+    if opts.subcommand == 'compare':
+        try:
+            current = find_entry(entries, opts.current)
+            baseline = find_entry(entries, opts.baseline,
+                                  subcommand=current['subcommand'])
+        except ValueError as e:
+            print(f"{program_name}: {e}", file=sys.stderr)
+            return 1
+        return compare_with_baseline(
+            program_name, baseline, current, opts.threshold)
+
+    # Find the baseline before running the benchmarks, so an invalid
+    # baseline is reported without waiting for them
+    baseline = None
+    if opts.baseline is not None:
+        try:
+            baseline = find_entry(entries, opts.baseline,
+                                  get_machine_fingerprint()['id'],
+                                  opts.subcommand)
+        except ValueError as e:
+            print(f"{program_name}: {e}", file=sys.stderr)
+            return 1
+
+    status, results = run_benchmarks(program_name, opts)
+    if results is None:
+        return status
+    entry = create_entry(opts.subcommand, results, opts.label)
+    if not opts.no_record:
+        try:
+            append_to_history(opts.history, entry)
+        except OSError as e:
+            print(f"{program_name}: {opts.history}: {e.strerror}",
+                  file=sys.stderr)
+            status = status or 1
+        except ValueError as e:
+            print(f"{program_name}: {e}", file=sys.stderr)
+            status = status or 1
+    if baseline is not None:
+        print()
+        status = compare_with_baseline(
+            program_name, baseline, entry, opts.threshold) or status
+    return status
+
+
+def main_wrapper() -> None:
+    program_name = Path(sys.argv[0]).name
+    sys.exit(main(program_name, sys.argv[1:]))
+
+
+if __name__ == '__main__':
+    sys.exit(main('python -m zarro_boogs_tools.bench', sys.argv[1:]))
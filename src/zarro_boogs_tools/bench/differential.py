@@ -0,0 +1,1145 @@
+#  zarro-boogs-tools Differential Testing of Package List Resolution
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.depcache import DependencyCache
+from zarro_boogs_tools.index import KeywordIndex
+from zarro_boogs_tools.list import get_package_lists
+from zarro_boogs_tools.package import \
+    PackageFilter, get_keyword_matching_pkg_filter, get_packages_to_process
+from zarro_boogs_tools.pkgcore.repository import open_standalone_repository
+from zarro_boogs_tools.pkgcore.restriction import \
+    PREPROCESS_CACHE, convert_and_restriction_to_list, preprocess_restriction
+from zarro_boogs_tools.resolver import Resolver
+
+import copy
+import hashlib
+import json
+import random
+import shutil
+import tempfile
+from collections import deque
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import nattka.package
+import pkgcore.restrictions.boolean as boolean
+import pkgcore.restrictions.restriction as restriction
+from pkgcore.ebuild import atom
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+from pkgcore.restrictions.packages import Conditional
+from pkgcore.restrictions.restriction import AlwaysBool
+
+"""The name of the profile of generated repositories."""
+DIFFERENTIAL_PROFILE = 'default'
+
+"""The architecture of the profile of generated repositories."""
+DIFFERENTIAL_ARCH = 'riscv'
+
+"""Another architecture packages in generated repositories may be keyworded
+for, which is used as the keyword to match."""
+DIFFERENTIAL_MATCH_ARCH = 'amd64'
+
+"""The USE flags used in generated repositories."""
+DIFFERENTIAL_USE_FLAGS = ('f0', 'f1', 'f2', 'f3', 'f4', 'f5')
+
+"""The versions packages in generated repositories may have.  Version 9999
+is a live ebuild without any keywords."""
+DIFFERENTIAL_VERSIONS = ('1', '1.1', '2', '2-r1', '3', '9999')
+
+"""The dependency classes of packages in generated repositories."""
+DEPENDENCY_CLASSES = ('BDEPEND', 'DEPEND', 'RDEPEND', 'PDEPEND', 'IDEPEND')
+
+"""The number of cases run by default."""
+DEFAULT_CASES = 100
+
+"""The maximum number of packages in a generated repository by default."""
+DEFAULT_MAX_PACKAGES = 12
+
+"""The maximum number of times a failing case is run while it is shrunk."""
+DEFAULT_MAX_SHRINK_RUNS = 500
+
+"""The number of threads for the engine that resolves dependencies in
+multiple threads."""
+DIFFERENTIAL_JOBS = 4
+
+_EBUILD_TEMPLATE = """\
+# Copyright 2022 zarro-boogs-tools Contributors
+# Distributed under the terms of the GNU General Public License v2
+
+EAPI=8
+
+DESCRIPTION="Generated package"
+HOMEPAGE="https://example.org"
+
+LICENSE="GPL-2"
+SLOT="{slot}"
+KEYWORDS="{keywords}"
+IUSE="{iuse}"
+PROPERTIES="{properties}"
+
+{dependencies}
+"""
+
+"""A type alias for nodes of dependency specifications in cases.  A node is
+either an atom, possibly a blocker, or a group, which is a list whose first
+element is the kind of the group:
+- ['||', child, ...]: an any-of group
+- ['()', child, ...]: an all-of group
+- ['?', flag, child, ...]: a USE-conditional group, where 'flag' may start
+  with '!'"""
+DependencyNode = Union[str, list]
+
+"""A type alias for the outcome of resolving a case: either the package
+lists, each of which is a list of the package's ${CATEGORY}/${PF}, for the
+main packages in order, or the error raised as a string."""
+Outcome = Union[list[list[str]], str]
+
+"""A type alias for resolution engines.  An engine is called with a
+repository, a profile, the main packages, the target keyword and the keyword
+to match, if any, and it returns the package list of each main package in
+order."""
+Engine = Callable[[UnconfiguredTree, OnDiskProfile, list[package], str,
+                   Optional[str]], list[list[package]]]
+
+
+class DifferentialCase:
+    """
+    A randomly generated ebuild repository and a keywording or stabilization
+    request to resolve in it.
+
+    The packages are described by a dictionary that maps each package's
+    ${CATEGORY}/${PN} to a dictionary that maps each of its versions to the
+    version's metadata, with keys 'slot', 'keywords', 'iuse', 'properties'
+    and 'dependencies'; 'dependencies' maps each dependency class to a list
+    of nodes of type 'DependencyNode'.  The profile is described by a
+    dictionary that maps the name of each file in the profile's directory to
+    the lines in the file.
+    """
+
+    def __init__(
+            self,
+            packages: dict[str, dict[str, dict[str, Any]]],
+            profile: dict[str, list[str]],
+            main_atoms: list[str],
+            target_keyword: str,
+            match_keyword: Optional[str] = None
+    ):
+        """
+        :param packages: the packages in the repository
+        :param profile: the files in the profile
+        :param main_atoms: the atoms of the main packages, each of which
+            matches exactly one version
+        :param target_keyword: the keyword the main packages will have
+        :param match_keyword: the keyword to prefer versions of dependencies
+            that have, or 'None' to not prefer any keyword
+        """
+        self.packages = packages
+        self.profile = profile
+        self.main_atoms = main_atoms
+        self.target_keyword = target_keyword
+        self.match_keyword = match_keyword
+
+    def copy(self) -> 'DifferentialCase':
+        """
+        Copy the case, so the copy can be modified without affecting it.
+
+        :return: the copy
+        """
+        return copy.deepcopy(self)
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Get the case as a dictionary.
+
+        :return: a dictionary that can be serialized into JSON, which maps the
+            name of each attribute of the case to its value
+        """
+        return copy.deepcopy(vars(self))
+
+    def get_size(self) -> int:
+        """
+        Get a measure of how large the case is, which decreases whenever the
+        case is shrunk.
+
+        :return: the number of package versions, dependency nodes and lines
+            in profile files in the case
+        """
+        def get_node_size(node: DependencyNode) -> int:
+            if isinstance(node, str):
+                return 1
+            return 1 + sum(map(get_node_size, _get_children(node)))
+
+        size = sum(map(len, self.profile.values())) + len(self.main_atoms)
+        for versions in self.packages.values():
+            for metadata in versions.values():
+                size += 1
+                for nodes in metadata['dependencies'].values():
+                    size += sum(map(get_node_size, nodes))
+        return size
+
+    def write(self, path: Path) -> None:
+        """
+        Write the repository of the case with an up-to-date md5-cache, so its
+        packages' metadata can be read without sourcing any ebuild.
+
+        :param path: the path to the directory to create the repository in,
+            which must not exist
+        :raise OSError: if the repository cannot be written
+        """
+        path.mkdir(parents=True)
+        _write_file(path / 'metadata' / 'layout.conf',
+                    'masters =\nthin-manifests = true\n')
+        profiles = path / 'profiles'
+        categories = sorted({key.split('/')[0] for key in self.packages})
+        _write_file(profiles / 'repo_name', 'differential\n')
+        _write_file(profiles / 'eapi', '8\n')
+        _write_file(profiles / 'categories', ''.join(
+            f'{category}\n' for category in categories))
+        _write_file(profiles / 'arch.list',
+                    f'{DIFFERENTIAL_MATCH_ARCH}\n{DIFFERENTIAL_ARCH}\n')
+        _write_file(profiles / 'profiles.desc',
+                    f'{DIFFERENTIAL_ARCH} {DIFFERENTIAL_PROFILE} stable\n')
+        profile = profiles / DIFFERENTIAL_PROFILE
+        _write_file(profile / 'eapi', '8\n')
+        _write_file(profile / 'make.defaults',
+                    f'ARCH="{DIFFERENTIAL_ARCH}"\n')
+        for file_name, lines in self.profile.items():
+            _write_file(profile / file_name,
+                        ''.join(f'{line}\n' for line in lines))
+
+        for key, versions in self.packages.items():
+            category, pn = key.split('/')
+            for version, metadata in versions.items():
+                variables = {
+                    'SLOT': metadata['slot'],
+                    'KEYWORDS': ' '.join(metadata['keywords']),
+                    'IUSE': ' '.join(metadata['iuse']),
+                    'PROPERTIES': metadata['properties']
+                }
+                for dep_class in DEPENDENCY_CLASSES:
+                    variables[dep_class] = ' '.join(map(
+                        render_dependency_node,
+                        metadata['dependencies'].get(dep_class, ())))
+                ebuild = _EBUILD_TEMPLATE.format(
+                    slot=variables['SLOT'],
+                    keywords=variables['KEYWORDS'],
+                    iuse=variables['IUSE'],
+                    properties=variables['PROPERTIES'],
+                    dependencies=''.join(
+                        f'{dep_class}="{variables[dep_class]}"\n'
+                        for dep_class in DEPENDENCY_CLASSES))
+                pf = f'{pn}-{version}'
+                _write_file(path / category / pn / f'{pf}.ebuild', ebuild)
+                entry = {
+                    'DEFINED_PHASES': '-',
+                    'DESCRIPTION': 'Generated package',
+                    'EAPI': '8',
+                    'HOMEPAGE': 'https://example.org',
+                    'LICENSE': 'GPL-2',
+                    **variables,
+                    '_md5_': hashlib.md5(ebuild.encode()).hexdigest()
+                }
+                _write_file(
+                    path / 'metadata' / 'md5-cache' / category / pf,
+                    ''.join(f'{k}={v}\n' for k, v in entry.items() if v))
+
+
+def _write_file(path: Path, contents: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(contents)
+
+
+def _get_children(node: list) -> list[DependencyNode]:
+    return node[2:] if node[0] == '?' else node[1:]
+
+
+def _set_children(node: list, children: list[DependencyNode]) -> list:
+    return node[:2] + children if node[0] == '?' else node[:1] + children
+
+
+def render_dependency_node(node: DependencyNode) -> str:
+    """
+    Render a node of a dependency specification in the syntax of ebuilds.
+
+    :param node: the node
+    :return: the dependency specification
+    """
+    if isinstance(node, str):
+        return node
+    children = ' '.join(map(render_dependency_node, _get_children(node)))
+    if node[0] == '?':
+        return f'{node[1]}? ( {children} )'
+    if node[0] == '||':
+        return f'|| ( {children} )'
+    return f'( {children} )'
+
+
+def _generate_atom(
+        rng: random.Random,
+        versions: dict[str, list[str]],
+        iuse: set[str],
+        blocker: bool
+) -> str:
+    if rng.random() < 0.05:
+        key = 'cat-z/missing'
+    else:
+        key = rng.choice(sorted(versions))
+    version = rng.choice(versions.get(key, ['1']))
+    base_version = version.split('-')[0]
+    operator = rng.random()
+    if operator < 0.5:
+        atom_str = key
+    elif operator < 0.6:
+        atom_str = f'>={key}-{version}'
+    elif operator < 0.65:
+        atom_str = f'<={key}-{version}'
+    elif operator < 0.7:
+        atom_str = f'>{key}-{version}'
+    elif operator < 0.75:
+        atom_str = f'<{key}-{version}'
+    elif operator < 0.85:
+        atom_str = f'={key}-{version}'
+    elif operator < 0.92:
+        atom_str = f'~{key}-{base_version}'
+    else:
+        atom_str = f"={key}-{base_version.split('.')[0]}*"
+
+    if rng.random() < 0.25:
+        # Blockers may not have slot operators
+        atom_str += rng.choice([':0', ':1'] if blocker else
+                               [':0', ':1', ':2', ':*', ':=', ':0='])
+    if not blocker and rng.random() < 0.25:
+        flag = rng.choice(DIFFERENTIAL_USE_FLAGS)
+        use_dep = rng.choice(['{}', '-{}', '{}(+)', '-{}(-)',
+                              '{}?', '!{}?', '{}=', '!{}=']).format(flag)
+        if '?' in use_dep or '=' in use_dep:
+            # Conditional USE dependencies refer to the depending package's
+            # USE flags
+            iuse.add(flag)
+        atom_str += f'[{use_dep}]'
+    if blocker:
+        atom_str = rng.choice(['!', '!!']) + atom_str
+    return atom_str
+
+
+def _generate_dependency_node(
+        rng: random.Random,
+        versions: dict[str, list[str]],
+        iuse: set[str],
+        depth: int = 0,
+        in_any_of: bool = False
+) -> DependencyNode:
+    kind = rng.random()
+    if depth >= 2 or kind < 0.55:
+        return _generate_atom(rng, versions, iuse,
+                              not in_any_of and rng.random() < 0.1)
+    if kind < 0.75:
+        return ['||'] + [
+            _generate_dependency_node(rng, versions, iuse, depth + 1, True)
+            for _ in range(rng.randint(2, 3))]
+    if kind < 0.92:
+        flag = rng.choice(DIFFERENTIAL_USE_FLAGS)
+        iuse.add(flag)
+        if rng.random() < 0.3:
+            flag = f'!{flag}'
+        return ['?', flag] + [
+            _generate_dependency_node(rng, versions, iuse, depth + 1,
+                                      in_any_of)
+            for _ in range(rng.randint(1, 2))]
+    return ['()'] + [
+        _generate_dependency_node(rng, versions, iuse, depth + 1, in_any_of)
+        for _ in range(2)]
+
+
+def _generate_keywords(rng: random.Random) -> list[str]:
+    keywords = list()
+    for arch in (DIFFERENTIAL_MATCH_ARCH, DIFFERENTIAL_ARCH):
+        state = rng.random()
+        if state < 0.3:
+            continue
+        if state < 0.65:
+            keywords.append(f'~{arch}')
+        elif state < 0.97:
+            keywords.append(arch)
+        else:
+            keywords.append(f'-{arch}')
+    return keywords
+
+
+def _generate_profile(
+        rng: random.Random,
+        versions: dict[str, list[str]]
+) -> dict[str, list[str]]:
+    def get_package_atom() -> str:
+        key = rng.choice(sorted(versions))
+        version = rng.choice(versions[key])
+        return rng.choice([key, key, f'>={key}-{version}',
+                           f'={key}-{version}'])
+
+    profile = dict()
+    for file_name, max_lines in [('use.mask', 2), ('use.force', 2),
+                                 ('use.stable.mask', 1),
+                                 ('use.stable.force', 1)]:
+        profile[file_name] = rng.sample(
+            DIFFERENTIAL_USE_FLAGS, rng.randint(0, max_lines))
+    for file_name, max_lines in [('package.use.mask', 3),
+                                 ('package.use.force', 2),
+                                 ('package.use.stable.mask', 1),
+                                 ('package.use.stable.force', 1)]:
+        lines = list()
+        for _ in range(rng.randint(0, max_lines)):
+            flag = rng.choice(DIFFERENTIAL_USE_FLAGS)
+            # Lines may also undo what other lines set
+            if rng.random() < 0.2:
+                flag = f'-{flag}'
+            lines.append(f'{get_package_atom()} {flag}')
+        profile[file_name] = lines
+    return profile
+
+
+def generate_case(
+        seed: int,
+        max_packages: int = DEFAULT_MAX_PACKAGES
+) -> DifferentialCase:
+    """
+    Generate a random case.  The repository's dependency specifications
+    cover USE-conditional groups, any-of and all-of groups, blockers,
+    versioned atoms, slot and slot operator dependencies, USE dependencies,
+    missing packages and cycles, and the profile masks and forces USE flags
+    for all packages, for some packages, and for stable packages.
+
+    :param seed: the seed of the random number generator; cases generated
+        with the same seed are identical
+    :param max_packages: the maximum number of packages, as in
+        ${CATEGORY}/${PN}, in the repository
+    :return: the case
+    """
+    rng = random.Random(seed)
+    keys = [f'cat-{"ab"[index % 2]}/pkg{index}'
+            for index in range(rng.randint(2, max(max_packages, 2)))]
+    versions = {key: sorted(rng.sample(DIFFERENTIAL_VERSIONS,
+                                       rng.randint(1, 3)),
+                            key=DIFFERENTIAL_VERSIONS.index)
+                for key in keys}
+
+    packages = dict()
+    for key in keys:
+        slotted = rng.random() < 0.3
+        packages[key] = dict()
+        for version in versions[key]:
+            iuse = set(rng.sample(DIFFERENTIAL_USE_FLAGS, rng.randint(0, 2)))
+            dependencies = dict()
+            for dep_class in DEPENDENCY_CLASSES:
+                count = rng.randint(0, 3 if dep_class == 'RDEPEND' else 1)
+                if count > 0:
+                    dependencies[dep_class] = [
+                        _generate_dependency_node(rng, versions, iuse)
+                        for _ in range(count)]
+            live = version == '9999'
+            packages[key][version] = {
+                'slot': version.split('.')[0].split('-')[0]
+                if slotted else '0',
+                'keywords': list() if live else _generate_keywords(rng),
+                'iuse': sorted(iuse),
+                'properties': 'live' if live else '',
+                'dependencies': dependencies
+            }
+
+    profile = _generate_profile(rng, versions)
+    target_keyword = rng.choice(
+        [f'~{DIFFERENTIAL_ARCH}', DIFFERENTIAL_ARCH])
+    main_atoms = list()
+    for key in rng.sample(keys, rng.randint(1, 2)):
+        # Prefer main packages that do not have the target keyword yet, whose
+        # package lists are not empty
+        candidates = [
+            version for version in versions[key]
+            if target_keyword not in packages[key][version]['keywords'] and
+            DIFFERENTIAL_ARCH not in packages[key][version]['keywords']]
+        version = rng.choice(candidates or versions[key])
+        main_atoms.append(f'={key}-{version}')
+    match_keyword = rng.choice(
+        [None, DIFFERENTIAL_MATCH_ARCH, f'~{DIFFERENTIAL_MATCH_ARCH}'])
+    return DifferentialCase(packages, profile, main_atoms, target_keyword,
+                            match_keyword)
+
+
+def reference_use_masked(
+        queried_package: package,
+        use_flag: str,
+        profile: OnDiskProfile,
+        stable: bool
+) -> bool:
+    """
+    Determine whether a USE flag is masked for a package on a profile like
+    the 'package_use_masked_in_profile' function does, with the original
+    implementation of algorithm 5.1 in PMS for EAPI 8 that renders the
+    profile's USE flag restrictions and checks them one line at a time on
+    every call.  This is a frozen copy kept for the reference implementation
+    only; it must not be optimized.
+
+    :param queried_package: the package whose USE flag is queried
+    :param use_flag: the USE flag whose masking state is queried
+    :param profile: the profile where the masking state is queried
+    :param stable: whether stable USE restrictions should be respected
+    :return: whether the USE flag is masked for the package on the profile
+    """
+    negated_flag = use_flag.startswith('-') or use_flag.startswith('!')
+    if negated_flag:
+        normalized_flag = use_flag.lstrip('-').lstrip('!')
+        use_dict = profile.forced_use.render_to_dict()
+        if stable:
+            use_dict.update(
+                profile.stable_forced_use.render_to_dict())
+    else:
+        normalized_flag = use_flag
+        use_dict = profile.masked_use.render_to_dict()
+        if stable:
+            use_dict.update(
+                profile.stable_masked_use.render_to_dict())
+    package_key = f'{queried_package.category}/{queried_package.PN}'
+    global_keys = set(filter(lambda k: isinstance(k, AlwaysBool),
+                             use_dict.keys()))
+
+    masked = False
+    use_lines_for_package = list()
+    for global_key in global_keys:
+        use_lines_for_package.extend(use_dict[global_key])
+    use_lines_for_package.extend(use_dict.get(package_key, ()))
+    matching_lines = filter(
+        lambda e: e.key.match(queried_package), use_lines_for_package)
+    for line in matching_lines:
+        if normalized_flag in line.pos:
+            masked = True
+        elif normalized_flag in line.neg:
+            masked = False
+    return masked
+
+
+def reference_preprocess_restriction(
+        restrict: restriction.base,
+        current_package: package,
+        profile: OnDiskProfile,
+        stable: bool
+) -> restriction.base:
+    """
+    Preprocess a dependency restriction like the 'preprocess_restriction'
+    function does, with a frozen copy of the original implementation that
+    does not share any code or cache with it: USE-conditional groups are
+    unwrapped with USE flag restrictions looked up by the
+    'reference_use_masked' function, and USE dependencies are stripped.
+
+    The only behavior added to the original implementation is the one the
+    'unwrap_use_conditional' function specifies for any-of groups: an
+    alternative that never takes effect under the profile is dropped, and an
+    any-of group left with one alternative is replaced by it.  It is decided
+    on the restriction before unwrapping, independently of how the
+    'unwrap_use_conditional' function detects it.
+
+    :param restrict: the restriction to preprocess
+    :param current_package: the package which has 'restrict' as a dependency
+    :param profile: the profile whose USE flag masks and forces are applied
+    :param stable: whether USE flag masks and forces for stable packages are
+        applied
+    :return: the preprocessing result
+    """
+    def is_masked(restrict: restriction.base) -> bool:
+        return isinstance(restrict, Conditional) and \
+            restrict.attr == 'use' and reference_use_masked(
+                current_package, set(restrict.restriction.vals).pop(),
+                profile, stable)
+
+    def never_takes_effect(restrict: restriction.base) -> bool:
+        if is_masked(restrict):
+            return True
+        if isinstance(restrict, Conditional):
+            return all(map(never_takes_effect, restrict.payload))
+        if isinstance(restrict, boolean.AndRestriction) and \
+                not isinstance(restrict, atom.atom):
+            return all(map(never_takes_effect, restrict))
+        return False
+
+    def unwrap(restrict: restriction.base) -> restriction.base:
+        if isinstance(restrict, Conditional):
+            if is_masked(restrict):
+                return boolean.AndRestriction()
+            return boolean.AndRestriction(*map(unwrap, restrict.payload))
+        elif isinstance(restrict, atom.atom):
+            return restrict
+        elif isinstance(restrict, boolean.OrRestriction):
+            alternatives = [unwrap(r) for r in restrict
+                            if not never_takes_effect(r)]
+            if len(alternatives) == 1 and len(restrict) > 1:
+                return alternatives[0]
+            return type(restrict)(*alternatives)
+        elif isinstance(restrict, boolean.AndRestriction):
+            return type(restrict)(*map(unwrap, restrict))
+        else:
+            return restrict
+
+    def strip_use_dep(restrict: restriction.base) -> restriction.base:
+        if isinstance(restrict, atom.atom):
+            return restrict.no_usedeps
+        elif isinstance(restrict, boolean.AndRestriction) or \
+                isinstance(restrict, boolean.OrRestriction):
+            return type(restrict)(*map(strip_use_dep, restrict))
+        else:
+            return restrict
+
+    return strip_use_dep(unwrap(restrict))
+
+
+def _breadth_first_package_lists(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str],
+        preprocess: Callable[[restriction.base, package, OnDiskProfile, bool],
+                             restriction.base]
+) -> list[list[package]]:
+    stable = not target_keyword.startswith('~')
+    keywords = [target_keyword]
+    if match_keyword is not None:
+        keywords.append(match_keyword)
+
+    def has_keyword(pkg: package, keyword: str) -> bool:
+        return keyword in pkg.keywords or keyword.lstrip('~') in pkg.keywords
+
+    def pkg_filter(pkgs: Iterable[package]) -> Iterable[package]:
+        return [pkg for pkg in pkgs
+                if any(has_keyword(pkg, keyword) for keyword in keywords)]
+
+    def get_best_version(restrict, use_filter: bool) -> Optional[package]:
+        matches = repo.match(
+            restrict, pkg_filter=pkg_filter if use_filter else None)
+        if not matches:
+            return None
+        return nattka.package.select_best_version(matches)
+
+    def get_direct_dependencies(pkg: package) -> list[package]:
+        deps_restrictions = set()
+        for dep_class in [pkg.bdepend, pkg.depend, pkg.rdepend,
+                          pkg.pdepend, pkg.idepend]:
+            deps_restrictions = deps_restrictions.union(
+                dep_class.restrictions)
+        restrictions = list()
+        for restrict in deps_restrictions:
+            restrict = preprocess(restrict, pkg, profile, stable)
+            if isinstance(restrict, atom.atom) and restrict.blocks:
+                continue
+            if isinstance(restrict, boolean.AndRestriction) and \
+                    not isinstance(restrict, atom.atom):
+                restrictions.extend(convert_and_restriction_to_list(restrict))
+            else:
+                restrictions.append(restrict)
+        result = list()
+        for restrict in restrictions:
+            dep_pkg = get_best_version(restrict, True)
+            if dep_pkg is None:
+                dep_pkg = get_best_version(restrict, False)
+            if dep_pkg is not None and dep_pkg not in result:
+                result.append(dep_pkg)
+        return result
+
+    package_lists = list()
+    for main_package in main_packages:
+        package_list = list()
+        queue = deque([main_package])
+        visited = {main_package}
+        while queue:
+            pkg = queue.popleft()
+            if has_keyword(pkg, target_keyword):
+                continue
+            package_list.append(pkg)
+            for dep_pkg in get_direct_dependencies(pkg):
+                if dep_pkg not in visited:
+                    visited.add(dep_pkg)
+                    queue.append(dep_pkg)
+        package_lists.append(package_list)
+    return package_lists
+
+
+def reference_package_lists(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists with the reference implementation, which every engine
+    must agree with.  The reference is the original breadth-first search of
+    the 'get_packages_to_process' function, one package at a time, without
+    any cache, thread, index or shared state, and it matches dependencies
+    with the repository's 'match' method directly.  Dependency restrictions
+    are preprocessed by the 'reference_preprocess_restriction' function, so
+    the reference does not share the preprocessing with the engines either.
+
+    :param repo: the object representing the ebuild repository
+    :param profile: the profile to apply USE flag restrictions from
+    :param main_packages: the main packages
+    :param target_keyword: the keyword the main packages will have
+    :param match_keyword: the keyword to prefer versions of dependencies
+        that have, or 'None' to not prefer any keyword
+    :return: the package list of each main package in order
+    """
+    return _breadth_first_package_lists(
+        repo, profile, main_packages, target_keyword, match_keyword,
+        reference_preprocess_restriction)
+
+
+def _get_pkg_filter(
+        target_keyword: str,
+        match_keyword: Optional[str],
+        keyword_index: Optional[KeywordIndex] = None
+) -> PackageFilter:
+    keywords = [target_keyword]
+    if match_keyword is not None:
+        keywords.append(match_keyword)
+    return get_keyword_matching_pkg_filter(
+        *keywords, keyword_index=keyword_index)
+
+
+def engine_preprocessing(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists with the reference implementation's breadth-first
+    search, but preprocess dependency restrictions with the
+    'preprocess_restriction' function, without its cache.  This checks the
+    USE flag restriction table and the rewriting of any-of groups on their
+    own, apart from any resolution engine.
+    """
+    return _breadth_first_package_lists(
+        repo, profile, main_packages, target_keyword, match_keyword,
+        lambda restrict, pkg, profile, stable: preprocess_restriction(
+            restrict, pkg, profile, stable, None))
+
+
+def engine_get_packages_to_process(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None,
+        jobs: int = 1
+) -> list[list[package]]:
+    """
+    Make package lists with a separate call to the 'get_packages_to_process'
+    function for each main package, without any cache.
+    """
+    pkg_filter = _get_pkg_filter(target_keyword, match_keyword)
+    return [get_packages_to_process(main_package, target_keyword, repo,
+                                    pkg_filter, profile, jobs=jobs)
+            for main_package in main_packages]
+
+
+def engine_threads(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists like the 'get_packages_to_process' engine does, but
+    resolve dependencies in multiple threads.
+    """
+    return engine_get_packages_to_process(
+        repo, profile, main_packages, target_keyword, match_keyword,
+        DIFFERENTIAL_JOBS)
+
+
+def engine_get_package_lists(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists with the 'get_package_lists' function of the 'list'
+    module, which shares best versions and the dependency graph between
+    main packages.
+    """
+    return list(get_package_lists(
+        repo, main_packages, profile, target_keyword,
+        match_keyword).values())
+
+
+def engine_keyword_index(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists with the 'get_package_lists' function of the 'list'
+    module, looking up keywords in a keyword index.
+    """
+    return list(get_package_lists(
+        repo, main_packages, profile, target_keyword, match_keyword,
+        keyword_index=KeywordIndex(repo)).values())
+
+
+def engine_dependency_cache(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None,
+        warm: bool = False
+) -> list[list[package]]:
+    """
+    Make package lists with the 'get_package_lists' function of the 'list'
+    module, looking up dependencies in a new persistent dependency cache.
+    """
+    temp_dir = Path(tempfile.mkdtemp())
+    try:
+        path = temp_dir / 'deps.json'
+        dep_cache = DependencyCache(repo, path)
+        package_lists = list(get_package_lists(
+            repo, main_packages, profile, target_keyword, match_keyword,
+            dep_cache=dep_cache).values())
+        if not warm:
+            return package_lists
+        dep_cache.save()
+        PREPROCESS_CACHE.clear()
+        return list(get_package_lists(
+            repo, main_packages, profile, target_keyword, match_keyword,
+            dep_cache=DependencyCache(repo, path)).values())
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def engine_warm_dependency_cache(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists like the 'dependency cache' engine does, save the
+    cache, and then make them again with the cache loaded from its file.
+    """
+    return engine_dependency_cache(
+        repo, profile, main_packages, target_keyword, match_keyword, True)
+
+
+def engine_resolver(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make package lists with a new Resolver.
+    """
+    resolver = Resolver(repo, profile, match_keyword)
+    return list(resolver.lists(main_packages, target_keyword).values())
+
+
+def engine_reused_resolver(
+        repo: UnconfiguredTree,
+        profile: OnDiskProfile,
+        main_packages: list[package],
+        target_keyword: str,
+        match_keyword: Optional[str] = None
+) -> list[list[package]]:
+    """
+    Make the package list of each main package with a Resolver in reverse
+    order first, and then make them again in order with the same resolver,
+    whose caches have been filled by the first requests.
+    """
+    resolver = Resolver(repo, profile, match_keyword)
+    for main_package in reversed(main_packages):
+        resolver.closure(main_package, target_keyword)
+    return list(resolver.lists(main_packages, target_keyword).values())
+
+
+"""The engines compared with the reference implementation, keyed on their
+names.  Register an engine here to have it tested."""
+ENGINES: dict[str, Engine] = {
+    'preprocessing': engine_preprocessing,
+    'get_packages_to_process': engine_get_packages_to_process,
+    'threads': engine_threads,
+    'get_package_lists': engine_get_package_lists,
+    'keyword index': engine_keyword_index,
+    'dependency cache': engine_dependency_cache,
+    'warm dependency cache': engine_warm_dependency_cache,
+    'resolver': engine_resolver,
+    'reused resolver': engine_reused_resolver
+}
+
+
+def run_case(
+        path: Path,
+        case: DifferentialCase,
+        engine: Optional[Engine] = None
+) -> Outcome:
+    """
+    Resolve a case whose repository has been written with an engine.  The
+    repository and the profile are loaded anew, and the cache of
+    preprocessed restrictions is cleared, so no state is shared with earlier
+    runs.
+
+    :param path: the path to the repository of the case
+    :param case: the case
+    :param engine: the engine; omit or specify 'None' to use the reference
+        implementation
+    :return: the outcome
+    """
+    if engine is None:
+        engine = reference_package_lists
+    repo = open_standalone_repository(path)
+    profile = OnDiskProfile(str(path / 'profiles'), DIFFERENTIAL_PROFILE)
+    PREPROCESS_CACHE.clear()
+    # Any error is part of the outcome, which the engines must agree on too
+    try:
+        main_packages = list()
+        for atom_str in case.main_atoms:
+            main_packages.append(nattka.package.select_best_version(
+                repo.match(atom.atom(atom_str))))
+        package_lists = engine(repo, profile, main_packages,
+                               case.target_keyword, case.match_keyword)
+    except Exception as e:
+        return f'{type(e).__name__}: {e}'
+    return [[pkg.cpvstr for pkg in package_list]
+            for package_list in package_lists]
+
+
+def _write_and_run(
+        work_dir: Path,
+        case: DifferentialCase,
+        engines: Iterable[Optional[Engine]]
+) -> list[Outcome]:
+    path = Path(tempfile.mkdtemp(dir=work_dir)) / 'repo'
+    try:
+        case.write(path)
+        return [run_case(path, case, engine) for engine in engines]
+    finally:
+        shutil.rmtree(path.parent)
+
+
+def _iter_node_list_reductions(nodes: list[DependencyNode]) \
+        -> Iterator[list[DependencyNode]]:
+    for index, node in enumerate(nodes):
+        yield nodes[:index] + nodes[index + 1:]
+        if isinstance(node, str):
+            # Drop the version, slot and USE dependency from the atom
+            blocker = node[:len(node) - len(node.lstrip('!'))]
+            simplified = atom.atom(node).key
+            if blocker + simplified != node:
+                yield nodes[:index] + [blocker + simplified] + \
+                    nodes[index + 1:]
+            continue
+        children = _get_children(node)
+        for child in children:
+            yield nodes[:index] + [child] + nodes[index + 1:]
+        for reduced in _iter_node_list_reductions(children):
+            if reduced:
+                yield nodes[:index] + [_set_children(node, reduced)] + \
+                    nodes[index + 1:]
+
+
+def iter_reductions(case: DifferentialCase) -> Iterator[DifferentialCase]:
+    """
+    Get the cases that are one step smaller than a case, with the steps
+    that remove the most first.  A step never removes a main package.
+
+    :param case: the case
+    :return: an iterator over the smaller cases
+    """
+    main_keys = {atom.atom(atom_str).key: atom.atom(atom_str).fullver
+                 for atom_str in case.main_atoms}
+    if len(case.main_atoms) > 1:
+        for atom_str in case.main_atoms:
+            reduced = case.copy()
+            reduced.main_atoms.remove(atom_str)
+            yield reduced
+    for key in case.packages:
+        if key not in main_keys:
+            reduced = case.copy()
+            del reduced.packages[key]
+            yield reduced
+    for key, versions in case.packages.items():
+        for version in versions:
+            if len(versions) > 1 and main_keys.get(key) != version:
+                reduced = case.copy()
+                del reduced.packages[key][version]
+                yield reduced
+    if case.match_keyword is not None:
+        reduced = case.copy()
+        reduced.match_keyword = None
+        yield reduced
+    for file_name, lines in case.profile.items():
+        for index in range(len(lines)):
+            reduced = case.copy()
+            del reduced.profile[file_name][index]
+            yield reduced
+    for key, versions in case.packages.items():
+        for version, metadata in versions.items():
+            for attribute in ('keywords', 'iuse'):
+                for index in range(len(metadata[attribute])):
+                    reduced = case.copy()
+                    del reduced.packages[key][version][attribute][index]
+                    yield reduced
+            for dep_class, nodes in metadata['dependencies'].items():
+                for reduced_nodes in _iter_node_list_reductions(nodes):
+                    reduced = case.copy()
+                    reduced.packages[key][version]['dependencies'][
+                        dep_class] = reduced_nodes
+                    yield reduced
+
+
+def shrink_case(
+        work_dir: Path,
+        case: DifferentialCase,
+        engine: Engine,
+        max_runs: int = DEFAULT_MAX_SHRINK_RUNS
+) -> tuple[DifferentialCase, Outcome, Outcome]:
+    """
+    Shrink a case on which an engine disagrees with the reference
+    implementation, by taking steps that keep the disagreement until no
+    step does or the case has been run too many times.
+
+    :param work_dir: the directory to write repositories in
+    :param case: the case
+    :param engine: the engine
+    :param max_runs: the maximum number of times to run the case
+    :return: the shrunk case, the reference outcome and the engine's outcome
+    :raise OSError: if a repository cannot be written
+    """
+    expected, actual = _write_and_run(work_dir, case, [None, engine])
+    runs = 1
+    shrunk = True
+    while shrunk and runs < max_runs:
+        shrunk = False
+        for reduced in iter_reductions(case):
+            if runs >= max_runs:
+                break
+            runs += 1
+            reduced_expected, reduced_actual = _write_and_run(
+                work_dir, reduced, [None, engine])
+            if reduced_expected != reduced_actual:
+                case, expected, actual = \
+                    reduced, reduced_expected, reduced_actual
+                shrunk = True
+                break
+    return case, expected, actual
+
+
+def run_differential(
+        seeds: Iterable[int],
+        engine_names: Iterable[str] = tuple(ENGINES),
+        max_packages: int = DEFAULT_MAX_PACKAGES,
+        shrink: bool = True
+) -> list[dict[str, Any]]:
+    """
+    Compare engines with the reference implementation on random cases.
+
+    :param seeds: the seed of each case
+    :param engine_names: the names of the engines in 'ENGINES'
+    :param max_packages: see the 'generate_case' function
+    :param shrink: whether to shrink the cases the engines disagree on
+    :return: a dictionary that can be serialized into JSON for each case an
+        engine disagrees with the reference implementation on, with keys
+        'seed', 'engine', 'case', which is returned by the
+        'DifferentialCase.to_dict' method, 'expected', which is the
+        reference outcome, and 'actual', which is the engine's outcome
+    :raise OSError: if a repository cannot be written
+    """
+    engine_names = list(engine_names)
+    failures = list()
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        for seed in seeds:
+            case = generate_case(seed, max_packages)
+            expected, *outcomes = _write_and_run(
+                work_dir, case, [None] + [ENGINES[name]
+                                          for name in engine_names])
+            for name, actual in zip(engine_names, outcomes):
+                if actual == expected:
+                    continue
+                failing_case = case
+                if shrink:
+                    failing_case, expected_outcome, actual = shrink_case(
+                        work_dir, case, ENGINES[name])
+                else:
+                    expected_outcome = expected
+                failures.append({
+                    'seed': seed,
+                    'engine': name,
+                    'case': failing_case.to_dict(),
+                    'expected': expected_outcome,
+                    'actual': actual
+                })
+    finally:
+        shutil.rmtree(work_dir)
+    return failures
+
+
+def format_failure(failure: dict[str, Any]) -> str:
+    """
+    Format a case an engine disagrees with the reference implementation on
+    for humans to read, as the metadata of every package in the case's
+    repository and the files of its profile.
+
+    :param failure: a value returned by the 'run_differential' function
+    :return: the formatted case, which ends with a newline
+    """
+    case = failure['case']
+    lines = [f"Engine '{failure['engine']}' differs from the reference "
+             f"on case {failure['seed']}",
+             f"Main packages: {' '.join(case['main_atoms'])}",
+             f"Target keyword: {case['target_keyword']}",
+             f"Keyword to match: {case['match_keyword'] or '-'}",
+             f"Expected: {json.dumps(failure['expected'])}",
+             f"Actual: {json.dumps(failure['actual'])}"]
+    for key, versions in case['packages'].items():
+        for version, metadata in versions.items():
+            lines.append(f'{key}-{version}:')
+            lines.append(f"    SLOT={metadata['slot']}")
+            lines.append(f"    KEYWORDS={' '.join(metadata['keywords'])}")
+            lines.append(f"    IUSE={' '.join(metadata['iuse'])}")
+            if metadata['properties']:
+                lines.append(f"    PROPERTIES={metadata['properties']}")
+            for dep_class, nodes in metadata['dependencies'].items():
+                if nodes:
+                    lines.append(f"    {dep_class}=" + ' '.join(
+                        map(render_dependency_node, nodes)))
+    for file_name, file_lines in case['profile'].items():
+        if file_lines:
+            lines.append(f'profiles/{DIFFERENTIAL_PROFILE}/{file_name}:')
+            lines.extend(f'    {line}' for line in file_lines)
+    return '\n'.join(lines) + '\n'
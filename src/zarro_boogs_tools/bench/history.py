@@ -0,0 +1,410 @@
+#  zarro-boogs-tools Benchmark History and Regression Detection
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools import __version__
+
+import datetime
+import hashlib
+import json
+import os
+import platform
+import statistics
+from pathlib import Path
+from typing import Any, Optional
+
+"""The version of the format of benchmark history files, which must be
+increased whenever the format changes incompatibly."""
+HISTORY_FORMAT_VERSION = 1
+
+"""The relative increase of a metric that is regarded as noise by default."""
+DEFAULT_THRESHOLD = 0.1
+
+"""The number of median absolute deviations of the times of a benchmark's
+runs that an increase of its median time must exceed to be regarded as a
+regression."""
+NOISE_DEVIATIONS = 3
+
+"""The counters and timed operations whose counts in the results of
+synthetic benchmarks are metrics, which are the ones that count work done.
+Other counts, like hits of a cache or the number of packages listed, change
+when the results or the caching change rather than when the amount of work
+does, so they are recorded but not compared."""
+COST_COUNTERS = frozenset({
+    'repo.match',
+    'version index lookup',
+    'packages expanded',
+    'restrictions processed',
+    'full repository scans'
+})
+
+
+class Metric:
+    """
+    A measured quantity in benchmark results, for which a lower value is
+    better.  A metric is either:
+    - sampled: measured by several runs of a benchmark, like its time, which
+      varies between runs
+    - exact: a count of operations that does not vary between runs, so any
+      increase of it is a regression
+    - neither: measured once, like the memory allocated or a percentile of
+      latencies, which is only compared with the threshold
+    """
+
+    def __init__(
+            self,
+            name: str,
+            value: float,
+            samples: Optional[list[float]] = None,
+            exact: bool = False
+    ):
+        """
+        :param name: the name of the metric, which identifies it among the
+            metrics of results of the same benchmarks on the same inputs
+        :param value: the value of the metric; for a sampled metric, the
+            median of the samples
+        :param samples: the samples of a sampled metric, or 'None' for other
+            metrics
+        :param exact: whether the metric is exact
+        """
+        self.name = name
+        self.value = value
+        self.samples = samples
+        self.exact = exact
+
+    def get_noise(self) -> float:
+        """
+        Get the variation between samples of the metric that is regarded as
+        noise, relative to the metric's value.
+
+        :return: the relative noise, which is 0 if the metric is not sampled
+        """
+        if not self.samples or self.value <= 0:
+            return 0.0
+        median_absolute_deviation = statistics.median(
+            abs(sample - self.value) for sample in self.samples)
+        return NOISE_DEVIATIONS * median_absolute_deviation / self.value
+
+
+def get_machine_fingerprint() -> dict[str, Any]:
+    """
+    Get the properties of this machine and Python interpreter that affect
+    benchmark results, so results measured on different machines are not
+    mistaken for a regression.
+
+    :return: a dictionary that can be serialized into JSON, which maps the
+        name of each property to its value, with an additional key 'id' for
+        a checksum of all the other properties
+    """
+    machine = {
+        'node': platform.node(),
+        'system': platform.system(),
+        'release': platform.release(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation()
+    }
+    machine['id'] = hashlib.md5(json.dumps(
+        machine, sort_keys=True).encode()).hexdigest()[:12]
+    return machine
+
+
+def create_entry(
+        subcommand: str,
+        results: list[dict[str, Any]],
+        label: Optional[str] = None
+) -> dict[str, Any]:
+    """
+    Create an entry of a benchmark history for the results of a run of the
+    benchmark entry point.
+
+    :param subcommand: the subcommand of the benchmark entry point that was
+        run, like 'synthetic'
+    :param results: the results of the run, each of which is a dictionary
+        returned by the functions that run benchmarks in this package
+    :param label: a name for the entry that can be used to choose it as a
+        baseline, like the name of a Git commit
+    :return: a dictionary that can be serialized into JSON, with keys
+        'timestamp', 'label', 'version', which is the version of this
+        program, 'machine', which is the value returned by the
+        'get_machine_fingerprint' function, 'subcommand' and 'results'
+    """
+    return {
+        'timestamp': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(timespec='seconds'),
+        'label': label,
+        'version': __version__,
+        'machine': get_machine_fingerprint(),
+        'subcommand': subcommand,
+        'results': results
+    }
+
+
+def read_history(path: Path) -> list[dict[str, Any]]:
+    """
+    Read the entries of a benchmark history file.
+
+    :param path: the path to the history file
+    :return: the entries from the oldest to the latest, or an empty list if
+        the file does not exist
+    :raise OSError: if the file cannot be read
+    :raise ValueError: if the file is not a benchmark history file in the
+        format this version of the program writes
+    """
+    try:
+        with open(path, encoding='utf-8') as history_file:
+            data = json.load(history_file)
+    except FileNotFoundError:
+        return list()
+    except ValueError as e:
+        raise ValueError(f"{path}: Invalid benchmark history: {e}") from e
+    if not isinstance(data, dict) or \
+            data.get('version') != HISTORY_FORMAT_VERSION or \
+            not isinstance(data.get('entries'), list):
+        raise ValueError(f"{path}: Unsupported benchmark history format")
+    return data['entries']
+
+
+def append_to_history(path: Path, entry: dict[str, Any]) -> None:
+    """
+    Add an entry to the end of a benchmark history file, creating the file
+    if it does not exist.  The file is replaced atomically, so it is never
+    left partially written.
+
+    :param path: the path to the history file
+    :param entry: the entry returned by the 'create_entry' function
+    :raise OSError: if the file cannot be read or written
+    :raise ValueError: if the file exists but is not a benchmark history
+        file in the format this version of the program writes
+    """
+    entries = read_history(path)
+    entries.append(entry)
+    data = {
+        'version': HISTORY_FORMAT_VERSION,
+        'entries': entries
+    }
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(temp_path, 'w', encoding='utf-8') as history_file:
+        json.dump(data, history_file, indent=2)
+    os.replace(temp_path, path)
+
+
+def find_entry(
+        entries: list[dict[str, Any]],
+        ref: str,
+        machine_id: Optional[str] = None,
+        subcommand: Optional[str] = None
+) -> dict[str, Any]:
+    """
+    Find an entry in a benchmark history.
+
+    :param entries: the entries returned by the 'read_history' function
+    :param ref: how to find the entry, which is one of the following:
+        - 'latest': the latest entry of the subcommand 'subcommand' recorded
+          on the machine whose fingerprint ID is 'machine_id'; either
+          condition is not checked if its argument is 'None'
+        - an integer: the index of the entry in the history, where negative
+          indexes count from the latest entry like they do for Python lists
+        - any other string: the label of the entry; if more than one entry
+          has the label, the latest one is found
+    :param machine_id: the fingerprint ID of the machine for 'latest'
+    :param subcommand: the subcommand of the benchmark entry point for
+        'latest', like 'synthetic'
+    :return: the entry found
+    :raise ValueError: if no entry is found
+    """
+    if ref == 'latest':
+        for entry in reversed(entries):
+            if machine_id is not None and \
+                    entry['machine']['id'] != machine_id:
+                continue
+            if subcommand is not None and entry['subcommand'] != subcommand:
+                continue
+            return entry
+        if subcommand is None:
+            raise ValueError("No benchmark results recorded on this machine")
+        raise ValueError(f"No results of benchmark subcommand "
+                         f"{subcommand!r} recorded on this machine")
+    try:
+        index = int(ref)
+    except ValueError:
+        for entry in reversed(entries):
+            if entry['label'] == ref:
+                return entry
+        raise ValueError(f"No benchmark results labeled {ref!r}")
+    try:
+        return entries[index]
+    except IndexError:
+        raise ValueError(f"No benchmark results at index {index}") from None
+
+
+def get_metrics(results: list[dict[str, Any]]) -> dict[str, Metric]:
+    """
+    Get the metrics in benchmark results.  The sizes of package lists are
+    not metrics because they change when the results change rather than when
+    the performance does, and only the counts in 'COST_COUNTERS' are.
+
+    :param results: the results in an entry of a benchmark history
+    :return: the metrics, keyed on their names
+    """
+    metrics = list()
+    for result in results:
+        benchmark = result['benchmark']
+        if benchmark == 'replay':
+            if result['latency'] is None:
+                continue
+            for name, value in result['latency'].items():
+                metrics.append(Metric(f'replay: latency {name}', value))
+            metrics.append(Metric(
+                'replay: errors', result['errors'], exact=True))
+        elif benchmark == 'startup':
+            metrics.append(Metric(
+                f"startup ({result['command']}): time", result['median'],
+                result['times']))
+        elif benchmark == 'memory':
+            source = result.get('packages')
+            source = result['repository'] if source is None \
+                else f'{source} packages'
+            for phase, record in result['phases'].items():
+                metrics.append(Metric(
+                    f'memory ({source}): {phase} peak',
+                    record['peak_traced']))
+                metrics.append(Metric(
+                    f'memory ({source}): {phase} retained',
+                    record['retained']))
+        else:
+            prefix = f"{benchmark} ({result['packages']} packages)"
+            metrics.append(Metric(
+                f'{prefix}: time', result['median'], result['times']))
+            for name, value in result.get('counts', dict()).items():
+                if name in COST_COUNTERS:
+                    metrics.append(Metric(
+                        f'{prefix}: {name}', value, exact=True))
+    return {metric.name: metric for metric in metrics}
+
+
+def compare_entries(
+        baseline: dict[str, Any],
+        current: dict[str, Any],
+        threshold: float = DEFAULT_THRESHOLD
+) -> list[dict[str, Any]]:
+    """
+    Compare the metrics in two entries of a benchmark history.  Metrics that
+    are not in both entries are not compared.
+
+    A metric has regressed if:
+    - it is exact, and its value has increased at all
+    - otherwise, its value has increased by more than 'threshold' relative to
+      the baseline, and, if it is sampled, by more than the noise in the
+      samples of both entries, as returned by the 'Metric.get_noise' method
+
+    :param baseline: the entry to compare with
+    :param current: the entry to compare
+    :param threshold: the relative increase of a metric that is regarded as
+        noise
+    :return: the comparison of each metric, as a dictionary with keys
+        'metric', 'baseline', 'current', 'change', which is the change of the
+        value relative to the baseline or 'None' if the baseline is 0, and
+        'regression'
+    """
+    baseline_metrics = get_metrics(baseline['results'])
+    comparisons = list()
+    for name, metric in get_metrics(current['results']).items():
+        baseline_metric = baseline_metrics.get(name)
+        if baseline_metric is None:
+            continue
+        difference = metric.value - baseline_metric.value
+        change = difference / baseline_metric.value \
+            if baseline_metric.value != 0 else None
+        if metric.exact:
+            regression = difference > 0
+        else:
+            tolerance = max(threshold, baseline_metric.get_noise(),
+                            metric.get_noise())
+            regression = difference > baseline_metric.value * tolerance
+        comparisons.append({
+            'metric': name,
+            'baseline': baseline_metric.value,
+            'current': metric.value,
+            'change': change,
+            'regression': regression
+        })
+    return comparisons
+
+
+def get_unmatched_metrics(
+        baseline: dict[str, Any],
+        current: dict[str, Any]
+) -> list[str]:
+    """
+    Find the metrics in an entry of a benchmark history that are not in
+    another entry and therefore cannot be compared with it, like the metrics
+    of a benchmark that the baseline did not run.
+
+    :param baseline: the entry to compare with
+    :param current: the entry to compare
+    :return: the names of the metrics in 'current' that are not in
+        'baseline', in the order they are in 'current'
+    """
+    baseline_metrics = get_metrics(baseline['results'])
+    return [name for name in get_metrics(current['results'])
+            if name not in baseline_metrics]
+
+
+def format_entry_summary(index: int, entry: dict[str, Any]) -> str:
+    """
+    Format a summary of an entry of a benchmark history in one line.
+
+    :param index: the index of the entry in the history
+    :param entry: the entry
+    :return: the formatted summary, which does not end with a newline
+    """
+    label = entry['label'] if entry['label'] is not None else '-'
+    return f"{index:>5}  {entry['timestamp']:<27}{label:<24}" \
+           f"{entry['version']:<10}{entry['machine']['id']:<14}" \
+           f"{entry['subcommand']}"
+
+
+def format_comparisons(comparisons: list[dict[str, Any]]) -> str:
+    """
+    Format the comparisons of benchmark results for humans to read.
+
+    :param comparisons: the comparisons returned by the 'compare_entries'
+        function
+    :return: the formatted comparisons, which ends with a newline
+    """
+    # Metric names are long, so they are in the last column
+    lines = [f"{'Baseline':>14}{'Current':>14}{'Change':>10}  Metric"]
+    for comparison in comparisons:
+        change = comparison['change']
+        change = '-' if change is None else f'{change:+.1%}'
+        lines.append(f"{comparison['baseline']:>14.6g}"
+                     f"{comparison['current']:>14.6g}{change:>10}  "
+                     f"{comparison['metric']}"
+                     f"{' (regressed)' if comparison['regression'] else ''}")
+    regressions = sum(
+        1 for comparison in comparisons if comparison['regression'])
+    lines.append('')
+    lines.append(f"{len(comparisons)} metrics compared, "
+                 f"{regressions} regressed")
+    return '\n'.join(lines) + '\n'
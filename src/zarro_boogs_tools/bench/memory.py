@@ -0,0 +1,300 @@
+#  zarro-boogs-tools Memory Benchmark
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.bench.synthetic import \
+    SYNTHETIC_PROFILE, SyntheticRepositoryParameters, \
+    get_synthetic_repository, get_top_level_packages
+from zarro_boogs_tools.list import get_target_keyword, iter_package_lists
+from zarro_boogs_tools.package import get_atom_obj_from_str, get_best_version
+from zarro_boogs_tools.pkgcore.profile import get_use_restriction_table
+from zarro_boogs_tools.session import Session
+from zarro_boogs_tools.stats import get_peak_rss
+
+import concurrent.futures
+import contextlib
+import multiprocessing
+import tracemalloc
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, Optional
+
+from nattka.bugzilla import BugCategory
+
+"""The number of allocation sites reported for each phase by default."""
+DEFAULT_TOP_ALLOCATIONS = 5
+
+"""The number of packages in the synthetic repositories measured by
+default.  Tracing allocations makes runs considerably slower, so the
+repositories are smaller than the ones for the other benchmarks."""
+DEFAULT_MEMORY_SIZES = (1000, 10000)
+
+"""The number of main packages package lists are made for in synthetic
+repositories."""
+MEMORY_MAIN_PACKAGES = 10
+
+
+class MemoryTracker:
+    """
+    A recorder of the memory used by phases of a run, which must be entered
+    one after another while tracemalloc is tracing allocations.  For each
+    phase, the following are recorded:
+    - 'peak_traced': the maximum number of bytes allocated by the phase and
+      not freed yet at any point during the phase
+    - 'retained': the number of bytes allocated by the phase and still not
+      freed when the phase ends
+    - 'peak_rss': the maximum resident set size of the process in bytes when
+      the phase ends, or 'None' if it cannot be measured on this system
+    - 'top_allocations': the source lines that allocated the most memory
+      retained by the phase, each as a dictionary with keys 'location',
+      'size' and 'count'
+    The resident set size includes the memory tracemalloc uses for tracing,
+    so it is higher than it is in a run without tracing.
+    """
+
+    def __init__(self, top: int = DEFAULT_TOP_ALLOCATIONS):
+        """
+        :param top: the number of source lines to record in
+            'top_allocations'
+        """
+        self.top = top
+        self.phases = dict()
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure the memory used by a phase.
+
+        :param name: the name of the phase
+        :return: a context manager whose body is the phase
+        """
+        start_snapshot = self._take_snapshot()
+        start_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        yield
+        size, peak = tracemalloc.get_traced_memory()
+        differences = self._take_snapshot().compare_to(
+            start_snapshot, 'lineno')
+        top_allocations = list()
+        for difference in differences[:self.top]:
+            if difference.size_diff <= 0:
+                break
+            frame = difference.traceback[0]
+            top_allocations.append({
+                'location': f'{frame.filename}:{frame.lineno}',
+                'size': difference.size_diff,
+                'count': difference.count_diff
+            })
+        self.phases[name] = {
+            'peak_traced': peak - start_size,
+            'retained': size - start_size,
+            'peak_rss': get_peak_rss(),
+            'top_allocations': top_allocations
+        }
+
+
+def measure_memory(
+        repo_path: Path,
+        profile_path: str,
+        atom_strs: list[str],
+        keyword_change_type: Optional[BugCategory] = None,
+        top: int = DEFAULT_TOP_ALLOCATIONS
+) -> dict[str, Any]:
+    """
+    Measure the memory used by each phase of making the package lists for
+    some atoms in an ebuild repository, in the same way as the 'ls'
+    subcommand makes them without the persistent dependency cache.
+
+    The package lists are made with the 'iter_package_lists' function of the
+    'list' module, whose output is then collected into package lists like
+    the 'get_package_lists' function does, so the breadth-first search and
+    the construction of the result are measured as separate phases.
+
+    Allocations are traced by tracemalloc, which slows the run down
+    considerably.  The peak resident set size only ever grows in a process,
+    so call the 'measure_memory_in_new_process' function instead to measure
+    more than one run.
+
+    :param repo_path: the path to the repository, which must not have any
+        masters
+    :param profile_path: the path to the target profile relative to the
+        repository's profiles directory
+    :param atom_strs: the atoms of the main packages
+    :param keyword_change_type: the type of keyword change to perform; omit
+        or specify 'None' to have the type be inferred
+    :param top: the number of source lines to report for each phase
+    :return: a dictionary that can be serialized into JSON, with keys
+        'benchmark', 'repository', 'phases', which maps the name of each
+        phase to the record described in the documentation of the
+        MemoryTracker class, and 'closure_size', which is the total number
+        of packages in the package lists
+    :raise ValueError: if the profile is unknown, or no package matches an
+        atom
+    """
+    tracker = MemoryTracker(top)
+    tracemalloc.start()
+    try:
+        with tracker.phase('load repository'):
+            repo_state = Session().get_repository_state(
+                repo_path, needs_domain=False)
+        repo = repo_state.repo
+
+        with tracker.phase('select main packages'):
+            main_packages = list()
+            for atom_str in atom_strs:
+                main_package = get_best_version(
+                    get_atom_obj_from_str(atom_str), repo,
+                    cache=repo_state.cache)
+                if main_package is None:
+                    raise ValueError(
+                        f"{atom_str}: "
+                        f"Could not find a matching package for atom")
+                main_packages.append(main_package)
+
+        with tracker.phase('load profile'):
+            profile = repo_state.get_profile(profile_path)
+            if profile is None:
+                raise ValueError(f"Unknown profile: {profile_path}")
+            # Profiles are loaded lazily, so load everything the search
+            # reads from the profile
+            get_use_restriction_table(profile)
+        target_keyword = get_target_keyword(
+            profile, main_packages, keyword_change_type)
+
+        with tracker.phase('search dependency graphs'):
+            found = list(iter_package_lists(
+                repo, main_packages, profile, target_keyword,
+                cache=repo_state.cache,
+                keyword_index=repo_state.keyword_index))
+
+        with tracker.phase('construct package lists'):
+            package_lists = {pkg: list() for pkg in main_packages}
+            for main_package, pkg in found:
+                package_lists[main_package].append(pkg)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'benchmark': 'memory',
+        'repository': str(repo_path),
+        'phases': tracker.phases,
+        'closure_size': sum(map(len, package_lists.values()))
+    }
+
+
+def measure_memory_in_new_process(
+        repo_path: Path,
+        profile_path: str,
+        atom_strs: list[str],
+        keyword_change_type: Optional[BugCategory] = None,
+        top: int = DEFAULT_TOP_ALLOCATIONS
+) -> dict[str, Any]:
+    """
+    Call the 'measure_memory' function in a new Python interpreter process,
+    so the peak resident set size is not affected by the memory used by
+    this process.
+
+    :param repo_path: see the 'measure_memory' function
+    :param profile_path: see the 'measure_memory' function
+    :param atom_strs: see the 'measure_memory' function
+    :param keyword_change_type: see the 'measure_memory' function
+    :param top: see the 'measure_memory' function
+    :return: the value returned by the 'measure_memory' function
+    :raise ValueError: see the 'measure_memory' function
+    :raise concurrent.futures.process.BrokenProcessPool: if the new process
+        is terminated abruptly
+    """
+    # Unlike a multiprocessing pool, which starts a new worker and waits
+    # forever if its worker is killed, the executor raises BrokenProcessPool
+    # if the process is killed, e.g. by the out-of-memory killer
+    with concurrent.futures.ProcessPoolExecutor(
+            1, multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(
+            measure_memory, repo_path, profile_path, atom_strs,
+            keyword_change_type, top).result()
+
+
+def run_memory_suite(
+        work_dir: Path,
+        sizes: Iterable[int] = DEFAULT_MEMORY_SIZES,
+        top: int = DEFAULT_TOP_ALLOCATIONS
+) -> list[dict[str, Any]]:
+    """
+    Measure the memory used to make package lists for keywording the
+    packages on the top level of synthetic repositories of different sizes,
+    each in a new process.  Repositories are generated under a directory if
+    they have not been generated before.
+
+    :param work_dir: the directory to keep generated repositories in
+    :param sizes: the numbers of packages in the repositories
+    :param top: the number of source lines to report for each phase
+    :return: the value returned by the 'measure_memory' function for each
+        repository, with an additional key 'packages' for the number of
+        packages in the repository
+    :raise OSError: if a repository cannot be generated
+    """
+    results = list()
+    for size in sizes:
+        parameters = SyntheticRepositoryParameters(packages=size)
+        path = get_synthetic_repository(work_dir, parameters)
+        result = measure_memory_in_new_process(
+            path, SYNTHETIC_PROFILE,
+            get_top_level_packages(parameters)[:MEMORY_MAIN_PACKAGES],
+            BugCategory.KEYWORDREQ, top)
+        result['packages'] = size
+        results.append(result)
+    return results
+
+
+def format_memory_results(results: list[dict[str, Any]]) -> str:
+    """
+    Format the results of memory benchmarks for humans to read.
+
+    :param results: the values returned by the 'measure_memory' function
+    :return: the formatted results, which ends with a newline
+    """
+    lines = list()
+    for result in results:
+        if lines:
+            lines.append('')
+        lines.append(f"Repository: {result['repository']}")
+        lines.append(f"{'Phase':<36}{'Peak':>12}{'Retained':>12}"
+                     f"{'Peak RSS':>12}")
+        for name, record in result['phases'].items():
+            peak_rss = record['peak_rss']
+            peak_rss = '-' if peak_rss is None \
+                else f'{peak_rss / 1048576:.1f}MiB'
+            lines.append(f"{name:<36}"
+                         f"{record['peak_traced'] / 1048576:>9.1f}MiB"
+                         f"{record['retained'] / 1048576:>9.1f}MiB"
+                         f"{peak_rss:>12}")
+        for name, record in result['phases'].items():
+            if not record['top_allocations']:
+                continue
+            lines.append('')
+            lines.append(f"Top allocations in phase '{name}':")
+            for allocation in record['top_allocations']:
+                lines.append(f"{allocation['size'] / 1024:>12.1f}KiB  "
+                             f"{allocation['location']}")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,343 @@
+#  zarro-boogs-tools Replay Benchmark for Recorded Requests
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.index import get_version_index
+from zarro_boogs_tools.inference import is_stabilizing
+from zarro_boogs_tools.list import get_package_lists
+from zarro_boogs_tools.package import \
+    check_atom_obj_for_keywording, get_atom_obj_from_str, get_best_version
+from zarro_boogs_tools.pkgcore.profile import get_use_restriction_table
+from zarro_boogs_tools.pkgcore.restriction import PREPROCESS_CACHE
+from zarro_boogs_tools.session import RepositoryState, Session
+
+import json
+import math
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from nattka.bugzilla import BugCategory
+
+"""The percentiles of request latencies reported by replay benchmarks."""
+LATENCY_PERCENTILES = (50, 90, 95, 99)
+
+
+class ReplayRequest:
+    """
+    A recorded keywording or stabilization request to replay.
+
+    In a corpus file, each request is a JSON object on its own line, with the
+    following keys:
+    - 'atoms': a list of the atoms of the main packages, like
+      '=dev-java/ant-core-1.10.9-r3'
+    - 'profile': the target profile, like 'default/linux/amd64/17.1', which
+      must be listed in the repository's profiles.desc file
+    - 'arch' (optional): the architecture to keyword or stabilize for; the
+      profile's architecture is used if omitted
+    - 'keyword_change_type' (optional): 'KEYWORDREQ' or 'STABLEREQ'; the
+      type is inferred from the main packages' keywords if omitted
+    - 'match_keyword' (optional): the keyword to prefer versions of
+      dependencies that have, like the '-m' option
+    - 'id' (optional): a name for the request in reports, like a bug number
+    Empty lines are ignored.
+    """
+
+    def __init__(
+            self,
+            atoms: list[str],
+            profile: str,
+            arch: Optional[str] = None,
+            keyword_change_type: Optional[BugCategory] = None,
+            match_keyword: Optional[str] = None,
+            request_id: Optional[str] = None
+    ):
+        """
+        See the class documentation for the meaning of the parameters.
+        """
+        self.atoms = atoms
+        self.profile = profile
+        self.arch = arch
+        self.keyword_change_type = keyword_change_type
+        self.match_keyword = match_keyword
+        self.request_id = request_id
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'ReplayRequest':
+        """
+        Create a request from a JSON object in a corpus file.
+
+        :param data: the deserialized JSON object
+        :return: the request
+        :raise ValueError: if the object is not a valid request
+        """
+        if not isinstance(data, dict):
+            raise ValueError("Request is not a JSON object")
+        atoms = data.get('atoms')
+        if not isinstance(atoms, list) or len(atoms) == 0 or \
+                not all(isinstance(a, str) for a in atoms):
+            raise ValueError("'atoms' is not a non-empty list of strings")
+        profile = data.get('profile')
+        if not isinstance(profile, str):
+            raise ValueError("'profile' is not a string")
+        keyword_change_type = data.get('keyword_change_type')
+        if keyword_change_type is not None:
+            if keyword_change_type not in ('KEYWORDREQ', 'STABLEREQ'):
+                raise ValueError(
+                    "'keyword_change_type' is neither 'KEYWORDREQ' nor "
+                    "'STABLEREQ'")
+            keyword_change_type = BugCategory[keyword_change_type]
+        request_id = data.get('id')
+        return cls(atoms, profile, data.get('arch'), keyword_change_type,
+                   data.get('match_keyword'),
+                   None if request_id is None else str(request_id))
+
+
+def read_corpus(path: Path) -> list[ReplayRequest]:
+    """
+    Read the requests in a corpus file.  See the documentation for the
+    ReplayRequest class for the format of the file.
+
+    :param path: the path to the corpus file
+    :return: the requests in the order they are listed
+    :raise OSError: if the file cannot be read
+    :raise ValueError: if the file contains an invalid request
+    """
+    requests = list()
+    with open(path, encoding='utf-8') as corpus_file:
+        for line_number, line in enumerate(corpus_file, 1):
+            if not line.strip():
+                continue
+            try:
+                request = ReplayRequest.from_dict(json.loads(line))
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from e
+            if request.request_id is None:
+                request.request_id = f'{path.name}:{line_number}'
+            requests.append(request)
+    return requests
+
+
+def replay_request(
+        repo_state: RepositoryState,
+        request: ReplayRequest,
+        warm: bool = False
+) -> dict[str, Any]:
+    """
+    Replay a request through the 'get_package_lists' function of the 'list'
+    module, and measure the time it takes from selecting the main packages
+    until the package lists are complete.
+
+    :param repo_state: the state of the repository snapshot to replay the
+        request on
+    :param request: the request
+    :param warm: whether to use the caches in 'repo_state', which contain
+        the results of the requests replayed before, like the 'serve'
+        subcommand does; otherwise, the repository snapshot is loaded again
+        and every cache is cleared before the time starts being measured, so
+        nothing loaded for an earlier request is reused, like in a separate
+        run of the 'ls' subcommand
+    :return: a dictionary that can be serialized into JSON, with keys 'id',
+        'keyword', 'latency' in seconds, 'closure_sizes', which is the
+        number of packages in each package list, and 'error', which is
+        'None' unless the request cannot be replayed
+    """
+    record = {
+        'id': request.request_id,
+        'keyword': None,
+        'latency': None,
+        'closure_sizes': None,
+        'error': None
+    }
+    if not warm:
+        # Besides the caches in the state, the version index and the USE flag
+        # restriction tables are cached for the repository and profile
+        # objects, and pkgcore keeps the metadata of packages it has loaded
+        repo_state = Session().get_repository_state(
+            Path(repo_state.repo.location), needs_domain=False)
+        PREPROCESS_CACHE.clear()
+        get_version_index.cache_clear()
+        get_use_restriction_table.cache_clear()
+    profile = repo_state.get_profile(request.profile)
+    if profile is None:
+        record['error'] = f"Unknown profile: {request.profile}"
+        return record
+    cache = repo_state.cache
+    keyword_index = repo_state.keyword_index
+
+    start = time.perf_counter()
+    main_packages = list()
+    for atom_str in request.atoms:
+        try:
+            atom_obj = get_atom_obj_from_str(atom_str)
+        except ValueError as e:
+            record['error'] = f"{atom_str}: {e}"
+            return record
+        check_result = check_atom_obj_for_keywording(atom_obj)
+        if check_result is not None:
+            record['error'] = f"{atom_str}: {check_result}"
+            return record
+        main_package = get_best_version(atom_obj, repo_state.repo, cache=cache)
+        if main_package is None:
+            record['error'] = \
+                f"{atom_str}: Could not find a matching package for atom"
+            return record
+        main_packages.append(main_package)
+    arch = request.arch if request.arch is not None else profile.arch
+    if request.keyword_change_type is None:
+        stable = is_stabilizing(main_packages, [arch])
+    else:
+        stable = request.keyword_change_type == BugCategory.STABLEREQ
+    target_keyword = arch if stable else f'~{arch}'
+    package_lists = get_package_lists(
+        repo_state.repo, main_packages, profile, target_keyword,
+        request.match_keyword, cache, keyword_index=keyword_index)
+    record['latency'] = time.perf_counter() - start
+    record['keyword'] = target_keyword
+    record['closure_sizes'] = [
+        len(package_list) for package_list in package_lists.values()]
+    return record
+
+
+def replay_corpus(
+        repo_path: Path,
+        requests: list[ReplayRequest],
+        repeat: int = 1,
+        warm: bool = False
+) -> list[dict[str, Any]]:
+    """
+    Replay the requests in a corpus on a repository snapshot.  The snapshot
+    is loaded once without the system's Portage configuration, so it must
+    not have any masters.
+
+    :param repo_path: the path to the repository snapshot
+    :param requests: the requests
+    :param repeat: the number of times to replay the whole corpus
+    :param warm: see the 'replay_request' function
+    :return: the record returned by the 'replay_request' function for each
+        request each time it is replayed
+    """
+    repo_state = Session().get_repository_state(
+        repo_path, needs_domain=False)
+    records = list()
+    for _ in range(repeat):
+        for request in requests:
+            records.append(replay_request(repo_state, request, warm))
+    return records
+
+
+def get_percentile(values: list[float], percentile: float) -> float:
+    """
+    Compute a percentile of some values, interpolating linearly between the
+    closest ranks.
+
+    :param values: the values, which must not be empty
+    :param percentile: the percentile, from 0 to 100
+    :return: the percentile of the values
+    """
+    values = sorted(values)
+    rank = (len(values) - 1) * percentile / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def summarize_replay(records: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Summarize the latencies and closure sizes of replayed requests.
+
+    :param records: the records returned by the 'replay_corpus' function
+    :return: a dictionary that can be serialized into JSON, with keys
+        'benchmark', 'requests', 'errors', 'latency' and 'closure_size';
+        'latency' maps 'mean', 'max' and 'pN' for each percentile N in
+        'LATENCY_PERCENTILES' to the latency in seconds, and 'closure_size'
+        maps 'min', 'median', 'max' and 'total' to a number of packages in
+        package lists; both are 'None' if no request was replayed
+        successfully
+    """
+    replayed = [record for record in records if record['error'] is None]
+    summary = {
+        'benchmark': 'replay',
+        'requests': len(records),
+        'errors': len(records) - len(replayed),
+        'latency': None,
+        'closure_size': None
+    }
+    if not replayed:
+        return summary
+    latencies = [record['latency'] for record in replayed]
+    summary['latency'] = {'mean': statistics.mean(latencies)}
+    for percentile in LATENCY_PERCENTILES:
+        summary['latency'][f'p{percentile}'] = \
+            get_percentile(latencies, percentile)
+    summary['latency']['max'] = max(latencies)
+    closure_sizes = [size for record in replayed
+                     for size in record['closure_sizes']]
+    summary['closure_size'] = {
+        'min': min(closure_sizes),
+        'median': statistics.median(closure_sizes),
+        'max': max(closure_sizes),
+        'total': sum(closure_sizes)
+    }
+    return summary
+
+
+def format_replay(
+        records: list[dict[str, Any]],
+        summary: dict[str, Any],
+        slowest: int = 5
+) -> str:
+    """
+    Format the results of a replay benchmark for humans to read.
+
+    :param records: the records returned by the 'replay_corpus' function
+    :param summary: the summary of the records returned by the
+        'summarize_replay' function
+    :param slowest: the number of slowest requests to list
+    :return: the formatted results, which ends with a newline
+    """
+    lines = [f"{'Requests':<36}{summary['requests']:>10}",
+             f"{'Errors':<36}{summary['errors']:>10}"]
+    if summary['latency'] is not None:
+        lines.append('')
+        lines.append(f"{'Latency':<36}{'Time':>10}")
+        for name, value in summary['latency'].items():
+            lines.append(f"{name:<36}{value:>9.3f}s")
+        lines.append('')
+        lines.append(f"{'Closure size':<36}{'Packages':>10}")
+        for name, value in summary['closure_size'].items():
+            lines.append(f"{name:<36}{value:>10g}")
+        lines.append('')
+        lines.append(f"{'Slowest request':<36}{'Time':>10}{'Packages':>10}")
+        replayed = sorted(
+            (record for record in records if record['error'] is None),
+            key=lambda record: record['latency'], reverse=True)
+        for record in replayed[:slowest]:
+            lines.append(f"{record['id']:<36}{record['latency']:>9.3f}s"
+                         f"{sum(record['closure_sizes']):>10}")
+    # Requests replayed more than once fail in the same way every time
+    errors = dict.fromkeys(
+        f"{record['id']}: {record['error']}" for record in records
+        if record['error'] is not None)
+    if errors:
+        lines.append('')
+        lines.extend(errors)
+    return '\n'.join(lines) + '\n'
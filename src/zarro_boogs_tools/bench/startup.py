@@ -0,0 +1,78 @@
+#  zarro-boogs-tools Startup Time Benchmark
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+
+"""The number of times the program is started by default."""
+DEFAULT_STARTUP_REPEAT = 20
+
+"""The command-line arguments the program is started with, which make it
+exit as soon as the modules needed to parse arguments are imported."""
+STARTUP_ARGS = ('--version',)
+
+
+def run_startup_benchmark(
+        repeat: int = DEFAULT_STARTUP_REPEAT) -> dict[str, Any]:
+    """
+    Measure the time it takes to start zbt and print its version, each time
+    in a new Python process, so the time includes importing every module
+    imported at startup from scratch.  An increase of the time means that
+    a module that slows down startup is imported before it is needed.
+
+    :param repeat: the number of times to start the program
+    :return: a dictionary that can be serialized into JSON, with keys
+        'benchmark', which is 'startup', 'command', 'times', 'min' and
+        'median', where 'times' is the wall-clock time of each run in seconds
+    :raise subprocess.CalledProcessError: if a run fails
+    """
+    args = [sys.executable, '-m', 'zarro_boogs_tools', *STARTUP_ARGS]
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return {
+        'benchmark': 'startup',
+        'command': ' '.join(['zbt', *STARTUP_ARGS]),
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times)
+    }
+
+
+def format_startup_result(result: dict[str, Any]) -> str:
+    """
+    Format the result of the startup time benchmark for humans to read.
+
+    :param result: the result returned by the 'run_startup_benchmark'
+        function
+    :return: the formatted result, which ends with a newline
+    """
+    lines = [f"{'Command':<36}{'Runs':>10}{'Min':>10}{'Median':>10}",
+             f"{result['command']:<36}{len(result['times']):>10}"
+             f"{result['min']:>9.3f}s{result['median']:>9.3f}s"]
+    return '\n'.join(lines) + '\n'
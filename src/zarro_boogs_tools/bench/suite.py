@@ -0,0 +1,294 @@
+#  zarro-boogs-tools Benchmark Suite
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.bench.synthetic import \
+    SYNTHETIC_ARCH, SYNTHETIC_PROFILE, SyntheticRepositoryParameters, \
+    get_synthetic_repository, get_top_level_packages
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, \
+    get_keyword_matching_pkg_filter, get_packages_to_process
+from zarro_boogs_tools.pkgcore.profile import package_use_masked_in_profile
+from zarro_boogs_tools.pkgcore.repository import open_standalone_repository
+from zarro_boogs_tools.pkgcore.restriction import \
+    PREPROCESS_CACHE, preprocess_restriction
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, Callable
+
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+"""The numbers of packages in the synthetic repositories benchmarked by
+default."""
+DEFAULT_SIZES = (1000, 10000, 30000)
+
+"""The number of times each benchmark is run by default."""
+DEFAULT_REPEAT = 5
+
+"""The number of main packages package lists are made for."""
+MAIN_PACKAGES = 10
+
+"""The number of packages whose dependencies and USE flags are processed by
+the benchmarks of single functions."""
+SAMPLE_PACKAGES = 1000
+
+"""A type alias for benchmarks.  A benchmark is called with the path to a
+synthetic repository and its parameters before each run, and it returns the
+function to time, so the preparation for the run is not timed."""
+Benchmark = Callable[[Path, SyntheticRepositoryParameters],
+                     Callable[[], None]]
+
+
+class BenchmarkInput:
+    """
+    The objects a benchmark run works on, which are loaded anew before each
+    run, so no run benefits from what pkgcore has cached in the objects
+    during the previous runs.
+    """
+
+    def __init__(self, path: Path, parameters: SyntheticRepositoryParameters):
+        """
+        :param path: the path to the synthetic repository
+        :param parameters: the parameters of the repository
+        """
+        self.repo: UnconfiguredTree = open_standalone_repository(path)
+        self.profile = OnDiskProfile(
+            str(path / 'profiles'), SYNTHETIC_PROFILE)
+        self.main_packages: list[package] = [
+            get_best_version(get_atom_obj_from_str(key), self.repo)
+            for key in get_top_level_packages(parameters)[:MAIN_PACKAGES]]
+        PREPROCESS_CACHE.clear()
+
+    def get_sample_packages(self) -> list[package]:
+        """
+        Get the packages processed by the benchmarks of single functions,
+        which are the first versions in the repository.
+
+        :return: the packages
+        """
+        sample = list()
+        for pkg in self.repo:
+            if len(sample) >= SAMPLE_PACKAGES:
+                break
+            sample.append(pkg)
+        return sample
+
+
+def bench_get_packages_to_process(
+        path: Path, parameters: SyntheticRepositoryParameters) \
+        -> Callable[[], None]:
+    """
+    Benchmark making the package lists for keywording the packages on the
+    top level of a synthetic repository, sharing one cache for best versions
+    of packages like the 'ls' subcommand does.
+    """
+    bench_input = BenchmarkInput(path, parameters)
+    target_keyword = f'~{SYNTHETIC_ARCH}'
+    pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
+
+    def run() -> None:
+        cache = LRUCache()
+        for main_package in bench_input.main_packages:
+            get_packages_to_process(
+                main_package, target_keyword, bench_input.repo, pkg_filter,
+                bench_input.profile, cache)
+
+    return run
+
+
+def bench_preprocess_restriction(
+        path: Path, parameters: SyntheticRepositoryParameters) \
+        -> Callable[[], None]:
+    """
+    Benchmark preprocessing the dependencies of packages in a synthetic
+    repository without any cache.  The dependencies are parsed before the
+    run.
+    """
+    bench_input = BenchmarkInput(path, parameters)
+    restrictions = list()
+    for pkg in bench_input.get_sample_packages():
+        for restrict in pkg.rdepend.restrictions:
+            restrictions.append((restrict, pkg))
+
+    def run() -> None:
+        for restrict, pkg in restrictions:
+            preprocess_restriction(
+                restrict, pkg, bench_input.profile, False, None)
+
+    return run
+
+
+def bench_package_use_masked_in_profile(
+        path: Path, parameters: SyntheticRepositoryParameters) \
+        -> Callable[[], None]:
+    """
+    Benchmark querying whether every USE flag of synthetic repositories is
+    masked for packages, including the compilation of the profile's USE flag
+    restrictions on the first query.
+    """
+    bench_input = BenchmarkInput(path, parameters)
+    packages = bench_input.get_sample_packages()
+    use_flags = [f'flag{flag}' for flag in range(parameters.use_flags)]
+
+    def run() -> None:
+        for pkg in packages:
+            for use_flag in use_flags:
+                package_use_masked_in_profile(
+                    pkg, use_flag, bench_input.profile, False)
+
+    return run
+
+
+def bench_zbt_ls(
+        path: Path, parameters: SyntheticRepositoryParameters) \
+        -> Callable[[], None]:
+    """
+    Benchmark a complete 'zbt ls' run in a new process for the packages on
+    the top level of a synthetic repository, without the persistent
+    dependency cache.
+    """
+    portage_config = tempfile.mkdtemp()
+    args = [sys.executable, '-m', 'zarro_boogs_tools',
+            '--portage-config', portage_config, '-r', str(path),
+            '--no-cache', '-k', 'ls', '-p', SYNTHETIC_PROFILE]
+    args.extend(get_top_level_packages(parameters)[:MAIN_PACKAGES])
+
+    def run() -> None:
+        try:
+            subprocess.run(args, stdout=subprocess.DEVNULL, check=True)
+        finally:
+            os.rmdir(portage_config)
+
+    return run
+
+
+"""The benchmarks in the suite, keyed on their names."""
+BENCHMARKS: dict[str, Benchmark] = {
+    'get_packages_to_process': bench_get_packages_to_process,
+    'preprocess_restriction': bench_preprocess_restriction,
+    'package_use_masked_in_profile': bench_package_use_masked_in_profile,
+    'zbt ls': bench_zbt_ls
+}
+
+
+def run_benchmark(
+        name: str,
+        path: Path,
+        parameters: SyntheticRepositoryParameters,
+        repeat: int = DEFAULT_REPEAT
+) -> dict[str, Any]:
+    """
+    Run a benchmark on a synthetic repository several times.  The first run
+    collects statistics to count the operations done by the benchmark, which
+    do not vary between runs, unlike their times.
+
+    :param name: the name of the benchmark in 'BENCHMARKS'
+    :param path: the path to the synthetic repository
+    :param parameters: the parameters of the repository
+    :param repeat: the number of times to run the benchmark
+    :return: a dictionary that can be serialized into JSON, with keys
+        'benchmark', 'packages', 'times', 'min', 'median' and 'counts', where
+        'times' is the wall-clock time of each run in seconds, and 'counts'
+        maps the name of each counter and of each timed operation, like
+        'version index lookup', to the value of the counter or the number of
+        calls to the operation in the first run; operations done in other
+        processes, like by 'zbt ls' runs, are not counted
+    :raise subprocess.CalledProcessError: if a 'zbt ls' run fails
+    """
+    times = list()
+    counts = dict()
+    for index in range(repeat):
+        run = BENCHMARKS[name](path, parameters)
+        collector = stats.enable() if index == 0 else None
+        try:
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        finally:
+            if collector is not None:
+                stats.disable()
+        if collector is not None:
+            report = collector.get_report()
+            counts.update(report['counters'])
+            counts.update((operation, record['calls'])
+                          for operation, record in report['timers'].items())
+    return {
+        'benchmark': name,
+        'packages': parameters.packages,
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+        'counts': counts
+    }
+
+
+def run_suite(
+        work_dir: Path,
+        sizes: Iterable[int] = DEFAULT_SIZES,
+        names: Iterable[str] = tuple(BENCHMARKS),
+        repeat: int = DEFAULT_REPEAT
+) -> list[dict[str, Any]]:
+    """
+    Run benchmarks on synthetic repositories of different sizes, generating
+    the repositories under a directory if they have not been generated
+    before.  Other than the number of packages, the repositories are
+    generated with the default parameters.
+
+    :param work_dir: the directory to keep generated repositories in
+    :param sizes: the numbers of packages in the repositories
+    :param names: the names of the benchmarks to run
+    :param repeat: the number of times to run each benchmark
+    :return: the result of each benchmark on each repository, as returned by
+        the 'run_benchmark' function
+    :raise OSError: if a repository cannot be generated
+    :raise subprocess.CalledProcessError: if a 'zbt ls' run fails
+    """
+    results = list()
+    for size in sizes:
+        parameters = SyntheticRepositoryParameters(packages=size)
+        path = get_synthetic_repository(work_dir, parameters)
+        for name in names:
+            results.append(run_benchmark(name, path, parameters, repeat))
+    return results
+
+
+def format_results(results: list[dict[str, Any]]) -> str:
+    """
+    Format benchmark results for humans to read.
+
+    :param results: the results returned by the 'run_suite' function
+    :return: the formatted results, which ends with a newline
+    """
+    lines = [f"{'Benchmark':<36}{'Packages':>10}{'Min':>10}{'Median':>10}"]
+    for result in results:
+        lines.append(f"{result['benchmark']:<36}{result['packages']:>10}"
+                     f"{result['min']:>9.3f}s{result['median']:>9.3f}s")
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,358 @@
+#  zarro-boogs-tools Synthetic Ebuild Repository Generator
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any
+
+"""The name of the profile of synthetic repositories."""
+SYNTHETIC_PROFILE = 'default'
+
+"""The architecture of the profile of synthetic repositories, which is the
+architecture keywords are added for."""
+SYNTHETIC_ARCH = 'riscv'
+
+"""The architecture every package in synthetic repositories is keyworded
+for, which can be used with the '-m' option."""
+SYNTHETIC_MATCH_ARCH = 'amd64'
+
+"""The number of packages in each category of synthetic repositories."""
+PACKAGES_PER_CATEGORY = 100
+
+_EBUILD_TEMPLATE = """\
+# Copyright 2022 zarro-boogs-tools Contributors
+# Distributed under the terms of the GNU General Public License v2
+
+EAPI=8
+
+DESCRIPTION="Synthetic package"
+HOMEPAGE="https://example.org"
+
+LICENSE="GPL-2"
+SLOT="0"
+KEYWORDS="{keywords}"
+IUSE="{iuse}"
+
+RDEPEND="{rdepend}"
+"""
+
+
+class SyntheticRepositoryParameters:
+    """
+    The parameters of a synthetic ebuild repository generated by the
+    'generate_repository' function.
+
+    Packages are arranged in levels: packages on a level only depend on
+    packages on the levels below it, and most of their dependencies are on
+    the level right below, so the dependency graph of a package on the top
+    level is as deep as the number of levels.  Every version of a package has
+    the same dependencies.
+    """
+
+    def __init__(
+            self,
+            packages: int = 1000,
+            versions: int = 3,
+            fan_out: int = 3,
+            depth: int = 6,
+            any_of_density: float = 0.1,
+            use_conditional_density: float = 0.2,
+            use_flags: int = 32,
+            use_mask_size: int = 4,
+            package_use_mask_size: int = 50,
+            keyworded_ratio: float = 0.3,
+            seed: int = 0
+    ):
+        """
+        :param packages: the number of packages, as in ${CATEGORY}/${PN}
+        :param versions: the number of versions of each package
+        :param fan_out: the number of dependencies of each package not on the
+            bottom level
+        :param depth: the number of levels of packages
+        :param any_of_density: the probability that a dependency is an any-of
+            group of two packages
+        :param use_conditional_density: the probability that a dependency is
+            in a USE-conditional group
+        :param use_flags: the number of USE flags that USE-conditional groups
+            may be conditional upon
+        :param use_mask_size: the number of USE flags masked in the profile's
+            use.mask file
+        :param package_use_mask_size: the number of lines in the profile's
+            package.use.mask file, every fourth of which only applies to some
+            versions of a package
+        :param keyworded_ratio: the probability that the versions of a package
+            other than the latest one already have the testing keyword for the
+            profile's architecture
+        :param seed: the seed of the random number generator; repositories
+            generated with the same parameters are identical
+        """
+        self.packages = packages
+        self.versions = versions
+        self.fan_out = fan_out
+        self.depth = depth
+        self.any_of_density = any_of_density
+        self.use_conditional_density = use_conditional_density
+        self.use_flags = use_flags
+        self.use_mask_size = use_mask_size
+        self.package_use_mask_size = package_use_mask_size
+        self.keyworded_ratio = keyworded_ratio
+        self.seed = seed
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Get the parameters as a dictionary.
+
+        :return: a dictionary that can be serialized into JSON, which maps the
+            name of each parameter to its value
+        """
+        return dict(vars(self))
+
+    def get_fingerprint(self) -> str:
+        """
+        Compute a checksum that identifies the repository generated with the
+        parameters.
+
+        :return: a hexadecimal checksum of the parameters
+        """
+        return hashlib.md5(json.dumps(
+            self.to_dict(), sort_keys=True).encode()).hexdigest()
+
+
+def get_package_key(index: int) -> str:
+    """
+    Get the ${CATEGORY}/${PN} of a package in a synthetic repository.
+
+    :param index: the index of the package, from 0 to the number of packages
+        in the repository minus 1
+    :return: the ${CATEGORY}/${PN} of the package
+    """
+    return f'cat-{index // PACKAGES_PER_CATEGORY:03d}/pkg{index:05d}'
+
+
+def get_level(parameters: SyntheticRepositoryParameters, index: int) -> int:
+    """
+    Get the level of a package in a synthetic repository.  Packages with
+    smaller indexes are on higher levels, so the first packages are on the
+    top level.
+
+    :param parameters: the parameters of the repository
+    :param index: the index of the package
+    :return: the level of the package, where 0 is the top level
+    """
+    return index * parameters.depth // parameters.packages
+
+
+def get_top_level_packages(parameters: SyntheticRepositoryParameters) \
+        -> list[str]:
+    """
+    Get the packages on the top level of a synthetic repository, which have
+    the deepest dependency graphs and are the ones to make package lists for
+    in benchmarks.
+
+    :param parameters: the parameters of the repository
+    :return: the ${CATEGORY}/${PN} of each package on the top level
+    """
+    return [get_package_key(index) for index in range(parameters.packages)
+            if get_level(parameters, index) == 0]
+
+
+def _get_level_range(
+        parameters: SyntheticRepositoryParameters, level: int) \
+        -> range:
+    start = -(-level * parameters.packages // parameters.depth)
+    end = -(-(level + 1) * parameters.packages // parameters.depth)
+    return range(start, end)
+
+
+def _get_dependency(
+        parameters: SyntheticRepositoryParameters,
+        rng: random.Random,
+        level: int,
+        iuse: set[str]
+) -> str:
+    def choose_package() -> str:
+        # Prefer the next level so dependency graphs are as deep as there
+        # are levels
+        if level + 2 < parameters.depth and rng.random() < 0.25:
+            dep_level = rng.randrange(level + 2, parameters.depth)
+        else:
+            dep_level = level + 1
+        key = get_package_key(
+            rng.choice(_get_level_range(parameters, dep_level)))
+        if rng.random() < 0.25:
+            return f'>={key}-1'
+        return key
+
+    dependency = choose_package()
+    if rng.random() < parameters.any_of_density:
+        dependency = f'|| ( {dependency} {choose_package()} )'
+    if parameters.use_flags > 0 and \
+            rng.random() < parameters.use_conditional_density:
+        use_flag = f'flag{rng.randrange(parameters.use_flags)}'
+        iuse.add(use_flag)
+        dependency = f'{use_flag}? ( {dependency} )'
+    return dependency
+
+
+def _write_file(path: Path, contents: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(contents)
+
+
+def _write_profiles(
+        path: Path,
+        parameters: SyntheticRepositoryParameters,
+        rng: random.Random
+) -> None:
+    profiles = path / 'profiles'
+    categories = sorted({get_package_key(index).split('/')[0]
+                         for index in range(parameters.packages)})
+    _write_file(profiles / 'repo_name', 'synthetic\n')
+    _write_file(profiles / 'eapi', '8\n')
+    _write_file(profiles / 'categories', ''.join(
+        f'{category}\n' for category in categories))
+    _write_file(profiles / 'arch.list',
+                f'{SYNTHETIC_MATCH_ARCH}\n{SYNTHETIC_ARCH}\n')
+    _write_file(profiles / 'profiles.desc',
+                f'{SYNTHETIC_ARCH} {SYNTHETIC_PROFILE} stable\n')
+
+    profile = profiles / SYNTHETIC_PROFILE
+    _write_file(profile / 'eapi', '8\n')
+    _write_file(profile / 'make.defaults', f'ARCH="{SYNTHETIC_ARCH}"\n')
+    _write_file(profile / 'use.mask', ''.join(
+        f'flag{flag}\n' for flag in range(
+            min(parameters.use_mask_size, parameters.use_flags))))
+    package_use_mask = list()
+    for line in range(parameters.package_use_mask_size):
+        key = get_package_key(rng.randrange(parameters.packages))
+        if line % 4 == 3:
+            key = f'>={key}-{parameters.versions}'
+        use_flag = f'flag{rng.randrange(max(parameters.use_flags, 1))}'
+        package_use_mask.append(f'{key} {use_flag}\n')
+    _write_file(profile / 'package.use.mask', ''.join(package_use_mask))
+
+
+def _write_package(
+        path: Path,
+        parameters: SyntheticRepositoryParameters,
+        rng: random.Random,
+        index: int
+) -> None:
+    level = get_level(parameters, index)
+    iuse = set()
+    dependencies = list()
+    if level + 1 < parameters.depth:
+        for _ in range(parameters.fan_out):
+            dependencies.append(
+                _get_dependency(parameters, rng, level, iuse))
+    rdepend = ' '.join(dependencies)
+    iuse = ' '.join(sorted(iuse, key=lambda flag: int(flag[4:])))
+    keyworded = rng.random() < parameters.keyworded_ratio
+
+    key = get_package_key(index)
+    category, pn = key.split('/')
+    for version in range(1, parameters.versions + 1):
+        if version == parameters.versions:
+            keywords = f'~{SYNTHETIC_MATCH_ARCH}'
+        elif keyworded:
+            keywords = f'{SYNTHETIC_MATCH_ARCH} ~{SYNTHETIC_ARCH}'
+        else:
+            keywords = SYNTHETIC_MATCH_ARCH
+        ebuild = _EBUILD_TEMPLATE.format(
+            keywords=keywords, iuse=iuse, rdepend=rdepend)
+        pf = f'{pn}-{version}'
+        _write_file(path / category / pn / f'{pf}.ebuild', ebuild)
+        entry = {
+            'DEFINED_PHASES': '-',
+            'DESCRIPTION': 'Synthetic package',
+            'EAPI': '8',
+            'HOMEPAGE': 'https://example.org',
+            'IUSE': iuse,
+            'KEYWORDS': keywords,
+            'LICENSE': 'GPL-2',
+            'RDEPEND': rdepend,
+            'SLOT': '0',
+            '_md5_': hashlib.md5(ebuild.encode()).hexdigest()
+        }
+        _write_file(
+            path / 'metadata' / 'md5-cache' / category / pf,
+            ''.join(f'{k}={v}\n' for k, v in entry.items() if v))
+
+
+def generate_repository(
+        path: Path,
+        parameters: SyntheticRepositoryParameters
+) -> None:
+    """
+    Generate a synthetic ebuild repository with an up-to-date md5-cache, so
+    its packages' metadata can be read without sourcing any ebuild.  The
+    repository has one profile, whose architecture does not have the testing
+    keyword in the latest version of any package.
+
+    :param path: the path to the directory to create the repository in,
+        which must not exist
+    :param parameters: the parameters of the repository
+    :raise OSError: if the repository cannot be written
+    """
+    rng = random.Random(parameters.seed)
+    path.mkdir(parents=True)
+    _write_file(path / 'metadata' / 'layout.conf',
+                'masters =\nthin-manifests = true\n')
+    _write_profiles(path, parameters, rng)
+    for index in range(parameters.packages):
+        _write_package(path, parameters, rng, index)
+
+
+def get_synthetic_repository(
+        work_dir: Path,
+        parameters: SyntheticRepositoryParameters
+) -> Path:
+    """
+    Get a synthetic ebuild repository generated with some parameters under a
+    directory, generating it only if it has not been generated before.
+
+    :param work_dir: the directory to keep generated repositories in
+    :param parameters: the parameters of the repository
+    :return: the path to the repository
+    :raise OSError: if the repository cannot be written
+    """
+    path = work_dir / f'synthetic-{parameters.get_fingerprint()}'
+    if path.is_dir():
+        return path
+    work_dir.mkdir(parents=True, exist_ok=True)
+    # Generate the repository elsewhere first, so a partially generated
+    # repository is never used
+    temp_dir = Path(tempfile.mkdtemp(dir=work_dir))
+    try:
+        generate_repository(temp_dir / 'repo', parameters)
+        os.rename(temp_dir / 'repo', path)
+    except OSError:
+        if not path.is_dir():
+            raise
+    finally:
+        shutil.rmtree(temp_dir)
+    return path
@@ -0,0 +1,121 @@
+#  zarro-boogs-tools In-memory Caches
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, Optional
+
+"""The default maximum number of entries an LRUCache may hold."""
+DEFAULT_MAX_SIZE = 65536
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least-recently-used entry whenever a new
+    entry would make it grow beyond its maximum size.  The number of lookups
+    that found an entry (hits) and that did not (misses) is counted, so the
+    effectiveness of the cache can be inspected after it has been used.
+
+    An LRUCache may be shared between threads.
+    """
+
+    def __init__(self, max_size: Optional[int] = DEFAULT_MAX_SIZE):
+        """
+        :param max_size: the maximum number of entries the cache may hold;
+            specify 'None' for a cache without any size limit
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Look up the value of an entry, marking the entry as the most recently
+        used one if it exists, and update the hit and miss counters.
+
+        :param key: the key of the entry
+        :param default: the value to return if there is no entry for 'key'
+        :return: the value of the entry for 'key' if there is one, or
+            'default' otherwise
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Add or replace an entry, evicting the least-recently-used entry if the
+        cache is full.
+
+        :param key: the key of the entry
+        :param value: the value of the entry
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def evict(self, predicate: Callable[[Hashable], bool]) -> int:
+        """
+        Remove every entry whose key satisfies a predicate.
+
+        :param predicate: a function that returns whether an entry should be
+            removed when it is called with the entry's key
+        :return: the number of entries removed
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the hit and miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The ratio of lookups that found an entry to all lookups, or 0 if the
+        cache has never been looked up.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
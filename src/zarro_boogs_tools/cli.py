@@ -20,17 +20,27 @@
 #  <https://www.gnu.org/licenses/>.
 
 from zarro_boogs_tools import __project_name__, __version__
-from zarro_boogs_tools.list import PackageListFileFormat
+from zarro_boogs_tools.formats import \
+    MetricsFormat, PackageListFileFormat, ProfileFormat
 
 import argparse
 from pathlib import Path
+from typing import Optional
 
-from nattka.bugzilla import BugCategory
+# Names of the members of 'nattka.bugzilla.BugCategory' for each type of
+# keyword change; the Bugzilla module is not imported just for these constants
+# since importing it takes longer than parsing the arguments
+KEYWORDREQ = 'KEYWORDREQ'
+STABLEREQ = 'STABLEREQ'
 
 
-def parse_args(args: list[str], exit_on_error: bool = True) \
-        -> argparse.Namespace:
+def parse_args(
+        args: list[str],
+        exit_on_error: bool = True,
+        prog: Optional[str] = None
+) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
+        prog=prog,
         exit_on_error=exit_on_error
     )
 
@@ -62,6 +72,68 @@ def parse_args(args: list[str], exit_on_error: bool = True) \
         """
     )
 
+    parser.add_argument(
+        '--no-cache',
+        help="""
+        neither read nor update the persistent cache of package dependencies
+        under ${XDG_CACHE_HOME}/zbt
+        """,
+        action='store_true'
+    )
+
+    parser.add_argument(
+        '--connect',
+        metavar='SOCKET',
+        help="""
+        send the command to a server started by the 'serve' subcommand that
+        listens on the Unix domain socket SOCKET instead of running it in this
+        process; the output is the same, except that it is printed only after
+        the command has finished, even with '--stream' or '--from-file'
+        """
+    )
+
+    group_stats = parser.add_argument_group(
+        title="options for performance analysis"
+    )
+    group_stats.add_argument(
+        '--stats',
+        help="""
+        print the time spent in each phase of the run, the time spent in
+        operations done many times, counters of events like visited packages
+        and hit rates of caches to standard error when the run finishes
+        """,
+        action='store_true'
+    )
+    group_stats.add_argument(
+        '--stats-file',
+        metavar='FILE',
+        help="""
+        write the statistics printed by '--stats' to FILE in JSON format
+        """
+    )
+    group_stats.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        type=Path,
+        help="""
+        write metrics of each package list made, including the time taken,
+        the number of packages in it, the number of packages visited and
+        repository searches done to make it, cache hit ratios and the peak
+        memory usage, labeled by the main package, keyword, architecture and
+        profile, to FILE
+        """
+    )
+    group_stats.add_argument(
+        '--metrics-format',
+        choices=[metrics_format.value for metrics_format in MetricsFormat],
+        help="""
+        the format of the file written by '--metrics-file': 'json', or
+        'prometheus' for the Prometheus text format read by the textfile
+        collector of the node exporter (default: 'prometheus' if FILE ends
+        with '.prom', 'json' otherwise)
+        """
+    )
+
     group_keyword_change_type = parser.add_argument_group(
         title="options to control the type of keyword change",
         description="""
@@ -77,14 +149,14 @@ def parse_args(args: list[str], exit_on_error: bool = True) \
         help="target the testing keyword ('~arch')",
         dest='keyword_change_type',
         action='store_const',
-        const=BugCategory.KEYWORDREQ
+        const=KEYWORDREQ
     )
     group_keyword_change_type.add_argument(
         '-s', '--stable',
         help="target the stable keyword ('arch')",
         dest='keyword_change_type',
         action='store_const',
-        const=BugCategory.STABLEREQ
+        const=STABLEREQ
     )
 
     parser.add_argument(
@@ -124,6 +196,87 @@ def parse_args(args: list[str], exit_on_error: bool = True) \
         current system)
         """
     )
+    parser_ls.add_argument(
+        '-j', '--jobs',
+        metavar='N',
+        type=int,
+        default=1,
+        help="""
+        resolve dependencies with N threads; the output is the same regardless
+        of N (default: %(default)s)
+        """
+    )
+    parser_ls.add_argument(
+        '-f', '--from-file',
+        metavar='FILE',
+        help="""
+        also process the atoms listed in FILE, or in standard input if FILE is
+        '-', separated by whitespace, with '#' starting a comment; every atom
+        is processed as a separate request, atoms that cannot be processed are
+        reported and skipped, and a JSON object is printed on a line for each
+        atom as soon as its package list is complete
+        """
+    )
+    parser_ls.add_argument(
+        '--stream',
+        help="""
+        print each line of the package lists as soon as its package is found
+        instead of after all package lists are complete
+        """,
+        action='store_true'
+    )
+    parser_ls.add_argument(
+        '--progress',
+        help="""
+        keep a status line on standard error updated with the number of
+        packages found, visited and queued and the search rate while package
+        lists are being made
+        """,
+        action='store_true'
+    )
+    parser_ls.add_argument(
+        '--max-time',
+        metavar='SECONDS',
+        type=float,
+        help="""
+        stop making package lists after SECONDS seconds, or after SECONDS
+        seconds for each atom with '-f', print the part of the package list
+        found so far, and exit with status 4; package list files are not
+        written for incomplete package lists
+        """
+    )
+    parser_ls.add_argument(
+        '--max-packages',
+        metavar='N',
+        type=int,
+        help="""
+        stop making a package list once it would have more than N packages,
+        print the first N packages, and exit with status 4; package list files
+        are not written for incomplete package lists
+        """
+    )
+    parser_ls.add_argument(
+        '--profile-out',
+        metavar='FILE',
+        type=Path,
+        help="""
+        profile the resolution of the package lists and write the profile to
+        FILE; the time spent in expanding each package and resolving each
+        dependency is shown under a frame named after the package or the
+        dependency
+        """
+    )
+    parser_ls.add_argument(
+        '--profile-format',
+        choices=[profile_format.value for profile_format in ProfileFormat],
+        help="""
+        the format of the profile written by '--profile-out': 'pstats' for a
+        deterministic profile of the main thread that can be read by the
+        pstats module, or 'speedscope' for a sampling profile of all threads
+        that can be opened in speedscope (default: 'speedscope' if FILE ends
+        with '.json', 'pstats' otherwise)
+        """
+    )
     group_ls_file_ops = parser_ls.add_argument_group(
         title="options to alter package lists written to disk",
         description="""
@@ -190,5 +343,66 @@ def parse_args(args: list[str], exit_on_error: bool = True) \
         action='append'
     )
 
+    parser_rdeps = subparsers.add_parser(
+        'rdeps',
+        help="""
+        list packages that would pull the specified packages into their package
+        lists
+        """,
+        description="""
+        List packages that do not have the target keyword yet and would
+        require the packages specified in the command-line to be keyworded or
+        stabilized along with them, either as direct dependencies or through
+        other dependencies that would have to be keyworded or stabilized.
+        """
+    )
+    parser_rdeps.add_argument(
+        'atoms',
+        help="package atoms to be processed",
+        nargs='+'
+    )
+    parser_rdeps.add_argument(
+        '-p', '--profile',
+        help="""
+        the Portage profile to target; used to filter out USE-conditional
+        dependencies for masked USE flags (default: the profile selected on the
+        current system)
+        """
+    )
+    parser_rdeps.add_argument(
+        '-a', '--arch',
+        help="""
+        the architectures concerned by the keywording or stabilization; can be
+        repeated to specify multiple architectures (default: the architecture
+        of the target profile)
+        """,
+        action='append'
+    )
+
+    parser_serve = subparsers.add_parser(
+        'serve',
+        help="""
+        run a server that keeps repositories and caches loaded between
+        commands
+        """,
+        description="""
+        Run a server that listens on a Unix domain socket and runs commands
+        sent by instances of this program invoked with the '--connect' option.
+        Loaded repositories, profiles and caches are kept in memory between
+        commands.  Changes to a repository are detected when it is
+        synchronized, its metadata is regenerated, a package is added or
+        removed, or its Git working tree changes; then, the packages that
+        have changed are discarded, or the whole repository if its eclasses
+        or profiles have changed.  An ebuild that is only modified in place,
+        without any of these changes, is not noticed until one of them
+        happens; restart the server or update the repository's
+        metadata/timestamp.chk file after editing ebuilds by hand.
+        """
+    )
+    parser_serve.add_argument(
+        'socket',
+        help="the path to the Unix domain socket to listen on"
+    )
+
     opts = parser.parse_args(args)
     return opts
@@ -0,0 +1,135 @@
+#  zarro-boogs-tools Client for the Server Started by the 'serve' Subcommand
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import socket
+import sys
+from typing import Optional
+
+"""The size of the buffer used to receive responses from the server."""
+BUFFER_SIZE = 65536
+
+
+def strip_connect_option(args: list[str]) -> list[str]:
+    """
+    Remove the '--connect' option and its argument from a list of
+    command-line arguments, so the remaining arguments can be run by the
+    server.
+
+    :param args: the command-line arguments
+    :return: the arguments without the '--connect' option
+    """
+    result = list()
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg == '--connect':
+            skip_next = True
+        elif not arg.startswith('--connect='):
+            result.append(arg)
+    return result
+
+
+def reads_standard_input(args: list[str]) -> bool:
+    """
+    Check if a list of command-line arguments makes the command read standard
+    input, which is the case when the file given to the '-f' or '--from-file'
+    option is '-'.
+
+    :param args: the command-line arguments
+    :return: whether the command reads standard input
+    """
+    for i, arg in enumerate(args):
+        if arg == '--':
+            break
+        if arg in ('-f', '--from-file'):
+            if i + 1 < len(args) and args[i + 1] == '-':
+                return True
+        elif arg in ('-f-', '--from-file=-'):
+            return True
+    return False
+
+
+def send_request(
+        socket_path: str,
+        program_name: str,
+        args: list[str],
+        cwd: str,
+        stdin: Optional[str] = None
+) -> dict:
+    """
+    Send a command to a server and wait for the result.
+
+    A request is a JSON object with the program name to use in messages, the
+    command-line arguments, the working directory to run the command in and
+    optionally the contents of the command's standard input, and the
+    response is a JSON object with the command's standard output, standard
+    error and exit status.  Both are sent as a single line.
+
+    :param socket_path: the path to the Unix domain socket the server listens
+        on
+    :param program_name: the program name to use in messages
+    :param args: the command-line arguments of the command
+    :param cwd: the working directory for the command
+    :param stdin: the contents of the command's standard input, or 'None' if
+        the command's standard input is empty
+    :return: a dictionary with keys 'stdout', 'stderr' and 'status'
+    :raise OSError: if the server cannot be reached
+    :raise ValueError: if the server's response is malformed
+    """
+    request = {
+        'program_name': program_name,
+        'args': args,
+        'cwd': cwd
+    }
+    if stdin is not None:
+        request['stdin'] = stdin
+    request = json.dumps(request) + '\n'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(request.encode())
+        client.shutdown(socket.SHUT_WR)
+        chunks = list()
+        while chunk := client.recv(BUFFER_SIZE):
+            chunks.append(chunk)
+    response = json.loads(b''.join(chunks))
+    if not isinstance(response, dict) or \
+            not isinstance(response.get('status'), int):
+        raise ValueError("Malformed response from server")
+    return response
+
+
+def main(program_name: str, socket_path: str, args: list[str]) -> int:
+    # The server cannot read this process's standard input, so it is sent
+    # with the request when the command would read it
+    stdin = sys.stdin.read() if reads_standard_input(args) else None
+    try:
+        response = send_request(
+            socket_path, program_name, args, os.getcwd(), stdin)
+    except (OSError, ValueError) as e:
+        print(f"{program_name}: {socket_path}: {e}", file=sys.stderr)
+        return 1
+    sys.stdout.write(response.get('stdout', ''))
+    sys.stderr.write(response.get('stderr', ''))
+    return response['status']
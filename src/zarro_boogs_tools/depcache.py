@@ -0,0 +1,244 @@
+#  zarro-boogs-tools Persistent Dependency Cache
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools import __project_name_abbrev__
+from zarro_boogs_tools.pkgcore.profile import get_profile_fingerprint
+from zarro_boogs_tools.pkgcore.repository import \
+    get_md5_cache_entry, is_md5_cache_entry_valid
+from zarro_boogs_tools.pkgcore.restriction import \
+    deserialize_restriction, serialize_restriction
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import pkgcore.restrictions.restriction as restriction
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+"""The version of the format of persistent dependency cache files, which must
+be increased whenever the format or the preprocessing of the cached
+restrictions changes."""
+DEPENDENCY_CACHE_FORMAT_VERSION = 2
+
+
+def get_cache_dir() -> Path:
+    """
+    Get the directory where this program stores persistent caches, which is
+    a subdirectory of '$XDG_CACHE_HOME', or of '~/.cache' if that variable is
+    not set.  The directory may not exist.
+
+    :return: the path to the directory for persistent caches
+    """
+    xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+    if not xdg_cache_home:
+        xdg_cache_home = os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(xdg_cache_home) / __project_name_abbrev__
+
+
+class DependencyCache:
+    """
+    A persistent cache for the keywords and the preprocessed dependency
+    restrictions of packages in an ebuild repository.
+
+    Each entry is keyed on the checksums of the package's ebuild and inherited
+    eclasses recorded in the repository's md5-cache, and an entry is only
+    used while those checksums match the files in the repository.  Packages
+    without an up-to-date md5-cache entry are never cached.  Preprocessed
+    restrictions are further keyed on the profile whose USE flag restrictions
+    were applied and on whether stable USE flag restrictions were applied.
+    """
+
+    def __init__(self, repo: UnconfiguredTree, path: Optional[Path] = None):
+        """
+        :param repo: the object representing the ebuild repository whose
+            packages are cached
+        :param path: the path to the file the cache is loaded from and saved
+            to; omit or specify 'None' to use a file for the repository under
+            the directory returned by the 'get_cache_dir' function
+        """
+        self.repo = repo
+        if path is None:
+            location_id = hashlib.md5(
+                os.path.abspath(repo.location).encode()).hexdigest()
+            path = get_cache_dir() / f'deps-{location_id}.json'
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = self._load()
+        self._dirty = False
+        # Entries already validated during this run; 'None' is stored for
+        # packages that cannot be cached
+        self._validated = dict()
+        self._eclass_md5s = dict()
+        self._profile_fingerprints = dict()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+        except (OSError, ValueError):
+            return dict()
+        if not isinstance(data, dict) or \
+                data.get('version') != DEPENDENCY_CACHE_FORMAT_VERSION or \
+                not isinstance(data.get('entries'), dict):
+            return dict()
+        return data['entries']
+
+    def save(self) -> bool:
+        """
+        Write the cache to its file if it has been modified since it was
+        loaded.
+
+        :return: 'True' if the file is up to date, or 'False' if the file
+            could not be written
+        """
+        if not self._dirty:
+            return True
+        data = {
+            'version': DEPENDENCY_CACHE_FORMAT_VERSION,
+            'entries': self._entries
+        }
+        temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(data, cache_file, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except OSError:
+            return False
+        self._dirty = False
+        return True
+
+    def _get_entry(self, pkg: package) -> Optional[dict]:
+        try:
+            return self._validated[pkg]
+        except KeyError:
+            pass
+        entry = None
+        md5_cache_entry = get_md5_cache_entry(self.repo, pkg)
+        if md5_cache_entry is not None and is_md5_cache_entry_valid(
+                self.repo, pkg, md5_cache_entry, self._eclass_md5s):
+            key = f"{md5_cache_entry['_md5_']}:" \
+                  f"{md5_cache_entry.get('_eclasses_', '')}"
+            entry = self._entries.get(pkg.cpvstr)
+            if entry is None or entry.get('key') != key:
+                entry = {
+                    'key': key,
+                    'keywords': md5_cache_entry.get('KEYWORDS', '').split(),
+                    'restrictions': dict()
+                }
+                self._entries[pkg.cpvstr] = entry
+                self._dirty = True
+        self._validated[pkg] = entry
+        return entry
+
+    def forget_package_keys(self, keys: set[tuple[str, str]]) -> None:
+        """
+        Validate the entries of some packages again the next time they are
+        looked up, because the packages' files may have changed.
+
+        :param keys: the ${CATEGORY} and ${PN} of each package
+        """
+        for pkg in list(self._validated.keys()):
+            if (pkg.category, pkg.package) in keys:
+                del self._validated[pkg]
+
+    def _get_restrictions_key(
+            self, profile: Optional[OnDiskProfile], stable: Optional[bool]) \
+            -> str:
+        if profile is None or stable is None:
+            return '*'
+        if profile not in self._profile_fingerprints:
+            self._profile_fingerprints[profile] = \
+                get_profile_fingerprint(profile)
+        return f'{self._profile_fingerprints[profile]}:{int(stable)}'
+
+    def get_keywords(self, pkg: package) -> tuple[str, ...]:
+        """
+        Get the keywords of a package, from the cache if possible.
+
+        :param pkg: the package
+        :return: the package's keywords
+        """
+        entry = self._get_entry(pkg)
+        if entry is None:
+            return pkg.keywords
+        return tuple(entry['keywords'])
+
+    def get_dependency_restrictions(
+            self,
+            pkg: package,
+            profile: Optional[OnDiskProfile] = None,
+            stable: Optional[bool] = None
+    ) -> Optional[list[restriction.base]]:
+        """
+        Look up the preprocessed dependency restrictions of a package.
+
+        :param pkg: the package
+        :param profile: the profile whose USE flag restrictions were applied
+            in preprocessing
+        :param stable: whether USE flag restrictions for stable packages were
+            applied in preprocessing
+        :return: the list of the restrictions if they are cached, or 'None'
+            otherwise
+        """
+        entry = self._get_entry(pkg)
+        if entry is not None:
+            restrictions = entry['restrictions'].get(
+                self._get_restrictions_key(profile, stable))
+            if restrictions is not None:
+                self.hits += 1
+                return list(map(deserialize_restriction, restrictions))
+        self.misses += 1
+        return None
+
+    def put_dependency_restrictions(
+            self,
+            pkg: package,
+            restrictions: list[restriction.base],
+            profile: Optional[OnDiskProfile] = None,
+            stable: Optional[bool] = None
+    ) -> None:
+        """
+        Store the preprocessed dependency restrictions of a package, if the
+        package can be cached.
+
+        :param pkg: the package
+        :param restrictions: the restrictions to store
+        :param profile: the profile whose USE flag restrictions were applied
+            in preprocessing
+        :param stable: whether USE flag restrictions for stable packages were
+            applied in preprocessing
+        """
+        entry = self._get_entry(pkg)
+        if entry is None:
+            return
+        try:
+            serialized = list(map(serialize_restriction, restrictions))
+        except TypeError:
+            return
+        entry['restrictions'][self._get_restrictions_key(profile, stable)] = \
+            serialized
+        self._dirty = True
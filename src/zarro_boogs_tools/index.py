@@ -0,0 +1,519 @@
+#  zarro-boogs-tools Repository Indexes
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.pkgcore.repository import \
+    get_md5_cache_path, is_md5_cache_entry_valid, read_md5_cache_file
+from zarro_boogs_tools.pkgcore.restriction import collect_atoms
+
+import bisect
+import functools
+import os.path
+import threading
+from collections.abc import Iterable, Iterator
+from typing import Callable, Optional
+
+import pkgcore.ebuild.cpv as cpv
+import pkgcore.restrictions.boolean as boolean
+import pkgcore.restrictions.restriction as restriction
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+
+class KeywordIndex:
+    """
+    An index mapping each keyword to the set of CPVs of packages in an ebuild
+    repository that have the keyword, built from the repository's md5-cache.
+
+    The index is populated for one ${CATEGORY}/${PN} at a time, the first time
+    a version of it is looked up, so only the md5-cache entries of packages a
+    caller is interested in are read.  A package without an up-to-date
+    md5-cache entry is not indexed; its keywords are read from the package
+    object instead, so the index always gives the same answers as
+    'pkg.keywords' would.
+    """
+
+    def __init__(self, repo: UnconfiguredTree):
+        """
+        :param repo: the object representing the ebuild repository to index
+        """
+        self.repo = repo
+        # Package filters that use this index, keyed on their keywords, for
+        # 'package.get_keyword_matching_pkg_filter'
+        self.pkg_filters = dict()
+        self._cpvs_by_keyword = dict()
+        self._indexed_cpvs = set()
+        self._indexed_keys = set()
+        self._eclass_md5s = dict()
+
+    def _index_package_key(self, category: str, pn: str) -> None:
+        md5_cache_dir = os.path.join(get_md5_cache_path(self.repo), category)
+        new_cpvs_by_keyword = dict()
+        new_indexed_cpvs = set()
+        for version in self.repo.versions.get((category, pn), ()):
+            pkg = self.repo.package_class(category, pn, version)
+            entry = read_md5_cache_file(os.path.join(md5_cache_dir, pkg.PF))
+            if entry is None or not is_md5_cache_entry_valid(
+                    self.repo, pkg, entry, self._eclass_md5s):
+                continue
+            new_indexed_cpvs.add(pkg.cpvstr)
+            for keyword in entry.get('KEYWORDS', '').split():
+                new_cpvs_by_keyword.setdefault(keyword, set()).add(pkg.cpvstr)
+        for keyword, cpvs in new_cpvs_by_keyword.items():
+            self._cpvs_by_keyword.setdefault(keyword, set()).update(cpvs)
+        self._indexed_cpvs.update(new_indexed_cpvs)
+        self._indexed_keys.add((category, pn))
+
+    def forget_package_keys(self, keys: set[tuple[str, str]]) -> None:
+        """
+        Remove some packages from the index, so they are indexed again the
+        next time they are looked up.  This must be done before the
+        repository forgets the versions of the packages.
+
+        :param keys: the ${CATEGORY} and ${PN} of each package
+        """
+        cpvs = set()
+        for category, pn in keys & self._indexed_keys:
+            for version in self.repo.versions.get((category, pn), ()):
+                cpvs.add(f'{category}/{pn}-{version}')
+        self._indexed_keys -= keys
+        self._indexed_cpvs -= cpvs
+        for keyword_cpvs in self._cpvs_by_keyword.values():
+            keyword_cpvs -= cpvs
+
+    def build(self) -> None:
+        """
+        Populate the index for every package in the repository at once.
+        """
+        for category, pn in list(self.repo.versions.keys()):
+            if (category, pn) not in self._indexed_keys:
+                self._index_package_key(category, pn)
+
+    def has_keyword(self, pkg: package, keyword: str) -> bool:
+        """
+        Check if a package has a keyword in its 'KEYWORDS' variable.
+
+        :param pkg: the package to check
+        :param keyword: the keyword to look up, like 'amd64' or '~riscv'
+        :return: whether the package has the keyword
+        """
+        if (pkg.category, pkg.package) not in self._indexed_keys:
+            self._index_package_key(pkg.category, pkg.package)
+        if pkg.cpvstr not in self._indexed_cpvs:
+            return keyword in pkg.keywords
+        return pkg.cpvstr in self._cpvs_by_keyword.get(keyword, ())
+
+    def is_visible(self, pkg: package, keyword: str) -> bool:
+        """
+        Check if a package is visible on a keyword, i.e. if it has either the
+        keyword itself or the stable variant of the keyword.
+
+        :param pkg: the package to check
+        :param keyword: the keyword to check against, like 'amd64' or '~riscv'
+        :return: whether the package is visible on the keyword
+        """
+        return self.has_keyword(pkg, keyword) or \
+            self.has_keyword(pkg, keyword.lstrip('~'))
+
+    def get_cpvs(self, keyword: str) -> frozenset[str]:
+        """
+        Get the CPVs of all indexed packages that have a keyword.  Only
+        packages for which the index has been populated are included; call
+        the 'build' method first to include every package in the repository.
+
+        :param keyword: the keyword to look up, like 'amd64' or '~riscv'
+        :return: the set of CPVs of the packages with the keyword
+        """
+        return frozenset(self._cpvs_by_keyword.get(keyword, ()))
+
+
+class PackageVersions:
+    """
+    The versions of one ${CATEGORY}/${PN} in an ebuild repository, sorted
+    from the oldest to the newest, with the slot, the sub-slot and a bitmask
+    of the keywords of each version.  The attributes of a version without an
+    up-to-date md5-cache entry are read from the package object the first
+    time they are needed, so they are always the same as the package's.
+    """
+
+    def __init__(
+            self,
+            packages: list[package],
+            slots: list[Optional[str]],
+            subslots: list[Optional[str]],
+            keyword_masks: list[Optional[int]],
+            version_index: 'VersionIndex'
+    ):
+        """
+        :param packages: the package objects of the versions, in order
+        :param slots: the slot of each version, or 'None' if it is unknown
+        :param subslots: the sub-slot of each version, or 'None' if it is
+            unknown
+        :param keyword_masks: the bitmask of the keywords of each version, or
+            'None' if it is unknown
+        :param version_index: the index that assigns the keywords' bits
+        """
+        self.packages = packages
+        self._slots = slots
+        self._subslots = subslots
+        self._keyword_masks = keyword_masks
+        self._version_index = version_index
+        self._fullvers = sorted(
+            (pkg.fullver, position) for position, pkg in enumerate(packages))
+
+    def get_slot(self, position: int) -> str:
+        """
+        :param position: the position of the version in 'packages'
+        :return: the slot of the version
+        """
+        if self._slots[position] is None:
+            self._slots[position] = self.packages[position].slot
+        return self._slots[position]
+
+    def get_subslot(self, position: int) -> str:
+        """
+        :param position: the position of the version in 'packages'
+        :return: the sub-slot of the version, which is the same as the slot
+            if the version does not have a sub-slot
+        """
+        if self._subslots[position] is None:
+            self._subslots[position] = self.packages[position].subslot
+        return self._subslots[position]
+
+    def get_keyword_mask(self, position: int) -> int:
+        """
+        :param position: the position of the version in 'packages'
+        :return: the bitmask of the keywords of the version, which is 0 if
+            and only if the version does not have any keywords
+        """
+        if self._keyword_masks[position] is None:
+            self._keyword_masks[position] = \
+                self._version_index.get_keyword_mask(
+                    self.packages[position].keywords)
+        return self._keyword_masks[position]
+
+    def _bisect(self, version: str, revision: Optional[int],
+                drop_revision: bool, strict: bool) -> int:
+        # Find the first position whose version compares greater than or
+        # equal to (or, if 'strict', greater than) the specified version, in
+        # the same way as pkgcore's version restrictions compare them
+        low, high = 0, len(self.packages)
+        while low < high:
+            middle = (low + high) // 2
+            pkg = self.packages[middle]
+            if drop_revision:
+                result = cpv.ver_cmp(pkg.version, None, version, None)
+            else:
+                result = cpv.ver_cmp(
+                    pkg.version, pkg.revision, version, revision)
+            if result > 0 or (result == 0 and not strict):
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def get_matching_positions(self, atom_obj: atom) -> list[int]:
+        """
+        Find the versions that satisfy an atom for this ${CATEGORY}/${PN}.
+        The atom must be supported by the 'VersionIndex.supports' method.
+
+        :param atom_obj: the object representing the atom
+        :return: the positions in 'packages' of the matching versions, in
+            ascending order
+        """
+        if atom_obj.fullver is None:
+            positions = range(len(self.packages))
+        elif atom_obj.op == '=*':
+            # Versions that start with the same string are adjacent in
+            # lexicographical order but not necessarily in version order
+            start = bisect.bisect_left(self._fullvers, (atom_obj.fullver,))
+            positions = list()
+            for fullver, position in self._fullvers[start:]:
+                if not fullver.startswith(atom_obj.fullver):
+                    break
+                positions.append(position)
+            positions.sort()
+        else:
+            drop_revision = atom_obj.op == '~'
+            start = self._bisect(atom_obj.version, atom_obj.revision,
+                                 drop_revision, False)
+            end = self._bisect(atom_obj.version, atom_obj.revision,
+                               drop_revision, True)
+            positions = {
+                '<': range(0, start),
+                '<=': range(0, end),
+                '=': range(start, end),
+                '~': range(start, end),
+                '>=': range(start, len(self.packages)),
+                '>': range(end, len(self.packages))
+            }[atom_obj.op]
+        if atom_obj.slot is not None:
+            positions = [p for p in positions
+                         if self.get_slot(p) == atom_obj.slot]
+            if atom_obj.subslot is not None:
+                positions = [p for p in positions
+                             if self.get_subslot(p) == atom_obj.subslot]
+        return list(positions)
+
+
+class VersionIndex:
+    """
+    An index mapping each ${CATEGORY}/${PN} in an ebuild repository to its
+    versions, so the best version of a package that satisfies an atom can be
+    found with binary searches and bitmask tests instead of evaluating the
+    atom's restrictions against every version like 'repo.match' does.  The
+    index also records restrictions that do not match any package.
+
+    Like a 'KeywordIndex', the index is populated for one ${CATEGORY}/${PN} at
+    a time, the first time it is looked up, from the repository's md5-cache.
+    The index is safe to use from multiple threads.
+    """
+
+    def __init__(self, repo: UnconfiguredTree):
+        """
+        :param repo: the object representing the ebuild repository to index
+        """
+        self.repo = repo
+        self._versions = dict()
+        self._keyword_bits = dict()
+        self._keyword_bits_lock = threading.Lock()
+        self._eclass_md5s = dict()
+        self._unmatched = set()
+
+    @staticmethod
+    def supports(restrict: restriction.base) -> bool:
+        """
+        Check if a restriction is an atom the index can resolve.  Atoms with
+        a USE dependency, a repository or a block are left to 'repo.match'.
+
+        :param restrict: the restriction to check
+        :return: whether the restriction is supported
+        """
+        return isinstance(restrict, atom) and not restrict.blocks and \
+            restrict.use is None and restrict.repo_id is None and \
+            not restrict.negate_vers
+
+    def get_keyword_mask(self, keywords: Iterable[str]) -> int:
+        """
+        Get the bitmask that represents some keywords.  A bit is assigned to
+        every keyword the first time it is seen.
+
+        :param keywords: the keywords, like 'amd64' or '~riscv'
+        :return: the bitmask with the bit of each keyword set
+        """
+        mask = 0
+        for keyword in keywords:
+            bit = self._keyword_bits.get(keyword)
+            if bit is None:
+                with self._keyword_bits_lock:
+                    bit = self._keyword_bits.setdefault(
+                        keyword, 1 << len(self._keyword_bits))
+            mask |= bit
+        return mask
+
+    def _index_package_key(self, category: str, pn: str) -> PackageVersions:
+        md5_cache_dir = os.path.join(get_md5_cache_path(self.repo), category)
+        packages = sorted(
+            self.repo.package_class(category, pn, version)
+            for version in self.repo.versions.get((category, pn), ()))
+        slots = list()
+        subslots = list()
+        keyword_masks = list()
+        for pkg in packages:
+            entry = read_md5_cache_file(os.path.join(md5_cache_dir, pkg.PF))
+            if entry is None or 'SLOT' not in entry or \
+                    not is_md5_cache_entry_valid(
+                        self.repo, pkg, entry, self._eclass_md5s):
+                slots.append(None)
+                subslots.append(None)
+                keyword_masks.append(None)
+                continue
+            slot, _, subslot = entry['SLOT'].partition('/')
+            slots.append(slot)
+            subslots.append(subslot or slot)
+            keyword_masks.append(self.get_keyword_mask(
+                entry.get('KEYWORDS', '').split()))
+        return PackageVersions(
+            packages, slots, subslots, keyword_masks, self)
+
+    def get_versions(self, category: str, pn: str) -> PackageVersions:
+        """
+        Get the versions of a ${CATEGORY}/${PN}.
+
+        :param category: the category
+        :param pn: the package name
+        :return: the versions, which are empty if the repository does not
+            have the package
+        """
+        versions = self._versions.get((category, pn))
+        if versions is None:
+            # Threads that index the same package at the same time build
+            # equivalent objects, so either one can be kept
+            versions = self._index_package_key(category, pn)
+            self._versions[(category, pn)] = versions
+        return versions
+
+    def find_matches(self, restrict: restriction.base) \
+            -> Optional[list[tuple[PackageVersions, int]]]:
+        """
+        Find the versions that match a restriction, which may be an atom or
+        an any-of or all-of group of atoms.  The versions that match a group
+        are found by uniting or intersecting the versions that match the
+        atoms in it, so only the packages named by the atoms are searched.
+
+        Atoms supported by the 'supports' method are resolved with binary
+        searches; other atoms, except blocks, are matched against every
+        version of the package they name.
+
+        :param restrict: the restriction
+        :return: the matching versions, each as the versions of its
+            ${CATEGORY}/${PN} and its position in them, sorted like packages
+            are sorted; or 'None' if the restriction contains anything else,
+            like an empty all-of group, which matches every package in the
+            repository
+        """
+        if isinstance(restrict, atom):
+            if restrict.blocks:
+                return None
+            versions = self.get_versions(restrict.category, restrict.package)
+            if self.supports(restrict):
+                positions = versions.get_matching_positions(restrict)
+            else:
+                positions = [position for position, pkg
+                             in enumerate(versions.packages)
+                             if restrict.match(pkg)]
+            return [(versions, position) for position in positions]
+
+        if isinstance(restrict, boolean.OrRestriction):
+            matches = dict()
+            for child in restrict:
+                child_matches = self.find_matches(child)
+                if child_matches is None:
+                    return None
+                matches.update(dict.fromkeys(child_matches))
+        elif isinstance(restrict, boolean.AndRestriction) and len(restrict):
+            matches = None
+            for child in restrict:
+                child_matches = self.find_matches(child)
+                if child_matches is None:
+                    return None
+                matches = dict.fromkeys(child_matches) if matches is None \
+                    else {m: None for m in child_matches if m in matches}
+        else:
+            return None
+        return sorted(matches, key=lambda m: m[0].packages[m[1]])
+
+    def select_best_version(
+            self,
+            matches: list[tuple[PackageVersions, int]],
+            keyword_mask: Optional[int] = None,
+            pkg_filter: Optional[Callable[
+                [Iterator[package]], Iterable[package]]] = None
+    ) -> Optional[package]:
+        """
+        Select the best version among the versions that match a restriction,
+        in the same way as 'nattka.package.select_best_version' selects it:
+        the newest version that has any keywords, or the newest version that
+        is not live, or the newest version.
+
+        :param matches: the versions returned by the 'find_matches' method
+        :param keyword_mask: if it is not 'None', only versions that have a
+            keyword in this bitmask, which is returned by the
+            'get_keyword_mask' method, may be selected
+        :param pkg_filter: a filter for limiting the set of packages that may
+            be selected; omit or specify 'None' to skip any filtering
+        :return: the object for the best version if there is one, or 'None'
+            otherwise
+        """
+        if keyword_mask is not None:
+            matches = [(versions, position) for versions, position in matches
+                       if versions.get_keyword_mask(position) & keyword_mask]
+        if pkg_filter is not None and matches:
+            selected = set(pkg_filter(
+                versions.packages[position] for versions, position in matches))
+            matches = [(versions, position) for versions, position in matches
+                       if versions.packages[position] in selected]
+        if not matches:
+            return None
+        for versions, position in reversed(matches):
+            if versions.get_keyword_mask(position):
+                return versions.packages[position]
+        for versions, position in reversed(matches):
+            if 'live' not in versions.packages[position].properties:
+                return versions.packages[position]
+        versions, position = matches[-1]
+        return versions.packages[position]
+
+    def has_no_match(self, restrict: restriction.base) -> bool:
+        """
+        Check if a restriction has been recorded as not matching any package
+        in the repository by the 'record_no_match' method.
+
+        :param restrict: the restriction
+        :return: whether the restriction is known to not match any package
+        """
+        return restrict in self._unmatched
+
+    def record_no_match(self, restrict: restriction.base) -> None:
+        """
+        Record that a restriction does not match any package in the
+        repository, regardless of any package filter, so the repository does
+        not have to be searched for it again.
+
+        :param restrict: the restriction
+        """
+        self._unmatched.add(restrict)
+
+    def forget_package_keys(self, keys: set[tuple[str, str]]) -> None:
+        """
+        Remove some packages from the index, so they are indexed again the
+        next time they are looked up, along with the restrictions recorded
+        as not matching any package that may match them now.
+
+        :param keys: the ${CATEGORY} and ${PN} of each package
+        """
+        def may_match(restrict: restriction.base) -> bool:
+            atoms = collect_atoms(restrict)
+            # Restrictions without atoms are not anchored to any package
+            return not atoms or any(
+                (atom_obj.category, atom_obj.package) in keys
+                for atom_obj in atoms)
+
+        for key in keys:
+            self._versions.pop(key, None)
+        self._unmatched = {restrict for restrict in self._unmatched
+                           if not may_match(restrict)}
+
+
+@functools.lru_cache(maxsize=16)
+def get_version_index(repo: UnconfiguredTree) -> Optional[VersionIndex]:
+    """
+    Get the version index of an ebuild repository.  The same index is
+    returned for the same repository object every time, so it is shared by
+    every caller that resolves atoms in the repository.
+
+    :param repo: the object representing the ebuild repository
+    :return: the index if the repository is an ebuild repository the index
+        supports, or 'None' otherwise
+    """
+    if not isinstance(repo, UnconfiguredTree):
+        return None
+    return VersionIndex(repo)
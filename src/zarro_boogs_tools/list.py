@@ -19,29 +19,38 @@
 #  along with zarro-boogs-tools.  If not, see
 #  <https://www.gnu.org/licenses/>.
 
-from zarro_boogs_tools import __project_name_abbrev__
+from zarro_boogs_tools import __project_name_abbrev__, stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.depcache import DependencyCache
+from zarro_boogs_tools.formats import PackageListFileFormat
+from zarro_boogs_tools.index import KeywordIndex
 from zarro_boogs_tools.inference import is_stabilizing
+from zarro_boogs_tools.monitor import \
+    ResolutionBudgetExceeded, ResolutionMonitor
 from zarro_boogs_tools.package import \
-    get_keyword_matching_pkg_filter, get_packages_to_process
+    check_atom_obj_for_keywording, get_atom_obj_from_str, get_best_version, \
+    get_keyword_matching_pkg_filter, iter_packages_to_process
+from zarro_boogs_tools.pkgcore.profile import get_profile_name
 from zarro_boogs_tools.portage import \
-    PAK, get_portage_config_file_prefix, get_accept_keywords_contents
+    PAK, get_portage_config_file_prefix, get_accept_keywords_contents, \
+    get_accept_keywords_line
 
-import enum
+import json
 import os
-from collections.abc import Iterable
+import sys
+from collections.abc import Iterable, Iterator
 from pathlib import Path
 from typing import Optional
 
 from nattka.bugzilla import BugCategory
 from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.errors import MalformedAtom
 from pkgcore.ebuild.profiles import OnDiskProfile
 from pkgcore.ebuild.repository import UnconfiguredTree
 
-
-class PackageListFileFormat(enum.Enum):
-    """Enumeration of supported package list file formats."""
-    PORTAGE = enum.auto()
-    TATT = enum.auto()
+"""The exit status when a package list is incomplete because the search for
+it exceeded a budget."""
+RESOLUTION_BUDGET_EXCEEDED_STATUS = 4
 
 
 def get_package_list_file_name_from_package(main_package: package) -> str:
@@ -86,12 +95,110 @@ def get_target_keyword(
     return arch if stable else f'~{arch}'
 
 
+def get_package_list_labels(
+        main_package: package,
+        target_profile: OnDiskProfile,
+        target_keyword: str
+) -> dict[str, str]:
+    """
+    Get the labels that identify the package list of a main package in
+    measurements of the work done to make package lists.
+
+    :param main_package: the main package
+    :param target_profile: the profile the package list is made for
+    :param target_keyword: the keyword the main package will have
+    :return: a dictionary with keys 'package', 'keyword', 'arch' and
+        'profile'
+    """
+    return {
+        'package': main_package.cpvstr,
+        'keyword': target_keyword,
+        'arch': target_profile.arch,
+        'profile': get_profile_name(target_profile)
+    }
+
+
+def iter_package_lists(
+        repo: UnconfiguredTree,
+        main_packages: Iterable[package],
+        target_profile: OnDiskProfile,
+        target_keyword: str,
+        match_keyword: Optional[str] = None,
+        cache: Optional[LRUCache] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        monitor: Optional[ResolutionMonitor] = None
+) -> Iterator[tuple[package, package]]:
+    """
+    For each of the specified main packages to keyword or stabilize for a
+    Portage profile, find all packages (including dependencies) that need to
+    be keyworded or stabilized at the same time, yielding each of them as soon
+    as it is found.  The packages for a main package are yielded in the order
+    of its package list, and they are all yielded before the packages for the
+    next main package.
+
+    See the 'get_package_lists' function for details about the parameters.
+
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param main_packages: the main packages to keyword or stabilize
+    :param target_profile: the profile to apply USE flag restrictions when
+        dependencies are being selected
+    :param target_keyword: the keyword that the main packages will have after
+        the keywording or stabilization process
+    :param match_keyword: if not omitted or not 'None', for unkeyworded or
+        unstable dependencies, use versions that are visible on the specified
+        keyword if possible
+    :param cache: a cache for best versions of dependencies shared by all the
+        main packages; omit or specify 'None' to use a new cache for this
+        invocation only
+    :param jobs: the number of threads to resolve dependencies with
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :param monitor: a monitor to report the progress of the search to; omit
+        or specify 'None' to not monitor the search
+    :return: an iterator over tuples, each of which contains a main package
+        and a package in its package list
+    :raise ResolutionBudgetExceeded: if 'monitor' stops the search, after the
+        packages found by then have been yielded
+    """
+    # Create package filter for dependencies
+    if match_keyword is not None:
+        pkg_filter = get_keyword_matching_pkg_filter(
+            target_keyword, match_keyword, keyword_index=keyword_index)
+    else:
+        pkg_filter = get_keyword_matching_pkg_filter(
+            target_keyword, keyword_index=keyword_index)
+
+    # Compute result, sharing resolved dependencies between main packages, so
+    # each package in the union of their dependency graphs is expanded once
+    if cache is None:
+        cache = LRUCache()
+    dep_graph = dict()
+    for main_package in main_packages:
+        with stats.measure('package list', get_package_list_labels(
+                main_package, target_profile, target_keyword)):
+            for pkg in iter_packages_to_process(
+                    main_package, target_keyword, repo, pkg_filter,
+                    target_profile, cache, dep_graph, jobs, dep_cache,
+                    keyword_index, monitor):
+                yield main_package, pkg
+
+
 def get_package_lists(
         repo: UnconfiguredTree,
         main_packages: Iterable[package],
         target_profile: OnDiskProfile,
         target_keyword: str,
-        match_keyword: Optional[str] = None
+        match_keyword: Optional[str] = None,
+        cache: Optional[LRUCache] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        monitor: Optional[ResolutionMonitor] = None
 ) -> dict[package, list[package]]:
     """
     For each of the specified main packages to keyword or stabilize for a
@@ -108,22 +215,27 @@ def get_package_lists(
     :param match_keyword: if not omitted or not 'None', for unkeyworded or
         unstable dependencies, use versions that are visible on the specified
         keyword if possible
+    :param cache: a cache for best versions of dependencies shared by all the
+        main packages; omit or specify 'None' to use a new cache for this
+        invocation only
+    :param jobs: the number of threads to resolve dependencies with
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :param monitor: a monitor to report the progress of the search to; omit
+        or specify 'None' to not monitor the search
     :return: a dictionary that maps each package in 'main_packages' to the list
         of all packages that need to be processed for keywording or stabilizing
         the package
+    :raise ResolutionBudgetExceeded: if 'monitor' stops the search
     """
-    # Create package filter for dependencies
-    if match_keyword is not None:
-        pkg_filter = get_keyword_matching_pkg_filter(
-            target_keyword, match_keyword)
-    else:
-        pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
-
-    # Compute result
-    result = dict()
-    for pkg in main_packages:
-        result[pkg] = get_packages_to_process(
-            pkg, target_keyword, repo, pkg_filter, target_profile)
+    main_packages = list(main_packages)
+    result = {pkg: list() for pkg in main_packages}
+    for main_package, pkg in iter_package_lists(
+            repo, main_packages, target_profile, target_keyword,
+            match_keyword, cache, jobs, dep_cache, keyword_index, monitor):
+        result[main_package].append(pkg)
     return result
 
 
@@ -147,6 +259,172 @@ def write_file_with_eperm_fallback(
         fallback_path.write_text(contents)
 
 
+def write_package_list_files(
+        portage_config: Path,
+        main_package: package,
+        package_list: list[package],
+        target_keyword: str,
+        ls_file_formats: Iterable[PackageListFileFormat]
+) -> None:
+    """
+    Write the package list for a main package to files in the specified
+    formats.
+
+    :param portage_config: the path to the Portage configuration files
+        directory
+    :param main_package: the main package that identifies the package list
+    :param package_list: the packages in the package list
+    :param target_keyword: the keyword that the packages will have after the
+        keywording or stabilization process
+    :param ls_file_formats: the formats of the files to write
+    """
+    portage_pak_contents = get_accept_keywords_contents(
+        package_list, target_keyword)
+    pkg_id = get_package_list_file_name_from_package(main_package)
+    for ls_file_format in ls_file_formats:
+        if ls_file_format == PackageListFileFormat.PORTAGE:
+            write_file_with_eperm_fallback(
+                os.linesep.join(portage_pak_contents) + os.linesep,
+                portage_config / PAK /
+                f'{get_portage_config_file_prefix()}{pkg_id}',
+                Path(PAK) / f'{get_portage_config_file_prefix()}{pkg_id}'
+            )
+        if ls_file_format == PackageListFileFormat.TATT:
+            file_path = Path('.') / f'{__project_name_abbrev__}--{pkg_id}'
+            file_contents = os.linesep.join(
+                map(lambda p: f'={p.cpvstr}', reversed(package_list)))
+            file_path.write_text(file_contents + os.linesep)
+
+
+def iter_atom_strs(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Extract package atoms from lines of text, where atoms are separated by
+    whitespace, and everything after a '#' on a line is a comment.  Atoms are
+    yielded as soon as the line containing them is read, so lines may come
+    from a stream that is still being written.
+
+    :param lines: the lines of text
+    :return: an iterator over the string representations of the atoms
+    """
+    for line in lines:
+        yield from line.partition('#')[0].split()
+
+
+def iter_batch_records(
+        repo: UnconfiguredTree,
+        atom_strs: Iterable[str],
+        target_profile: OnDiskProfile,
+        keyword_change_type: Optional[BugCategory] = None,
+        match_keyword: Optional[str] = None,
+        cache: Optional[LRUCache] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        monitor: Optional[ResolutionMonitor] = None
+) -> Iterator[tuple[dict, Optional[package], Optional[list[package]]]]:
+    """
+    Make the package list for each atom in a batch, yielding a record for
+    each atom as soon as its package list is complete.  Unlike the 'main'
+    function, every atom is treated as a separate keywording or stabilization
+    request, so the target keyword is inferred for each main package on its
+    own.  An atom that cannot be processed does not stop the batch; an error
+    record is yielded for it instead.
+
+    Resolved dependencies are shared by the whole batch, so the more atoms a
+    batch has, the more of their dependencies have already been resolved when
+    they are processed.
+
+    A record for an atom that has been processed has the following keys:
+    - 'atom': the atom as specified
+    - 'package': the CPV of the main package selected for the atom
+    - 'keyword': the keyword that the main package will have
+    - 'packages': the CPVs of the packages in the package list, in order
+    A record for an atom that cannot be processed only has keys 'atom' and
+    'error', where the value for 'error' describes the issue.  If 'monitor'
+    stops the search for an atom's package list, the record has all keys of
+    a record for a processed atom, with the partial package list for
+    'packages', and 'error' describing the budget that was exceeded.
+
+    The clock for the time budget of 'monitor' is restarted for every atom.
+
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param atom_strs: the string representations of the atoms
+    :param target_profile: the profile to apply USE flag restrictions when
+        dependencies are being selected
+    :param keyword_change_type: the type of keyword change to perform; omit or
+        specify 'None' to have the type be inferred for each main package
+    :param match_keyword: if not omitted or not 'None', for unkeyworded or
+        unstable dependencies, use versions that are visible on the specified
+        keyword if possible
+    :param cache: a cache for best versions of dependencies shared by all the
+        atoms; omit or specify 'None' to use a new cache for this invocation
+        only
+    :param jobs: the number of threads to resolve dependencies with
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :param monitor: a monitor to report the progress of the searches to; omit
+        or specify 'None' to not monitor the searches
+    :return: an iterator over tuples, each of which contains a record, the
+        main package, and the package list; the main package and the package
+        list are 'None' in tuples for atoms that cannot be processed
+    """
+    if cache is None:
+        cache = LRUCache()
+    # A dependency graph is only valid for one target keyword
+    dep_graphs = dict()
+    for atom_str in atom_strs:
+        record = {'atom': atom_str}
+        try:
+            atom_obj = get_atom_obj_from_str(atom_str)
+        except MalformedAtom as e:
+            record['error'] = str(e)
+            yield record, None, None
+            continue
+        check_result = check_atom_obj_for_keywording(atom_obj)
+        if check_result is not None:
+            record['error'] = check_result
+            yield record, None, None
+            continue
+        main_package = get_best_version(atom_obj, repo, cache=cache)
+        if main_package is None:
+            record['error'] = "Could not find a matching package for atom"
+            yield record, None, None
+            continue
+
+        target_keyword = get_target_keyword(
+            target_profile, [main_package], keyword_change_type)
+        if match_keyword is not None:
+            pkg_filter = get_keyword_matching_pkg_filter(
+                target_keyword, match_keyword, keyword_index=keyword_index)
+        else:
+            pkg_filter = get_keyword_matching_pkg_filter(
+                target_keyword, keyword_index=keyword_index)
+        if monitor is not None:
+            monitor.start()
+        package_list = list()
+        budget_exceeded = None
+        with stats.measure('package list', get_package_list_labels(
+                main_package, target_profile, target_keyword)):
+            try:
+                for pkg in iter_packages_to_process(
+                        main_package, target_keyword, repo, pkg_filter,
+                        target_profile, cache,
+                        dep_graphs.setdefault(target_keyword, dict()), jobs,
+                        dep_cache, keyword_index, monitor):
+                    package_list.append(pkg)
+            except ResolutionBudgetExceeded as e:
+                budget_exceeded = e
+        record['package'] = main_package.cpvstr
+        record['keyword'] = target_keyword
+        record['packages'] = [pkg.cpvstr for pkg in package_list]
+        if budget_exceeded is not None:
+            record['error'] = str(budget_exceeded)
+        yield record, main_package, package_list
+
+
 def main(
         portage_config: Path,
         repo: UnconfiguredTree,
@@ -155,7 +433,13 @@ def main(
         keyword_change_type: Optional[BugCategory] = None,
         match_keyword: Optional[str] = None,
         clean: bool = False,
-        ls_file_formats: list[PackageListFileFormat] = None
+        ls_file_formats: list[PackageListFileFormat] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        stream: bool = False,
+        cache: Optional[LRUCache] = None,
+        monitor: Optional[ResolutionMonitor] = None
 ) -> int:
     # If requested, clean any package list files created previously and exit
     if clean:
@@ -184,42 +468,107 @@ def main(
                 # Package list files for tatt
                 file_paths_to_clean.append(
                     Path('.') / f'{__project_name_abbrev__}--{pkg_id}')
-        for file_path in file_paths_to_clean:
-            file_path.unlink(missing_ok)
+        with stats.phase('clean package list files'):
+            for file_path in file_paths_to_clean:
+                file_path.unlink(missing_ok)
         return 0
 
     if ls_file_formats is None:
         ls_file_formats = list()
 
     # Determine target keyword
-    target_keyword = get_target_keyword(
-        target_profile, main_packages, keyword_change_type)
+    with stats.phase('infer target keyword'):
+        target_keyword = get_target_keyword(
+            target_profile, main_packages, keyword_change_type)
 
     # Get and output package lists
-    pkg_to_list_dict = get_package_lists(
-        repo, main_packages, target_profile, target_keyword, match_keyword)
-    for main_package in pkg_to_list_dict:
-        package_list = pkg_to_list_dict[main_package]
-        # Print package list to standard output in Portage
-        # package.accept_keywords format
-        portage_pak_contents = get_accept_keywords_contents(
-            package_list, target_keyword)
-        for line in portage_pak_contents:
-            print(line)
-
-        pkg_id = get_package_list_file_name_from_package(main_package)
-        for ls_file_format in ls_file_formats:
-            if ls_file_format == PackageListFileFormat.PORTAGE:
-                write_file_with_eperm_fallback(
-                    os.linesep.join(portage_pak_contents) + os.linesep,
-                    portage_config / PAK /
-                    f'{get_portage_config_file_prefix()}{pkg_id}',
-                    Path(PAK) / f'{get_portage_config_file_prefix()}{pkg_id}'
-                )
-            if ls_file_format == PackageListFileFormat.TATT:
-                file_path = Path('.') / f'{__project_name_abbrev__}--{pkg_id}'
-                file_contents = os.linesep.join(
-                    map(lambda p: f'={p.cpvstr}', reversed(package_list)))
-                file_path.write_text(file_contents + os.linesep)
+    budget_exceeded = None
+    with stats.phase('resolve package lists'):
+        # In streaming mode, print each line as soon as its package is found,
+        # and only keep the package lists in memory if they need to be
+        # written to files
+        if not stream or len(ls_file_formats) > 0:
+            pkg_to_list_dict = {pkg: list() for pkg in main_packages}
+        else:
+            pkg_to_list_dict = dict()
+        try:
+            for main_package, pkg in iter_package_lists(
+                    repo, main_packages, target_profile, target_keyword,
+                    match_keyword, cache, jobs, dep_cache, keyword_index,
+                    monitor):
+                if stream:
+                    print(get_accept_keywords_line(pkg, target_keyword),
+                          flush=True)
+                if main_package in pkg_to_list_dict:
+                    pkg_to_list_dict[main_package].append(pkg)
+        except ResolutionBudgetExceeded as e:
+            budget_exceeded = e
+            # Package lists that were not started are left out of the output
+            started = main_packages[:main_packages.index(e.main_package) + 1]
+            pkg_to_list_dict = {pkg: pkg_to_list_dict[pkg]
+                                for pkg in started if pkg in pkg_to_list_dict}
+    with stats.phase('write package lists'):
+        for main_package in pkg_to_list_dict:
+            package_list = pkg_to_list_dict[main_package]
+            # Print package list to standard output in Portage
+            # package.accept_keywords format
+            portage_pak_contents = get_accept_keywords_contents(
+                package_list, target_keyword)
+            if not stream:
+                for line in portage_pak_contents:
+                    print(line)
 
+            # Do not let an incomplete package list be used for testing
+            if budget_exceeded is not None and \
+                    main_package == budget_exceeded.main_package:
+                continue
+            write_package_list_files(
+                portage_config, main_package, package_list, target_keyword,
+                ls_file_formats)
+
+    if budget_exceeded is not None:
+        print(f"{budget_exceeded.main_package.cpvstr}: {budget_exceeded}; "
+              f"the package list is incomplete", file=sys.stderr)
+        return RESOLUTION_BUDGET_EXCEEDED_STATUS
     return 0
+
+
+def main_batch(
+        portage_config: Path,
+        repo: UnconfiguredTree,
+        atom_strs: Iterable[str],
+        target_profile: OnDiskProfile,
+        keyword_change_type: Optional[BugCategory] = None,
+        match_keyword: Optional[str] = None,
+        ls_file_formats: list[PackageListFileFormat] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        cache: Optional[LRUCache] = None,
+        monitor: Optional[ResolutionMonitor] = None
+) -> int:
+    if ls_file_formats is None:
+        ls_file_formats = list()
+    if cache is None:
+        cache = LRUCache()
+
+    # Print each record in JSON Lines format as soon as it is ready
+    status = 0
+    with stats.phase('resolve package lists'):
+        for record, main_package, package_list in iter_batch_records(
+                repo, atom_strs, target_profile, keyword_change_type,
+                match_keyword, cache, jobs, dep_cache, keyword_index,
+                monitor):
+            print(json.dumps(record), flush=True)
+            if 'error' in record:
+                if 'packages' not in record:
+                    status = 1
+                elif status == 0:
+                    # The package list is incomplete
+                    status = RESOLUTION_BUDGET_EXCEEDED_STATUS
+                continue
+            write_package_list_files(
+                portage_config, main_package, package_list,
+                record['keyword'], ls_file_formats)
+
+    return status
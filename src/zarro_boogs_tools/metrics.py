@@ -0,0 +1,184 @@
+#  zarro-boogs-tools Metrics Files for Monitoring Systems
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools import __project_name_abbrev__
+from zarro_boogs_tools.formats import MetricsFormat
+from zarro_boogs_tools.stats import StatsCollector
+
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+"""The name of the measurements metrics are made from."""
+PACKAGE_LIST_MEASUREMENT = 'package list'
+
+"""The name, the type and the description of each metric in Prometheus text
+files, in the order they are written, keyed on the metric's key in JSON."""
+PROMETHEUS_METRICS = {
+    'latency_seconds': (
+        'package_list_latency_seconds', 'gauge',
+        "Time spent making the package list of a main package."),
+    'size': (
+        'package_list_size', 'gauge',
+        "Number of packages in the package list of a main package."),
+    'packages_visited': (
+        'package_list_packages_visited', 'gauge',
+        "Number of packages visited while making the package list."),
+    'match_calls': (
+        'package_list_match_calls', 'gauge',
+        "Number of repository searches while making the package list."),
+    'cache_hit_ratios': (
+        'package_list_cache_hit_ratio', 'gauge',
+        "Ratio of cache lookups that hit while making the package list."),
+    'peak_rss_bytes': (
+        'peak_rss_bytes', 'gauge',
+        "Maximum resident set size of the process after making the package "
+        "list."),
+}
+
+
+def get_package_list_metrics(collector: StatsCollector) -> list[dict]:
+    """
+    Get the metrics of every package list made while statistics were being
+    collected.
+
+    :param collector: the collector the statistics were collected with
+    :return: a list of dictionaries, one for each package list in the order
+        the package lists were completed; the keys are 'labels' and the keys
+        in 'PROMETHEUS_METRICS', and 'cache_hit_ratios' maps the name of each
+        cache that was looked up to its hit ratio
+    """
+    result = list()
+    for measurement in collector.measurements:
+        if measurement['name'] != PACKAGE_LIST_MEASUREMENT:
+            continue
+        cache_hit_ratios = dict()
+        for cache, (hits, misses) in measurement['caches'].items():
+            if hits + misses > 0:
+                cache_hit_ratios[cache] = hits / (hits + misses)
+        result.append({
+            'labels': measurement['labels'],
+            'latency_seconds': measurement['wall_time'],
+            'size': measurement['counters'].get('packages listed', 0),
+            'packages_visited':
+                measurement['counters'].get('packages visited', 0),
+            'match_calls':
+                measurement['timer_calls'].get('repo.match', 0) +
+                measurement['timer_calls'].get('version index lookup', 0),
+            'cache_hit_ratios': cache_hit_ratios,
+            'peak_rss_bytes': measurement['peak_rss']
+        })
+    return result
+
+
+def escape_prometheus_label_value(value: str) -> str:
+    """
+    Escape a label value for the Prometheus text format.
+
+    :param value: the label value
+    :return: the escaped label value, without surrounding quotes
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_prometheus_metrics(package_list_metrics: list[dict]) -> str:
+    """
+    Format metrics returned by the 'get_package_list_metrics' function in the
+    Prometheus text format, which can be collected by the textfile collector
+    of the Prometheus node exporter.
+
+    :param package_list_metrics: the metrics
+    :return: the formatted metrics, which ends with a newline
+    """
+    lines = list()
+    for key, (name, metric_type, description) in PROMETHEUS_METRICS.items():
+        name = f'{__project_name_abbrev__}_{name}'
+        samples = list()
+        for metrics in package_list_metrics:
+            if key == 'cache_hit_ratios':
+                values = [({'cache': cache}, ratio) for cache, ratio
+                          in metrics['cache_hit_ratios'].items()]
+            elif metrics[key] is not None:
+                values = [(dict(), metrics[key])]
+            else:
+                values = list()
+            for extra_labels, value in values:
+                labels = ','.join(
+                    f'{label}="{escape_prometheus_label_value(label_value)}"'
+                    for label, label_value
+                    in {**metrics['labels'], **extra_labels}.items())
+                samples.append(f'{name}{{{labels}}} {value}')
+        if len(samples) > 0:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.extend(samples)
+    return ''.join(f'{line}\n' for line in lines)
+
+
+def get_metrics_format_from_path(path: Path) -> MetricsFormat:
+    """
+    Guess the format metrics should be written in from the name of the file
+    they are written to.  Files with extension '.prom', which the Prometheus
+    node exporter looks for, are Prometheus text files; all other files are
+    JSON files.
+
+    :param path: the path to the file
+    :return: the metrics format
+    """
+    if Path(path).suffix == '.prom':
+        return MetricsFormat.PROMETHEUS
+    return MetricsFormat.JSON
+
+
+def write_metrics_file(
+        path: Path,
+        collector: StatsCollector,
+        metrics_format: Optional[MetricsFormat] = None
+) -> None:
+    """
+    Write the metrics of the package lists made while statistics were being
+    collected to a file.  The file is replaced atomically, so a monitoring
+    system never reads a partially written file.
+
+    :param path: the path to the file
+    :param collector: the collector the statistics were collected with
+    :param metrics_format: the format of the file; omit or specify 'None' to
+        choose the format with the 'get_metrics_format_from_path' function
+    :raise OSError: if the file cannot be written
+    """
+    if metrics_format is None:
+        metrics_format = get_metrics_format_from_path(path)
+    package_list_metrics = get_package_list_metrics(collector)
+    if metrics_format == MetricsFormat.PROMETHEUS:
+        contents = format_prometheus_metrics(package_list_metrics)
+    else:
+        contents = json.dumps(
+            {'package_lists': package_list_metrics}, indent=2) + '\n'
+    path = Path(path)
+    temp_path = path.with_name(f'.{path.name}.{os.getpid()}')
+    try:
+        with open(temp_path, 'w') as metrics_file:
+            metrics_file.write(contents)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
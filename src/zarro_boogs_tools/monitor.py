@@ -0,0 +1,196 @@
+#  zarro-boogs-tools Progress Reporting and Budgets for Package List Making
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+import sys
+import time
+from typing import Callable, Optional, TextIO
+
+from pkgcore.ebuild.ebuild_src import package
+
+"""The default minimum number of seconds between progress reports."""
+DEFAULT_PROGRESS_INTERVAL = 0.1
+
+"""A type alias for functions that receive progress reports.  The arguments
+are the main package whose package list is being made, the number of packages
+in the search queue, the number of packages visited, the number of packages
+in the package list so far, and the number of seconds since the monitor was
+started."""
+ProgressCallback = Callable[[package, int, int, int, float], None]
+
+
+class ResolutionBudgetExceeded(Exception):
+    """
+    An exception raised when making a package list exceeds a budget set by a
+    ResolutionMonitor.  The packages found for the main package before the
+    exception was raised form a partial package list.
+    """
+
+    def __init__(self, message: str, main_package: package):
+        """
+        :param message: a description of the budget that was exceeded
+        :param main_package: the main package whose package list was being
+            made when the budget was exceeded
+        """
+        super().__init__(message)
+        self.main_package = main_package
+
+
+class ResolutionMonitor:
+    """
+    An object that the breadth-first search for a package list reports its
+    progress to, which enforces budgets on the search and forwards progress
+    reports to a callback at a limited rate.
+
+    The time budget covers every package list made while the monitor is
+    used, starting from the first report or the call to the 'start' method;
+    the size budget applies to each package list on its own.  Budgets are
+    checked whenever a package is added to a package list, and the time
+    budget is also checked before the dependencies of each package are
+    resolved, so a search may run past the time budget by the time it takes
+    to resolve the dependencies of one package.
+    """
+
+    def __init__(
+            self,
+            max_time: Optional[float] = None,
+            max_packages: Optional[int] = None,
+            progress_callback: Optional[ProgressCallback] = None,
+            progress_interval: float = DEFAULT_PROGRESS_INTERVAL
+    ):
+        """
+        :param max_time: the maximum number of seconds to spend; omit or
+            specify 'None' for no time limit
+        :param max_packages: the maximum number of packages in each package
+            list; omit or specify 'None' for no size limit
+        :param progress_callback: a function to report progress to; omit or
+            specify 'None' to not report progress
+        :param progress_interval: the minimum number of seconds between calls
+            to 'progress_callback'
+        """
+        self.max_time = max_time
+        self.max_packages = max_packages
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.start_time = None
+        self._last_progress_time = None
+
+    def start(self) -> None:
+        """Start the clock for the time budget."""
+        self.start_time = time.monotonic()
+
+    def update(
+            self,
+            main_package: package,
+            queue_length: int,
+            visited: int,
+            listed: int
+    ) -> None:
+        """
+        Report the progress of the search for a package list.
+
+        :param main_package: the main package whose package list is being made
+        :param queue_length: the number of packages in the search queue
+        :param visited: the number of packages visited
+        :param listed: the number of packages in the package list so far
+        :raise ResolutionBudgetExceeded: if any budget is exceeded
+        """
+        now = time.monotonic()
+        if self.start_time is None:
+            self.start_time = now
+        elapsed = now - self.start_time
+        if self.progress_callback is not None and (
+                self._last_progress_time is None or
+                now - self._last_progress_time >= self.progress_interval):
+            self._last_progress_time = now
+            self.progress_callback(
+                main_package, queue_length, visited, listed, elapsed)
+        if self.max_packages is not None and listed > self.max_packages:
+            raise ResolutionBudgetExceeded(
+                f"Package list has more than {self.max_packages} packages",
+                main_package)
+        if self.max_time is not None and elapsed > self.max_time:
+            raise ResolutionBudgetExceeded(
+                f"Time limit of {self.max_time} seconds exceeded",
+                main_package)
+
+    def check_time(self, main_package: package) -> None:
+        """
+        Check the time budget without reporting progress.  Unlike 'update',
+        this method can be called from any thread.
+
+        :param main_package: the main package whose package list is being made
+        :raise ResolutionBudgetExceeded: if the time budget is exceeded
+        """
+        if self.max_time is None or self.start_time is None:
+            return
+        if time.monotonic() - self.start_time > self.max_time:
+            raise ResolutionBudgetExceeded(
+                f"Time limit of {self.max_time} seconds exceeded",
+                main_package)
+
+
+class ProgressPrinter:
+    """
+    A progress callback for ResolutionMonitor objects that keeps a status
+    line updated on a terminal.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        """
+        :param stream: the stream to print the status line to; omit or
+            specify 'None' to use the standard error stream at the time the
+            status line is printed
+        """
+        self.stream = stream
+        self._line_length = 0
+
+    def __call__(
+            self,
+            main_package: package,
+            queue_length: int,
+            visited: int,
+            listed: int,
+            elapsed: float
+    ) -> None:
+        rate = visited / elapsed if elapsed > 0 else 0.0
+        line = f"{main_package.cpvstr}: {listed} listed, {visited} visited, " \
+               f"{queue_length} queued, {rate:.1f} packages/s"
+        self._print(line)
+
+    def _get_stream(self) -> TextIO:
+        return sys.stderr if self.stream is None else self.stream
+
+    def _print(self, line: str) -> None:
+        # Overwrite the previous line completely even if the new one is
+        # shorter
+        padding = ' ' * max(0, self._line_length - len(line))
+        stream = self._get_stream()
+        stream.write(f'\r{line}{padding}')
+        stream.flush()
+        self._line_length = len(line)
+
+    def clear(self) -> None:
+        """Erase the status line, if one has been printed."""
+        if self._line_length > 0:
+            self._print('')
+            stream = self._get_stream()
+            stream.write('\r')
+            stream.flush()
@@ -19,23 +19,44 @@
 #  along with zarro-boogs-tools.  If not, see
 #  <https://www.gnu.org/licenses/>.
 
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.depcache import DependencyCache
+from zarro_boogs_tools.index import KeywordIndex, get_version_index
+from zarro_boogs_tools.monitor import ResolutionMonitor
 from zarro_boogs_tools.pkgcore.restriction import \
-    convert_and_restriction_to_list, preprocess_restriction
+    convert_and_restriction_to_list, is_anchored, preprocess_restriction
+from zarro_boogs_tools.profiling import annotated_call
 
+import functools
+import warnings
 from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, ThreadPoolExecutor
 from typing import Callable, Optional
 
 import nattka.package
 import pkgcore.ebuild.atom as atom
 import pkgcore.restrictions.boolean as boolean
+import pkgcore.restrictions.restriction as restriction
 from pkgcore.ebuild.ebuild_src import package
 from pkgcore.ebuild.errors import MalformedAtom
 from pkgcore.ebuild.profiles import OnDiskProfile
 from pkgcore.ebuild.repository import UnconfiguredTree
+from pkgcore.package.errors import MetadataException
 
 """A type alias for package filters."""
 PackageFilter = Callable[[Iterator[package]], Iterable[package]]
 
+"""A sentinel for telling a cached 'None' from a missing cache entry."""
+_NOT_CACHED = object()
+
+
+class FullRepositoryScanWarning(UserWarning):
+    """
+    A warning that a restriction could only be matched by traversing all the
+    packages in an ebuild repository.
+    """
+
 
 def get_atom_obj_from_str(atom_str: str) -> atom:
     """
@@ -90,24 +111,86 @@ def check_atom_obj_for_keywording(atom_obj: atom) -> Optional[str]:
 def get_best_version(
         atom_obj: atom,
         repo: UnconfiguredTree,
-        pkg_filter: Optional[PackageFilter] = None
+        pkg_filter: Optional[PackageFilter] = None,
+        cache: Optional[LRUCache] = None
 ) -> Optional[package]:
     """
     Find the best version of the package that satisfies the specified atom in
     a given ebuild repository.  If a version can be found, return the object
     that represents the best version; otherwise, 'None' is returned.
 
+    If 'cache' is not 'None', the result is memoized in it, keyed on the atom,
+    the repository and the identity of 'pkg_filter'.  Because of this, a cache
+    should only be shared by callers whose package filters are not modified
+    after being created, which holds for all package filters created by this
+    module.
+
+    Atoms and any-of and all-of groups of atoms are resolved with the
+    repository's version index, which is returned by the 'get_version_index'
+    function of the 'index' module, and the keywords of packages are tested
+    against filters returned by the 'get_keyword_matching_pkg_filter'
+    function without calling the filters.  Restrictions that match no
+    package are recorded in the index, so they are never searched for again.
+    Other restrictions are passed to pkgcore's 'repo.match' instead; if such
+    a restriction is not anchored to any package, as determined by the
+    'is_anchored' function of the 'pkgcore.restriction' module, the whole
+    repository is traversed, which is counted in the statistics as 'full
+    repository scans' and reported with a FullRepositoryScanWarning.
+
     :param atom_obj: the object representing the atom
     :param repo: the object representing the ebuild repository where candidate
         packages are searched
     :param pkg_filter: a filter for limiting the set of packages that may be
         selected as the best version; omit or specify 'None' to skip any
         filtering
+    :param cache: a cache for results of previous invocations of this function
+        to be looked up and updated; omit or specify 'None' to always search
+        the repository
     :return: the object for the best-matching package if there is one, or
         'None' otherwise
     """
-    matches = repo.match(atom_obj, pkg_filter=pkg_filter)
+    if cache is not None:
+        key = (atom_obj, repo, pkg_filter)
+        result = cache.get(key, _NOT_CACHED)
+        if result is _NOT_CACHED:
+            result = get_best_version(atom_obj, repo, pkg_filter)
+            cache.put(key, result)
+        return result
+
+    version_index = get_version_index(repo)
+    if version_index is not None:
+        if version_index.has_no_match(atom_obj):
+            stats.increment('negative match cache hits')
+            return None
+        keyword_mask = None
+        generic_filter = pkg_filter
+        if isinstance(pkg_filter, KeywordMatchingPackageFilter):
+            keyword_mask = version_index.get_keyword_mask(
+                pkg_filter.get_visible_keywords())
+            generic_filter = None
+        try:
+            with stats.timer('version index lookup'):
+                matches = version_index.find_matches(atom_obj)
+                if matches is not None:
+                    if not matches:
+                        version_index.record_no_match(atom_obj)
+                    return version_index.select_best_version(
+                        matches, keyword_mask, generic_filter)
+        except MetadataException:
+            # Let pkgcore handle packages with broken metadata in the same
+            # way as it would without the index
+            pass
+
+    if not is_anchored(atom_obj):
+        stats.increment('full repository scans')
+        warnings.warn(
+            f"{atom_obj}: Searching the whole repository for packages "
+            f"matching restriction", FullRepositoryScanWarning)
+    with stats.timer('repo.match'):
+        matches = repo.match(atom_obj, pkg_filter=pkg_filter)
     if len(matches) == 0:
+        if version_index is not None and pkg_filter is None:
+            version_index.record_no_match(atom_obj)
         return None
     else:
         return nattka.package.select_best_version(matches)
@@ -118,7 +201,13 @@ def get_packages_to_process(
         target_keyword: str,
         repo: UnconfiguredTree,
         pkg_filter: Optional[PackageFilter] = None,
-        profile: Optional[OnDiskProfile] = None
+        profile: Optional[OnDiskProfile] = None,
+        cache: Optional[LRUCache] = None,
+        dep_graph: Optional[dict[package, list[package]]] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        monitor: Optional[ResolutionMonitor] = None
 ) -> list[package]:
     """
     When keywording or stabilizing a package, find the dependencies that also
@@ -151,6 +240,42 @@ def get_packages_to_process(
     USE flag masks or forces, then the USE-conditional group will be ignored by
     this function.
 
+    'cache' is passed to every invocation of the 'get_best_version' function
+    made by this function.  Sharing a cache between calls to this function
+    avoids searching the repository again for dependencies that have already
+    been resolved for other packages.
+
+    'dep_graph' maps each package whose dependencies have been resolved to the
+    list returned by the 'get_direct_dependencies' function for it.  This
+    function looks up the dependencies of a package in 'dep_graph' before
+    resolving them, and it adds every package it resolves to 'dep_graph'.
+    Therefore, when the dependencies of multiple main packages are found,
+    sharing 'dep_graph' between calls to this function guarantees that each
+    package is only resolved once.  A dependency graph is only valid for one
+    combination of 'repo', 'pkg_filter', 'profile', and whether stabilization
+    is done, so it should not be shared between calls with different
+    arguments for these parameters.
+
+    If 'jobs' is greater than 1, the dependencies of all packages in the same
+    level of the breadth-first search are resolved by a pool of that many
+    threads.  The returned list is identical to the one returned when 'jobs'
+    is 1.
+
+    'dep_cache' is used to look up the keywords and the preprocessed
+    dependency restrictions of packages without parsing their metadata, and it
+    is updated with the restrictions of packages that are not in it yet.
+    'keyword_index', if it is not 'None', is used instead to check if a
+    package already has the target keyword.
+
+    'monitor', if it is not 'None', receives progress reports during the
+    search and may stop it by raising ResolutionBudgetExceeded, in which case
+    the packages found so far are lost; use the 'iter_packages_to_process'
+    function to keep them.
+
+    To consume the packages while the search is still running, use the
+    'iter_packages_to_process' function, which yields the same packages in
+    the same order.
+
     'pkg_filter' examples:
     - lambda pkgs: filter(lambda pkg: '~amd64' in pkg.keywords, pkgs)
         For each dependency, use the best version among all versions that are
@@ -188,59 +313,416 @@ def get_packages_to_process(
     :param profile: a profile to apply USE flag restrictions when dependencies
         are being selected; omit or specify 'None' to include dependencies from
         all USE-conditional groups
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param dep_graph: a dependency graph to look up and extend; omit or specify
+        'None' to use a new dependency graph for this invocation only
+    :param jobs: the number of threads to resolve dependencies with
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :param monitor: a monitor to report the progress of the search to; omit
+        or specify 'None' to not monitor the search
     :return: a list of the selected packages to process
+    :raise ResolutionBudgetExceeded: if 'monitor' stops the search
+    """
+    return list(iter_packages_to_process(
+        main_package, target_keyword, repo, pkg_filter, profile, cache,
+        dep_graph, jobs, dep_cache, keyword_index, monitor))
+
+
+def iter_packages_to_process(
+        main_package: package,
+        target_keyword: str,
+        repo: UnconfiguredTree,
+        pkg_filter: Optional[PackageFilter] = None,
+        profile: Optional[OnDiskProfile] = None,
+        cache: Optional[LRUCache] = None,
+        dep_graph: Optional[dict[package, list[package]]] = None,
+        jobs: int = 1,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        monitor: Optional[ResolutionMonitor] = None
+) -> Iterator[package]:
+    """
+    Find the dependencies that also need to be keyworded or stabilized when a
+    package is keyworded or stabilized, yielding each package as soon as the
+    breadth-first search in the package's dependency graph reaches it.  The
+    packages are yielded in the same order as they appear in the list returned
+    by the 'get_packages_to_process' function for the same arguments; see that
+    function for details about the parameters.
+
+    If the generator is closed before it is exhausted, or 'monitor' stops the
+    search, 'dep_graph' only contains the packages whose dependencies had
+    been resolved by then, which is still valid for sharing with later calls.
+    The packages yielded before 'monitor' stops the search form a partial
+    package list.
+
+    :param main_package: the main package to keyword or stabilize
+    :param target_keyword: the keyword that would be added to the main
+        package's 'KEYWORDS' variable after the process
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param pkg_filter: a filter to set a preference on the versions of
+        dependencies chosen to be processed; omit or specify 'None' to skip any
+        filtering
+    :param profile: a profile to apply USE flag restrictions when dependencies
+        are being selected; omit or specify 'None' to include dependencies from
+        all USE-conditional groups
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param dep_graph: a dependency graph to look up and extend; omit or specify
+        'None' to use a new dependency graph for this invocation only
+    :param jobs: the number of threads to resolve dependencies with
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :param monitor: a monitor to report the progress of the search to; omit
+        or specify 'None' to not monitor the search
+    :return: an iterator over the selected packages to process
+    :raise ResolutionBudgetExceeded: if 'monitor' stops the search
     """
     stable = not target_keyword.startswith('~')
+    if dep_graph is None:
+        dep_graph = dict()
 
-    # Run an ordinary breadth-first search in the package's dependency graph
-    result = list()
+    # Run an ordinary breadth-first search in the package's dependency graph,
+    # one level at a time, so all packages in a level can be expanded together
     main_package_singleton = [main_package]
     pkg_processing_queue = list(main_package_singleton)
     visited_pkgs = set(main_package_singleton)
+    listed = 0
 
-    while len(pkg_processing_queue) > 0:
-        next_pkg = pkg_processing_queue.pop(0)
-        if target_keyword in next_pkg.keywords or \
-                target_keyword.lstrip('~') in next_pkg.keywords:
-            # The package already has the target keyword; no action needed
-            continue
-        result.append(next_pkg)
-
-        deps_restrictions = set()
-        for dep_class in [next_pkg.bdepend, next_pkg.depend, next_pkg.rdepend,
-                          next_pkg.pdepend, next_pkg.idepend]:
-            deps_restrictions = deps_restrictions.union(dep_class.restrictions)
-
-        processed_restrictions = list()
-        for restriction in deps_restrictions:
-            restriction = preprocess_restriction(
-                restriction, next_pkg, profile, stable)
-            if isinstance(restriction, atom.atom) and restriction.blocks:
+    if monitor is not None and monitor.max_time is not None:
+        def check_budget() -> None:
+            monitor.check_time(main_package)
+    else:
+        check_budget = None
+
+    executor = ThreadPoolExecutor(jobs) if jobs > 1 else None
+    try:
+        while len(pkg_processing_queue) > 0:
+            current_level = list()
+            stats.increment('packages visited', len(pkg_processing_queue))
+            for next_pkg in pkg_processing_queue:
+                if keyword_index is not None:
+                    has_target_keyword = keyword_index.is_visible(
+                        next_pkg, target_keyword)
+                else:
+                    if dep_cache is not None:
+                        keywords = dep_cache.get_keywords(next_pkg)
+                    else:
+                        keywords = next_pkg.keywords
+                    has_target_keyword = target_keyword in keywords or \
+                        target_keyword.lstrip('~') in keywords
+                if has_target_keyword:
+                    # The package already has the target keyword; no action
+                    # needed
+                    continue
+                if monitor is not None:
+                    monitor.update(main_package, len(pkg_processing_queue),
+                                   len(visited_pkgs), listed + 1)
+                current_level.append(next_pkg)
+                listed += 1
+                stats.increment('packages listed')
+                yield next_pkg
+
+            if monitor is not None:
+                monitor.update(main_package, len(current_level),
+                               len(visited_pkgs), listed)
+            expand_dependency_graph(
+                [pkg for pkg in current_level if pkg not in dep_graph],
+                dep_graph, repo, pkg_filter, profile, stable, cache, executor,
+                dep_cache, check_budget)
+
+            # Merge dependencies in the order of the packages in the level,
+            # which is the order a one-package-at-a-time search would use
+            pkg_processing_queue = list()
+            for next_pkg in current_level:
+                for dep_pkg in dep_graph[next_pkg]:
+                    if dep_pkg not in visited_pkgs:
+                        pkg_processing_queue.append(dep_pkg)
+                        visited_pkgs.add(dep_pkg)
+    finally:
+        if executor is not None:
+            # Tasks that have not started yet are not needed anymore if the
+            # search has been stopped
+            executor.shutdown(cancel_futures=True)
+
+
+def expand_dependency_graph(
+        pkgs: list[package],
+        dep_graph: dict[package, list[package]],
+        repo: UnconfiguredTree,
+        pkg_filter: Optional[PackageFilter] = None,
+        profile: Optional[OnDiskProfile] = None,
+        stable: Optional[bool] = None,
+        cache: Optional[LRUCache] = None,
+        executor: Optional[Executor] = None,
+        dep_cache: Optional[DependencyCache] = None,
+        check_budget: Optional[Callable[[], None]] = None
+) -> None:
+    """
+    Add the direct dependencies of every specified package to a dependency
+    graph, as the 'get_direct_dependencies' function would find them.
+
+    If 'executor' is not 'None', the dependency metadata of the packages is
+    parsed, and then the restrictions of all the packages are resolved, by
+    tasks submitted to the executor.  The resulting dependency graph is the
+    same as the one built without an executor.
+
+    If 'check_budget' raises an exception, the expansion stops, and
+    'dep_graph' only contains the packages whose dependencies had been
+    resolved completely by then.
+
+    :param pkgs: the packages whose dependencies are resolved
+    :param dep_graph: the dependency graph to extend
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param pkg_filter: a filter to set a preference on the versions of
+        dependencies; omit or specify 'None' to skip any filtering
+    :param profile: a profile to apply USE flag restrictions on USE-conditional
+        groups; omit or specify 'None' to include dependencies from all
+        USE-conditional groups
+    :param stable: whether USE flag restrictions for stable packages should be
+        applied
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param executor: an executor to run the resolution in parallel; omit or
+        specify 'None' to run it in the calling thread
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of packages
+    :param check_budget: a function called before the dependencies of each
+        package are parsed and before each dependency is resolved, which may
+        be called from the executor's threads and raises an exception to stop
+        the expansion; omit or specify 'None' to never stop it
+    """
+    stats.increment('packages expanded', len(pkgs))
+    if check_budget is None:
+        def check_budget() -> None:
+            pass
+
+    if executor is None:
+        for pkg in pkgs:
+            check_budget()
+            dep_graph[pkg] = annotated_call(
+                'expand', pkg.cpvstr, get_direct_dependencies,
+                pkg, repo, pkg_filter, profile, stable, cache, dep_cache)
+        return
+
+    def expand(pkg: package) -> list[restriction.base]:
+        check_budget()
+        return annotated_call(
+            'expand', pkg.cpvstr, get_dependency_restrictions,
+            pkg, profile, stable, dep_cache)
+
+    def resolve(dep_restriction: restriction.base) -> Optional[package]:
+        check_budget()
+        return annotated_call(
+            'resolve', dep_restriction, get_dependency_best_version,
+            dep_restriction, repo, pkg_filter, cache)
+
+    pkgs_restrictions = list(executor.map(expand, pkgs))
+    dep_pkgs = iter(executor.map(
+        resolve,
+        [r for restrictions in pkgs_restrictions for r in restrictions]))
+    for pkg, restrictions in zip(pkgs, pkgs_restrictions):
+        pkg_deps = list()
+        for _ in restrictions:
+            dep_pkg = next(dep_pkgs)
+            if dep_pkg is not None and dep_pkg not in pkg_deps:
+                pkg_deps.append(dep_pkg)
+        dep_graph[pkg] = pkg_deps
+
+
+def get_dependency_restrictions(
+        pkg: package,
+        profile: Optional[OnDiskProfile] = None,
+        stable: Optional[bool] = None,
+        dep_cache: Optional[DependencyCache] = None
+) -> list[restriction.base]:
+    """
+    Get the restrictions for all dependencies of a package in every dependency
+    class, preprocessed so that each of them may be passed to the
+    'get_best_version' function individually.  Dependencies specified as a
+    block are not included.
+
+    :param pkg: the package whose dependencies are returned
+    :param profile: a profile to apply USE flag restrictions on USE-conditional
+        groups; omit or specify 'None' to include dependencies from all
+        USE-conditional groups
+    :param stable: whether USE flag restrictions for stable packages should be
+        applied
+    :param dep_cache: a persistent dependency cache to look up and update;
+        omit or specify 'None' to always parse the metadata of the package
+    :return: a list of the preprocessed restrictions for the dependencies
+    """
+    if dep_cache is not None:
+        processed_restrictions = dep_cache.get_dependency_restrictions(
+            pkg, profile, stable)
+        if processed_restrictions is None:
+            processed_restrictions = get_dependency_restrictions(
+                pkg, profile, stable)
+            dep_cache.put_dependency_restrictions(
+                pkg, processed_restrictions, profile, stable)
+        return processed_restrictions
+
+    deps_restrictions = set()
+    with stats.timer('dependency metadata parsing'):
+        for dep_class in [pkg.bdepend, pkg.depend, pkg.rdepend,
+                          pkg.pdepend, pkg.idepend]:
+            deps_restrictions = deps_restrictions.union(
+                dep_class.restrictions)
+    stats.increment('restrictions processed', len(deps_restrictions))
+
+    processed_restrictions = list()
+    with stats.timer('restriction preprocessing'):
+        for restrict in deps_restrictions:
+            restrict = preprocess_restriction(restrict, pkg, profile, stable)
+            if isinstance(restrict, atom.atom) and restrict.blocks:
                 # Do not process dependencies specified as a block
                 continue
             # Each dependency in an all-of group needs to be processed
             # individually; otherwise, if an all-of group was given to the
             # get_best_version() function directly, 'None' would be returned
-            if isinstance(restriction, boolean.AndRestriction) and \
-                    not isinstance(restriction, atom.atom):
+            if isinstance(restrict, boolean.AndRestriction) and \
+                    not isinstance(restrict, atom.atom):
                 processed_restrictions.extend(
-                    convert_and_restriction_to_list(restriction))
+                    convert_and_restriction_to_list(restrict))
             else:
-                processed_restrictions.append(restriction)
+                processed_restrictions.append(restrict)
+    return processed_restrictions
 
-        for restriction in processed_restrictions:
-            dep_pkg = get_best_version(restriction, repo, pkg_filter)
-            if dep_pkg is None:
-                # No package matches the filter; try again without it
-                dep_pkg = get_best_version(restriction, repo)
-            if dep_pkg is not None and dep_pkg not in visited_pkgs:
-                pkg_processing_queue.append(dep_pkg)
-                visited_pkgs.add(dep_pkg)
 
+def get_direct_dependencies(
+        pkg: package,
+        repo: UnconfiguredTree,
+        pkg_filter: Optional[PackageFilter] = None,
+        profile: Optional[OnDiskProfile] = None,
+        stable: Optional[bool] = None,
+        cache: Optional[LRUCache] = None,
+        dep_cache: Optional[DependencyCache] = None
+) -> list[package]:
+    """
+    Find the best version of every direct dependency of a package.  The
+    versions are selected in the same way as the 'get_packages_to_process'
+    function selects them, and they are returned in the order that function
+    visits them, without duplicates.
+
+    :param pkg: the package whose dependencies are resolved
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param pkg_filter: a filter to set a preference on the versions of
+        dependencies; omit or specify 'None' to skip any filtering
+    :param profile: a profile to apply USE flag restrictions on USE-conditional
+        groups; omit or specify 'None' to include dependencies from all
+        USE-conditional groups
+    :param stable: whether USE flag restrictions for stable packages should be
+        applied
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param dep_cache: a persistent dependency cache; omit or specify 'None' to
+        always parse the metadata of the package
+    :return: a list of the best versions of the package's dependencies
+    """
+    result = list()
+    for restrict in get_dependency_restrictions(
+            pkg, profile, stable, dep_cache):
+        dep_pkg = annotated_call(
+            'resolve', restrict, get_dependency_best_version,
+            restrict, repo, pkg_filter, cache)
+        if dep_pkg is not None and dep_pkg not in result:
+            result.append(dep_pkg)
     return result
 
 
-def get_keyword_matching_pkg_filter(*keywords: str) -> PackageFilter:
+def get_dependency_best_version(
+        restrict: restriction.base,
+        repo: UnconfiguredTree,
+        pkg_filter: Optional[PackageFilter] = None,
+        cache: Optional[LRUCache] = None
+) -> Optional[package]:
+    """
+    Find the best version of a dependency, preferring versions that pass
+    through the specified package filter.  If no version passes through the
+    filter, the best version is searched again without the filter.
+
+    :param restrict: the preprocessed restriction for the dependency
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param pkg_filter: a filter to set a preference on the versions of the
+        dependency; omit or specify 'None' to skip any filtering
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :return: the object for the best version of the dependency if there is
+        one, or 'None' otherwise
+    """
+    dep_pkg = get_best_version(restrict, repo, pkg_filter, cache)
+    if dep_pkg is None and pkg_filter is not None:
+        # No package matches the filter; try again without it
+        stats.increment('filter fallbacks')
+        dep_pkg = get_best_version(restrict, repo, cache=cache)
+    return dep_pkg
+
+
+class KeywordMatchingPackageFilter:
+    """
+    A package filter that selects only packages visible on at least one of
+    some keywords.  'get_best_version' recognizes filters of this class and
+    tests the keywords of packages in the repository's version index instead
+    of calling the filter.
+    """
+
+    def __init__(
+            self,
+            keywords: tuple[str, ...],
+            keyword_index: Optional[KeywordIndex] = None
+    ):
+        """
+        :param keywords: the keywords to check against the filtered packages
+        :param keyword_index: an index of the keywords of packages in the
+            repository the filtered packages are from; omit or specify 'None'
+            to read keywords from the package objects
+        """
+        self.keywords = keywords
+        self.keyword_index = keyword_index
+
+    def get_visible_keywords(self) -> set[str]:
+        """
+        Get the keywords a package may have to pass through the filter.
+
+        :return: the filter's keywords and their stable variants
+        """
+        return {k for keyword in self.keywords
+                for k in (keyword, keyword.lstrip('~'))}
+
+    def is_visible(self, pkg: package) -> bool:
+        """
+        Check if a package passes through the filter.
+
+        :param pkg: the package to check
+        :return: whether the package is visible on any of the filter's
+            keywords
+        """
+        for keyword in self.keywords:
+            if self.keyword_index is not None:
+                if self.keyword_index.is_visible(pkg, keyword):
+                    return True
+            elif keyword in pkg.keywords or \
+                    keyword.lstrip('~') in pkg.keywords:
+                return True
+        return False
+
+    def __call__(self, pkgs: Iterator[package]) -> Iterable[package]:
+        return filter(self.is_visible, pkgs)
+
+
+def get_keyword_matching_pkg_filter(
+        *keywords: str,
+        keyword_index: Optional[KeywordIndex] = None
+) -> PackageFilter:
     """
     Obtain a package filter that may be used to prevent some most bleeding-edge
     versions of packages from being selected for keywording or stabilization.
@@ -248,16 +730,35 @@ def get_keyword_matching_pkg_filter(*keywords: str) -> PackageFilter:
     filter out packages that are invisible on every keyword specified in the
     arguments to this function.
 
+    The same filter object is returned for the same keywords and keyword
+    index, so results of 'get_best_version' cached for a filter can be reused
+    by every caller that asks for a filter with the same keywords.  Filters
+    that use a keyword index are memoized in the index, so they are discarded
+    together with it.
+
+    If 'keyword_index' is not 'None', the returned filter looks up the
+    keywords of packages in the index instead of reading them from the
+    package objects, so the metadata of packages that are filtered out never
+    has to be loaded.
+
     :param keywords: the keywords to check against the packages passed to the
         returned filter
+    :param keyword_index: an index of the keywords of packages in the
+        repository the filtered packages are from; omit or specify 'None' to
+        read keywords from the package objects
     :return: a package filter that selects only packages visible on at least
         one of the 'keywords'
     """
-    def is_visible_on_any_keyword(pkg: package) -> bool:
-        for keyword in keywords:
-            if keyword in pkg.keywords or keyword.lstrip('~') in pkg.keywords:
-                return True
-        return False
-
-    return lambda pkgs: filter(
-        lambda pkg: is_visible_on_any_keyword(pkg), pkgs)
+    if keyword_index is None:
+        return _get_keyword_matching_pkg_filter(keywords)
+    pkg_filter = keyword_index.pkg_filters.get(keywords)
+    if pkg_filter is None:
+        pkg_filter = keyword_index.pkg_filters.setdefault(
+            keywords, KeywordMatchingPackageFilter(keywords, keyword_index))
+    return pkg_filter
+
+
+@functools.lru_cache(maxsize=None)
+def _get_keyword_matching_pkg_filter(
+        keywords: tuple[str, ...]) -> PackageFilter:
+    return KeywordMatchingPackageFilter(keywords)
@@ -19,6 +19,10 @@
 #  along with zarro-boogs-tools.  If not, see
 #  <https://www.gnu.org/licenses/>.
 
+from zarro_boogs_tools import stats
+
+import functools
+import hashlib
 import os.path
 from typing import Optional
 
@@ -46,6 +50,107 @@ def get_selected_portage_profile(portage_config_root: str) -> Optional[str]:
     return profile
 
 
+class UseRestrictionTable:
+    """
+    The USE flag masks and forces set by a profile, compiled into a form that
+    answers queries about a package's USE flag without rendering the
+    profile's USE flag restrictions again.
+
+    For every combination of masks vs. forces and stable vs. unstable
+    packages, the table maps each USE flag to the lines that mention it, in
+    the order algorithm 5.1 in PMS for EAPI 8 processes them: lines for all
+    packages first, then lines for ${CATEGORY}/${PN} keys.  Each line is
+    reduced to the atom it applies to and whether it sets or unsets the flag.
+    """
+
+    def __init__(self, profile: OnDiskProfile):
+        """
+        :param profile: the profile whose USE flag restrictions are compiled
+        """
+        self._tables = dict()
+        version_specific_keys = set()
+        for forced, use_restrictions, stable_use_restrictions in [
+                (False, profile.masked_use, profile.stable_masked_use),
+                (True, profile.forced_use, profile.stable_forced_use)]:
+            for stable in [False, True]:
+                use_dict = use_restrictions.render_to_dict()
+                if stable:
+                    use_dict.update(stable_use_restrictions.render_to_dict())
+                # The keys in the dictionaries for USE flag restrictions are
+                # unversioned ${CATEGORY}/${PN} atoms represented by a string,
+                # except for the key for global USE flag restrictions
+                global_keys = set(filter(lambda k: isinstance(k, AlwaysBool),
+                                         use_dict.keys()))
+                global_lines = list()
+                for global_key in global_keys:
+                    global_lines.extend(use_dict[global_key])
+                global_table = self._compile_lines(global_lines)
+                package_tables = dict()
+                for package_key, lines in use_dict.items():
+                    if package_key in global_keys:
+                        continue
+                    package_tables[package_key] = self._compile_lines(lines)
+                    for line in lines:
+                        if not isinstance(line.key, AlwaysBool) and \
+                                str(line.key) != package_key:
+                            version_specific_keys.add(package_key)
+                self._tables[(forced, stable)] = \
+                    (global_table, package_tables)
+        self.version_specific_keys = frozenset(version_specific_keys)
+
+    @staticmethod
+    def _compile_lines(lines) -> dict[str, list]:
+        table = dict()
+        for line in lines:
+            for flag in line.pos:
+                table.setdefault(flag, list()).append((line.key, True))
+            for flag in line.neg:
+                if flag not in line.pos:
+                    table.setdefault(flag, list()).append((line.key, False))
+        return table
+
+    def is_masked(
+            self, queried_package: package, use_flag: str, stable: bool) \
+            -> bool:
+        """
+        Determine whether a USE flag is masked for a package.  See the
+        'package_use_masked_in_profile' function for details.
+
+        :param queried_package: the package whose USE flag is queried
+        :param use_flag: the USE flag whose masking state is queried
+        :param stable: whether stable USE restrictions should be respected
+        :return: whether the specified USE flag is masked for the package
+        """
+        negated_flag = use_flag.startswith('-') or use_flag.startswith('!')
+        if negated_flag:
+            normalized_flag = use_flag.lstrip('-').lstrip('!')
+        else:
+            normalized_flag = use_flag
+        global_table, package_tables = self._tables[(negated_flag, stable)]
+        package_key = f'{queried_package.category}/{queried_package.PN}'
+
+        # Implement algorithm 5.1 in PMS for EAPI 8
+        masked = False
+        for table in [global_table, package_tables.get(package_key, {})]:
+            for key, value in table.get(normalized_flag, ()):
+                if key.match(queried_package):
+                    masked = value
+        return masked
+
+
+@functools.lru_cache(maxsize=16)
+def get_use_restriction_table(profile: OnDiskProfile) -> UseRestrictionTable:
+    """
+    Get the compiled USE flag restrictions of a profile.  The table is only
+    compiled the first time it is requested for a profile object.
+
+    :param profile: the profile
+    :return: the compiled USE flag restrictions set by the profile
+    """
+    with stats.timer('USE flag restriction table compilation'):
+        return UseRestrictionTable(profile)
+
+
 def package_use_masked_in_profile(
         queried_package: package,
         use_flag: str,
@@ -67,6 +172,10 @@ def package_use_masked_in_profile(
     arguments for the 'use_flag' and 'stable' parameters) are respected by this
     function.
 
+    The profile's USE flag restrictions are looked up in the table returned
+    by the 'get_use_restriction_table' function, so they are only rendered
+    once per profile.
+
     :param queried_package: the package whose USE flag is queried
     :param use_flag: the USE flag whose masking state is queried
     :param profile: the profile where the masking state of the package's USE
@@ -75,38 +184,55 @@ def package_use_masked_in_profile(
     :return: whether the specified USE flag is masked for the package on the
         specified profile
     """
-    negated_flag = use_flag.startswith('-') or use_flag.startswith('!')
-    if negated_flag:
-        normalized_flag = use_flag.lstrip('-').lstrip('!')
-        use_dict = profile.forced_use.render_to_dict()
-        if stable:
-            use_dict.update(
-                profile.stable_forced_use.render_to_dict())
-    else:
-        normalized_flag = use_flag
-        use_dict = profile.masked_use.render_to_dict()
-        if stable:
-            use_dict.update(
-                profile.stable_masked_use.render_to_dict())
-    # The keys in the dictionaries for USE flag restrictions are
-    # unversioned ${CATEGORY}/${PN} atoms represented by a string
-    package_key = f'{queried_package.category}/{queried_package.PN}'
-    # There might also be an entry for the global USE flag restrictions
-    global_keys = set(filter(lambda k: isinstance(k, AlwaysBool),
-                             use_dict.keys()))
-
-    # Implement algorithm 5.1 in PMS for EAPI 8
-    masked = False
-    use_lines_for_package = list()
-    # Process global restrictions first
-    for global_key in global_keys:
-        use_lines_for_package.extend(use_dict[global_key])
-    use_lines_for_package.extend(use_dict.get(package_key, ()))
-    matching_lines = filter(
-        lambda e: e.key.match(queried_package), use_lines_for_package)
-    for line in matching_lines:
-        if normalized_flag in line.pos:
-            masked = True
-        elif normalized_flag in line.neg:
-            masked = False
-    return masked
+    with stats.timer('USE flag restriction evaluation'):
+        return get_use_restriction_table(profile).is_masked(
+            queried_package, use_flag, stable)
+
+
+def get_version_specific_use_package_keys(profile: OnDiskProfile) \
+        -> frozenset[str]:
+    """
+    Find the packages for which a profile has USE flag masks or forces that
+    only apply to some versions or slots of the package, like an entry for
+    '>=dev-java/openjdk-17' in package.use.mask.  For any other package, the
+    USE flag restrictions set by the profile are the same for every version.
+
+    :param profile: the profile
+    :return: the set of unversioned ${CATEGORY}/${PN} atoms of such packages,
+        represented by a string
+    """
+    return get_use_restriction_table(profile).version_specific_keys
+
+
+def get_profile_fingerprint(profile: OnDiskProfile) -> str:
+    """
+    Compute a checksum that changes whenever any file in the directory of the
+    profile or any of its parent profiles changes, and that thus identifies
+    the USE flag restrictions set by the profile.
+
+    :param profile: the profile
+    :return: a hexadecimal checksum identifying the profile's current state
+    """
+    checksum = hashlib.md5()
+    for node in profile.stack:
+        node_path = os.path.abspath(node.path)
+        checksum.update(node_path.encode())
+        for file_name in sorted(os.listdir(node_path)):
+            file_path = os.path.join(node_path, file_name)
+            if os.path.isfile(file_path):
+                checksum.update(file_name.encode())
+                with open(file_path, 'rb') as file:
+                    checksum.update(hashlib.md5(file.read()).digest())
+    return checksum.hexdigest()
+
+
+def get_profile_name(profile: OnDiskProfile) -> str:
+    """
+    Get the name of a profile as it would be listed in profiles.desc, like
+    'default/linux/amd64/17.1'.
+
+    :param profile: the profile
+    :return: the path to the profile relative to its repository's profiles
+        directory
+    """
+    return os.path.relpath(profile.path, profile.basepath)
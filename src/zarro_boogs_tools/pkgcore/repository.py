@@ -0,0 +1,333 @@
+#  zarro-boogs-tools Utility Functions for pkgcore Repository Objects
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+import hashlib
+import os.path
+from pathlib import Path
+from typing import Optional
+
+from pkgcore.cache.flat_hash import md5_cache
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.repo_objs import RepoConfig
+from pkgcore.ebuild.repository import UnconfiguredTree
+from pkgcore.repository.errors import InvalidRepo
+
+"""The paths, relative to the location of an ebuild repository, of the files
+and directories whose modification times the 'get_repo_stamp' function
+checks, besides the directories of categories.  They are updated when the
+repository is synchronized, when its metadata is regenerated, and when a Git
+working tree of it is checked out, committed or pulled."""
+REPO_STAMP_PATHS = (
+    'metadata/timestamp',
+    'metadata/timestamp.chk',
+    'metadata/timestamp.commit',
+    'metadata/timestamp.x',
+    'metadata/md5-cache',
+    'eclass',
+    'profiles',
+    'profiles/categories',
+    '.git/HEAD',
+    '.git/index'
+)
+
+
+def open_standalone_repository(path: Path) -> Optional[UnconfiguredTree]:
+    """
+    Open an ebuild repository that does not have any masters directly,
+    without loading the Portage configuration of the system.  Like
+    'nattka.package.find_repository', the repository may be specified by
+    the path to any directory in it.
+
+    Repositories with masters need the system's repository configuration to
+    find their masters, so they are not opened by this function.
+
+    :param path: the path to the repository or a directory in it
+    :return: the object representing the repository if a repository without
+        masters is found, or 'None' otherwise
+    """
+    location = os.path.abspath(path)
+    while True:
+        if os.path.isdir(os.path.join(location, 'profiles')):
+            try:
+                repo_config = RepoConfig(location, disable_inst_caching=True)
+            except OSError:
+                return None
+            if getattr(repo_config, '_missing_masters', False) or \
+                    len(repo_config.masters) > 0:
+                return None
+            cache = ()
+            if repo_config.cache_format is not None:
+                cache = (md5_cache(location),)
+            try:
+                return UnconfiguredTree(
+                    location, cache=cache, repo_config=repo_config)
+            except InvalidRepo:
+                pass
+        parent = os.path.dirname(location)
+        if parent == location:
+            return None
+        location = parent
+
+
+def get_md5_cache_path(repo: UnconfiguredTree) -> str:
+    """
+    Get the path to the md5-cache metadata directory of an ebuild repository.
+    The directory may not exist.
+
+    :param repo: the object representing the ebuild repository
+    :return: a string representation of the path to the repository's
+        metadata/md5-cache directory
+    """
+    return os.path.join(repo.location, 'metadata', 'md5-cache')
+
+
+def read_md5_cache_file(path: str) -> Optional[dict[str, str]]:
+    """
+    Read the metadata in a file in md5-cache format, where each line has the
+    form 'KEY=VALUE'.
+
+    :param path: a string representation of the path to the file
+    :return: a dictionary mapping each key in the file to its value if the
+        file can be read, or 'None' otherwise
+    """
+    try:
+        with open(path, encoding='utf-8') as md5_cache_file:
+            lines = md5_cache_file.read().splitlines()
+    except OSError:
+        return None
+    entry = dict()
+    for line in lines:
+        key, sep, value = line.partition('=')
+        if sep:
+            entry[key] = value
+    return entry
+
+
+def get_md5_cache_entry(repo: UnconfiguredTree, pkg: package) \
+        -> Optional[dict[str, str]]:
+    """
+    Get a package's metadata from the md5-cache of an ebuild repository.
+
+    :param repo: the object representing the ebuild repository that contains
+        the package
+    :param pkg: the package whose metadata is returned
+    :return: a dictionary mapping each metadata key to its value if the
+        repository has an md5-cache entry for the package, or 'None' otherwise
+    """
+    return read_md5_cache_file(
+        os.path.join(get_md5_cache_path(repo), pkg.category, pkg.PF))
+
+
+def get_file_md5(path: str) -> Optional[str]:
+    """
+    Compute the MD5 checksum of a file, in the form used by md5-cache.
+
+    :param path: a string representation of the path to the file
+    :return: the hexadecimal MD5 checksum of the file if it can be read, or
+        'None' otherwise
+    """
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.md5(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def get_eclass_md5(repo: UnconfiguredTree, eclass: str) -> Optional[str]:
+    """
+    Compute the MD5 checksum of an eclass available to an ebuild repository,
+    looking up the repository itself before its masters.
+
+    :param repo: the object representing the ebuild repository
+    :param eclass: the name of the eclass without the '.eclass' suffix
+    :return: the hexadecimal MD5 checksum of the eclass if it can be found, or
+        'None' otherwise
+    """
+    for location in [repo.location] + [m.location for m in repo.masters]:
+        checksum = get_file_md5(
+            os.path.join(location, 'eclass', f'{eclass}.eclass'))
+        if checksum is not None:
+            return checksum
+    return None
+
+
+def is_md5_cache_entry_valid(
+        repo: UnconfiguredTree,
+        pkg: package,
+        entry: dict[str, str],
+        eclass_md5s: Optional[dict[str, Optional[str]]] = None
+) -> bool:
+    """
+    Check if an md5-cache entry for a package is up to date, i.e. if the
+    checksums of the ebuild and all inherited eclasses recorded in the entry
+    match the current files.
+
+    :param repo: the object representing the ebuild repository that contains
+        the package
+    :param pkg: the package the entry is for
+    :param entry: the md5-cache entry
+    :param eclass_md5s: a dictionary to look up and memoize checksums of
+        eclasses in; omit or specify 'None' to compute every checksum
+    :return: whether the entry is up to date
+    """
+    if entry.get('_md5_') != get_file_md5(pkg.path):
+        return False
+    eclasses = entry.get('_eclasses_', '').split()
+    for eclass, checksum in zip(eclasses[0::2], eclasses[1::2]):
+        if eclass_md5s is None:
+            current_checksum = get_eclass_md5(repo, eclass)
+        else:
+            if eclass not in eclass_md5s:
+                eclass_md5s[eclass] = get_eclass_md5(repo, eclass)
+            current_checksum = eclass_md5s[eclass]
+        if checksum != current_checksum:
+            return False
+    return True
+
+
+def get_repo_stamp(repo: UnconfiguredTree) -> str:
+    """
+    Compute a checksum of the modification times of the files and
+    directories in 'REPO_STAMP_PATHS' and of the directories of every
+    category, both in the repository and in its md5-cache.  The checksum is
+    much cheaper to compute than the one returned by 'get_repo_fingerprint'
+    and changes whenever the repository is synchronized, its metadata is
+    regenerated, a package is added or removed, or a Git working tree of it
+    changes, but not when an ebuild is only modified in place.
+
+    :param repo: the object representing the ebuild repository
+    :return: a hexadecimal checksum identifying the repository's current state
+    """
+    checksum = hashlib.md5()
+    paths = [os.path.join(repo.location, path) for path in REPO_STAMP_PATHS]
+    for category in sorted(repo.categories):
+        paths.append(os.path.join(repo.location, category))
+        paths.append(os.path.join(get_md5_cache_path(repo), category))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            checksum.update(f'{path}\0\n'.encode())
+            continue
+        checksum.update(
+            f'{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n'.encode())
+    return checksum.hexdigest()
+
+
+def get_package_fingerprints(repo: UnconfiguredTree) -> dict[str, str]:
+    """
+    Compute a checksum for each ${CATEGORY}/${PN} in an ebuild repository
+    that changes whenever a file in the package's directory is added,
+    removed or modified, based on the modification times and sizes of the
+    files rather than their contents.  The 'eclass' and 'profiles'
+    directories and the 'metadata/layout.conf' file of the repository have
+    checksums too, under the keys 'eclass', 'profiles' and 'layout.conf',
+    which never contain a '/'.
+
+    :param repo: the object representing the ebuild repository
+    :return: a dictionary mapping each ${CATEGORY}/${PN} and each of the
+        other keys to a checksum
+    """
+    fingerprints = dict()
+
+    def add_entry(checksum, entry: os.DirEntry) -> None:
+        try:
+            stat = entry.stat()
+        except OSError:
+            return
+        checksum.update(
+            f'{entry.path}\0{stat.st_mtime_ns}\0{stat.st_size}\n'.encode())
+
+    def add_dir(checksum, path: str, recursive: bool) -> None:
+        try:
+            entries = sorted(os.scandir(path), key=lambda e: e.name)
+        except OSError:
+            return
+        for entry in entries:
+            add_entry(checksum, entry)
+            if recursive and entry.is_dir(follow_symlinks=False):
+                add_dir(checksum, entry.path, recursive)
+
+    for top_dir in ['eclass', 'profiles']:
+        checksum = hashlib.md5()
+        add_dir(checksum, os.path.join(repo.location, top_dir), True)
+        fingerprints[top_dir] = checksum.hexdigest()
+    layout_conf_path = os.path.join(repo.location, 'metadata', 'layout.conf')
+    try:
+        stat = os.stat(layout_conf_path)
+        fingerprints['layout.conf'] = f'{stat.st_mtime_ns}:{stat.st_size}'
+    except OSError:
+        fingerprints['layout.conf'] = ''
+    for category in sorted(repo.categories):
+        category_path = os.path.join(repo.location, category)
+        try:
+            package_entries = os.scandir(category_path)
+        except OSError:
+            continue
+        for package_entry in package_entries:
+            checksum = hashlib.md5()
+            add_entry(checksum, package_entry)
+            if package_entry.is_dir(follow_symlinks=False):
+                add_dir(checksum, package_entry.path, False)
+            fingerprints[f'{category}/{package_entry.name}'] = \
+                checksum.hexdigest()
+    return fingerprints
+
+
+def get_repo_fingerprint(repo: UnconfiguredTree) -> str:
+    """
+    Compute a checksum that changes whenever an ebuild, eclass or profile
+    file in an ebuild repository is added, removed or modified, based on the
+    checksums returned by the 'get_package_fingerprints' function.
+
+    :param repo: the object representing the ebuild repository
+    :return: a hexadecimal checksum identifying the repository's current state
+    """
+    checksum = hashlib.md5()
+    for key, fingerprint in sorted(get_package_fingerprints(repo).items()):
+        checksum.update(f'{key}\0{fingerprint}\n'.encode())
+    return checksum.hexdigest()
+
+
+def forget_packages(
+        repo: UnconfiguredTree,
+        keys: set[tuple[str, str]]
+) -> None:
+    """
+    Make pkgcore forget what it has loaded for some packages in an ebuild
+    repository, namely their versions, package objects and shared data like
+    metadata.xml, so the packages' current files are read the next time
+    they are looked up.  Package objects that are still referenced elsewhere
+    are not updated.
+
+    :param repo: the object representing the ebuild repository
+    :param keys: the ${CATEGORY} and ${PN} of each package
+    """
+    repo.categories.force_regen()
+    for category in {category for category, _ in keys}:
+        repo.packages.force_regen(category)
+    for key in keys:
+        repo.versions.force_regen(key, None)
+        repo._shared_pkg_cache.pop(key, None)
+    instances = repo.package_class._cached_instances
+    for args in list(instances.keys()):
+        if tuple(args[:2]) in keys:
+            instances.pop(args, None)
@@ -19,9 +19,12 @@
 #  along with zarro-boogs-tools.  If not, see
 #  <https://www.gnu.org/licenses/>.
 
-from zarro_boogs_tools.pkgcore.profile import package_use_masked_in_profile
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.pkgcore.profile import \
+    get_version_specific_use_package_keys, package_use_masked_in_profile
 
-from typing import Optional
+from collections.abc import Hashable
+from typing import Optional, Union
 
 import pkgcore.ebuild.atom as atom
 import pkgcore.restrictions.boolean as boolean
@@ -30,12 +33,47 @@ from pkgcore.ebuild.ebuild_src import package
 from pkgcore.ebuild.profiles import OnDiskProfile
 from pkgcore.restrictions.packages import Conditional
 
+"""The cache 'preprocess_restriction' uses by default."""
+PREPROCESS_CACHE = LRUCache()
 
-def preprocess_restriction(
+
+def get_preprocess_cache_key(
         restrict: restriction.base,
         current_package: Optional[package] = None,
         profile: Optional[OnDiskProfile] = None,
         stable: Optional[bool] = None
+) -> Hashable:
+    """
+    Get the key under which the result of preprocessing a restriction is
+    cached.  The USE flag restrictions of a profile usually apply to all
+    versions of a package, so the key identifies the package by its
+    ${CATEGORY}/${PN} and lets packages that share a dependency string share
+    the result.  The exact version is only used when the profile has USE flag
+    restrictions for just some versions of the package.
+
+    :param restrict: the restriction to preprocess
+    :param current_package: the package which has 'restrict' as a dependency
+    :param profile: the profile whose USE flag masks and forces are applied
+    :param stable: whether USE flag masks and forces for stable packages are
+        applied
+    :return: the key for the preprocessing result
+    """
+    if current_package is None or profile is None or stable is None:
+        return restrict, None, None, None
+    package_key = f'{current_package.category}/{current_package.PN}'
+    if package_key in get_version_specific_use_package_keys(profile):
+        package_id = current_package.cpvstr
+    else:
+        package_id = package_key
+    return restrict, package_id, profile, stable
+
+
+def preprocess_restriction(
+        restrict: restriction.base,
+        current_package: Optional[package] = None,
+        profile: Optional[OnDiskProfile] = None,
+        stable: Optional[bool] = None,
+        cache: Optional[LRUCache] = PREPROCESS_CACHE
 ) -> restriction.base:
     """
     Run a pkgcore restriction object through the preprocessing pipeline, so it
@@ -55,8 +93,20 @@ def preprocess_restriction(
         applied in USE-conditional group filtering
     :param stable: whether USE flag masks and forces for stable packages should
         be considered in USE-conditional group filtering
+    :param cache: a cache for preprocessing results; omit to use a cache
+        shared by the whole program, or specify 'None' to disable caching
     :return: the preprocessing result
     """
+    if cache is not None:
+        cache_key = get_preprocess_cache_key(
+            restrict, current_package, profile, stable)
+        result = cache.get(cache_key)
+        if result is None:
+            result = preprocess_restriction(
+                restrict, current_package, profile, stable, None)
+            cache.put(cache_key, result)
+        return result
+
     restrict = unwrap_use_conditional(
         restrict, current_package, profile, stable)
     restrict = strip_use_dep_from_restriction(restrict)
@@ -92,6 +142,12 @@ def unwrap_use_conditional(
     following all-of group instead:
         ( >=virtual/jdk-1.8:* )
 
+    A USE-conditional group that never takes effect is removed from any any-of
+    group that contains it, as Portage does, so
+        || ( test? ( dev-java/junit:4 ) dev-java/testng )
+    is transformed to the following atom when the 'test' USE flag is masked:
+        dev-java/testng
+
     The purpose of this function is to promote these USE-conditional
     dependencies to generic ones, so when a package is being keyworded or
     stabilized, all the USE-conditional dependencies (or, if a profile is
@@ -140,8 +196,17 @@ def unwrap_use_conditional(
         return boolean.AndRestriction(*payloads)
     elif isinstance(restrict, atom.atom):
         return restrict
-    elif isinstance(restrict, boolean.AndRestriction) or \
-            isinstance(restrict, boolean.OrRestriction):
+    elif isinstance(restrict, boolean.OrRestriction):
+        children = [unwrap_use_conditional(r, current_package, profile, stable)
+                    for r in restrict]
+        # A USE-conditional group that never takes effect becomes an empty
+        # all-of group, which would match every package in the repository
+        # as an alternative; like Portage, drop it from the any-of group
+        alternatives = [r for r in children if not _is_empty_all_of_group(r)]
+        if len(alternatives) == 1 and len(children) > 1:
+            return alternatives[0]
+        return type(restrict)(*alternatives)
+    elif isinstance(restrict, boolean.AndRestriction):
         return type(restrict)(*map(
             lambda r: unwrap_use_conditional(
                 r, current_package, profile, stable), restrict))
@@ -149,6 +214,12 @@ def unwrap_use_conditional(
         return restrict
 
 
+def _is_empty_all_of_group(restrict: restriction.base) -> bool:
+    return isinstance(restrict, boolean.AndRestriction) and \
+        not isinstance(restrict, atom.atom) and \
+        all(map(_is_empty_all_of_group, restrict))
+
+
 def strip_use_dep_from_restriction(restrict: restriction.base) \
         -> restriction.base:
     """
@@ -200,6 +271,32 @@ def strip_use_dep_from_restriction(restrict: restriction.base) \
         return restrict
 
 
+def is_anchored(restrict: restriction.base) -> bool:
+    """
+    Check if a restriction can only match packages whose ${CATEGORY}/${PN}
+    is named by an atom in it.  pkgcore finds the packages that match such a
+    restriction by searching only the named packages; for any other
+    restriction, it traverses all the packages in the ebuild repository,
+    which takes unacceptably long for repositories as large as ::gentoo.
+
+    An atom is anchored; an any-of group is anchored if all of its children
+    are; an all-of group is anchored if any of its children is.  Thus, an
+    empty all-of group, which matches every package, is not anchored, and
+    neither is an any-of group that contains one.
+
+    :param restrict: the restriction to check
+    :return: whether the restriction is anchored
+    """
+    if isinstance(restrict, atom.atom):
+        return True
+    elif isinstance(restrict, boolean.OrRestriction):
+        return all(map(is_anchored, restrict))
+    elif isinstance(restrict, boolean.AndRestriction):
+        return any(map(is_anchored, restrict))
+    else:
+        return False
+
+
 def convert_and_restriction_to_list(and_restrict: boolean.AndRestriction) \
         -> list[restriction.base]:
     """
@@ -224,3 +321,64 @@ def convert_and_restriction_to_list(and_restrict: boolean.AndRestriction) \
         else:
             result.append(child)
     return result
+
+
+def serialize_restriction(restrict: restriction.base) -> Union[str, list]:
+    """
+    Convert a restriction that has been run through the preprocessing pipeline
+    to a value that can be stored in JSON format and converted back with the
+    'deserialize_restriction' function.  An atom is converted to its string
+    representation, and an all-of or any-of group is converted to a list
+    starting with '&&' or '||' followed by its serialized children.
+
+    :param restrict: the restriction to convert, which may only consist of
+        atoms, AndRestrictions and OrRestrictions
+    :return: the serialized restriction
+    :raise TypeError: if the restriction contains an object of another type
+    """
+    if isinstance(restrict, atom.atom):
+        return str(restrict)
+    elif isinstance(restrict, boolean.OrRestriction):
+        return ['||'] + list(map(serialize_restriction, restrict))
+    elif isinstance(restrict, boolean.AndRestriction):
+        return ['&&'] + list(map(serialize_restriction, restrict))
+    else:
+        raise TypeError(f"Cannot serialize restriction: {restrict!r}")
+
+
+def deserialize_restriction(serialized: Union[str, list]) -> restriction.base:
+    """
+    Convert a value returned by the 'serialize_restriction' function back to
+    a restriction equal to the one originally serialized.
+
+    :param serialized: the serialized restriction
+    :return: the restriction
+    """
+    if isinstance(serialized, str):
+        return atom.atom(serialized)
+    children = map(deserialize_restriction, serialized[1:])
+    if serialized[0] == '||':
+        return boolean.OrRestriction(*children)
+    else:
+        return boolean.AndRestriction(*children)
+
+
+def collect_atoms(restrict: restriction.base) -> list[atom.atom]:
+    """
+    Collect all atoms in a restriction that has been run through the
+    preprocessing pipeline, including atoms in any nested all-of or any-of
+    groups, in order.  Atoms specified as a block are not included.
+
+    :param restrict: the restriction to collect atoms from
+    :return: a list of the atoms in the restriction
+    """
+    if isinstance(restrict, atom.atom):
+        return [] if restrict.blocks else [restrict]
+    elif isinstance(restrict, boolean.AndRestriction) or \
+            isinstance(restrict, boolean.OrRestriction):
+        result = list()
+        for child in restrict:
+            result.extend(collect_atoms(child))
+        return result
+    else:
+        return []
@@ -79,6 +79,25 @@ def get_accept_keywords_file_basename(atom_obj: atom) -> str:
     return f'{get_portage_config_file_prefix()}{file_name_atom}'
 
 
+def get_accept_keywords_line(pkg: package, target_keyword: str) -> str:
+    """
+    Get the line to be added to /etc/portage/package.accept_keywords that
+    allows the specified package to be tested before the specified keyword can
+    be applied to it.
+
+    :param pkg: the package to test
+    :param target_keyword: the keyword that the package is expected to have
+        after testing
+    :return: the line to be added to /etc/portage/package.accept_keywords to
+        accept the current keywords for the specified package
+    """
+    if target_keyword.startswith('~'):
+        keyword_to_accept = '**'
+    else:
+        keyword_to_accept = f'~{target_keyword}'
+    return f'={pkg.cpvstr} {keyword_to_accept}'
+
+
 def get_accept_keywords_contents(
         packages: Iterable[package], target_keyword: str) -> Iterable[str]:
     """
@@ -92,12 +111,7 @@ def get_accept_keywords_contents(
     :return: the lines to be added to /etc/portage/package.accept_keywords to
         accept the current keywords for the specified packages
     """
-    if target_keyword.startswith('~'):
-        keyword_to_accept = '**'
-    else:
-        keyword_to_accept = f'~{target_keyword}'
-
     result = list()
     for pkg in packages:
-        result.append(f'={pkg.cpvstr} {keyword_to_accept}')
+        result.append(get_accept_keywords_line(pkg, target_keyword))
     return result
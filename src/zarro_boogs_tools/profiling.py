@@ -0,0 +1,265 @@
+#  zarro-boogs-tools Profiler Integration
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+# Like the stats module, this module must only import modules from the
+# standard library
+
+from zarro_boogs_tools import __project_name__, __version__
+from zarro_boogs_tools.formats import ProfileFormat
+
+import cProfile
+import contextlib
+import json
+import sys
+import threading
+import time
+import types
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+"""The default number of seconds between samples taken by SamplingProfiler."""
+DEFAULT_SAMPLING_INTERVAL = 0.001
+
+"""Whether calls made through 'annotated_call' are annotated."""
+_annotating = False
+
+"""Functions that call a function, each of whose code object has a label as
+its name, keyed on the label.  There is one for every label used while a
+profile is being recorded, which is as many as there are frames named after
+labels in the profile, so they are discarded when the recording stops."""
+_trampolines = dict()
+_trampolines_lock = threading.Lock()
+
+
+def _trampoline(function: Callable, args: tuple) -> Any:
+    return function(*args)
+
+
+def _get_trampoline(label: str) -> Callable:
+    with _trampolines_lock:
+        trampoline = _trampolines.get(label)
+        if trampoline is None:
+            # Profilers name frames after their code objects, so a copy of
+            # '_trampoline' whose code object is renamed shows up as a frame
+            # named after the label
+            names = {'co_name': label}
+            if hasattr(_trampoline.__code__, 'co_qualname'):
+                # Python 3.11 and above
+                names['co_qualname'] = label
+            code = _trampoline.__code__.replace(**names)
+            trampoline = types.FunctionType(
+                code, _trampoline.__globals__, label)
+            _trampolines[label] = trampoline
+        return trampoline
+
+
+def _stop_annotating() -> None:
+    global _annotating
+    _annotating = False
+    with _trampolines_lock:
+        _trampolines.clear()
+
+
+def annotated_call(
+        action: str,
+        subject: Any,
+        function: Callable,
+        *args: Any
+) -> Any:
+    """
+    Call a function, making the call appear in profiles as a frame named after
+    what the function does, like 'expand dev-libs/foo-1.0', under which the
+    function's own frame appears.  This allows the time spent in functions of
+    libraries to be attributed to the packages and restrictions they are
+    called for.  The frame is only added while a profile is being recorded by
+    the 'record_profile' function; otherwise, the function is called directly.
+
+    :param action: a short description of what the function does
+    :param subject: the object the function works on, whose string
+        representation is included in the frame's name
+    :param function: the function to call
+    :param args: the arguments to pass to the function
+    :return: the return value of the function
+    """
+    if not _annotating:
+        return function(*args)
+    return _get_trampoline(f'{action} {subject}')(function, args)
+
+
+class SamplingProfiler:
+    """
+    A profiler that periodically records the call stacks of all threads but
+    its own.  Unlike cProfile, which only profiles the thread it is enabled
+    in, it also profiles threads started after it.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLING_INTERVAL):
+        """
+        :param interval: the number of seconds to wait between samples
+        """
+        self.interval = interval
+        self.frames = list()
+        # For each thread: the name of the thread, the samples, each of which
+        # is a list of indexes into 'self.frames' from the outermost frame,
+        # and the number of seconds each sample represents
+        self.threads = dict()
+        self._frame_indexes = dict()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _get_frame_index(self, code: types.CodeType) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frame_indexes.get(key)
+        if index is None:
+            index = len(self.frames)
+            self.frames.append(key)
+            self._frame_indexes[key] = index
+        return index
+
+    def _sample(self, weight: float) -> None:
+        thread_names = {thread.ident: thread.name
+                        for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == threading.get_ident():
+                continue
+            stack = list()
+            while frame is not None:
+                stack.append(self._get_frame_index(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            name = thread_names.get(thread_id, str(thread_id))
+            _, samples, weights = self.threads.setdefault(
+                thread_id, (name, list(), list()))
+            samples.append(stack)
+            weights.append(weight)
+
+    def _run(self) -> None:
+        last_sample = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last_sample)
+            last_sample = now
+
+    def start(self) -> None:
+        """Start taking samples in a new thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop taking samples and wait for the sampling thread to exit."""
+        self._stopped.set()
+        self._thread.join()
+
+    def get_speedscope_data(self, name: str) -> dict[str, Any]:
+        """
+        Get the samples in the speedscope file format
+        <https://www.speedscope.app/file-format-schema.json>, with one profile
+        for each thread.
+
+        :param name: the name of the profile file
+        :return: a dictionary that can be serialized into JSON
+        """
+        profiles = list()
+        for thread_name, samples, weights in self.threads.values():
+            profiles.append({
+                'type': 'sampled',
+                'name': thread_name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': name,
+            'exporter': f'{__project_name__} {__version__}',
+            'activeProfileIndex': 0,
+            'shared': {
+                'frames': [{'name': frame_name, 'file': file, 'line': line}
+                           for frame_name, file, line in self.frames]
+            },
+            'profiles': profiles
+        }
+
+
+def get_profile_format_from_path(path: Path) -> ProfileFormat:
+    """
+    Guess the format a profile should be written in from the name of the file
+    it is written to.  Files with extension '.json' are speedscope files; all
+    other files are pstats files.
+
+    :param path: the path to the file
+    :return: the profile format
+    """
+    if path.suffix == '.json':
+        return ProfileFormat.SPEEDSCOPE
+    return ProfileFormat.PSTATS
+
+
+@contextlib.contextmanager
+def record_profile(
+        path: Path,
+        profile_format: Optional[ProfileFormat] = None
+) -> Iterator[None]:
+    """
+    Profile the code run in a context and write the profile to a file when
+    the context exits.  Calls made through the 'annotated_call' function are
+    annotated while the profile is being recorded.
+
+    A pstats profile is recorded deterministically by cProfile, which only
+    profiles the thread the context is entered in.  A speedscope profile is
+    recorded by a SamplingProfiler, which profiles all threads.
+
+    :param path: the path to the file to write the profile to
+    :param profile_format: the format of the profile; omit or specify 'None'
+        to choose the format with the 'get_profile_format_from_path' function
+    :return: a context manager whose body is profiled
+    :raise OSError: if the profile cannot be written
+    """
+    global _annotating
+    if profile_format is None:
+        profile_format = get_profile_format_from_path(path)
+    if profile_format == ProfileFormat.PSTATS:
+        profiler = cProfile.Profile()
+        _annotating = True
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            _stop_annotating()
+        profiler.dump_stats(path)
+    else:
+        profiler = SamplingProfiler()
+        _annotating = True
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            _stop_annotating()
+        with open(path, 'w') as profile_file:
+            json.dump(profiler.get_speedscope_data(Path(path).name),
+                      profile_file)
@@ -0,0 +1,416 @@
+#  zarro-boogs-tools Functions Pertaining to the 'rdeps' Subcommand
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.depcache import \
+    DEPENDENCY_CACHE_FORMAT_VERSION, DependencyCache, get_cache_dir
+from zarro_boogs_tools.index import KeywordIndex
+from zarro_boogs_tools.inference import is_stabilizing
+from zarro_boogs_tools.package import \
+    PackageFilter, get_dependency_best_version, get_dependency_restrictions, \
+    get_keyword_matching_pkg_filter
+from zarro_boogs_tools.pkgcore.profile import get_profile_fingerprint
+from zarro_boogs_tools.pkgcore.repository import get_repo_fingerprint
+from zarro_boogs_tools.pkgcore.restriction import \
+    collect_atoms, deserialize_restriction, serialize_restriction
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import pkgcore.restrictions.restriction as restriction
+from pkgcore.ebuild import atom
+from nattka.bugzilla import BugCategory
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+"""The version of the format of persistent reverse dependency index files,
+which must be increased whenever the format changes.  Index files are also
+discarded whenever the version of the persistent dependency cache's format
+changes, as the indexed restrictions are preprocessed in the same way."""
+REVERSE_DEPENDENCY_INDEX_FORMAT_VERSION = 1
+
+
+def get_reverse_dependency_index_path(
+        repo: UnconfiguredTree,
+        profile: Optional[OnDiskProfile] = None,
+        stable: Optional[bool] = None
+) -> Path:
+    """
+    Get the path to the file under the directory returned by the
+    'get_cache_dir' function where the reverse dependency index of an ebuild
+    repository for a profile and whether stabilization is done is persisted.
+
+    :param repo: the object representing the ebuild repository
+    :param profile: the profile of the index, or 'None' for an index of
+        dependencies from all USE-conditional groups
+    :param stable: whether the index is for stabilization
+    :return: the path to the index file
+    """
+    location_id = hashlib.md5(
+        os.path.abspath(repo.location).encode()).hexdigest()
+    if profile is None or stable is None:
+        profile_id = 'all'
+    else:
+        profile_id = hashlib.md5(
+            f'{os.path.abspath(profile.path)}:{int(stable)}'.encode()) \
+            .hexdigest()
+    return get_cache_dir() / f'rdeps-{location_id}-{profile_id}.json'
+
+
+class ReverseDependencyIndex:
+    """
+    An index mapping each ${CATEGORY}/${PN} to the dependency restrictions of
+    packages in an ebuild repository that may select a version of it.
+
+    The restrictions are the ones returned by the 'get_dependency_restrictions'
+    function, so USE-conditional groups that can never be enabled under the
+    index's profile are not indexed, just like they are not followed when
+    package lists are made.  An index is therefore only valid for one
+    combination of profile and whether stabilization is done.
+
+    An index can be persisted to a file, in which case it is loaded from the
+    file instead of being built as long as the fingerprints of the
+    repository and the profile recorded in the file are still current.
+    Restrictions loaded from the file are only deserialized when a package
+    they may select is looked up.
+    """
+
+    def __init__(
+            self,
+            repo: UnconfiguredTree,
+            profile: Optional[OnDiskProfile] = None,
+            stable: Optional[bool] = None,
+            dep_cache: Optional[DependencyCache] = None,
+            path: Optional[Path] = None
+    ):
+        """
+        :param repo: the object representing the ebuild repository to index
+        :param profile: a profile to apply USE flag restrictions on
+            USE-conditional groups; omit or specify 'None' to index
+            dependencies from all USE-conditional groups
+        :param stable: whether USE flag restrictions for stable packages
+            should be applied
+        :param dep_cache: a persistent dependency cache to read preprocessed
+            dependency restrictions from and update; omit or specify 'None' to
+            parse the metadata of every package
+        :param path: the path to the file the index is loaded from and saved
+            to; omit or specify 'None' to build the index in memory only
+        """
+        self.repo = repo
+        self.profile = profile
+        self.stable = stable
+        self.dep_cache = dep_cache
+        self.path = path
+        self._entries = None
+        # Entries loaded from the index file that have not been deserialized
+        self._serialized = None
+        self._packages = dict()
+        self._dirty = False
+        self._fingerprint = None
+
+    def _get_fingerprint(self) -> str:
+        if self._fingerprint is None:
+            fingerprint = get_repo_fingerprint(self.repo)
+            if self.profile is not None and self.stable is not None:
+                fingerprint += \
+                    f':{get_profile_fingerprint(self.profile)}' \
+                    f':{int(self.stable)}'
+            self._fingerprint = fingerprint
+        return self._fingerprint
+
+    def _load(self) -> bool:
+        try:
+            with open(self.path, encoding='utf-8') as index_file:
+                data = json.load(index_file)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, dict) or \
+                data.get('version') != \
+                REVERSE_DEPENDENCY_INDEX_FORMAT_VERSION or \
+                data.get('dependency cache version') != \
+                DEPENDENCY_CACHE_FORMAT_VERSION or \
+                data.get('fingerprint') != self._get_fingerprint() or \
+                not isinstance(data.get('entries'), dict):
+            return False
+        self._entries = dict()
+        self._serialized = data['entries']
+        return True
+
+    def save(self) -> bool:
+        """
+        Write the index to its file if it has been built since it was loaded
+        and a file has been specified for it.
+
+        :return: 'True' if the file is up to date or no file has been
+            specified, or 'False' if the file could not be written
+        """
+        if not self._dirty or self.path is None:
+            return True
+        try:
+            entries = {
+                f'{category}/{pn}': [
+                    [serialize_restriction(restrict), rdep.cpvstr]
+                    for restrict, rdep in key_entries
+                ]
+                for (category, pn), key_entries in self._entries.items()
+            }
+        except TypeError:
+            return False
+        data = {
+            'version': REVERSE_DEPENDENCY_INDEX_FORMAT_VERSION,
+            'dependency cache version': DEPENDENCY_CACHE_FORMAT_VERSION,
+            'fingerprint': self._get_fingerprint(),
+            'entries': entries
+        }
+        temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}')
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump(data, index_file, separators=(',', ':'))
+            os.replace(temp_path, self.path)
+        except OSError:
+            return False
+        self._dirty = False
+        return True
+
+    def build(self) -> None:
+        """
+        Populate the index for every package in the repository.  This is done
+        automatically the first time the index is looked up, unless the index
+        can be loaded from its file.
+        """
+        if self.path is not None:
+            # Fingerprint the repository before reading any package, so that
+            # a change made while the index is built invalidates the index
+            self._get_fingerprint()
+        entries = dict()
+        with stats.phase('build reverse dependency index'):
+            for pkg in self.repo:
+                for restrict in get_dependency_restrictions(
+                        pkg, self.profile, self.stable, self.dep_cache):
+                    keys = set()
+                    for atom_obj in collect_atoms(restrict):
+                        keys.add((atom_obj.category, atom_obj.package))
+                    for key in keys:
+                        entries.setdefault(key, list()).append(
+                            (restrict, pkg))
+        self._entries = entries
+        self._serialized = None
+        self._dirty = True
+
+    def _get_package(self, cpvstr: str) -> Optional[package]:
+        if cpvstr not in self._packages:
+            matches = self.repo.match(atom.atom(f'={cpvstr}'))
+            self._packages[cpvstr] = matches[0] if matches else None
+        return self._packages[cpvstr]
+
+    def _get_entries(self, key: tuple[str, str]) \
+            -> list[tuple[restriction.base, package]]:
+        if self._entries is None:
+            with stats.phase('load reverse dependency index'):
+                loaded = self.path is not None and self._load()
+            if not loaded:
+                self.build()
+        entries = self._entries.get(key)
+        if entries is None and self._serialized is not None:
+            entries = list()
+            for serialized, cpvstr in self._serialized.get('/'.join(key), ()):
+                rdep = self._get_package(cpvstr)
+                if rdep is not None:
+                    entries.append(
+                        (deserialize_restriction(serialized), rdep))
+            self._entries[key] = entries
+        return entries if entries is not None else list()
+
+    def get_dependency_restrictions(self, pkg: package) \
+            -> list[tuple[restriction.base, package]]:
+        """
+        Get the dependency restrictions in the repository that contain an atom
+        matching a package, without checking if the package would be the best
+        version selected for them.
+
+        :param pkg: the package to look up
+        :return: a list of tuples, each of which contains a restriction and the
+            package that has the restriction in its dependencies
+        """
+        result = list()
+        for restrict, rdep in self._get_entries((pkg.category, pkg.package)):
+            for atom_obj in collect_atoms(restrict):
+                if atom_obj.key == pkg.key and atom_obj.match(pkg):
+                    result.append((restrict, rdep))
+                    break
+        return result
+
+
+def get_direct_reverse_dependencies(
+        pkg: package,
+        target_keyword: str,
+        repo: UnconfiguredTree,
+        rdep_index: ReverseDependencyIndex,
+        pkg_filter: Optional[PackageFilter] = None,
+        cache: Optional[LRUCache] = None,
+        keyword_index: Optional[KeywordIndex] = None
+) -> list[package]:
+    """
+    Find the packages that do not have the target keyword yet and have a
+    direct dependency whose best version is a package.  Dependency versions
+    are selected in the same way as the 'get_packages_to_process' function
+    selects them.
+
+    :param pkg: the package whose reverse dependencies are returned
+    :param target_keyword: the keyword that would be added to the reverse
+        dependencies' 'KEYWORDS' variable
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param rdep_index: a reverse dependency index of 'repo'
+    :param pkg_filter: a filter to set a preference on the versions of
+        dependencies; omit or specify 'None' to skip any filtering
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :return: a sorted list of the reverse dependencies, without duplicates
+    """
+    result = set()
+    for restrict, rdep in rdep_index.get_dependency_restrictions(pkg):
+        if rdep in result:
+            continue
+        if keyword_index is not None:
+            has_target_keyword = keyword_index.is_visible(rdep, target_keyword)
+        else:
+            has_target_keyword = target_keyword in rdep.keywords or \
+                target_keyword.lstrip('~') in rdep.keywords
+        if has_target_keyword:
+            # The reverse dependency's dependencies would not be followed
+            continue
+        if get_dependency_best_version(
+                restrict, repo, pkg_filter, cache) == pkg:
+            result.add(rdep)
+    return sorted(result)
+
+
+def get_reverse_dependencies(
+        pkg: package,
+        target_keyword: str,
+        repo: UnconfiguredTree,
+        rdep_index: ReverseDependencyIndex,
+        pkg_filter: Optional[PackageFilter] = None,
+        cache: Optional[LRUCache] = None,
+        keyword_index: Optional[KeywordIndex] = None
+) -> list[package]:
+    """
+    Find the packages that would pull a package into their package lists if
+    they were keyworded or stabilized.  These are the direct reverse
+    dependencies returned by the 'get_direct_reverse_dependencies' function,
+    and recursively the direct reverse dependencies of each of them, which
+    is the reverse of the breadth-first search made by the
+    'get_packages_to_process' function: the search only follows the
+    dependencies of packages that do not have the target keyword yet.
+    Whether the package itself has the target keyword is not checked.
+
+    :param pkg: the package whose reverse dependencies are returned
+    :param target_keyword: the keyword that would be added to the reverse
+        dependencies' 'KEYWORDS' variable
+    :param repo: the object representing the ebuild repository where candidate
+        packages are searched
+    :param rdep_index: a reverse dependency index of 'repo'
+    :param pkg_filter: a filter to set a preference on the versions of
+        dependencies; omit or specify 'None' to skip any filtering
+    :param cache: a cache for best versions of dependencies; omit or specify
+        'None' to disable caching
+    :param keyword_index: an index of the keywords of packages in 'repo'; omit
+        or specify 'None' to read keywords from the package objects
+    :return: a sorted list of the reverse dependencies, without duplicates
+        and without the package itself
+    """
+    visited_pkgs = {pkg}
+    pkg_processing_queue = [pkg]
+    while len(pkg_processing_queue) > 0:
+        next_pkg = pkg_processing_queue.pop()
+        for rdep in get_direct_reverse_dependencies(
+                next_pkg, target_keyword, repo, rdep_index, pkg_filter,
+                cache, keyword_index):
+            if rdep not in visited_pkgs:
+                visited_pkgs.add(rdep)
+                pkg_processing_queue.append(rdep)
+    visited_pkgs.remove(pkg)
+    return sorted(visited_pkgs)
+
+
+def main(
+        repo: UnconfiguredTree,
+        main_packages: list[package],
+        target_profile: OnDiskProfile,
+        arches: Optional[list[str]] = None,
+        keyword_change_type: Optional[BugCategory] = None,
+        match_keyword: Optional[str] = None,
+        dep_cache: Optional[DependencyCache] = None,
+        keyword_index: Optional[KeywordIndex] = None,
+        cache: Optional[LRUCache] = None,
+        rdep_indexes: Optional[dict[tuple[OnDiskProfile, bool],
+                                    ReverseDependencyIndex]] = None
+) -> int:
+    if not arches:
+        arches = [target_profile.arch]
+    if keyword_change_type is None:
+        stable = is_stabilizing(main_packages, arches)
+    else:
+        stable = keyword_change_type == BugCategory.STABLEREQ
+
+    # Reverse dependency indexes may be reused by later calls
+    if rdep_indexes is None:
+        rdep_indexes = dict()
+    rdep_index = rdep_indexes.get((target_profile, stable))
+    if rdep_index is None:
+        # The index is only persisted along with the dependency cache
+        index_path = None
+        if dep_cache is not None:
+            index_path = get_reverse_dependency_index_path(
+                repo, target_profile, stable)
+        rdep_index = ReverseDependencyIndex(
+            repo, target_profile, stable, dep_cache, index_path)
+        rdep_indexes[(target_profile, stable)] = rdep_index
+    if cache is None:
+        cache = LRUCache()
+    rdeps = set()
+    with stats.phase('find reverse dependencies'):
+        for arch in arches:
+            target_keyword = arch if stable else f'~{arch}'
+            if match_keyword is not None:
+                pkg_filter = get_keyword_matching_pkg_filter(
+                    target_keyword, match_keyword,
+                    keyword_index=keyword_index)
+            else:
+                pkg_filter = get_keyword_matching_pkg_filter(
+                    target_keyword, keyword_index=keyword_index)
+            for pkg in main_packages:
+                rdeps.update(get_reverse_dependencies(
+                    pkg, target_keyword, repo, rdep_index, pkg_filter,
+                    cache, keyword_index))
+
+    for rdep in sorted(rdeps):
+        print(f'={rdep.cpvstr}')
+    return 0
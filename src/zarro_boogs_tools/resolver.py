@@ -0,0 +1,272 @@
+#  zarro-boogs-tools Resolver for Use by Other Python Programs
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.depcache import DependencyCache
+from zarro_boogs_tools.index import KeywordIndex
+from zarro_boogs_tools.inference import is_stabilizing
+from zarro_boogs_tools.list import get_target_keyword
+from zarro_boogs_tools.package import \
+    PackageFilter, check_atom_obj_for_keywording, get_atom_obj_from_str, \
+    get_best_version, get_keyword_matching_pkg_filter, \
+    iter_packages_to_process
+from zarro_boogs_tools.session import Session
+
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Optional, Union
+
+from nattka.bugzilla import BugCategory
+from pkgcore.ebuild.atom import atom
+from pkgcore.ebuild.ebuild_src import package
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+"""A type alias for the ways a main package can be specified."""
+PackageSpec = Union[str, atom, package]
+
+
+class Resolver:
+    """
+    An object that makes package lists for keywording and stabilization
+    requests in an ebuild repository for a profile, for programs that use
+    this project as a library.
+
+    A resolver keeps every cache used for making package lists between calls
+    to its methods, including the best versions of dependencies, the
+    dependency graphs that have been explored and the keyword index of the
+    repository, so the more requests a resolver has handled, the less work
+    later requests take.  The caches stay valid only while the repository
+    does not change; create a new resolver after the repository is updated.
+
+    Resolvers are not thread-safe; use the 'jobs' parameter to resolve
+    dependencies in multiple threads instead.
+    """
+
+    def __init__(
+            self,
+            repo: UnconfiguredTree,
+            profile: OnDiskProfile,
+            match_keyword: Optional[str] = None,
+            jobs: int = 1,
+            dep_cache: Optional[DependencyCache] = None,
+            keyword_index: Optional[KeywordIndex] = None,
+            cache: Optional[LRUCache] = None
+    ):
+        """
+        :param repo: the object representing the ebuild repository where
+            candidate packages are searched
+        :param profile: the profile to apply USE flag restrictions when
+            dependencies are being selected, whose architecture is the one
+            keywords are inferred for
+        :param match_keyword: if not omitted or not 'None', for unkeyworded or
+            unstable dependencies, use versions that are visible on the
+            specified keyword if possible
+        :param jobs: the number of threads to resolve dependencies with
+        :param dep_cache: a persistent dependency cache; omit or specify
+            'None' to always parse the metadata of packages
+        :param keyword_index: an index of the keywords of packages in 'repo';
+            omit or specify 'None' to create a new one
+        :param cache: a cache for best versions of packages; omit or specify
+            'None' to create a new one
+        """
+        self.repo = repo
+        self.profile = profile
+        self.match_keyword = match_keyword
+        self.jobs = jobs
+        self.dep_cache = dep_cache
+        self.keyword_index = keyword_index if keyword_index is not None \
+            else KeywordIndex(repo)
+        self.cache = cache if cache is not None else LRUCache()
+        # A dependency graph is only valid for one target keyword
+        self._dep_graphs = dict()
+
+    @classmethod
+    def open(
+            cls,
+            repo_path: Path,
+            profile_path: str,
+            portage_config_path: Optional[Path] = None,
+            match_keyword: Optional[str] = None,
+            jobs: int = 1,
+            use_dep_cache: bool = True
+    ) -> 'Resolver':
+        """
+        Create a resolver for an ebuild repository on disk, loading the
+        repository in the same way as the command-line interface does.
+
+        :param repo_path: the path to the repository or a directory in it
+        :param profile_path: the path to the profile relative to the
+            repository's profiles directory, like 'default/linux/amd64/17.1'
+        :param portage_config_path: the path to the Portage configuration
+            files directory; specify 'None' to detect it automatically
+        :param match_keyword: see the constructor
+        :param jobs: see the constructor
+        :param use_dep_cache: whether to use the persistent dependency cache
+            of the repository; call the 'save' method to update the cache
+        :return: the resolver
+        :raise ValueError: if the profile is not listed in the repository's
+            profiles.desc file
+        """
+        repo_state = Session().get_repository_state(
+            repo_path, portage_config_path, needs_domain=False)
+        profile = repo_state.get_profile(profile_path)
+        if profile is None:
+            raise ValueError(f"Unknown profile: {profile_path}")
+        dep_cache = repo_state.dep_cache if use_dep_cache else None
+        return cls(repo_state.repo, profile, match_keyword, jobs, dep_cache,
+                   repo_state.keyword_index, repo_state.cache)
+
+    def get_package(self, pkg_spec: PackageSpec) -> package:
+        """
+        Get the main package selected for a package atom, in the same way as
+        the command-line interface selects main packages.
+
+        :param pkg_spec: the atom, either as a string or as an object; a
+            package object is returned as is
+        :return: the best version of the package matching the atom
+        :raise ValueError: if the atom is invalid in the context of
+            keywording, or no package matches it
+        """
+        if isinstance(pkg_spec, package):
+            return pkg_spec
+        if isinstance(pkg_spec, str):
+            # Raises MalformedAtom, which is a subclass of ValueError
+            atom_obj = get_atom_obj_from_str(pkg_spec)
+        else:
+            atom_obj = pkg_spec
+        check_result = check_atom_obj_for_keywording(atom_obj)
+        if check_result is not None:
+            raise ValueError(f"{check_result}: {atom_obj}")
+        main_package = get_best_version(atom_obj, self.repo, cache=self.cache)
+        if main_package is None:
+            raise ValueError(
+                f"Could not find a matching package for atom: {atom_obj}")
+        return main_package
+
+    def get_target_keyword(
+            self,
+            pkg_specs: Iterable[PackageSpec],
+            keyword_change_type: Optional[BugCategory] = None
+    ) -> str:
+        """
+        Get the keyword that main packages will have after being keyworded or
+        stabilized on the architecture of the resolver's profile.
+
+        :param pkg_specs: the main packages or atoms for them
+        :param keyword_change_type: the type of keyword change to perform;
+            omit or specify 'None' to have the type be inferred according to
+            the keywords of the main packages
+        :return: the keyword the main packages will have
+        """
+        return get_target_keyword(
+            self.profile, map(self.get_package, pkg_specs),
+            keyword_change_type)
+
+    def _get_pkg_filter(self, target_keyword: str) -> PackageFilter:
+        if self.match_keyword is not None:
+            return get_keyword_matching_pkg_filter(
+                target_keyword, self.match_keyword,
+                keyword_index=self.keyword_index)
+        return get_keyword_matching_pkg_filter(
+            target_keyword, keyword_index=self.keyword_index)
+
+    def _get_packages_to_process(
+            self, main_package: package, target_keyword: str) \
+            -> list[package]:
+        return list(iter_packages_to_process(
+            main_package, target_keyword, self.repo,
+            self._get_pkg_filter(target_keyword), self.profile, self.cache,
+            self._dep_graphs.setdefault(target_keyword, dict()), self.jobs,
+            self.dep_cache, self.keyword_index))
+
+    def closure(
+            self,
+            pkg_spec: PackageSpec,
+            keyword: Optional[str] = None
+    ) -> list[package]:
+        """
+        Make the package list for a main package, which contains the main
+        package and all the dependencies that need to be keyworded or
+        stabilized with it, in the same order as the 'ls' subcommand prints
+        them.
+
+        :param pkg_spec: the main package or an atom for it
+        :param keyword: the keyword that the main package will have, like
+            '~amd64' or 'amd64'; omit or specify 'None' to infer it from the
+            main package's keywords
+        :return: the package list
+        :raise ValueError: if the main package cannot be selected
+        """
+        main_package = self.get_package(pkg_spec)
+        if keyword is None:
+            keyword = get_target_keyword(self.profile, [main_package])
+        return self._get_packages_to_process(main_package, keyword)
+
+    def lists(
+            self,
+            pkg_specs: Iterable[PackageSpec],
+            keyword: Optional[str] = None
+    ) -> dict[package, list[package]]:
+        """
+        Make the package lists for main packages that are keyworded or
+        stabilized together, like the 'ls' subcommand does for multiple atoms.
+
+        :param pkg_specs: the main packages or atoms for them
+        :param keyword: the keyword that the main packages will have, like
+            '~amd64' or 'amd64'; omit or specify 'None' to infer it from the
+            keywords the main packages have in common
+        :return: a dictionary that maps each main package to its package list
+        :raise ValueError: if any main package cannot be selected
+        """
+        main_packages = list(map(self.get_package, pkg_specs))
+        if keyword is None:
+            keyword = get_target_keyword(self.profile, main_packages)
+        result = dict()
+        for main_package in main_packages:
+            result[main_package] = self._get_packages_to_process(
+                main_package, keyword)
+        return result
+
+    def is_stabilizing(
+            self,
+            pkg_specs: Iterable[PackageSpec],
+            arches: Optional[Iterable[str]] = None
+    ) -> bool:
+        """
+        Infer whether keywording or stabilization is intended to be done for
+        main packages based on their keywords.
+
+        :param pkg_specs: the main packages or atoms for them
+        :param arches: the architectures where keywording or stabilization is
+            to happen; omit or specify 'None' to use the architecture of the
+            resolver's profile
+        :return: 'True' if it is inferred that stabilization is to be done, or
+            'False' if keywording is inferred to be done
+        """
+        if arches is None:
+            arches = [self.profile.arch]
+        return is_stabilizing(list(map(self.get_package, pkg_specs)), arches)
+
+    def save(self) -> None:
+        """Write the persistent dependency cache if the resolver has one."""
+        if self.dep_cache is not None:
+            self.dep_cache.save()
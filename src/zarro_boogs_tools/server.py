@@ -0,0 +1,173 @@
+#  zarro-boogs-tools Server for the 'serve' Subcommand
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+import zarro_boogs_tools.cli
+from zarro_boogs_tools.__main__ import run_subcommand
+from zarro_boogs_tools.session import Session
+
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any
+
+
+def run_request(program_name: str, session: Session, request: Any) -> dict:
+    """
+    Run a command sent by a client, capturing its output.
+
+    :param program_name: the program name to use in messages if the request
+        does not specify one
+    :param session: the session to run the command with
+    :param request: the request decoded from JSON
+    :return: a dictionary with keys 'stdout', 'stderr' and 'status' that is
+        the response to the request
+    """
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    if not isinstance(request, dict) or \
+            not isinstance(request.get('args'), list) or \
+            not all(isinstance(arg, str) for arg in request['args']) or \
+            not isinstance(request.get('cwd'), str) or \
+            not isinstance(request.get('stdin', ''), str):
+        return {'stdout': '', 'stderr': f"{program_name}: Malformed request\n",
+                'status': 1}
+    if isinstance(request.get('program_name'), str):
+        program_name = request['program_name']
+
+    # The command must never read the server's own standard input
+    stdin = io.StringIO(request.get('stdin', ''))
+
+    old_cwd = os.getcwd()
+    old_stdin = sys.stdin
+    sys.stdin = stdin
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            os.chdir(request['cwd'])
+            opts = zarro_boogs_tools.cli.parse_args(
+                request['args'], prog=program_name)
+            if opts.subcommand == 'serve':
+                print(f"{program_name}: serve: "
+                      f"Subcommand cannot be sent to a server",
+                      file=sys.stderr)
+                status = 1
+            else:
+                status = run_subcommand(program_name, opts, session)
+        except SystemExit as e:
+            # Raised by argparse for '--help', '--version' and errors
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os.chdir(old_cwd)
+            sys.stdin = old_stdin
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+            'status': status}
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Handler for a connection from a client."""
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        response = run_request(
+            self.server.program_name, self.server.session, request)
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    A server that runs commands sent by clients one at a time with a shared
+    session, so repositories, profiles and caches stay loaded between
+    commands.  Commands are not run concurrently because each of them changes
+    the working directory and captures the standard output of the process.
+    """
+
+    def __init__(self, program_name: str, socket_path: str):
+        """
+        :param program_name: the program name to use in messages
+        :param socket_path: the path to the Unix domain socket to listen on
+        """
+        self.program_name = program_name
+        self.session = Session(check_for_changes=True)
+        super().__init__(socket_path, RequestHandler)
+
+
+def is_socket_in_use(socket_path: str) -> bool:
+    """
+    Check if a server is listening on a Unix domain socket.
+
+    :param socket_path: the path to the socket
+    :return: whether a connection to the socket can be made
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(program_name: str, socket_path: str) -> int:
+    if os.path.exists(socket_path):
+        if is_socket_in_use(socket_path):
+            print(f"{program_name}: {socket_path}: "
+                  f"Another server is listening on the socket",
+                  file=sys.stderr)
+            return 1
+        # Left behind by a server that did not exit cleanly
+        os.unlink(socket_path)
+    try:
+        server = Server(program_name, socket_path)
+    except OSError as e:
+        print(f"{program_name}: {socket_path}: {e}", file=sys.stderr)
+        return 1
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.session.save()
+        os.unlink(socket_path)
+    return 0
@@ -0,0 +1,237 @@
+#  zarro-boogs-tools Sessions for Running Subcommands
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.depcache import DependencyCache
+from zarro_boogs_tools.index import KeywordIndex, get_version_index
+from zarro_boogs_tools.pkgcore.repository import \
+    forget_packages, get_package_fingerprints, get_repo_stamp, \
+    open_standalone_repository
+from zarro_boogs_tools.pkgcore.restriction import collect_atoms
+
+import os.path
+from pathlib import Path
+from typing import Optional
+
+import nattka.package
+from pkgcore.ebuild.domain import domain as Domain
+from pkgcore.ebuild.profiles import OnDiskProfile
+from pkgcore.ebuild.repository import UnconfiguredTree
+
+
+class RepositoryState:
+    """
+    The objects loaded for an ebuild repository and the caches built for it,
+    which remain valid for as long as the repository does not change.
+    """
+
+    def __init__(
+            self,
+            repo: UnconfiguredTree,
+            domain: Optional[Domain] = None,
+            stamp: Optional[str] = None,
+            package_fingerprints: Optional[dict[str, str]] = None
+    ):
+        """
+        :param repo: the object representing the ebuild repository
+        :param domain: the pkgcore domain the repository was loaded from, or
+            'None' if the repository was loaded without a domain
+        :param stamp: the value returned by the 'get_repo_stamp' function
+            when the repository was loaded, or 'None' if changes to the
+            repository are not checked
+        :param package_fingerprints: the value returned by the
+            'get_package_fingerprints' function when the repository was
+            loaded, or 'None' if changes to the repository are not checked
+        """
+        self.repo = repo
+        self.domain = domain
+        self.stamp = stamp
+        self.package_fingerprints = package_fingerprints
+        self.cache = LRUCache()
+        self.keyword_index = KeywordIndex(repo)
+        self.rdep_indexes = dict()
+        self._dep_cache = None
+        self._profiles = dict()
+
+    @property
+    def dep_cache(self) -> DependencyCache:
+        """The persistent dependency cache for the repository."""
+        if self._dep_cache is None:
+            self._dep_cache = DependencyCache(self.repo)
+        return self._dep_cache
+
+    def get_profile(self, profile_path: str) -> Optional[OnDiskProfile]:
+        """
+        Get a profile listed in the repository's profiles.desc file.  The same
+        object is returned for the same profile every time, so caches keyed
+        on profiles can be reused.
+
+        :param profile_path: the path to the profile relative to the
+            repository's profiles directory
+        :return: the object for the profile if it is listed, or 'None'
+            otherwise
+        """
+        if profile_path not in self._profiles:
+            profile = None
+            for repo_profile in self.repo.profiles.profiles:
+                if profile_path == repo_profile.path:
+                    profile = OnDiskProfile(
+                        repo_profile.base, repo_profile.path)
+                    break
+            self._profiles[profile_path] = profile
+        return self._profiles[profile_path]
+
+    def forget_packages(self, keys: set[tuple[str, str]]) -> None:
+        """
+        Discard what has been loaded and cached for some packages, so the
+        current files of the packages are read again.  Best versions of
+        dependencies that may be one of the packages are discarded too, and
+        so are the reverse dependency indexes, which contain the dependencies
+        of every package.
+
+        :param keys: the ${CATEGORY} and ${PN} of each package
+        """
+        def may_match(cache_key: tuple) -> bool:
+            atoms = collect_atoms(cache_key[0])
+            # Restrictions without atoms are not anchored to any package
+            return not atoms or any(
+                (atom_obj.category, atom_obj.package) in keys
+                for atom_obj in atoms)
+
+        self.cache.evict(may_match)
+        if self._dep_cache is not None:
+            self._dep_cache.forget_package_keys(keys)
+        self.keyword_index.forget_package_keys(keys)
+        version_index = get_version_index(self.repo)
+        if version_index is not None:
+            version_index.forget_package_keys(keys)
+        self.rdep_indexes.clear()
+        forget_packages(self.repo, keys)
+
+    def save(self) -> None:
+        """
+        Write the persistent dependency cache if it has been used, and the
+        reverse dependency indexes that have been built.
+        """
+        if self._dep_cache is not None:
+            self._dep_cache.save()
+        for rdep_index in self.rdep_indexes.values():
+            rdep_index.save()
+
+
+class Session:
+    """
+    A collection of repository states that can be shared by multiple runs of
+    subcommands in the same process.  A session used by a single run loads
+    each repository once; a long-lived session can also check the
+    repositories for changes before reusing their states.
+    """
+
+    def __init__(self, check_for_changes: bool = False):
+        """
+        :param check_for_changes: whether to update the state of a
+            repository when it has changed since it was loaded; see the
+            'get_repository_state' method
+        """
+        self.check_for_changes = check_for_changes
+        self._states = dict()
+
+    def get_repository_state(
+            self,
+            repo_path: Path,
+            portage_config_path: Optional[Path] = None,
+            needs_domain: bool = True
+    ) -> RepositoryState:
+        """
+        Get the state of an ebuild repository, loading the repository if it
+        has not been loaded in this session.
+
+        If the session checks for changes, the cheap checksum returned by the
+        'get_repo_stamp' function is compared with the one recorded when the
+        state was loaded.  Only if it differs are the files of the
+        repository checked, and only the packages whose files have changed
+        are discarded from the state, unless eclasses, profiles or the
+        repository's layout.conf have changed, in which case the repository
+        is loaded again.  An ebuild modified in place without any change that
+        'get_repo_stamp' detects is therefore not noticed until there is one.
+
+        If 'needs_domain' is 'False' and the repository does not have any
+        masters, the repository is opened without building a pkgcore domain
+        from the Portage configuration, which is considerably faster.
+
+        :param repo_path: the path to the repository or a directory in it
+        :param portage_config_path: the path to the Portage configuration
+            files directory; specify 'None' to detect it automatically
+        :param needs_domain: whether the returned state must have a domain
+        :return: the state of the repository
+        """
+        key = (os.path.abspath(repo_path),
+               None if portage_config_path is None
+               else os.path.abspath(portage_config_path),
+               needs_domain)
+        state = self._states.get(key)
+        if state is not None and self.check_for_changes:
+            state = self._check_for_changes(state)
+        if state is None:
+            domain = None
+            repo = None
+            if not needs_domain:
+                repo = open_standalone_repository(repo_path)
+            if repo is None:
+                domain, repo = nattka.package.find_repository(
+                    repo_path, portage_config_path)
+            stamp = None
+            package_fingerprints = None
+            if self.check_for_changes:
+                stamp = get_repo_stamp(repo)
+                package_fingerprints = get_package_fingerprints(repo)
+            state = RepositoryState(repo, domain, stamp, package_fingerprints)
+            self._states[key] = state
+        return state
+
+    @staticmethod
+    def _check_for_changes(state: RepositoryState) \
+            -> Optional[RepositoryState]:
+        stamp = get_repo_stamp(state.repo)
+        if stamp == state.stamp:
+            return state
+        package_fingerprints = get_package_fingerprints(state.repo)
+        changed_keys = {
+            key for key in
+            package_fingerprints.keys() | state.package_fingerprints.keys()
+            if package_fingerprints.get(key) !=
+            state.package_fingerprints.get(key)}
+        if any('/' not in key for key in changed_keys):
+            # Eclasses, profiles or the repository's layout.conf have
+            # changed, which may affect any package
+            state.save()
+            return None
+        state.forget_packages(
+            {tuple(key.split('/', 1)) for key in changed_keys})
+        state.stamp = stamp
+        state.package_fingerprints = package_fingerprints
+        return state
+
+    def save(self) -> None:
+        """Write the persistent caches of all repositories in the session."""
+        for state in self._states.values():
+            state.save()
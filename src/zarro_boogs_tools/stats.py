@@ -0,0 +1,367 @@
+#  zarro-boogs-tools Timing and Counter Statistics
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+# This module is imported by modules that are imported lazily as well as by
+# the ones that are not, so it must only import modules from the standard
+# library
+
+import contextlib
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from typing import Any, ContextManager, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+"""The context manager returned for phases and timers while disabled."""
+_NULL_CONTEXT = contextlib.nullcontext()
+
+"""The collector that instrumentation points report to, if enabled."""
+_collector: Optional['StatsCollector'] = None
+
+
+class StatsCollector:
+    """
+    A collection of the statistics reported by instrumentation points while
+    it is enabled, which include:
+    - phases: sections of a run whose wall-clock time and CPU time are
+      measured each time they are entered
+    - timers: operations done many times, possibly from multiple threads,
+      whose accumulated wall-clock time and number of calls are measured
+    - counters: numbers of events
+    - caches: the lookups in caches, counted from when the caches are added
+      to the collector
+    - measurements: the statistics above collected while a unit of work, like
+      making the package list for one main package, was being done
+
+    A StatsCollector may be shared between threads.
+    """
+
+    def __init__(self):
+        self.phases = dict()
+        self.timers = dict()
+        self.counters = dict()
+        self.measurements = list()
+        self._caches = dict()
+        self._lock = threading.Lock()
+
+    def _get_snapshot(self) -> tuple[dict, dict, dict]:
+        with self._lock:
+            return ({name: record['calls']
+                     for name, record in self.timers.items()},
+                    dict(self.counters),
+                    {name: (cache.hits, cache.misses)
+                     for name, (cache, _, _) in self._caches.items()})
+
+    @contextlib.contextmanager
+    def measure(self, name: str, labels: dict[str, str]) -> Iterator[None]:
+        """
+        Measure a unit of work, and add the measurement to the
+        'measurements' attribute.  Each measurement is a dictionary with the
+        following keys:
+        - 'name': the name of the kind of work
+        - 'labels': the labels that identify the unit of work
+        - 'wall_time': the wall-clock time spent in the work in seconds
+        - 'timer_calls': the number of calls to each timed operation
+        - 'counters': the increase of each counter
+        - 'caches': the hits and misses of each cache, each as a list
+        - 'peak_rss': the maximum resident set size of this process in bytes
+          so far, or 'None' if it cannot be measured on this system
+        Because statistics are collected for the whole process, the
+        measurement also includes work done concurrently in other threads.
+
+        :param name: the name of the kind of work
+        :param labels: the labels that identify the unit of work
+        :return: a context manager whose body is the work
+        """
+        timer_calls_start, counters_start, caches_start = \
+            self._get_snapshot()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            timer_calls, counters, caches = self._get_snapshot()
+            measurement = {
+                'name': name,
+                'labels': dict(labels),
+                'wall_time': wall_time,
+                'timer_calls': {
+                    timer: calls - timer_calls_start.get(timer, 0)
+                    for timer, calls in timer_calls.items()},
+                'counters': {
+                    counter: value - counters_start.get(counter, 0)
+                    for counter, value in counters.items()},
+                'caches': {
+                    cache: [hits - caches_start.get(cache, (0, 0))[0],
+                            misses - caches_start.get(cache, (0, 0))[1]]
+                    for cache, (hits, misses) in caches.items()},
+                'peak_rss': get_peak_rss()
+            }
+            with self._lock:
+                self.measurements.append(measurement)
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Measure the time spent in a phase of a run.
+
+        :param name: the name of the phase
+        :return: a context manager whose body is the phase
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall_time = time.perf_counter() - wall_start
+            cpu_time = time.process_time() - cpu_start
+            with self._lock:
+                record = self.phases.setdefault(
+                    name, {'wall_time': 0.0, 'cpu_time': 0.0, 'calls': 0})
+                record['wall_time'] += wall_time
+                record['cpu_time'] += cpu_time
+                record['calls'] += 1
+
+    @contextlib.contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Measure the time spent in an operation.
+
+        :param name: the name of the operation
+        :return: a context manager whose body is the operation
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                record = self.timers.setdefault(
+                    name, {'time': 0.0, 'calls': 0})
+                record['time'] += elapsed
+                record['calls'] += 1
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Increase a counter.
+
+        :param name: the name of the counter
+        :param value: the amount to increase the counter by
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def add_cache(self, name: str, cache: Any) -> None:
+        """
+        Start counting the lookups in a cache.  Lookups made before this
+        method is called are not counted.  Adding another cache with the same
+        name replaces the previous one.
+
+        :param name: the name to report the cache with
+        :param cache: the cache, which must have integer attributes 'hits' and
+            'misses' that count its lookups
+        """
+        with self._lock:
+            self._caches[name] = (cache, cache.hits, cache.misses)
+
+    def get_report(self) -> dict[str, dict[str, Any]]:
+        """
+        Get the statistics collected so far.
+
+        :return: a dictionary that can be serialized into JSON, with keys
+            'phases', 'timers', 'counters', 'caches' and 'peak_rss'; the hit
+            rate of a cache without any lookups is 'None', and see the
+            'measure' method for the value for 'peak_rss'
+        """
+        with self._lock:
+            caches = dict()
+            for name, (cache, hits, misses) in self._caches.items():
+                hits = cache.hits - hits
+                misses = cache.misses - misses
+                lookups = hits + misses
+                caches[name] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / lookups if lookups > 0 else None
+                }
+            return {
+                'phases': {name: dict(record)
+                           for name, record in self.phases.items()},
+                'timers': {name: dict(record)
+                           for name, record in self.timers.items()},
+                'counters': dict(self.counters),
+                'caches': caches,
+                'peak_rss': get_peak_rss()
+            }
+
+
+def get_peak_rss() -> Optional[int]:
+    """
+    Get the maximum resident set size of this process so far.
+
+    :return: the maximum resident set size in bytes, or 'None' if it cannot
+        be measured on this system
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # The size is in bytes on macOS and in kilobytes on other systems
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def format_report(report: dict[str, dict[str, Any]]) -> str:
+    """
+    Format statistics returned by the 'StatsCollector.get_report' method for
+    humans to read.
+
+    :param report: the statistics
+    :return: the formatted statistics, which ends with a newline
+    """
+    lines = list()
+    lines.append(f"{'Phase':<36}{'Wall':>10}{'CPU':>10}{'Calls':>10}")
+    for name, record in report['phases'].items():
+        lines.append(f"{name:<36}{record['wall_time']:>9.3f}s"
+                     f"{record['cpu_time']:>9.3f}s{record['calls']:>10}")
+    lines.append('')
+    lines.append(f"{'Operation':<36}{'Time':>10}{'Calls':>20}")
+    for name, record in report['timers'].items():
+        lines.append(f"{name:<36}{record['time']:>9.3f}s"
+                     f"{record['calls']:>20}")
+    lines.append('')
+    lines.append(f"{'Counter':<36}{'Value':>30}")
+    for name, value in report['counters'].items():
+        lines.append(f"{name:<36}{value:>30}")
+    lines.append('')
+    lines.append(f"{'Cache':<36}{'Hits':>10}{'Misses':>10}{'Hit rate':>10}")
+    for name, record in report['caches'].items():
+        hit_rate = record['hit_rate']
+        hit_rate = '-' if hit_rate is None else f'{hit_rate:.1%}'
+        lines.append(f"{name:<36}{record['hits']:>10}{record['misses']:>10}"
+                     f"{hit_rate:>10}")
+    if report['peak_rss'] is not None:
+        lines.append('')
+        lines.append(f"{'Peak resident set size':<36}"
+                     f"{report['peak_rss'] / 1048576:>27.1f}MiB")
+    return '\n'.join(lines) + '\n'
+
+
+def enable() -> StatsCollector:
+    """
+    Start collecting statistics with a new collector, discarding the
+    statistics collected previously.
+
+    :return: the new collector
+    """
+    global _collector
+    _collector = StatsCollector()
+    return _collector
+
+
+def disable() -> None:
+    """Stop collecting statistics."""
+    global _collector
+    _collector = None
+
+
+def get_collector() -> Optional[StatsCollector]:
+    """
+    Get the collector that statistics are being collected with.
+
+    :return: the collector if statistics are being collected, or 'None'
+        otherwise
+    """
+    return _collector
+
+
+# The following functions are the instrumentation points, which do nothing
+# other than checking if statistics are being collected while they are not
+
+def phase(name: str) -> ContextManager[None]:
+    """
+    Measure the time spent in a phase of a run if statistics are being
+    collected.
+
+    :param name: the name of the phase
+    :return: a context manager whose body is the phase
+    """
+    collector = _collector
+    if collector is None:
+        return _NULL_CONTEXT
+    return collector.phase(name)
+
+
+def timer(name: str) -> ContextManager[None]:
+    """
+    Measure the time spent in an operation if statistics are being
+    collected.
+
+    :param name: the name of the operation
+    :return: a context manager whose body is the operation
+    """
+    collector = _collector
+    if collector is None:
+        return _NULL_CONTEXT
+    return collector.timer(name)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """
+    Increase a counter if statistics are being collected.
+
+    :param name: the name of the counter
+    :param value: the amount to increase the counter by
+    """
+    collector = _collector
+    if collector is not None:
+        collector.increment(name, value)
+
+
+def measure(name: str, labels: dict[str, str]) -> ContextManager[None]:
+    """
+    Measure a unit of work if statistics are being collected.
+
+    :param name: the name of the kind of work
+    :param labels: the labels that identify the unit of work
+    :return: a context manager whose body is the work
+    """
+    collector = _collector
+    if collector is None:
+        return _NULL_CONTEXT
+    return collector.measure(name, labels)
+
+
+def add_cache(name: str, cache: Any) -> None:
+    """
+    Start counting the lookups in a cache if statistics are being collected.
+
+    :param name: the name to report the cache with
+    :param cache: the cache, which must have integer attributes 'hits' and
+        'misses' that count its lookups
+    """
+    collector = _collector
+    if collector is not None:
+        collector.add_cache(name, cache)
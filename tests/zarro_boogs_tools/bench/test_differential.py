@@ -0,0 +1,140 @@
+#  Unit tests for bench/differential.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.differential import *
+from zarro_boogs_tools.bench.__main__ import main
+from zarro_boogs_tools.pkgcore.profile import UseRestrictionTable
+
+import contextlib
+import io
+import shutil
+import tempfile
+import unittest.mock
+from pathlib import Path
+
+
+def truncating_engine(repo, profile, main_packages, target_keyword,
+                      match_keyword):
+    """An engine that drops every package after the third one."""
+    return [package_list[:3] for package_list in reference_package_lists(
+        repo, profile, main_packages, target_keyword, match_keyword)]
+
+
+class TestDifferential(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_case(self):
+        """
+        Test if cases generated with the same seed are identical, and if the
+        reference implementation resolves them without errors.
+        """
+        non_empty = 0
+        for seed in range(10):
+            case = generate_case(seed)
+            self.assertEqual(case.to_dict(), generate_case(seed).to_dict())
+            path = self.temp_dir / str(seed)
+            case.write(path)
+            outcome = run_case(path, case)
+            self.assertIsInstance(outcome, list)
+            self.assertEqual(len(case.main_atoms), len(outcome))
+            if any(outcome):
+                non_empty += 1
+        self.assertGreater(non_empty, 0)
+
+    def test_engines_agree(self):
+        """
+        Test if every engine agrees with the reference implementation.
+        """
+        self.assertEqual([], run_differential(range(10), shrink=False))
+
+    def test_preprocessing_checked(self):
+        """
+        Test if the reference implementation does not share the
+        preprocessing of dependency restrictions with the engines, so that
+        the 'preprocessing' engine disagrees with it when USE flag
+        restrictions are ignored or any-of groups are not rewritten.
+        """
+        seeds = [13, 36, 48, 93]
+        with unittest.mock.patch.object(
+                UseRestrictionTable, 'is_masked', return_value=False):
+            failures = run_differential(seeds, ['preprocessing'],
+                                        shrink=False)
+        self.assertGreater(len(failures), 0)
+        with unittest.mock.patch(
+                'zarro_boogs_tools.pkgcore.restriction.'
+                '_is_empty_all_of_group', return_value=False):
+            failures = run_differential(seeds, ['preprocessing'],
+                                        shrink=False)
+        self.assertGreater(len(failures), 0)
+
+    def test_shrink(self):
+        """
+        Test if a case an engine disagrees on is shrunk to a smaller case
+        that the engine still disagrees on.
+        """
+        with unittest.mock.patch.dict(ENGINES, truncating=truncating_engine):
+            failures = run_differential(range(6), ['truncating'])
+        self.assertGreater(len(failures), 0)
+        for failure in failures:
+            self.assertEqual('truncating', failure['engine'])
+            self.assertNotEqual(failure['expected'], failure['actual'])
+            case = DifferentialCase(**failure['case'])
+            self.assertLess(case.get_size(),
+                            generate_case(failure['seed']).get_size())
+            # The minimal case needs exactly one package list with four
+            # packages
+            self.assertEqual(1, len(case.main_atoms))
+            self.assertEqual(4, len(failure['expected'][0]))
+            self.assertIn(f"differs from the reference on case "
+                          f"{failure['seed']}", format_failure(failure))
+
+    def test_main(self):
+        """
+        Test if the 'differential' subcommand reports and writes the cases an
+        engine disagrees on, and exits with a nonzero status.
+        """
+        output = io.StringIO()
+        with unittest.mock.patch.dict(ENGINES, truncating=truncating_engine), \
+                contextlib.redirect_stdout(output):
+            status = main('zbt-bench', [
+                'differential', '-n', '5', '-e', 'truncating', '--no-shrink',
+                '-o', str(self.temp_dir)])
+        self.assertEqual(1, status)
+        self.assertTrue(output.getvalue().endswith(
+            'disagreements found\n'))
+        cases = list(self.temp_dir.iterdir())
+        self.assertGreater(len(cases), 0)
+        for case_dir in cases:
+            self.assertTrue((case_dir / 'case.json').is_file())
+            self.assertTrue((case_dir / 'repo' / 'profiles').is_dir())
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(0, main('zbt-bench', [
+                'differential', '-n', '2', '-e', 'resolver']))
+
+
+if __name__ == '__main__':
+    unittest.main()
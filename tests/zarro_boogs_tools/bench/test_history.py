@@ -0,0 +1,241 @@
+#  Unit tests for bench/history.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.history import *
+from zarro_boogs_tools.bench.__main__ import main
+
+import contextlib
+import io
+import shutil
+import statistics
+import tempfile
+from pathlib import Path
+
+
+def get_suite_result(times: list[float], expanded: int) -> dict:
+    return {
+        'benchmark': 'get_packages_to_process',
+        'packages': 1000,
+        'times': times,
+        'min': min(times),
+        'median': statistics.median(times),
+        'counts': {'packages expanded': expanded,
+                   'negative match cache hits': expanded,
+                   'packages listed': expanded}
+    }
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def compare(self, baseline: dict, current: dict, **kwargs) \
+            -> dict[str, bool]:
+        comparisons = compare_entries(
+            create_entry('synthetic', [baseline]),
+            create_entry('synthetic', [current]), **kwargs)
+        return {comparison['metric']: comparison['regression']
+                for comparison in comparisons}
+
+    def test_history_file(self):
+        """
+        Test if entries added to a benchmark history file are read back in
+        order, and if an invalid history file is rejected.
+        """
+        path = self.temp_dir / 'history' / 'history.json'
+        self.assertEqual([], read_history(path))
+        first = create_entry(
+            'synthetic', [get_suite_result([1.0], 10)], 'first')
+        second = create_entry('synthetic', [get_suite_result([1.0], 10)])
+        append_to_history(path, first)
+        append_to_history(path, second)
+        self.assertEqual([first, second], read_history(path))
+        self.assertEqual(['history.json'],
+                         [child.name for child in path.parent.iterdir()])
+
+        path.write_text('[]')
+        with self.assertRaisesRegex(ValueError, 'Unsupported'):
+            read_history(path)
+        path.write_text('{')
+        with self.assertRaisesRegex(ValueError, 'Invalid'):
+            append_to_history(path, first)
+
+    def test_find_entry(self):
+        """
+        Test if entries of a benchmark history are found by every kind of
+        reference.
+        """
+        entries = [
+            {'label': 'a', 'machine': {'id': 'x'}, 'subcommand': 'replay'},
+            {'label': 'b', 'machine': {'id': 'y'}, 'subcommand': 'replay'},
+            {'label': 'a', 'machine': {'id': 'y'}, 'subcommand': 'memory'},
+            {'label': None, 'machine': {'id': 'x'}, 'subcommand': 'memory'}
+        ]
+        self.assertIs(entries[3], find_entry(entries, 'latest'))
+        self.assertIs(entries[2], find_entry(entries, 'latest', 'y'))
+        self.assertIs(entries[1],
+                      find_entry(entries, 'latest', 'y', 'replay'))
+        self.assertIs(entries[0],
+                      find_entry(entries, 'latest', 'x', 'replay'))
+        self.assertIs(entries[1], find_entry(entries, '1'))
+        self.assertIs(entries[3], find_entry(entries, '-1'))
+        self.assertIs(entries[2], find_entry(entries, 'a'))
+        with self.assertRaises(ValueError):
+            find_entry(entries, 'latest', 'z')
+        with self.assertRaises(ValueError):
+            find_entry(entries, 'latest', 'x', 'synthetic')
+        with self.assertRaises(ValueError):
+            find_entry(entries, '4')
+        with self.assertRaises(ValueError):
+            find_entry(entries, 'c')
+
+    def test_times(self):
+        """
+        Test if an increase of the time of a benchmark is only a regression
+        when it exceeds both the threshold and the noise in the runs' times.
+        """
+        metric = 'get_packages_to_process (1000 packages): time'
+        baseline = get_suite_result([1.0, 1.0, 1.02], 10)
+        self.assertFalse(self.compare(
+            baseline, get_suite_result([1.05, 1.05, 1.06], 10))[metric])
+        self.assertTrue(self.compare(
+            baseline, get_suite_result([1.2, 1.2, 1.21], 10))[metric])
+        self.assertTrue(self.compare(
+            baseline, get_suite_result([1.05, 1.05, 1.06], 10),
+            threshold=0.01)[metric])
+        # The runs vary by much more than the threshold
+        self.assertFalse(self.compare(
+            get_suite_result([1.0, 0.5, 1.5], 10),
+            get_suite_result([1.2, 1.2, 1.2], 10))[metric])
+        self.assertFalse(self.compare(
+            baseline, get_suite_result([0.5, 0.5, 0.5], 10))[metric])
+
+    def test_counts(self):
+        """
+        Test if any increase of an operation count is a regression, and if
+        counts that do not count work done are not compared.
+        """
+        metric = 'get_packages_to_process (1000 packages): packages expanded'
+        baseline = get_suite_result([1.0], 1000)
+        comparison = self.compare(baseline, get_suite_result([1.0], 1001))
+        self.assertTrue(comparison[metric])
+        self.assertEqual(2, len(comparison))
+        self.assertFalse(self.compare(
+            baseline, get_suite_result([1.0], 1000))[metric])
+        self.assertFalse(self.compare(
+            baseline, get_suite_result([1.0], 999))[metric])
+
+    def test_other_metrics(self):
+        """
+        Test if the metrics of replay, memory and startup benchmarks are
+        compared, and if metrics that are not in both results are not
+        compared.
+        """
+        replay = {
+            'benchmark': 'replay',
+            'requests': 2,
+            'errors': 0,
+            'latency': {'mean': 1.0, 'p50': 1.0, 'max': 1.0},
+            'closure_size': {'min': 1, 'median': 1, 'max': 1, 'total': 2}
+        }
+        slower_replay = dict(replay, latency={'mean': 1.5, 'p50': 1.0})
+        self.assertEqual({'replay: latency mean': True,
+                          'replay: latency p50': False,
+                          'replay: errors': False},
+                         self.compare(replay, slower_replay))
+
+        memory = {
+            'benchmark': 'memory',
+            'repository': 'repo',
+            'phases': {'load repository': {'peak_traced': 100,
+                                           'retained': 50}},
+            'closure_size': 2
+        }
+        self.assertEqual({'memory (repo): load repository peak': False,
+                          'memory (repo): load repository retained': False},
+                         self.compare(memory, memory))
+        self.assertEqual(dict(), self.compare(memory, dict(
+            memory, repository='other')))
+
+        startup = {
+            'benchmark': 'startup',
+            'command': 'zbt --version',
+            'times': [0.1, 0.1, 0.11],
+            'min': 0.1,
+            'median': 0.1
+        }
+        self.assertEqual({'startup (zbt --version): time': True},
+                         self.compare(startup, dict(
+                             startup, times=[0.2, 0.2, 0.2], median=0.2)))
+
+        lines = format_comparisons(compare_entries(
+            create_entry('replay', [replay]),
+            create_entry('replay', [slower_replay]))).splitlines()
+        self.assertEqual(6, len(lines))
+        self.assertTrue(lines[1].endswith('replay: latency mean (regressed)'))
+        self.assertEqual('3 metrics compared, 1 regressed', lines[-1])
+
+    def test_unmatched_metrics(self):
+        """
+        Test if comparing with a baseline that does not have any metric of
+        the results fails, and if metrics missing from the baseline are
+        reported.
+        """
+        path = self.temp_dir / 'history.json'
+        other = dict(get_suite_result([1.0], 10), benchmark='resolver')
+        append_to_history(path, create_entry(
+            'synthetic', [get_suite_result([1.0], 10)], 'one'))
+        append_to_history(path, create_entry(
+            'synthetic', [get_suite_result([1.0], 10), other], 'two'))
+        append_to_history(path, create_entry(
+            'replay', [{'benchmark': 'replay', 'errors': 0,
+                        'latency': {'mean': 1.0}}]))
+        self.assertEqual(
+            ['resolver (1000 packages): time',
+             'resolver (1000 packages): packages expanded'],
+            get_unmatched_metrics(*read_history(path)[:2]))
+
+        output = io.StringIO()
+        errors = io.StringIO()
+        with contextlib.redirect_stdout(output), \
+                contextlib.redirect_stderr(errors):
+            self.assertEqual(1, main('zbt-bench', [
+                'compare', '--history', str(path), 'two']))
+            self.assertEqual('', output.getvalue())
+            self.assertIn('does not have any metric', errors.getvalue())
+            errors.truncate(0)
+            self.assertEqual(0, main('zbt-bench', [
+                'compare', '--history', str(path), 'one', 'two']))
+            self.assertIn('2 metrics are not in the baseline',
+                          errors.getvalue())
+            self.assertTrue(output.getvalue().endswith(
+                '2 metrics compared, 0 regressed\n'))
+            # 'latest' finds the latest results of the same subcommand
+            self.assertEqual(0, main('zbt-bench', [
+                'compare', '--history', str(path), 'latest', '1']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#  Unit tests for bench/memory.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.memory import *
+
+import json
+import tracemalloc
+from pathlib import Path
+
+from nattka.bugzilla import BugCategory
+
+
+class TestMemory(unittest.TestCase):
+    repo_path = Path('tests/ebuild-repos/cached-deps')
+    phases = ['load repository', 'select main packages', 'load profile',
+              'search dependency graphs', 'construct package lists']
+
+    def test_memory_tracker(self):
+        """
+        Test if a MemoryTracker tells apart memory that a phase allocates
+        temporarily from memory it retains, and finds where the retained
+        memory was allocated.
+        """
+        tracker = MemoryTracker(top=1)
+        tracemalloc.start()
+        try:
+            with tracker.phase('temporary'):
+                temporary = bytearray(4 << 20)
+                del temporary
+            with tracker.phase('retained'):
+                retained = bytearray(2 << 20)
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(['temporary', 'retained'], list(tracker.phases))
+        temporary_record = tracker.phases['temporary']
+        self.assertGreaterEqual(temporary_record['peak_traced'], 4 << 20)
+        self.assertLess(temporary_record['retained'], 1 << 20)
+        retained_record = tracker.phases['retained']
+        self.assertGreaterEqual(retained_record['retained'], 2 << 20)
+        self.assertLess(retained_record['peak_traced'], 3 << 20)
+        self.assertEqual(1, len(retained_record['top_allocations']))
+        top_allocation = retained_record['top_allocations'][0]
+        self.assertTrue(top_allocation['location'].startswith(__file__))
+        self.assertGreaterEqual(top_allocation['size'], 2 << 20)
+        self.assertEqual(len(retained), 2 << 20)
+
+    def test_measure_memory(self):
+        """
+        Test if the 'measure_memory' function measures every phase of making
+        package lists and stops tracing allocations afterwards.
+        """
+        result = measure_memory(
+            self.repo_path, 'default', ['=app-misc/foo-1.0'])
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual('memory', result['benchmark'])
+        self.assertEqual(self.phases, list(result['phases']))
+        self.assertEqual(1, result['closure_size'])
+        for record in result['phases'].values():
+            self.assertGreaterEqual(record['peak_traced'],
+                                    record['retained'])
+        # The result is reported in JSON
+        json.dumps(result)
+
+        with self.assertRaisesRegex(ValueError, 'Unknown profile'):
+            measure_memory(self.repo_path, 'nonexistent',
+                           ['=app-misc/foo-1.0'])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_measure_memory_in_new_process(self):
+        """
+        Test if the 'measure_memory_in_new_process' function returns the
+        result of the measurement in the new process, and raises the errors
+        raised there.
+        """
+        result = measure_memory_in_new_process(
+            self.repo_path, 'default', ['=app-misc/foo-9999'],
+            BugCategory.KEYWORDREQ, 2)
+        self.assertEqual(self.phases, list(result['phases']))
+        self.assertEqual(1, result['closure_size'])
+        for record in result['phases'].values():
+            self.assertLessEqual(len(record['top_allocations']), 2)
+        self.assertTrue(format_memory_results([result]).startswith(
+            f'Repository: {self.repo_path}\n'))
+
+        with self.assertRaisesRegex(ValueError, 'Could not find'):
+            measure_memory_in_new_process(
+                self.repo_path, 'default', ['dev-util/nonexistent'])
+
+
+if __name__ == '__main__':
+    unittest.main()
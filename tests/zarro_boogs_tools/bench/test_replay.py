@@ -0,0 +1,171 @@
+#  Unit tests for bench/replay.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.replay import *
+from zarro_boogs_tools.index import get_version_index
+from zarro_boogs_tools.session import Session
+
+import os
+import tempfile
+from pathlib import Path
+
+from nattka.bugzilla import BugCategory
+
+
+class TestReplay(unittest.TestCase):
+    repo_path = Path('tests/ebuild-repos/cached-deps')
+
+    def write_corpus(self, contents: str) -> Path:
+        fd, path = tempfile.mkstemp(suffix='.jsonl')
+        with os.fdopen(fd, 'w') as corpus_file:
+            corpus_file.write(contents)
+        self.addCleanup(os.remove, path)
+        return Path(path)
+
+    def test_read_corpus(self):
+        """
+        Test if the 'read_corpus' function reads every request in a corpus
+        file, naming requests without an ID after their lines.
+        """
+        path = self.write_corpus(
+            '{"id": 1, "atoms": ["=app-misc/foo-1.0"], "profile": "default",'
+            ' "arch": "riscv", "match_keyword": "amd64"}\n'
+            '\n'
+            '{"atoms": ["app-misc/foo"], "profile": "default",'
+            ' "keyword_change_type": "KEYWORDREQ"}\n')
+        requests = read_corpus(path)
+        self.assertEqual(2, len(requests))
+        self.assertEqual('1', requests[0].request_id)
+        self.assertEqual(['=app-misc/foo-1.0'], requests[0].atoms)
+        self.assertEqual('default', requests[0].profile)
+        self.assertEqual('riscv', requests[0].arch)
+        self.assertIsNone(requests[0].keyword_change_type)
+        self.assertEqual('amd64', requests[0].match_keyword)
+        self.assertEqual(f'{path.name}:3', requests[1].request_id)
+        self.assertIsNone(requests[1].arch)
+        self.assertEqual(BugCategory.KEYWORDREQ,
+                         requests[1].keyword_change_type)
+
+    def test_read_corpus_invalid(self):
+        """
+        Test if the 'read_corpus' function reports the line of an invalid
+        request.
+        """
+        for line in ['not JSON', '[]', '{"atoms": [], "profile": "default"}',
+                     '{"atoms": ["app-misc/foo"]}',
+                     '{"atoms": ["app-misc/foo"], "profile": "default",'
+                     ' "keyword_change_type": "SECURITY"}']:
+            path = self.write_corpus(
+                '{"atoms": ["app-misc/foo"], "profile": "default"}\n'
+                f'{line}\n')
+            with self.assertRaisesRegex(ValueError, f':2: '):
+                read_corpus(path)
+
+    def test_replay_corpus(self):
+        """
+        Test if the 'replay_corpus' function replays every request the
+        requested number of times, recording the package list sizes of
+        requests that can be replayed and the errors of the others.
+        """
+        requests = [
+            ReplayRequest(['=app-misc/foo-1.0'], 'default', request_id='a'),
+            ReplayRequest(['=app-misc/foo-9999'], 'default',
+                          keyword_change_type=BugCategory.KEYWORDREQ,
+                          request_id='b'),
+            ReplayRequest(['=app-misc/foo-1.0'], 'default', arch='riscv',
+                          request_id='c'),
+            ReplayRequest(['dev-util/nonexistent'], 'default',
+                          request_id='d'),
+            ReplayRequest(['=app-misc/foo-1.0'], 'nonexistent',
+                          request_id='e')
+        ]
+        for warm in [False, True]:
+            records = replay_corpus(self.repo_path, requests, 2, warm)
+            self.assertEqual(10, len(records))
+            self.assertEqual(list('abcdeabcde'),
+                             [record['id'] for record in records])
+            a, b, c, d, e = records[:5]
+            self.assertEqual('amd64', a['keyword'])
+            self.assertEqual([1], a['closure_sizes'])
+            self.assertEqual('~amd64', b['keyword'])
+            self.assertEqual([1], b['closure_sizes'])
+            self.assertEqual('~riscv', c['keyword'])
+            for record in [a, b, c]:
+                self.assertIsNone(record['error'])
+                self.assertGreater(record['latency'], 0)
+            self.assertIn('Could not find', d['error'])
+            self.assertIn('Unknown profile', e['error'])
+
+            summary = summarize_replay(records)
+            self.assertEqual(10, summary['requests'])
+            self.assertEqual(4, summary['errors'])
+            self.assertLessEqual(summary['latency']['p50'],
+                                 summary['latency']['p99'])
+            self.assertLessEqual(summary['latency']['p99'],
+                                 summary['latency']['max'])
+            self.assertEqual(1, summary['closure_size']['max'])
+            formatted = format_replay(records, summary)
+            self.assertEqual(1, formatted.count('d: '))
+
+    def test_replay_request_cold(self):
+        """
+        Test if a request replayed cold does not reuse anything loaded or
+        cached for the repository before, unlike a request replayed warm.
+        """
+        request = ReplayRequest(['=app-misc/foo-1.0'], 'default')
+        repo_state = Session().get_repository_state(
+            self.repo_path, needs_domain=False)
+        version_index = get_version_index(repo_state.repo)
+        self.assertIsNone(replay_request(repo_state, request)['error'])
+        self.assertEqual(0, len(repo_state.cache))
+        self.assertIsNot(version_index, get_version_index(repo_state.repo))
+
+        version_index = get_version_index(repo_state.repo)
+        self.assertIsNone(
+            replay_request(repo_state, request, True)['error'])
+        self.assertGreater(len(repo_state.cache), 0)
+        self.assertIs(version_index, get_version_index(repo_state.repo))
+
+    def test_summarize_replay_no_requests(self):
+        """
+        Test if the 'summarize_replay' function handles replays where no
+        request could be replayed.
+        """
+        summary = summarize_replay([])
+        self.assertEqual(0, summary['requests'])
+        self.assertIsNone(summary['latency'])
+        self.assertIsNone(summary['closure_size'])
+        self.assertTrue(format_replay([], summary).endswith('\n'))
+
+    def test_get_percentile(self):
+        """
+        Test if the 'get_percentile' function interpolates between values.
+        """
+        self.assertEqual(5, get_percentile([5], 99))
+        self.assertEqual(1, get_percentile([3, 1, 2], 0))
+        self.assertEqual(2, get_percentile([3, 1, 2], 50))
+        self.assertEqual(3, get_percentile([3, 1, 2], 100))
+        self.assertAlmostEqual(2.5, get_percentile([1, 2, 3, 4], 50))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#  Unit tests for bench/startup.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+from .. import unittest
+from zarro_boogs_tools.bench.startup import *
+
+
+class TestStartup(unittest.TestCase):
+    def test_run_startup_benchmark(self):
+        """
+        Test if the 'run_startup_benchmark' function starts the program the
+        requested number of times.
+        """
+        result = run_startup_benchmark(repeat=2)
+        self.assertEqual('startup', result['benchmark'])
+        self.assertEqual('zbt --version', result['command'])
+        self.assertEqual(2, len(result['times']))
+        self.assertEqual(min(result['times']), result['min'])
+        self.assertLessEqual(result['min'], result['median'])
+
+        lines = format_startup_result(result).splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[1].startswith('zbt --version'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#  Unit tests for bench/suite.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.suite import *
+
+import shutil
+import tempfile
+from pathlib import Path
+
+
+class TestSuite(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_run_suite(self):
+        """
+        Test if the 'run_suite' function runs every benchmark the requested
+        number of times on a repository of each size.
+        """
+        results = run_suite(self.temp_dir, [100, 200], repeat=2)
+        self.assertEqual(2 * len(BENCHMARKS), len(results))
+        self.assertEqual(
+            [(size, name) for size in [100, 200] for name in BENCHMARKS],
+            [(result['packages'], result['benchmark'])
+             for result in results])
+        for result in results:
+            self.assertEqual(2, len(result['times']))
+            self.assertEqual(min(result['times']), result['min'])
+            self.assertLessEqual(result['min'], result['median'])
+            if result['benchmark'] == 'get_packages_to_process':
+                self.assertGreater(
+                    result['counts']['version index lookup'], 0)
+        self.assertEqual(2, len(list(self.temp_dir.iterdir())))
+
+        lines = format_results(results).splitlines()
+        self.assertEqual(len(results) + 1, len(lines))
+        self.assertTrue(lines[1].startswith('get_packages_to_process'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#  Unit tests for bench/synthetic.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.bench.synthetic import *
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, \
+    get_keyword_matching_pkg_filter, get_packages_to_process
+from zarro_boogs_tools.pkgcore.repository import \
+    get_md5_cache_entry, is_md5_cache_entry_valid, open_standalone_repository
+
+import filecmp
+import shutil
+import tempfile
+from pathlib import Path
+
+from pkgcore.ebuild.profiles import OnDiskProfile
+
+
+class TestSynthetic(unittest.TestCase):
+    parameters = SyntheticRepositoryParameters(
+        packages=120, versions=2, fan_out=2, depth=4,
+        package_use_mask_size=8)
+
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generate_repository(self):
+        """
+        Test if the 'generate_repository' function generates a repository
+        with the requested number of packages and versions, whose md5-cache
+        is up to date and whose top level packages have dependencies that
+        need to be keyworded.
+        """
+        path = self.temp_dir / 'repo'
+        generate_repository(path, self.parameters)
+        repo = open_standalone_repository(path)
+        self.assertIsNotNone(repo)
+        packages = list(repo)
+        self.assertEqual(240, len(packages))
+        self.assertEqual(
+            120, len({(pkg.category, pkg.package) for pkg in packages}))
+        for pkg in packages:
+            entry = get_md5_cache_entry(repo, pkg)
+            self.assertIsNotNone(entry)
+            self.assertTrue(is_md5_cache_entry_valid(repo, pkg, entry))
+
+        profile = OnDiskProfile(str(path / 'profiles'), SYNTHETIC_PROFILE)
+        self.assertEqual(SYNTHETIC_ARCH, profile.arch)
+        target_keyword = f'~{SYNTHETIC_ARCH}'
+        top_level_packages = get_top_level_packages(self.parameters)
+        self.assertEqual(30, len(top_level_packages))
+        main_package = get_best_version(
+            get_atom_obj_from_str(top_level_packages[0]), repo)
+        self.assertNotIn(target_keyword, main_package.keywords)
+        package_list = get_packages_to_process(
+            main_package, target_keyword, repo,
+            get_keyword_matching_pkg_filter(target_keyword), profile)
+        self.assertGreater(len(package_list), 1)
+        for pkg in package_list:
+            self.assertNotIn(target_keyword, pkg.keywords)
+
+    def test_generate_repository_repeatable(self):
+        """
+        Test if the 'generate_repository' function generates identical
+        repositories for the same parameters.
+        """
+        generate_repository(self.temp_dir / 'first', self.parameters)
+        generate_repository(self.temp_dir / 'second', self.parameters)
+        comparison = filecmp.dircmp(
+            self.temp_dir / 'first', self.temp_dir / 'second')
+        pending = [comparison]
+        while pending:
+            comparison = pending.pop()
+            self.assertEqual([], comparison.left_only)
+            self.assertEqual([], comparison.right_only)
+            _, mismatch, errors = filecmp.cmpfiles(
+                comparison.left, comparison.right, comparison.common_files,
+                shallow=False)
+            self.assertEqual([], mismatch)
+            self.assertEqual([], errors)
+            pending.extend(comparison.subdirs.values())
+
+    def test_get_synthetic_repository(self):
+        """
+        Test if the 'get_synthetic_repository' function reuses a repository
+        generated with the same parameters and generates a new one for
+        different parameters.
+        """
+        path = get_synthetic_repository(self.temp_dir, self.parameters)
+        self.assertTrue((path / 'profiles' / 'repo_name').is_file())
+        self.assertEqual(
+            path, get_synthetic_repository(self.temp_dir, self.parameters))
+        other_parameters = SyntheticRepositoryParameters(
+            packages=120, versions=2, fan_out=2, depth=4,
+            package_use_mask_size=8, seed=1)
+        other_path = get_synthetic_repository(
+            self.temp_dir, other_parameters)
+        self.assertNotEqual(path, other_path)
+        self.assertEqual(
+            sorted([path, other_path]), sorted(self.temp_dir.iterdir()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -24,6 +24,8 @@ from zarro_boogs_tools.package import *
 from zarro_boogs_tools.pkgcore.profile import *
 
 import os.path
+import shutil
+import tempfile
 import warnings
 from collections.abc import Iterable
 from pathlib import Path
@@ -345,6 +347,48 @@ class TestProfile(unittest.TestCase):
             masked_when_disabled_and_stable
         )
 
+    def test_get_profile_fingerprint(self):
+        """
+        Test if the 'get_profile_fingerprint' function returns the same value
+        for an unchanged profile and a different value after a file in a
+        parent profile is changed.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            profiles_path = os.path.join(temp_dir, 'profiles')
+            shutil.copytree(os.path.join(
+                self.use_restrictions.location, 'profiles'), profiles_path)
+            fingerprint = get_profile_fingerprint(
+                OnDiskProfile(profiles_path, 'default'))
+            self.assertEqual(fingerprint, get_profile_fingerprint(
+                OnDiskProfile(profiles_path, 'default')))
+            with open(os.path.join(profiles_path, 'use.desc'), 'a') as file:
+                file.write('new - A new USE flag\n')
+            self.assertNotEqual(fingerprint, get_profile_fingerprint(
+                OnDiskProfile(profiles_path, 'default')))
+
+
+    def test_get_use_restriction_table(self):
+        """
+        Test if the 'get_use_restriction_table' function compiles the USE flag
+        restrictions of a profile only once.
+        """
+        table = get_use_restriction_table(self.profile)
+        self.assertIs(table, get_use_restriction_table(self.profile))
+        self.assertTrue(table.is_masked(self.restricted0, 'pkg-mask', False))
+        self.assertTrue(table.is_masked(
+            self.restricted_by_version0, 'pkg-stable-mask', True))
+        self.assertFalse(table.is_masked(
+            self.restricted_by_version1, 'pkg-stable-mask', True))
+        self.assertFalse(table.is_masked(self.free0, 'pkg-mask', False))
+
+    def test_get_version_specific_use_package_keys(self):
+        """
+        Test if the 'get_version_specific_use_package_keys' function returns
+        only the packages whose USE flag restrictions depend on the version.
+        """
+        self.assertEqual(
+            frozenset({'app-misc/restricted-by-version'}),
+            get_version_specific_use_package_keys(self.profile))
 
 if __name__ == '__main__':
     unittest.main()
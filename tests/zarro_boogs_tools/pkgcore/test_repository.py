@@ -0,0 +1,107 @@
+#  Unit tests for pkgcore/repository.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from .. import unittest
+from zarro_boogs_tools.package import get_atom_obj_from_str, get_best_version
+from zarro_boogs_tools.pkgcore.repository import *
+
+import os.path
+import shutil
+import tempfile
+from pathlib import Path
+
+import nattka.package
+
+
+class TestRepository(unittest.TestCase):
+    def test_get_md5_cache_entry(self):
+        """
+        Test if the 'get_md5_cache_entry' function returns the metadata of a
+        package in the md5-cache, and 'None' for a package without an entry.
+        """
+        _, cached_deps = nattka.package.find_repository(
+            Path('tests/ebuild-repos/cached-deps'))
+        foo = get_best_version(
+            get_atom_obj_from_str('=app-misc/foo-1.0'), cached_deps)
+        entry = get_md5_cache_entry(cached_deps, foo)
+        self.assertEqual('~amd64', entry['KEYWORDS'])
+        self.assertEqual('dev-libs/libbar', entry['DEPEND'])
+        self.assertEqual('bar', entry['INHERIT'])
+        self.assertTrue(is_md5_cache_entry_valid(cached_deps, foo, entry))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_path = os.path.join(temp_dir, 'repo')
+            shutil.copytree('tests/ebuild-repos/cached-deps', repo_path)
+            shutil.rmtree(os.path.join(repo_path, 'metadata', 'md5-cache'))
+            _, repo = nattka.package.find_repository(Path(repo_path))
+            self.assertIsNone(get_md5_cache_entry(repo, foo))
+
+    def test_is_md5_cache_entry_valid_eclass_change(self):
+        """
+        Test if the 'is_md5_cache_entry_valid' function reports an entry as
+        outdated after an eclass inherited by the package is changed.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_path = os.path.join(temp_dir, 'repo')
+            shutil.copytree('tests/ebuild-repos/cached-deps', repo_path)
+            _, repo = nattka.package.find_repository(Path(repo_path))
+            foo = get_best_version(
+                get_atom_obj_from_str('=app-misc/foo-1.0'), repo)
+            entry = get_md5_cache_entry(repo, foo)
+            eclass_md5s = dict()
+            self.assertTrue(
+                is_md5_cache_entry_valid(repo, foo, entry, eclass_md5s))
+            self.assertTrue('bar' in eclass_md5s)
+
+            with open(os.path.join(repo_path, 'eclass', 'bar.eclass'),
+                      'a') as eclass:
+                eclass.write('# Modified\n')
+            self.assertFalse(is_md5_cache_entry_valid(repo, foo, entry))
+
+
+    def test_open_standalone_repository(self):
+        """
+        Test if the 'open_standalone_repository' function opens the same
+        repository as 'nattka.package.find_repository' from any directory in
+        it, and if it refuses to open a repository with masters.
+        """
+        repo_path = 'tests/ebuild-repos/java'
+        _, expected = nattka.package.find_repository(Path(repo_path))
+        for path in [repo_path, os.path.join(repo_path, 'dev-java')]:
+            repo = open_standalone_repository(Path(path))
+            self.assertEqual(expected.location, repo.location)
+            self.assertEqual(expected.repo_id, repo.repo_id)
+            self.assertEqual(
+                sorted(pkg.cpvstr for pkg in expected),
+                sorted(pkg.cpvstr for pkg in repo))
+            self.assertEqual(1, len(repo.cache))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            overlay_path = os.path.join(temp_dir, 'overlay')
+            shutil.copytree(repo_path, overlay_path)
+            with open(os.path.join(overlay_path, 'metadata', 'layout.conf'),
+                      'w') as layout_conf:
+                layout_conf.write('masters = gentoo\n')
+            self.assertIsNone(open_standalone_repository(Path(overlay_path)))
+            self.assertIsNone(open_standalone_repository(Path(temp_dir)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,7 @@
 #  <https://www.gnu.org/licenses/>.
 
 from .. import unittest
+from zarro_boogs_tools.cache import LRUCache
 from zarro_boogs_tools.package import *
 from zarro_boogs_tools.pkgcore.restriction import *
 
@@ -30,6 +31,7 @@ from typing import Optional
 
 import nattka.package
 import pkgcore.ebuild.atom as atom
+from pkgcore.ebuild.conditionals import DepSet
 from pkgcore.ebuild.profiles import OnDiskProfile
 import pkgcore.restrictions.boolean as boolean
 import pkgcore.restrictions.restriction as restriction
@@ -164,6 +166,53 @@ class TestRestriction(unittest.TestCase):
             if len(child) > 0:
                 self.assertEqual('>=sys-libs/glibc-2.2.5:*', str(child[0]))
 
+    def test_unwrap_use_conditional_any_of(self):
+        """
+        Test if the 'unwrap_use_conditional' function removes USE-conditional
+        groups defined with USE flags masked by a profile from any-of groups.
+        """
+        test_repo_path = 'tests/ebuild-repos/use-restrictions'
+        _, use_restrictions = nattka.package.find_repository(
+            Path(test_repo_path))
+        profile = OnDiskProfile(
+            os.path.join(test_repo_path, 'profiles'), 'default')
+        free = get_best_version(
+            get_atom_obj_from_str('app-misc/free'), use_restrictions)
+
+        [restrict] = DepSet.parse(
+            '|| ( mask? ( dev-libs/mask ) dev-libs/normal )',
+            atom.atom).restrictions
+        self.assertEqual(
+            get_atom_obj_from_str('dev-libs/normal'),
+            unwrap_use_conditional(restrict, free, profile, False))
+        unwrapped = unwrap_use_conditional(restrict)
+        self.assertIsInstance(unwrapped, boolean.OrRestriction)
+        self.assertEqual(2, len(unwrapped))
+
+        unwrapped = unwrap_use_conditional(
+            boolean.OrRestriction(restrict[0]), free, profile, False)
+        self.assertIsInstance(unwrapped, boolean.OrRestriction)
+        self.assertEqual(0, len(unwrapped))
+
+    def test_is_anchored(self):
+        """
+        Test if the 'is_anchored' function tells restrictions pkgcore matches
+        by searching only the packages they name from other restrictions.
+        """
+        jdk = get_atom_obj_from_str('virtual/jdk')
+        jre = get_atom_obj_from_str('virtual/jre')
+        self.assertTrue(is_anchored(jdk))
+        self.assertTrue(is_anchored(boolean.OrRestriction(jdk, jre)))
+        self.assertTrue(is_anchored(boolean.OrRestriction()))
+        self.assertTrue(is_anchored(boolean.AndRestriction(
+            boolean.AndRestriction(), jdk)))
+        self.assertTrue(is_anchored(boolean.OrRestriction(
+            boolean.AndRestriction(jdk, jre), jre)))
+        self.assertFalse(is_anchored(boolean.AndRestriction()))
+        self.assertFalse(is_anchored(boolean.OrRestriction(
+            boolean.AndRestriction(), jdk)))
+        self.assertFalse(is_anchored(self.etr_use_cond))
+
     def test_strip_use_dep_from_restriction(self):
         """
         Test if the 'strip_use_dep_from_restriction' function can correctly
@@ -229,6 +278,103 @@ class TestRestriction(unittest.TestCase):
         self.assertEqual(jdk, multiple_restrictions[0])
         self.assertEqual(jre, multiple_restrictions[1])
 
+    def test_serialize_restriction(self):
+        """
+        Test if the 'deserialize_restriction' function converts the value
+        returned by the 'serialize_restriction' function back to an equal
+        restriction.
+        """
+        openjdk8 = get_best_version(
+            get_atom_obj_from_str('dev-java/openjdk:8'),
+            self.java
+        )
+        for restrict in [
+            get_atom_obj_from_str('!!>=virtual/jdk-1.8:*'),
+            get_atom_obj_from_str('=dev-java/antlr-4*'),
+            get_atom_obj_from_str('dev-libs/libffi:0/8='),
+            boolean.AndRestriction(),
+            preprocess_restriction(self.etr_use_cond),
+            preprocess_restriction(openjdk8.depend[0]),
+            boolean.OrRestriction(
+                boolean.AndRestriction(),
+                boolean.AndRestriction(get_atom_obj_from_str('virtual/jdk'),
+                                       get_atom_obj_from_str('virtual/jre')))
+        ]:
+            serialized = serialize_restriction(restrict)
+            deserialized = deserialize_restriction(serialized)
+            self.assertEqual(restrict, deserialized)
+            self.assertEqual(hash(restrict), hash(deserialized))
+
+        with self.assertRaises(TypeError):
+            serialize_restriction(self.etr_use_cond)
+
+
+    def test_collect_atoms(self):
+        """
+        Test if the 'collect_atoms' function returns atoms nested in groups in
+        order and leaves out blocks.
+        """
+        restrict = boolean.OrRestriction(
+            get_atom_obj_from_str('virtual/jdk'),
+            boolean.AndRestriction(
+                get_atom_obj_from_str('!!dev-java/ant-core'),
+                get_atom_obj_from_str('virtual/jre:1.8'))
+        )
+        self.assertEqual(
+            [get_atom_obj_from_str('virtual/jdk'),
+             get_atom_obj_from_str('virtual/jre:1.8')],
+            collect_atoms(restrict))
+        self.assertEqual(
+            [], collect_atoms(get_atom_obj_from_str('!dev-java/ant-core')))
+        self.assertEqual([], collect_atoms(self.etr_use_cond))
+
+    def test_preprocess_restriction_cache(self):
+        """
+        Test if the 'preprocess_restriction' function returns the same results
+        with and without a cache, including for packages whose USE flag
+        restrictions in the profile depend on their versions.
+        """
+        test_repo_path = 'tests/ebuild-repos/use-restrictions'
+        _, use_restrictions = nattka.package.find_repository(
+            Path(test_repo_path))
+        profile = OnDiskProfile(
+            os.path.join(test_repo_path, 'profiles'), 'default')
+        cache = LRUCache()
+        for stable in [False, True]:
+            for pkg in use_restrictions:
+                for restrict in pkg.rdepend.restrictions:
+                    self.assertEqual(
+                        preprocess_restriction(
+                            restrict, pkg, profile, stable, None),
+                        preprocess_restriction(
+                            restrict, pkg, profile, stable, cache))
+        # Versions of app-misc/restricted share results
+        self.assertGreater(cache.hits, 0)
+
+    def test_get_preprocess_cache_key(self):
+        """
+        Test if the 'get_preprocess_cache_key' function only distinguishes
+        versions of a package when the profile's USE flag restrictions for
+        the package depend on the version.
+        """
+        test_repo_path = 'tests/ebuild-repos/use-restrictions'
+        _, use_restrictions = nattka.package.find_repository(
+            Path(test_repo_path))
+        profile = OnDiskProfile(
+            os.path.join(test_repo_path, 'profiles'), 'default')
+        restrict = get_atom_obj_from_str('dev-libs/normal')
+
+        def get_key(atom_str: str):
+            return get_preprocess_cache_key(
+                restrict,
+                get_best_version(
+                    get_atom_obj_from_str(atom_str), use_restrictions),
+                profile, False)
+
+        self.assertEqual(get_key('~app-misc/restricted-1.0.0'),
+                         get_key('~app-misc/restricted-1.0.1'))
+        self.assertNotEqual(get_key('~app-misc/restricted-by-version-1.0.0'),
+                            get_key('~app-misc/restricted-by-version-1.0.1'))
 
 if __name__ == '__main__':
     unittest.main()
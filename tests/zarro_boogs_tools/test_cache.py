@@ -0,0 +1,75 @@
+#  Unit tests for cache.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.cache import *
+
+
+class TestCache(unittest.TestCase):
+    def test_lru_cache_counters(self):
+        """
+        Test if an 'LRUCache' counts hits and misses upon lookups, including
+        lookups of entries whose value is 'None'.
+        """
+        cache = LRUCache()
+        self.assertEqual(0.0, cache.hit_rate)
+        self.assertIsNone(cache.get('foo'))
+        cache.put('foo', None)
+        cache.put('bar', 1)
+        self.assertIsNone(cache.get('foo', 0))
+        self.assertEqual(1, cache.get('bar'))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertAlmostEqual(2 / 3, cache.hit_rate)
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(0, cache.misses)
+
+    def test_lru_cache_eviction(self):
+        """
+        Test if an 'LRUCache' evicts the least-recently-used entry when it is
+        full.
+        """
+        cache = LRUCache(2)
+        cache.put('foo', 1)
+        cache.put('bar', 2)
+        # Mark 'foo' as the most recently used entry
+        cache.get('foo')
+        cache.put('baz', 3)
+        self.assertEqual(2, len(cache))
+        self.assertTrue('foo' in cache)
+        self.assertFalse('bar' in cache)
+        self.assertTrue('baz' in cache)
+
+    def test_lru_cache_unbounded(self):
+        """
+        Test if an 'LRUCache' without a maximum size never evicts entries.
+        """
+        cache = LRUCache(None)
+        for i in range(DEFAULT_MAX_SIZE + 1):
+            cache.put(i, i)
+        self.assertEqual(DEFAULT_MAX_SIZE + 1, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
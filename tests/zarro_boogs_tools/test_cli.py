@@ -0,0 +1,92 @@
+#  Unit tests for cli.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+from . import unittest
+from zarro_boogs_tools.cli import *
+from zarro_boogs_tools.formats import PackageListFileFormat
+
+import os
+import subprocess
+import sys
+
+from nattka.bugzilla import BugCategory
+
+
+class TestCli(unittest.TestCase):
+    @staticmethod
+    def run_python(code: str) -> subprocess.CompletedProcess:
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, sys.path))
+        return subprocess.run([sys.executable, '-c', code], env=env,
+                              capture_output=True, text=True, check=True)
+
+    def test_parse_args(self):
+        """
+        Test if the 'parse_args' function stores the type of keyword change
+        and the package list file formats correctly.
+        """
+        opts = parse_args(['-s', 'ls', '-e', '-t', 'dev-java/ant-core'])
+        self.assertEqual(BugCategory.STABLEREQ,
+                         BugCategory[opts.keyword_change_type])
+        self.assertEqual(
+            [PackageListFileFormat.PORTAGE, PackageListFileFormat.TATT],
+            opts.ls_file_formats)
+        opts = parse_args(['-k', 'ls'])
+        self.assertEqual(BugCategory.KEYWORDREQ,
+                         BugCategory[opts.keyword_change_type])
+        self.assertIsNone(parse_args(['ls']).keyword_change_type)
+
+    def test_parse_args_lazy_imports(self):
+        """
+        Test if parsing arguments with the main entry point's module loaded
+        does not import nattka, pkgcore or requests.
+        """
+        result = self.run_python(
+            'import sys\n'
+            'import zarro_boogs_tools.__main__\n'
+            'zarro_boogs_tools.cli.parse_args(["-s", "ls", "-e", "foo"])\n'
+            'print(" ".join(sorted(set(m.split(".")[0] for m in sys.modules'
+            ' if m.split(".")[0] in ("nattka", "pkgcore", "requests")))))\n')
+        self.assertEqual('', result.stdout.strip())
+
+    def test_version_lazy_imports(self):
+        """
+        Test if printing the version does not import nattka, pkgcore,
+        requests or the modules of this package that are only needed to run
+        a subcommand.
+        """
+        result = self.run_python(
+            'import sys\n'
+            'import zarro_boogs_tools.__main__\n'
+            'try:\n'
+            '    zarro_boogs_tools.__main__.main("zbt", ["--version"])\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'print(" ".join(sorted(m for m in sys.modules'
+            ' if m.split(".")[0] in ("nattka", "pkgcore", "requests") or'
+            ' m in ("zarro_boogs_tools.package", "zarro_boogs_tools.list",'
+            ' "zarro_boogs_tools.session"))), file=sys.stderr)\n')
+        self.assertEqual('', result.stderr.strip())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#  Unit tests for client.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+from . import unittest
+from zarro_boogs_tools.client import *
+
+import os.path
+import tempfile
+
+
+class TestClient(unittest.TestCase):
+    def test_strip_connect_option(self):
+        """
+        Test if the 'strip_connect_option' function removes the '--connect'
+        option in both of its forms and keeps all other arguments.
+        """
+        self.assertEqual(
+            ['-s', 'ls', 'dev-java/ant-core'],
+            strip_connect_option(
+                ['--connect', '/run/zbt.sock', '-s', 'ls',
+                 'dev-java/ant-core']))
+        self.assertEqual(
+            ['-r', 'repo', 'ls'],
+            strip_connect_option(['-r', 'repo', '--connect=zbt.sock', 'ls']))
+
+    def test_reads_standard_input(self):
+        """
+        Test if the 'reads_standard_input' function finds out if a command
+        reads its atoms from standard input.
+        """
+        self.assertTrue(reads_standard_input(['ls', '-f', '-']))
+        self.assertTrue(reads_standard_input(['ls', '--from-file=-']))
+        self.assertTrue(reads_standard_input(['ls', '-f-', 'app-misc/foo']))
+        self.assertFalse(reads_standard_input(['ls', '-f', 'atoms.txt']))
+        self.assertFalse(reads_standard_input(['ls', '--', '-f', '-']))
+        self.assertFalse(reads_standard_input(['ls', '-f']))
+
+    def test_main_without_server(self):
+        """
+        Test if the client reports an error when no server is listening on
+        the socket.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertEqual(1, main(
+                'zbt', os.path.join(temp_dir, 'zbt.sock'), ['ls']))
+
+
+if __name__ == '__main__':
+    unittest.main()
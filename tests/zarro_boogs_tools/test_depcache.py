@@ -0,0 +1,153 @@
+#  Unit tests for depcache.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.depcache import *
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_dependency_restrictions, \
+    get_packages_to_process
+
+import os.path
+import shutil
+import tempfile
+from pathlib import Path
+
+import nattka.package
+from pkgcore.ebuild.profiles import OnDiskProfile
+
+
+class TestDepCache(unittest.TestCase):
+    cached_deps_path = 'tests/ebuild-repos/cached-deps'
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.temp_dir.name) / 'deps.json'
+        _, self.repo = nattka.package.find_repository(
+            Path(self.cached_deps_path))
+        self.profile = OnDiskProfile(
+            os.path.join(self.cached_deps_path, 'profiles'), 'default')
+        self.foo = get_best_version(
+            get_atom_obj_from_str('=app-misc/foo-1.0'), self.repo)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_get_cache_dir(self):
+        """
+        Test if the 'get_cache_dir' function respects $XDG_CACHE_HOME.
+        """
+        xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        try:
+            os.environ['XDG_CACHE_HOME'] = self.temp_dir.name
+            self.assertEqual(Path(self.temp_dir.name) / 'zbt', get_cache_dir())
+            os.environ['XDG_CACHE_HOME'] = ''
+            self.assertEqual(
+                Path(os.path.expanduser('~')) / '.cache' / 'zbt',
+                get_cache_dir())
+        finally:
+            if xdg_cache_home is None:
+                del os.environ['XDG_CACHE_HOME']
+            else:
+                os.environ['XDG_CACHE_HOME'] = xdg_cache_home
+
+    def test_dependency_cache_round_trip(self):
+        """
+        Test if a 'DependencyCache' returns the same restrictions and keywords
+        after it is saved and loaded again.
+        """
+        expected = get_dependency_restrictions(self.foo, self.profile, False)
+        dep_cache = DependencyCache(self.repo, self.cache_path)
+        self.assertEqual(expected, get_dependency_restrictions(
+            self.foo, self.profile, False, dep_cache))
+        self.assertEqual(1, dep_cache.misses)
+        self.assertTrue(dep_cache.save())
+        self.assertTrue(self.cache_path.exists())
+
+        dep_cache = DependencyCache(self.repo, self.cache_path)
+        self.assertEqual(expected, dep_cache.get_dependency_restrictions(
+            self.foo, self.profile, False))
+        self.assertEqual(1, dep_cache.hits)
+        self.assertEqual(self.foo.keywords, dep_cache.get_keywords(self.foo))
+        # Restrictions are cached separately for each profile and stability
+        self.assertIsNone(dep_cache.get_dependency_restrictions(
+            self.foo, self.profile, True))
+        self.assertIsNone(dep_cache.get_dependency_restrictions(self.foo))
+
+    def test_dependency_cache_profile(self):
+        """
+        Test if a 'DependencyCache' keeps USE-conditional dependencies dropped
+        by a profile out of the restrictions cached for that profile only.
+        """
+        dep_cache = DependencyCache(self.repo, self.cache_path)
+        with_profile = get_dependency_restrictions(
+            self.foo, self.profile, False, dep_cache)
+        without_profile = get_dependency_restrictions(
+            self.foo, None, None, dep_cache)
+        with_profile_strs = list(map(str, with_profile))
+        without_profile_strs = list(map(str, without_profile))
+        # The 'test' USE flag is masked by the profile
+        self.assertFalse('dev-util/checker' in ' '.join(with_profile_strs))
+        self.assertTrue('dev-util/checker' in ' '.join(without_profile_strs))
+        self.assertEqual(with_profile, dep_cache.get_dependency_restrictions(
+            self.foo, self.profile, False))
+        self.assertEqual(without_profile,
+                         dep_cache.get_dependency_restrictions(self.foo))
+
+    def test_dependency_cache_invalidated_by_ebuild_change(self):
+        """
+        Test if a 'DependencyCache' stops using an entry once the ebuild of
+        the package no longer matches the md5-cache.
+        """
+        repo_path = Path(self.temp_dir.name) / 'repo'
+        shutil.copytree(self.cached_deps_path, repo_path)
+        _, repo = nattka.package.find_repository(repo_path)
+        foo = get_best_version(
+            get_atom_obj_from_str('=app-misc/foo-1.0'), repo)
+        dep_cache = DependencyCache(repo, self.cache_path)
+        get_dependency_restrictions(foo, None, None, dep_cache)
+        dep_cache.save()
+
+        with open(foo.path, 'a') as ebuild:
+            ebuild.write('# Modified\n')
+        dep_cache = DependencyCache(repo, self.cache_path)
+        self.assertIsNone(dep_cache.get_dependency_restrictions(foo))
+        dep_cache.put_dependency_restrictions(foo, [])
+        self.assertIsNone(dep_cache.get_dependency_restrictions(foo))
+
+    def test_get_packages_to_process_dep_cache(self):
+        """
+        Test if the 'get_packages_to_process' function returns the same list
+        when a 'DependencyCache' is used, whether the cache is cold or warm.
+        """
+        for target_keyword in ['~riscv', 'riscv']:
+            expected = get_packages_to_process(
+                self.foo, target_keyword, self.repo, None, self.profile)
+            for _ in range(2):
+                dep_cache = DependencyCache(self.repo, self.cache_path)
+                self.assertEqual(expected, get_packages_to_process(
+                    self.foo, target_keyword, self.repo, None, self.profile,
+                    dep_cache=dep_cache))
+                dep_cache.save()
+            self.assertGreater(dep_cache.hits, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+#  Unit tests for index.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.index import *
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_keyword_matching_pkg_filter, \
+    get_packages_to_process
+
+import gc
+import os.path
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+
+import nattka.package
+import pkgcore.ebuild.atom as atom
+
+
+class TestIndex(unittest.TestCase):
+    java = None
+
+    @classmethod
+    def setUpClass(cls):
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        cls.java = java
+
+    def helper_keyword_index_agrees_with_packages(self, repo):
+        keyword_index = KeywordIndex(repo)
+        for pkg in repo:
+            for keyword in ['amd64', '~amd64', 'riscv', '~riscv', 'arm64']:
+                self.assertEqual(keyword in pkg.keywords,
+                                 keyword_index.has_keyword(pkg, keyword))
+                self.assertEqual(
+                    keyword in pkg.keywords or
+                    keyword.lstrip('~') in pkg.keywords,
+                    keyword_index.is_visible(pkg, keyword))
+
+    def test_keyword_index(self):
+        """
+        Test if a 'KeywordIndex' reports the same keywords as the packages
+        themselves.
+        """
+        self.helper_keyword_index_agrees_with_packages(self.java)
+
+    def test_keyword_index_without_md5_cache(self):
+        """
+        Test if a 'KeywordIndex' falls back to the keywords of the packages
+        when the repository does not have an md5-cache.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_path = os.path.join(temp_dir, 'repo')
+            shutil.copytree(self.java.location, repo_path, ignore=
+                            shutil.ignore_patterns('md5-cache'))
+            _, repo = nattka.package.find_repository(Path(repo_path))
+            self.helper_keyword_index_agrees_with_packages(repo)
+
+    def test_keyword_index_get_cpvs(self):
+        """
+        Test if the 'get_cpvs' method of a 'KeywordIndex' returns the CPVs of
+        all packages with a keyword after the index is built.
+        """
+        keyword_index = KeywordIndex(self.java)
+        keyword_index.build()
+        self.assertEqual(
+            frozenset(pkg.cpvstr for pkg in self.java
+                      if '~riscv' in pkg.keywords),
+            keyword_index.get_cpvs('~riscv'))
+        self.assertTrue('sys-libs/musl-1.2.2-r8' in
+                        keyword_index.get_cpvs('~riscv'))
+        self.assertEqual(frozenset(), keyword_index.get_cpvs('~nonexistent'))
+
+    def test_keyword_matching_pkg_filter_keyword_index(self):
+        """
+        Test if package filters and the 'get_packages_to_process' function
+        give the same results with a 'KeywordIndex'.
+        """
+        keyword_index = KeywordIndex(self.java)
+        for keywords in [('~riscv',), ('~riscv', 'amd64'), ('amd64',),
+                         ('arm', '~arm64')]:
+            pkg_filter = get_keyword_matching_pkg_filter(*keywords)
+            indexed_pkg_filter = get_keyword_matching_pkg_filter(
+                *keywords, keyword_index=keyword_index)
+            self.assertEqual(list(pkg_filter(iter(self.java))),
+                             list(indexed_pkg_filter(iter(self.java))))
+
+        ant_core = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), self.java)
+        for target_keyword in ['~riscv', 'amd64']:
+            self.assertEqual(
+                get_packages_to_process(
+                    ant_core, target_keyword, self.java,
+                    get_keyword_matching_pkg_filter(target_keyword)),
+                get_packages_to_process(
+                    ant_core, target_keyword, self.java,
+                    get_keyword_matching_pkg_filter(
+                        target_keyword, keyword_index=keyword_index),
+                    keyword_index=keyword_index))
+
+
+    def test_keyword_matching_pkg_filter_lifetime(self):
+        """
+        Test if the same package filter is returned for the same keywords and
+        'KeywordIndex', and the filter does not keep the index alive.
+        """
+        keyword_index = KeywordIndex(self.java)
+        pkg_filter = get_keyword_matching_pkg_filter(
+            '~riscv', keyword_index=keyword_index)
+        self.assertIs(pkg_filter, get_keyword_matching_pkg_filter(
+            '~riscv', keyword_index=keyword_index))
+        self.assertIsNot(pkg_filter, get_keyword_matching_pkg_filter(
+            '~riscv', keyword_index=KeywordIndex(self.java)))
+        self.assertIs(get_keyword_matching_pkg_filter('~riscv'),
+                      get_keyword_matching_pkg_filter('~riscv'))
+
+        reference = weakref.ref(keyword_index)
+        del keyword_index, pkg_filter
+        gc.collect()
+        self.assertIsNone(reference())
+
+    def helper_version_index_agrees_with_repo_match(self, repo):
+        version_index = VersionIndex(repo)
+        atom_strs = list()
+        for pkg in repo:
+            atom_strs.append(pkg.key)
+            for operator in ['<', '<=', '=', '>=', '>']:
+                atom_strs.append(f'{operator}{pkg.cpvstr}')
+            atom_strs.append(f'~{pkg.key}-{pkg.version}')
+            atom_strs.append(f"={pkg.key}-{pkg.version.split('.')[0]}*")
+            atom_strs.append(f'{pkg.key}:{pkg.slot}')
+            atom_strs.append(f'>={pkg.cpvstr}:{pkg.slot}/{pkg.subslot}')
+        atom_strs.append('dev-java/nonexistent')
+        for keywords in [None, ('~riscv',), ('amd64', '~arm64')]:
+            pkg_filter = None if keywords is None \
+                else get_keyword_matching_pkg_filter(*keywords)
+            keyword_mask = None if keywords is None \
+                else version_index.get_keyword_mask(
+                    pkg_filter.get_visible_keywords())
+            for atom_str in atom_strs:
+                atom_obj = atom.atom(atom_str)
+                self.assertTrue(version_index.supports(atom_obj))
+                matches = repo.match(atom_obj, pkg_filter=pkg_filter)
+                expected = nattka.package.select_best_version(matches) \
+                    if matches else None
+                found = version_index.find_matches(atom_obj)
+                self.assertEqual(
+                    expected,
+                    version_index.select_best_version(found, keyword_mask),
+                    f'{atom_str} with keywords {keywords}')
+                self.assertEqual(
+                    expected,
+                    version_index.select_best_version(
+                        found, pkg_filter=pkg_filter),
+                    f'{atom_str} with filter for keywords {keywords}')
+
+    def test_version_index(self):
+        """
+        Test if a 'VersionIndex' selects the same best versions as pkgcore's
+        'repo.match' and NATTkA's 'select_best_version' do.
+        """
+        self.helper_version_index_agrees_with_repo_match(self.java)
+
+    def test_version_index_without_md5_cache(self):
+        """
+        Test if a 'VersionIndex' falls back to the attributes of the packages
+        when the repository does not have an md5-cache.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_path = os.path.join(temp_dir, 'repo')
+            shutil.copytree(self.java.location, repo_path, ignore=
+                            shutil.ignore_patterns('md5-cache'))
+            _, repo = nattka.package.find_repository(Path(repo_path))
+            self.helper_version_index_agrees_with_repo_match(repo)
+
+    def test_version_index_unsupported_atoms(self):
+        """
+        Test if atoms a 'VersionIndex' cannot resolve are not supported.
+        """
+        for atom_str in ['dev-java/ant-core[doc]', 'dev-java/ant-core::java',
+                         '!dev-java/ant-core']:
+            self.assertFalse(VersionIndex.supports(atom.atom(atom_str)))
+
+    def test_get_version_index(self):
+        """
+        Test if the same 'VersionIndex' is returned for the same repository.
+        """
+        version_index = get_version_index(self.java)
+        self.assertIs(self.java, version_index.repo)
+        self.assertIs(version_index, get_version_index(self.java))
+        self.assertEqual(
+            [pkg.fullver for pkg in self.java.match(
+                atom.atom('dev-java/openjdk'), sorter=sorted)],
+            [pkg.fullver for pkg in version_index.get_versions(
+                'dev-java', 'openjdk').packages])
+        self.assertEqual([], version_index.get_versions(
+            'dev-java', 'nonexistent').packages)
+
+if __name__ == '__main__':
+    unittest.main()
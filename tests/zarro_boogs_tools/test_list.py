@@ -20,8 +20,11 @@
 #  <https://www.gnu.org/licenses/>.
 
 from . import unittest
+from zarro_boogs_tools.cache import LRUCache
 from zarro_boogs_tools.list import *
-from zarro_boogs_tools.package import get_atom_obj_from_str, get_best_version
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_keyword_matching_pkg_filter, \
+    get_packages_to_process
 
 import os.path
 from pathlib import Path
@@ -122,3 +125,100 @@ class TestList(unittest.TestCase):
         c3p0_pkgs = pkg_to_list_dict[c3p0]
         self.assertEqual(1, len(c3p0_pkgs))
         self.assertEqual(c3p0, c3p0_pkgs[0])
+
+    def test_generate_package_lists_shared_cache(self):
+        """
+        Test if the 'generate_package_lists' function shares the specified
+        cache between main packages with common dependencies.
+        """
+        openjdk_bin11 = get_best_version(
+            get_atom_obj_from_str('dev-java/openjdk-bin:11'), self.java)
+        openjdk_bin17 = get_best_version(
+            get_atom_obj_from_str('dev-java/openjdk-bin:17'), self.java)
+        cache = LRUCache()
+        pkg_to_list_dict = get_package_lists(
+            self.java, [openjdk_bin11, openjdk_bin17], self.profile, '~riscv',
+            cache=cache)
+        self.assertEqual(2, len(pkg_to_list_dict))
+        # Both packages depend on the same version of glibc
+        self.assertGreater(cache.hits, 0)
+
+    def test_generate_package_lists_shared_dep_graph(self):
+        """
+        Test if the 'generate_package_lists' function returns the same package
+        list for each main package as an independent search would, even though
+        the dependency graph is shared between main packages.
+        """
+        main_packages = list()
+        for atom_str in ['dev-java/ant-core', 'virtual/jdk:11',
+                         'dev-java/openjdk:11', 'dev-java/openjdk-bin:17']:
+            main_packages.append(get_best_version(
+                get_atom_obj_from_str(atom_str), self.java))
+        target_keyword = '~riscv'
+        pkg_to_list_dict = get_package_lists(
+            self.java, main_packages, self.profile, target_keyword, 'amd64')
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword, 'amd64')
+        for main_package in main_packages:
+            self.assertEqual(
+                get_packages_to_process(main_package, target_keyword,
+                                        self.java, pkg_filter, self.profile),
+                pkg_to_list_dict[main_package])
+
+    def test_iter_atom_strs(self):
+        """
+        Test if the 'iter_atom_strs' function splits lines on whitespace and
+        skips comments.
+        """
+        lines = ['dev-java/ant-core # main package\n', '\n',
+                 '  virtual/jdk:11\t=dev-java/openjdk-bin-17*\n',
+                 '# dev-java/c3p0\n']
+        self.assertEqual(
+            ['dev-java/ant-core', 'virtual/jdk:11',
+             '=dev-java/openjdk-bin-17*'],
+            list(iter_atom_strs(lines)))
+
+    def test_iter_batch_records_errors(self):
+        """
+        Test if the 'iter_batch_records' function yields an error record for
+        each atom that cannot be processed without stopping the batch.
+        """
+        records = list(iter_batch_records(
+            self.java, ['!dev-java/c3p0', 'dev-java/nonexistent', '=foo',
+                        'dev-java/c3p0'],
+            self.profile))
+        self.assertEqual(4, len(records))
+        for record, main_package, package_list in records[:3]:
+            self.assertEqual({'atom', 'error'}, set(record.keys()))
+            self.assertIsNone(main_package)
+            self.assertIsNone(package_list)
+        record, main_package, package_list = records[3]
+        self.assertEqual('dev-java/c3p0', record['atom'])
+        self.assertEqual(main_package.cpvstr, record['package'])
+        self.assertEqual([pkg.cpvstr for pkg in package_list],
+                         record['packages'])
+
+    def test_iter_batch_records_package_lists(self):
+        """
+        Test if the 'iter_batch_records' function returns the same package
+        list for each atom as an independent search would, and shares the
+        specified cache between atoms.
+        """
+        _, repo = nattka.package.find_repository(
+            Path('tests/ebuild-repos/cached-deps'))
+        profile = OnDiskProfile(os.path.join(repo.base, 'profiles'), 'default')
+        atom_strs = ['app-misc/foo', 'dev-util/checker', 'dev-libs/libbar',
+                     'app-misc/foo']
+        cache = LRUCache()
+        records = list(iter_batch_records(
+            repo, atom_strs, profile, BugCategory.KEYWORDREQ, cache=cache))
+        self.assertEqual(atom_strs,
+                         [record['atom'] for record, _, _ in records])
+        pkg_filter = get_keyword_matching_pkg_filter('~amd64')
+        for record, main_package, package_list in records:
+            self.assertEqual('~amd64', record['keyword'])
+            self.assertEqual(
+                get_packages_to_process(main_package, '~amd64', repo,
+                                        pkg_filter, profile),
+                package_list)
+        # The repeated atom is resolved from the cache
+        self.assertGreater(cache.hits, 0)
@@ -0,0 +1,119 @@
+#  Unit tests for metrics.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.metrics import *
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.list import get_package_lists
+from zarro_boogs_tools.package import get_atom_obj_from_str, get_best_version
+
+import json
+import os.path
+import tempfile
+from pathlib import Path
+
+import nattka.package
+from pkgcore.ebuild.profiles import OnDiskProfile
+
+
+class TestMetrics(unittest.TestCase):
+    package_lists = None
+    collector = None
+
+    @classmethod
+    def setUpClass(cls):
+        _, repo = nattka.package.find_repository(
+            Path('tests/ebuild-repos/cached-deps'))
+        profile = OnDiskProfile(os.path.join(repo.base, 'profiles'), 'default')
+        main_packages = [
+            get_best_version(get_atom_obj_from_str(atom_str), repo)
+            for atom_str in ['app-misc/foo', 'dev-libs/libbar']]
+        cache = LRUCache()
+        cls.collector = stats.enable()
+        try:
+            stats.add_cache('best versions', cache)
+            cls.package_lists = get_package_lists(
+                repo, main_packages, profile, '~amd64', cache=cache)
+        finally:
+            stats.disable()
+
+    def test_get_package_list_metrics(self):
+        """
+        Test if the 'get_package_list_metrics' function returns metrics for
+        each package list with the correct labels and sizes.
+        """
+        package_list_metrics = get_package_list_metrics(self.collector)
+        self.assertEqual(len(self.package_lists), len(package_list_metrics))
+        for (main_package, package_list), metrics in zip(
+                self.package_lists.items(), package_list_metrics):
+            self.assertEqual(
+                {'package': main_package.cpvstr, 'keyword': '~amd64',
+                 'arch': 'amd64', 'profile': 'default'},
+                metrics['labels'])
+            self.assertEqual(len(package_list), metrics['size'])
+            self.assertGreaterEqual(metrics['packages_visited'],
+                                    metrics['size'])
+            self.assertGreaterEqual(metrics['latency_seconds'], 0)
+            for ratio in metrics['cache_hit_ratios'].values():
+                self.assertTrue(0 <= ratio <= 1)
+
+    def test_format_prometheus_metrics(self):
+        """
+        Test if the 'format_prometheus_metrics' function writes a sample for
+        every package list under each metric's type declaration.
+        """
+        contents = format_prometheus_metrics(
+            get_package_list_metrics(self.collector))
+        lines = contents.splitlines()
+        self.assertIn('# TYPE zbt_package_list_size gauge', lines)
+        for main_package, package_list in self.package_lists.items():
+            self.assertIn(
+                f'zbt_package_list_size{{package="{main_package.cpvstr}",'
+                f'keyword="~amd64",arch="amd64",profile="default"}} '
+                f'{len(package_list)}',
+                lines)
+        self.assertEqual('a\\\\b\\"c\\nd',
+                         escape_prometheus_label_value('a\\b"c\nd'))
+
+    def test_write_metrics_file(self):
+        """
+        Test if the 'write_metrics_file' function chooses the format from
+        the file name and leaves no temporary file behind.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_path = Path(temp_dir) / 'metrics.json'
+            write_metrics_file(json_path, self.collector)
+            with open(json_path) as metrics_file:
+                self.assertEqual(
+                    json.loads(json.dumps(
+                        get_package_list_metrics(self.collector))),
+                    json.load(metrics_file)['package_lists'])
+            prom_path = Path(temp_dir) / 'zbt.prom'
+            write_metrics_file(prom_path, self.collector)
+            with open(prom_path) as metrics_file:
+                self.assertTrue(metrics_file.read().startswith('# HELP'))
+            self.assertEqual({'metrics.json', 'zbt.prom'},
+                             set(os.listdir(temp_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+#  Unit tests for monitor.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.monitor import *
+from zarro_boogs_tools.list import iter_batch_records
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_keyword_matching_pkg_filter, \
+    get_packages_to_process, iter_packages_to_process
+
+import io
+import os.path
+from pathlib import Path
+
+import nattka.package
+from nattka.bugzilla import BugCategory
+from pkgcore.ebuild.profiles import OnDiskProfile
+
+
+class TestMonitor(unittest.TestCase):
+    def setUp(self):
+        _, self.java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        self.ant_core = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), self.java)
+        self.pkg_filter = get_keyword_matching_pkg_filter('~riscv', 'amd64')
+        self.full_list = get_packages_to_process(
+            self.ant_core, '~riscv', self.java, self.pkg_filter)
+
+    def collect_until_stopped(self, monitor: ResolutionMonitor) -> list:
+        package_list = list()
+        with self.assertRaises(ResolutionBudgetExceeded) as context:
+            for pkg in iter_packages_to_process(
+                    self.ant_core, '~riscv', self.java, self.pkg_filter,
+                    monitor=monitor):
+                package_list.append(pkg)
+        self.assertEqual(self.ant_core, context.exception.main_package)
+        return package_list
+
+    def test_max_packages(self):
+        """
+        Test if a monitor with a size budget stops the search with exactly
+        as many packages as the budget allows, in the usual order.
+        """
+        self.assertGreater(len(self.full_list), 2)
+        max_packages = len(self.full_list) - 1
+        self.assertEqual(
+            self.full_list[:max_packages],
+            self.collect_until_stopped(
+                ResolutionMonitor(max_packages=max_packages)))
+        # A budget that is not exceeded does not change the package list
+        self.assertEqual(
+            self.full_list,
+            get_packages_to_process(
+                self.ant_core, '~riscv', self.java, self.pkg_filter,
+                monitor=ResolutionMonitor(
+                    max_time=3600, max_packages=len(self.full_list))))
+
+    def test_max_time(self):
+        """
+        Test if a monitor with an expired time budget stops the search with
+        a prefix of the package list.
+        """
+        monitor = ResolutionMonitor(max_time=1)
+        monitor.start_time = -3600.0
+        package_list = self.collect_until_stopped(monitor)
+        self.assertEqual(self.full_list[:len(package_list)], package_list)
+
+    def test_max_time_during_expansion(self):
+        """
+        Test if the time budget is checked while the dependencies of the
+        packages in a level of the search are being resolved, with and
+        without threads, and stops the search before the level is complete.
+        """
+        class ExpiringMonitor(ResolutionMonitor):
+            def __init__(self):
+                super().__init__(max_time=3600)
+                self.checks = 0
+
+            def check_time(self, main_package):
+                self.checks += 1
+                if self.checks > 1:
+                    raise ResolutionBudgetExceeded(
+                        "Time limit exceeded", main_package)
+
+        for jobs in [1, 2]:
+            with self.subTest(jobs=jobs):
+                monitor = ExpiringMonitor()
+                dep_graph = dict()
+                package_list = list()
+                with self.assertRaises(ResolutionBudgetExceeded):
+                    for pkg in iter_packages_to_process(
+                            self.ant_core, '~riscv', self.java,
+                            self.pkg_filter, dep_graph=dep_graph, jobs=jobs,
+                            monitor=monitor):
+                        package_list.append(pkg)
+                self.assertGreater(monitor.checks, 1)
+                self.assertEqual(
+                    self.full_list[:len(package_list)], package_list)
+                self.assertLessEqual(len(dep_graph), 1)
+
+    def test_progress_callback(self):
+        """
+        Test if a monitor reports progress to its callback with sensible
+        numbers.
+        """
+        reports = list()
+        monitor = ResolutionMonitor(
+            progress_callback=lambda *args: reports.append(args),
+            progress_interval=0)
+        get_packages_to_process(
+            self.ant_core, '~riscv', self.java, self.pkg_filter,
+            monitor=monitor)
+        self.assertGreater(len(reports), 0)
+        for main_package, queue_length, visited, listed, elapsed in reports:
+            self.assertEqual(self.ant_core, main_package)
+            self.assertGreaterEqual(visited, listed)
+            self.assertLessEqual(listed, len(self.full_list))
+            self.assertGreaterEqual(elapsed, 0)
+        self.assertEqual(len(self.full_list), reports[-1][3])
+
+    def test_progress_printer(self):
+        """
+        Test if a progress printer overwrites its status line and erases it.
+        """
+        stream = io.StringIO()
+        printer = ProgressPrinter(stream)
+        printer(self.ant_core, 10, 100, 20, 2.0)
+        printer(self.ant_core, 1, 2, 1, 1.0)
+        printer.clear()
+        lines = stream.getvalue().split('\r')
+        self.assertEqual(
+            ['', f'{self.ant_core.cpvstr}: 20 listed, 100 visited, 10 queued, '
+                 f'50.0 packages/s'],
+            lines[:2])
+        self.assertEqual(len(lines[1]), len(lines[2]))
+        self.assertEqual('', lines[-1])
+        self.assertEqual('', lines[-2].strip())
+
+    def test_batch_partial_records(self):
+        """
+        Test if the 'iter_batch_records' function yields the partial package
+        list and an error for an atom whose package list exceeds a budget.
+        """
+        profile = OnDiskProfile(
+            os.path.join(self.java.base, 'profiles'), 'base')
+        records = list(iter_batch_records(
+            self.java, ['dev-java/ant-core'], profile, BugCategory.KEYWORDREQ,
+            monitor=ResolutionMonitor(max_packages=1)))
+        self.assertEqual(1, len(records))
+        record, main_package, package_list = records[0]
+        self.assertEqual(self.ant_core, main_package)
+        self.assertEqual(1, len(package_list))
+        self.assertEqual([self.ant_core.cpvstr], record['packages'])
+        self.assertIn('error', record)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,12 +20,17 @@
 #  <https://www.gnu.org/licenses/>.
 
 from . import unittest
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.index import get_version_index
 from zarro_boogs_tools.package import *
 
 import os.path
+import warnings
 from pathlib import Path
 
 import nattka.package
+import pkgcore.restrictions.boolean as boolean
 from pkgcore.ebuild.profiles import OnDiskProfile
 
 
@@ -198,6 +203,141 @@ class TestPackage(unittest.TestCase):
             get_atom_obj_from_str('>foo-bar/baz-1.0.2'), single_pkg_multi_vers,
             lambda ps: filter(lambda p: p.version == '1.0.2', ps)))
 
+    def test_get_best_version_cache(self):
+        """
+        Test if the 'get_best_version' function reuses results stored in the
+        specified cache, including results for atoms without a match, and
+        distinguishes between package filters.
+        """
+        _, single_pkg_multi_vers = nattka.package.find_repository(
+            Path('tests/ebuild-repos/single-pkg-multi-vers'))
+        cache = LRUCache()
+        baz_atom = get_atom_obj_from_str('foo-bar/baz')
+        qux_atom = get_atom_obj_from_str('foo-bar/qux')
+        pkg_filter = get_keyword_matching_pkg_filter('~amd64')
+
+        baz = get_best_version(baz_atom, single_pkg_multi_vers, cache=cache)
+        self.assertEqual('1.0.3', baz.version)
+        self.assertIs(baz, get_best_version(
+            baz_atom, single_pkg_multi_vers, cache=cache))
+        self.assertIsNone(get_best_version(
+            qux_atom, single_pkg_multi_vers, cache=cache))
+        self.assertIsNone(get_best_version(
+            qux_atom, single_pkg_multi_vers, cache=cache))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(2, cache.misses)
+
+        get_best_version(baz_atom, single_pkg_multi_vers, pkg_filter, cache)
+        self.assertEqual(3, cache.misses)
+        get_best_version(baz_atom, single_pkg_multi_vers,
+                         get_keyword_matching_pkg_filter('~amd64'), cache)
+        self.assertEqual(3, cache.hits)
+
+    def test_get_best_version_groups(self):
+        """
+        Test if the 'get_best_version' function selects the same version for
+        any-of and all-of groups as pkgcore's 'repo.match' and NATTkA's
+        'select_best_version' do, without searching the whole repository.
+        """
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        jdk = get_atom_obj_from_str('virtual/jdk')
+        openjdk = get_atom_obj_from_str('dev-java/openjdk')
+        openjdk11 = get_atom_obj_from_str('dev-java/openjdk:11')
+        openjdk_bin = get_atom_obj_from_str('>=dev-java/openjdk-bin-11')
+        missing = get_atom_obj_from_str('dev-java/missing')
+        restrictions = [
+            boolean.OrRestriction(openjdk11, openjdk_bin),
+            boolean.OrRestriction(missing, jdk),
+            boolean.OrRestriction(boolean.AndRestriction(openjdk, openjdk11),
+                                  missing),
+            boolean.AndRestriction(openjdk, openjdk11),
+            boolean.AndRestriction(openjdk, openjdk_bin),
+            boolean.OrRestriction()
+        ]
+        collector = stats.enable()
+        try:
+            for restrict in restrictions:
+                for pkg_filter in [None,
+                                   get_keyword_matching_pkg_filter('amd64')]:
+                    matches = java.match(restrict, pkg_filter=pkg_filter)
+                    expected = nattka.package.select_best_version(matches) \
+                        if matches else None
+                    self.assertEqual(
+                        expected, get_best_version(restrict, java, pkg_filter),
+                        str(restrict))
+        finally:
+            stats.disable()
+        self.assertNotIn('full repository scans',
+                         collector.get_report()['counters'])
+
+    def test_get_best_version_full_scan(self):
+        """
+        Test if the 'get_best_version' function counts and warns about
+        restrictions that can only be matched by searching the whole
+        repository.
+        """
+        _, single_pkg_multi_vers = nattka.package.find_repository(
+            Path('tests/ebuild-repos/single-pkg-multi-vers'))
+        restrict = boolean.OrRestriction(
+            boolean.AndRestriction(), get_atom_obj_from_str('foo-bar/qux'))
+        collector = stats.enable()
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always', FullRepositoryScanWarning)
+                self.assertEqual('1.0.3', get_best_version(
+                    restrict, single_pkg_multi_vers).version)
+        finally:
+            stats.disable()
+        self.assertEqual(
+            [FullRepositoryScanWarning],
+            [warning.category for warning in caught
+             if issubclass(warning.category, FullRepositoryScanWarning)])
+        self.assertEqual(
+            1, collector.get_report()['counters']['full repository scans'])
+
+    def test_get_best_version_negative_match_cache(self):
+        """
+        Test if the 'get_best_version' function records restrictions that do
+        not match any package and does not search for them again.
+        """
+        _, single_pkg_multi_vers = nattka.package.find_repository(
+            Path('tests/ebuild-repos/single-pkg-multi-vers'))
+        version_index = get_version_index(single_pkg_multi_vers)
+        qux_atom = get_atom_obj_from_str('foo-bar/qux')
+        use_dep_atom = get_atom_obj_from_str('foo-bar/baz[nonexistent]')
+        blocker_atom = get_atom_obj_from_str('!foo-bar/qux')
+        baz_atom = get_atom_obj_from_str('foo-bar/baz')
+        pkg_filter = get_keyword_matching_pkg_filter('~nonexistent')
+
+        self.assertIsNone(get_best_version(qux_atom, single_pkg_multi_vers))
+        self.assertTrue(version_index.has_no_match(qux_atom))
+        self.assertIsNone(get_best_version(
+            use_dep_atom, single_pkg_multi_vers, pkg_filter))
+        self.assertTrue(version_index.has_no_match(use_dep_atom))
+        # Versions filtered out by a package filter still match
+        self.assertIsNone(get_best_version(
+            baz_atom, single_pkg_multi_vers, pkg_filter))
+        self.assertFalse(version_index.has_no_match(baz_atom))
+        # Restrictions the index does not support are matched by pkgcore,
+        # which applies the package filter itself
+        self.assertIsNone(get_best_version(
+            blocker_atom, single_pkg_multi_vers, pkg_filter))
+        self.assertFalse(version_index.has_no_match(blocker_atom))
+        self.assertIsNone(get_best_version(
+            blocker_atom, single_pkg_multi_vers))
+        self.assertTrue(version_index.has_no_match(blocker_atom))
+
+        collector = stats.enable()
+        try:
+            self.assertIsNone(get_best_version(
+                use_dep_atom, single_pkg_multi_vers, pkg_filter))
+        finally:
+            stats.disable()
+        report = collector.get_report()
+        self.assertEqual(1, report['counters']['negative match cache hits'])
+        self.assertNotIn('repo.match', report['timers'])
+
     def test_get_packages_to_process(self):
         """
         Run a basic test for the 'get_packages_to_process' function.
@@ -329,6 +469,78 @@ class TestPackage(unittest.TestCase):
         c3p0_pkgs_strs = [pkg.cpvstr for pkg in c3p0_pkgs]
         self.assertTrue('dev-java/c3p0-0.9.5.5-r1' in c3p0_pkgs_strs)
 
+    def test_get_packages_to_process_dep_graph(self):
+        """
+        Test if the 'get_packages_to_process' function reuses and extends the
+        dependency graph specified with the 'dep_graph' parameter.
+        """
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        ant_core = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), java)
+        jdk = get_best_version(get_atom_obj_from_str('virtual/jdk:11'), java)
+        target_keyword = '~riscv'
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword, 'amd64')
+        dep_graph = dict()
+        ant_core_pkgs = get_packages_to_process(
+            ant_core, target_keyword, java, pkg_filter, dep_graph=dep_graph)
+        # Every package in the result has its dependencies resolved
+        self.assertEqual(set(ant_core_pkgs), set(dep_graph.keys()))
+        self.assertTrue(jdk in dep_graph[ant_core])
+
+        # The dependencies of virtual/jdk should not be resolved again
+        dep_graph[jdk] = []
+        jdk_pkgs = get_packages_to_process(
+            jdk, target_keyword, java, pkg_filter, dep_graph=dep_graph)
+        self.assertEqual([jdk], jdk_pkgs)
+
+    def test_get_packages_to_process_jobs(self):
+        """
+        Test if the 'get_packages_to_process' function returns the same list
+        when dependencies are resolved by multiple threads.
+        """
+        java_path = 'tests/ebuild-repos/java'
+        _, java = nattka.package.find_repository(Path(java_path))
+        profile = OnDiskProfile(os.path.join(java_path, 'profiles'), 'base')
+        for atom_str in ['dev-java/ant-core', 'dev-java/openjdk:11',
+                         'dev-java/openjdk:17', 'virtual/jre:1.8']:
+            main_package = get_best_version(
+                get_atom_obj_from_str(atom_str), java)
+            for target_keyword in ['~riscv', 'amd64']:
+                pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
+                for pkg_profile in [None, profile]:
+                    expected = get_packages_to_process(
+                        main_package, target_keyword, java, pkg_filter,
+                        pkg_profile)
+                    actual = get_packages_to_process(
+                        main_package, target_keyword, java, pkg_filter,
+                        pkg_profile, jobs=4)
+                    self.assertEqual(expected, actual)
+
+    def test_iter_packages_to_process(self):
+        """
+        Test if the 'iter_packages_to_process' function yields the main
+        package before resolving any dependencies, and if it yields the same
+        packages as the 'get_packages_to_process' function.
+        """
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        ant_core = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), java)
+        target_keyword = '~riscv'
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
+        dep_graph = dict()
+        pkgs = iter_packages_to_process(
+            ant_core, target_keyword, java, pkg_filter, dep_graph=dep_graph)
+        self.assertEqual(ant_core, next(pkgs))
+        self.assertEqual(0, len(dep_graph))
+        pkgs.close()
+        self.assertEqual(
+            get_packages_to_process(
+                ant_core, target_keyword, java, pkg_filter),
+            list(iter_packages_to_process(
+                ant_core, target_keyword, java, pkg_filter, jobs=4)))
+
     def test_get_keyword_matching_pkg_filter(self):
         """
         Test if the filter returned by the 'get_keyword_matching_pkg_filter'
@@ -372,6 +584,32 @@ class TestPackage(unittest.TestCase):
         self.assertEqual('2.33-r13', get_best_version(
             glibc_atom, java, pkg_filter_amd64).PVR)
 
+    def test_get_packages_to_process_cache(self):
+        """
+        Test if the 'get_packages_to_process' function returns the same result
+        with a cache, and if the cache is hit when it is shared between calls.
+        """
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        ant_core = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), java)
+        target_keyword = '~riscv'
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword, 'amd64')
+        expected = get_packages_to_process(
+            ant_core, target_keyword, java, pkg_filter)
+
+        cache = LRUCache()
+        actual = get_packages_to_process(
+            ant_core, target_keyword, java, pkg_filter, cache=cache)
+        self.assertEqual(expected, actual)
+        self.assertEqual(0, cache.hits)
+        misses = cache.misses
+        actual = get_packages_to_process(
+            ant_core, target_keyword, java, pkg_filter, cache=cache)
+        self.assertEqual(expected, actual)
+        self.assertEqual(misses, cache.misses)
+        self.assertEqual(misses, cache.hits)
+
     def test_get_keyword_matching_pkg_filter_unstable_older_than_stable(self):
         """
         Test if the filter returned by the 'get_keyword_matching_pkg_filter'
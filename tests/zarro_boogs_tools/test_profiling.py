@@ -0,0 +1,114 @@
+#  Unit tests for profiling.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools import profiling
+from zarro_boogs_tools.profiling import *
+
+import json
+import pstats
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def get_caller_name() -> str:
+    return sys._getframe(1).f_code.co_name
+
+
+def busy_wait(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_annotated_call_not_recording(self):
+        """
+        Test if the 'annotated_call' function calls the function directly
+        when no profile is being recorded.
+        """
+        self.assertEqual(
+            'annotated_call',
+            annotated_call('expand', 'foo', get_caller_name))
+
+    def test_record_profile_pstats(self):
+        """
+        Test if a pstats profile contains a frame named after the subject of
+        an annotated call.
+        """
+        path = Path(self.temp_dir.name) / 'profile.pstats'
+        with record_profile(path):
+            self.assertEqual(
+                'expand dev-libs/foo-1.0',
+                annotated_call('expand', 'dev-libs/foo-1.0', get_caller_name))
+        function_names = set(
+            key[2] for key in pstats.Stats(str(path)).stats.keys())
+        self.assertIn('expand dev-libs/foo-1.0', function_names)
+        # Calls are no longer annotated after the profile is recorded
+        self.assertEqual(
+            'annotated_call',
+            annotated_call('expand', 'foo', get_caller_name))
+
+    def test_record_profile_speedscope(self):
+        """
+        Test if a speedscope profile contains samples under a frame named
+        after the subject of an annotated call.
+        """
+        path = Path(self.temp_dir.name) / 'profile.json'
+        with record_profile(path):
+            annotated_call('resolve', 'dev-libs/bar', busy_wait, 0.1)
+        with open(path) as profile_file:
+            data = json.load(profile_file)
+        frame_names = [frame['name'] for frame in data['shared']['frames']]
+        frame_index = frame_names.index('resolve dev-libs/bar')
+        self.assertTrue(any(frame_index in sample
+                            for profile in data['profiles']
+                            for sample in profile['samples']))
+        for profile in data['profiles']:
+            self.assertEqual('sampled', profile['type'])
+            self.assertEqual(len(profile['samples']),
+                             len(profile['weights']))
+
+    def test_trampolines_discarded(self):
+        """
+        Test if the functions made for annotated calls are discarded when a
+        profile has been recorded in either format.
+        """
+        for name in ['profile.pstats', 'profile.json']:
+            with self.subTest(name=name):
+                with record_profile(Path(self.temp_dir.name) / name):
+                    for i in range(100):
+                        annotated_call('expand', f'dev-libs/foo-{i}', len, ())
+                    self.assertEqual(100, len(profiling._trampolines))
+                self.assertEqual(0, len(profiling._trampolines))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+#  Unit tests for rdeps.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.rdeps import *
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_direct_dependencies, \
+    get_keyword_matching_pkg_filter, get_packages_to_process
+
+import os.path
+import shutil
+import tempfile
+from pathlib import Path
+
+import nattka.package
+from pkgcore.ebuild.profiles import OnDiskProfile
+
+
+class TestRdeps(unittest.TestCase):
+    cached_deps_path = 'tests/ebuild-repos/cached-deps'
+    java = None
+    cached_deps = None
+
+    @classmethod
+    def setUpClass(cls):
+        _, java = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        cls.java = java
+        _, cached_deps = nattka.package.find_repository(
+            Path(cls.cached_deps_path))
+        cls.cached_deps = cached_deps
+
+    def helper_rdeps_agree_with_direct_deps(
+            self, repo, target_keyword, profile=None):
+        stable = not target_keyword.startswith('~')
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
+        rdep_index = ReverseDependencyIndex(repo, profile, stable)
+        expected = dict()
+        for rdep in repo:
+            if target_keyword in rdep.keywords or \
+                    target_keyword.lstrip('~') in rdep.keywords:
+                continue
+            for dep in get_direct_dependencies(
+                    rdep, repo, pkg_filter, profile, stable):
+                expected.setdefault(dep, set()).add(rdep)
+        for pkg in repo:
+            self.assertEqual(
+                sorted(expected.get(pkg, ())),
+                get_direct_reverse_dependencies(
+                    pkg, target_keyword, repo, rdep_index, pkg_filter))
+
+    def helper_rdeps_agree_with_package_lists(
+            self, repo, target_keyword, profile=None):
+        stable = not target_keyword.startswith('~')
+        pkg_filter = get_keyword_matching_pkg_filter(target_keyword)
+        rdep_index = ReverseDependencyIndex(repo, profile, stable)
+        expected = dict()
+        for rdep in repo:
+            for pkg in get_packages_to_process(
+                    rdep, target_keyword, repo, pkg_filter, profile):
+                if pkg != rdep:
+                    expected.setdefault(pkg, set()).add(rdep)
+        for pkg in repo:
+            if target_keyword in pkg.keywords or \
+                    target_keyword.lstrip('~') in pkg.keywords:
+                # Such a package is never in any package list
+                continue
+            self.assertEqual(
+                sorted(expected.get(pkg, ())),
+                get_reverse_dependencies(
+                    pkg, target_keyword, repo, rdep_index, pkg_filter))
+
+    def test_direct_reverse_dependencies(self):
+        """
+        Test if the 'get_direct_reverse_dependencies' function finds exactly
+        the packages whose direct dependencies include a package.
+        """
+        for target_keyword in ['~riscv', 'amd64']:
+            self.helper_rdeps_agree_with_direct_deps(
+                self.java, target_keyword)
+
+    def test_reverse_dependencies(self):
+        """
+        Test if the 'get_reverse_dependencies' function finds exactly the
+        packages whose package lists include a package, including packages
+        that only depend on it indirectly.
+        """
+        for target_keyword in ['~riscv', 'amd64']:
+            self.helper_rdeps_agree_with_package_lists(
+                self.java, target_keyword)
+
+        _, etr = nattka.package.find_repository(
+            Path('tests/ebuild-repos/etr-simplified'))
+        self.helper_rdeps_agree_with_package_lists(etr, '~s390')
+        libogg = get_best_version(
+            get_atom_obj_from_str('media-libs/libogg'), etr)
+        rdep_index = ReverseDependencyIndex(etr)
+        pkg_filter = get_keyword_matching_pkg_filter('~s390')
+        self.assertNotIn(
+            'games-action/extreme-tuxracer-0.8.1_p1',
+            [pkg.cpvstr for pkg in get_direct_reverse_dependencies(
+                libogg, '~s390', etr, rdep_index, pkg_filter)])
+        self.assertIn(
+            'games-action/extreme-tuxracer-0.8.1_p1',
+            [pkg.cpvstr for pkg in get_reverse_dependencies(
+                libogg, '~s390', etr, rdep_index, pkg_filter)])
+
+    def test_reverse_dependencies_profile(self):
+        """
+        Test if the 'get_reverse_dependencies' function does not follow
+        USE-conditional dependencies that are disabled by a profile.
+        """
+        profile = OnDiskProfile(
+            os.path.join(self.cached_deps_path, 'profiles'), 'default')
+        for target_keyword in ['~amd64', 'amd64', '~riscv']:
+            self.helper_rdeps_agree_with_direct_deps(
+                self.cached_deps, target_keyword, profile)
+            self.helper_rdeps_agree_with_package_lists(
+                self.cached_deps, target_keyword, profile)
+
+        checker = get_best_version(
+            get_atom_obj_from_str('dev-util/checker'), self.cached_deps)
+        pkg_filter = get_keyword_matching_pkg_filter('~riscv')
+        self.assertEqual(
+            [], get_reverse_dependencies(
+                checker, '~riscv', self.cached_deps,
+                ReverseDependencyIndex(self.cached_deps, profile, False),
+                pkg_filter))
+        self.assertEqual(
+            ['app-misc/foo-1.0'],
+            [pkg.cpvstr for pkg in get_reverse_dependencies(
+                checker, '~riscv', self.cached_deps,
+                ReverseDependencyIndex(self.cached_deps), pkg_filter)])
+
+    def test_reverse_dependency_index_persistence(self):
+        """
+        Test if a 'ReverseDependencyIndex' is loaded from its file instead of
+        being built again, and is built again once the repository changes.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            repo_path = Path(temp_dir) / 'repo'
+            shutil.copytree(self.cached_deps_path, repo_path)
+            _, repo = nattka.package.find_repository(repo_path)
+            profile = OnDiskProfile(
+                os.path.join(repo_path, 'profiles'), 'default')
+            index_path = Path(temp_dir) / 'rdeps.json'
+            checker = get_best_version(
+                get_atom_obj_from_str('dev-util/checker'), repo)
+            expected = ReverseDependencyIndex(repo) \
+                .get_dependency_restrictions(checker)
+            self.assertTrue(expected)
+
+            rdep_index = ReverseDependencyIndex(repo, path=index_path)
+            self.assertEqual(
+                expected, rdep_index.get_dependency_restrictions(checker))
+            self.assertTrue(rdep_index.save())
+            self.assertTrue(index_path.exists())
+
+            rdep_index = ReverseDependencyIndex(repo, path=index_path)
+            rdep_index.build = None
+            self.assertEqual(
+                expected, rdep_index.get_dependency_restrictions(checker))
+            # An index for another profile is not loaded from the file
+            rdep_index = ReverseDependencyIndex(
+                repo, profile, False, path=index_path)
+            self.assertEqual(
+                [], rdep_index.get_dependency_restrictions(checker))
+            self.assertTrue(rdep_index.save())
+
+            with open(checker.path, 'a') as ebuild:
+                ebuild.write('# Modified\n')
+            os.utime(checker.path, ns=(0, 0))
+            rdep_index = ReverseDependencyIndex(
+                repo, profile, False, path=index_path)
+            built = list()
+            build = rdep_index.build
+            rdep_index.build = lambda: built.append(build())
+            rdep_index.get_dependency_restrictions(checker)
+            self.assertEqual(1, len(built))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#  Unit tests for resolver.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.resolver import *
+from zarro_boogs_tools.list import get_package_lists
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_keyword_matching_pkg_filter, \
+    get_packages_to_process
+
+from pathlib import Path
+
+from pkgcore.ebuild.errors import MalformedAtom
+
+
+class TestResolver(unittest.TestCase):
+    cached_deps_path = 'tests/ebuild-repos/cached-deps'
+    resolver = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.resolver = Resolver.open(
+            Path(cls.cached_deps_path), 'default', use_dep_cache=False)
+
+    def test_open_unknown_profile(self):
+        """
+        Test if the 'Resolver.open' method rejects a profile that is not
+        listed in the repository.
+        """
+        with self.assertRaises(ValueError):
+            Resolver.open(Path(self.cached_deps_path), 'nonexistent',
+                          use_dep_cache=False)
+
+    def test_get_package(self):
+        """
+        Test if the 'get_package' method accepts atoms as strings and objects
+        and rejects atoms that cannot be used for keywording.
+        """
+        foo = self.resolver.get_package('app-misc/foo')
+        self.assertEqual('app-misc/foo-1.0', foo.cpvstr)
+        self.assertIs(foo, self.resolver.get_package(foo))
+        self.assertEqual(foo, self.resolver.get_package(
+            get_atom_obj_from_str('app-misc/foo-1.0')))
+        with self.assertRaises(MalformedAtom):
+            self.resolver.get_package('=foo')
+        with self.assertRaises(ValueError):
+            self.resolver.get_package('!app-misc/foo')
+        with self.assertRaises(ValueError):
+            self.resolver.get_package('app-misc/nonexistent')
+
+    def test_closure(self):
+        """
+        Test if the 'closure' method returns the same package list as the
+        'get_packages_to_process' function, whether the keyword is specified
+        or inferred.
+        """
+        repo = self.resolver.repo
+        profile = self.resolver.profile
+        foo = self.resolver.get_package('app-misc/foo')
+        for keyword in ['~amd64', 'amd64']:
+            self.assertEqual(
+                get_packages_to_process(
+                    foo, keyword, repo,
+                    get_keyword_matching_pkg_filter(keyword), profile),
+                self.resolver.closure('app-misc/foo', keyword))
+        inferred_keyword = self.resolver.get_target_keyword([foo])
+        self.assertEqual(
+            self.resolver.closure(foo, inferred_keyword),
+            self.resolver.closure(foo))
+
+    def test_lists(self):
+        """
+        Test if the 'lists' method returns the same package lists as the
+        'get_package_lists' function, and reuses its caches between calls.
+        """
+        resolver = Resolver.open(
+            Path(self.cached_deps_path), 'default', use_dep_cache=False)
+        atom_strs = ['app-misc/foo', 'dev-util/checker']
+        main_packages = list(map(resolver.get_package, atom_strs))
+        expected = get_package_lists(
+            resolver.repo, main_packages, resolver.profile, '~amd64')
+        self.assertEqual(expected, resolver.lists(atom_strs, '~amd64'))
+        hits = resolver.cache.hits
+        self.assertEqual(expected, resolver.lists(atom_strs, '~amd64'))
+        self.assertGreater(resolver.cache.hits, hits)
+
+    def test_is_stabilizing(self):
+        """
+        Test if the 'is_stabilizing' method agrees with the keyword inferred
+        by the 'get_target_keyword' method.
+        """
+        for atom_str in ['app-misc/foo', 'dev-libs/libbar',
+                         'dev-libs/openssl']:
+            self.assertEqual(
+                not self.resolver.get_target_keyword([atom_str])
+                .startswith('~'),
+                self.resolver.is_stabilizing([atom_str]))
+        self.assertFalse(self.resolver.is_stabilizing(
+            ['app-misc/foo'], ['amd64', 'nonexistent']))
+
+
+if __name__ == '__main__':
+    unittest.main()
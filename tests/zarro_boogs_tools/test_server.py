@@ -0,0 +1,150 @@
+#  Unit tests for server.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+
+from . import unittest
+from zarro_boogs_tools.client import send_request
+from zarro_boogs_tools.server import *
+
+import os.path
+import shutil
+import tempfile
+import threading
+from typing import Optional
+
+
+class TestServer(unittest.TestCase):
+    cached_deps_path = 'tests/ebuild-repos/cached-deps'
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(
+            self.temp_dir.name, 'cache')
+        self.socket_path = os.path.join(self.temp_dir.name, 'zbt.sock')
+        self.server = Server('zbt', self.socket_path)
+
+    def tearDown(self):
+        self.server.server_close()
+        if self.xdg_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.xdg_cache_home
+        self.temp_dir.cleanup()
+
+    def send(self, *args: str, stdin: Optional[str] = None) -> dict:
+        # The server handles the request in the main thread, as it would when
+        # it is run by the 'serve' subcommand, since pkgcore's ebuild
+        # processor can only be used from the main thread
+        responses = list()
+        client_thread = threading.Thread(target=lambda: responses.append(
+            send_request(self.socket_path, 'zbt', list(args), os.getcwd(),
+                         stdin)))
+        client_thread.start()
+        self.server.handle_request()
+        client_thread.join()
+        return responses[0]
+
+    def test_server_output(self):
+        """
+        Test if the server returns the output and exit status of commands,
+        including argument errors, and keeps repositories loaded between
+        commands.
+        """
+        args = ['-r', self.cached_deps_path, '-s', 'ls', '-p', 'default',
+                'app-misc/foo']
+        response = self.send(*args)
+        self.assertEqual(
+            {'stdout': '=app-misc/foo-1.0 ~amd64\n', 'stderr': '',
+             'status': 0},
+            response)
+        self.assertEqual(response, self.send(*args))
+        self.assertEqual(1, len(self.server.session._states))
+
+        response = self.send('-r', self.cached_deps_path, 'ls', '-p',
+                             'default', 'app-misc/nonexistent')
+        self.assertEqual(3, response['status'])
+        self.assertEqual('', response['stdout'])
+        self.assertIn('Could not find a matching package', response['stderr'])
+
+        response = self.send('ls', '--nonexistent-option')
+        self.assertEqual(2, response['status'])
+        self.assertTrue(response['stderr'].startswith('usage: zbt'))
+
+        response = self.send('serve', self.socket_path)
+        self.assertEqual(1, response['status'])
+
+    def test_server_progress(self):
+        """
+        Test if the status line printed with '--progress' is returned to the
+        client of every request, not only the first one.
+        """
+        args = ['-r', self.cached_deps_path, '-s', 'ls', '-p', 'default',
+                '--progress', 'app-misc/foo']
+        for _ in range(2):
+            response = self.send(*args)
+            self.assertEqual(0, response['status'])
+            self.assertIn('app-misc/foo-1.0: 1 listed', response['stderr'])
+
+    def test_server_stdin(self):
+        """
+        Test if a command that reads standard input reads the contents sent
+        by the client instead of the server's standard input.
+        """
+        args = ['-r', self.cached_deps_path, '-s', 'ls', '-p', 'default',
+                '-f', '-']
+        response = self.send(*args, stdin='app-misc/foo\n')
+        self.assertEqual(0, response['status'])
+        self.assertEqual(
+            '{"atom": "app-misc/foo", "package": "app-misc/foo-1.0", '
+            '"keyword": "amd64", "packages": ["app-misc/foo-1.0"]}\n',
+            response['stdout'])
+
+        response = self.send(*args)
+        self.assertEqual(0, response['status'])
+        self.assertEqual('', response['stdout'])
+
+    def test_server_repo_change(self):
+        """
+        Test if the server picks up a change to an ebuild in a repository
+        after the repository is synchronized.
+        """
+        repo_path = os.path.join(self.temp_dir.name, 'repo')
+        shutil.copytree(self.cached_deps_path, repo_path)
+        args = ['-r', repo_path, '-k', 'ls', '-p', 'default',
+                'app-misc/foo-9999']
+        self.assertEqual('=app-misc/foo-9999 **\n', self.send(*args)['stdout'])
+
+        ebuild_path = os.path.join(
+            repo_path, 'dev-libs', 'libbar', 'libbar-3.ebuild')
+        with open(ebuild_path) as ebuild:
+            contents = ebuild.read()
+        with open(ebuild_path, 'w') as ebuild:
+            ebuild.write(contents.replace('KEYWORDS="~amd64"', 'KEYWORDS=""'))
+        with open(os.path.join(repo_path, 'metadata', 'timestamp.chk'),
+                  'w') as timestamp:
+            timestamp.write('Mon, 17 Oct 2022 00:00:00 +0000\n')
+        self.assertEqual('=app-misc/foo-9999 **\n=dev-libs/libbar-3 **\n',
+                         self.send(*args)['stdout'])
+
+
+if __name__ == '__main__':
+    unittest.main()
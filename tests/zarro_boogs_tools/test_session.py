@@ -0,0 +1,167 @@
+#  Unit tests for session.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools.session import *
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_dependency_best_version, \
+    get_keyword_matching_pkg_filter, get_packages_to_process
+from zarro_boogs_tools.pkgcore.repository import get_file_md5
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+class TestSession(unittest.TestCase):
+    cached_deps_path = 'tests/ebuild-repos/cached-deps'
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.xdg_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(
+            self.temp_dir.name, 'cache')
+        self.repo_path = Path(self.temp_dir.name) / 'repo'
+        shutil.copytree(self.cached_deps_path, self.repo_path)
+        self.session = Session(check_for_changes=True)
+
+    def tearDown(self):
+        if self.xdg_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.xdg_cache_home
+        self.temp_dir.cleanup()
+
+    def get_state(self) -> RepositoryState:
+        return self.session.get_repository_state(
+            self.repo_path, needs_domain=False)
+
+    def get_best_versions(self, state: RepositoryState) -> dict[str, str]:
+        pkg_filter = get_keyword_matching_pkg_filter(
+            'amd64', keyword_index=state.keyword_index)
+        result = dict()
+        for atom_str in ['dev-libs/libbar', 'app-misc/foo']:
+            pkg = get_dependency_best_version(
+                get_atom_obj_from_str(atom_str), state.repo, pkg_filter,
+                state.cache)
+            result[atom_str] = pkg.cpvstr if pkg is not None else None
+        return result
+
+    def touch_timestamp(self) -> None:
+        with open(self.repo_path / 'metadata' / 'timestamp.chk',
+                  'w') as timestamp:
+            timestamp.write('Mon, 17 Oct 2022 00:00:00 +0000\n')
+
+    def test_unchanged_repository(self):
+        """
+        Test if the state of a repository is reused while the repository
+        does not change, without checking the packages' files.
+        """
+        state = self.get_state()
+        self.assertIs(state, self.get_state())
+        fingerprints = state.package_fingerprints
+        # A modification that does not change the stamp is not noticed
+        ebuild_path = self.repo_path / 'dev-libs' / 'libbar' / \
+            'libbar-3.ebuild'
+        with open(ebuild_path, 'a') as ebuild:
+            ebuild.write('# Modified\n')
+        self.assertIs(state, self.get_state())
+        self.assertIs(fingerprints, state.package_fingerprints)
+
+    def test_changed_package(self):
+        """
+        Test if only the packages whose files have changed are discarded from
+        the state of a repository after it is synchronized.
+        """
+        state = self.get_state()
+        self.assertEqual(
+            {'dev-libs/libbar': 'dev-libs/libbar-2',
+             'app-misc/foo': 'app-misc/foo-1.0'},
+            self.get_best_versions(state))
+        cached = len(state.cache)
+
+        ebuild_path = self.repo_path / 'dev-libs' / 'libbar' / \
+            'libbar-3.ebuild'
+        contents = ebuild_path.read_text()
+        ebuild_path.write_text(
+            contents.replace('KEYWORDS="~amd64"', 'KEYWORDS="amd64"'))
+        self.touch_timestamp()
+        self.assertIs(state, self.get_state())
+        self.assertEqual(cached - 1, len(state.cache))
+        self.assertEqual(
+            {'dev-libs/libbar': 'dev-libs/libbar-3',
+             'app-misc/foo': 'app-misc/foo-1.0'},
+            self.get_best_versions(state))
+
+        # A removed package is not found anymore
+        shutil.rmtree(self.repo_path / 'dev-libs' / 'libbar')
+        self.touch_timestamp()
+        self.assertIs(state, self.get_state())
+        self.assertIsNone(self.get_best_versions(state)['dev-libs/libbar'])
+
+    def test_changed_package_dep_cache(self):
+        """
+        Test if the persistent dependency cache does not return the old
+        dependencies of a package whose files have changed.
+        """
+        def get_package_list() -> list[str]:
+            foo = get_best_version(
+                get_atom_obj_from_str('app-misc/foo'), state.repo)
+            # The order of dependencies of the same package is unspecified
+            return sorted(pkg.cpvstr for pkg in get_packages_to_process(
+                foo, 'amd64', state.repo, dep_cache=state.dep_cache))
+
+        state = self.get_state()
+        self.assertEqual(
+            ['app-misc/foo-1.0', 'dev-libs/libbar-3', 'dev-util/checker-1'],
+            get_package_list())
+
+        ebuild_path = self.repo_path / 'app-misc' / 'foo' / 'foo-1.0.ebuild'
+        ebuild_path.write_text(ebuild_path.read_text().replace(
+            'DEPEND="dev-libs/libbar"\n', ''))
+        md5_cache_path = self.repo_path / 'metadata' / 'md5-cache' / \
+            'app-misc' / 'foo-1.0'
+        md5_cache_entry = ''.join(
+            f'_md5_={get_file_md5(str(ebuild_path))}\n'
+            if line.startswith('_md5_=') else line
+            for line in md5_cache_path.read_text().splitlines(True)
+            if not line.startswith('DEPEND='))
+        md5_cache_path.write_text(md5_cache_entry)
+        self.touch_timestamp()
+        self.assertIs(state, self.get_state())
+        self.assertEqual(
+            ['app-misc/foo-1.0', 'dev-util/checker-1'], get_package_list())
+
+    def test_changed_eclass(self):
+        """
+        Test if the state of a repository is loaded again after an eclass
+        changes.
+        """
+        state = self.get_state()
+        eclass_dir = self.repo_path / 'eclass'
+        eclass_dir.mkdir(exist_ok=True)
+        (eclass_dir / 'new.eclass').write_text('# New eclass\n')
+        self.assertIsNot(state, self.get_state())
+
+
+if __name__ == '__main__':
+    unittest.main()
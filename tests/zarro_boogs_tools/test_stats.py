@@ -0,0 +1,136 @@
+#  Unit tests for stats.py
+#
+#  Copyright (C) 2022 Yuan Liao
+#  Copyright (C) 2022 zarro-boogs-tools Contributors
+#
+#  This file is part of zarro-boogs-tools.
+#
+#  zarro-boogs-tools is free software: you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License as
+#  published by the Free Software Foundation, either version 3 of the
+#  License, or (at your option) any later version.
+#
+#  zarro-boogs-tools is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with zarro-boogs-tools.  If not, see
+#  <https://www.gnu.org/licenses/>.
+
+from . import unittest
+from zarro_boogs_tools import stats
+from zarro_boogs_tools.cache import LRUCache
+from zarro_boogs_tools.package import \
+    get_atom_obj_from_str, get_best_version, get_keyword_matching_pkg_filter, \
+    get_packages_to_process
+
+import json
+from pathlib import Path
+
+import nattka.package
+
+
+class TestStats(unittest.TestCase):
+
+    def tearDown(self):
+        stats.disable()
+
+    def test_disabled(self):
+        """
+        Test if instrumentation points do not record anything while
+        statistics are not being collected.
+        """
+        self.assertIsNone(stats.get_collector())
+        with stats.measure('work', {'label': 'value'}):
+            with stats.phase('phase'):
+                with stats.timer('timer'):
+                    stats.increment('counter')
+        stats.add_cache('cache', LRUCache())
+        collector = stats.enable()
+        self.assertIs(collector, stats.get_collector())
+        report = collector.get_report()
+        for key in ['phases', 'timers', 'counters', 'caches']:
+            self.assertEqual({}, report[key])
+        self.assertEqual([], collector.measurements)
+
+    def test_enabled(self):
+        """
+        Test if instrumentation points record statistics while statistics are
+        being collected, and if the report can be serialized into JSON.
+        """
+        cache = LRUCache()
+        cache.get('missed before collection')
+        collector = stats.enable()
+        stats.add_cache('cache', cache)
+        for _ in range(2):
+            with stats.phase('phase'):
+                with stats.timer('timer'):
+                    stats.increment('counter', 3)
+        cache.put('key', 'value')
+        cache.get('key')
+        cache.get('missed')
+        stats.disable()
+        stats.increment('counter')
+
+        report = collector.get_report()
+        self.assertEqual(2, report['phases']['phase']['calls'])
+        self.assertGreaterEqual(report['phases']['phase']['wall_time'],
+                                report['timers']['timer']['time'])
+        self.assertEqual(2, report['timers']['timer']['calls'])
+        self.assertEqual({'counter': 6}, report['counters'])
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': 0.5},
+                         report['caches']['cache'])
+        self.assertEqual(report, json.loads(json.dumps(report)))
+        self.assertIn('counter', stats.format_report(report))
+
+    def test_measure(self):
+        """
+        Test if a measurement only includes the statistics collected while
+        the unit of work was being done.
+        """
+        cache = LRUCache()
+        collector = stats.enable()
+        stats.add_cache('cache', cache)
+        stats.increment('counter')
+        cache.get('missed before measurement')
+        with stats.measure('work', {'label': 'value'}):
+            with stats.timer('timer'):
+                stats.increment('counter', 2)
+                cache.get('missed')
+        self.assertEqual(1, len(collector.measurements))
+        measurement = collector.measurements[0]
+        self.assertEqual('work', measurement['name'])
+        self.assertEqual({'label': 'value'}, measurement['labels'])
+        self.assertEqual({'timer': 1}, measurement['timer_calls'])
+        self.assertEqual({'counter': 2}, measurement['counters'])
+        self.assertEqual({'cache': [0, 1]}, measurement['caches'])
+        self.assertGreaterEqual(measurement['wall_time'], 0)
+
+    def test_packages_to_process_instrumentation(self):
+        """
+        Test if the 'get_packages_to_process' function reports the packages it
+        visits and the repository searches it does.
+        """
+        _, repo = nattka.package.find_repository(
+            Path('tests/ebuild-repos/java'))
+        main_package = get_best_version(
+            get_atom_obj_from_str('dev-java/ant-core'), repo)
+        collector = stats.enable()
+        package_list = get_packages_to_process(
+            main_package, '~riscv', repo,
+            get_keyword_matching_pkg_filter('~riscv', 'amd64'))
+        report = collector.get_report()
+        self.assertGreaterEqual(report['counters']['packages visited'],
+                                len(package_list))
+        self.assertEqual(len(package_list),
+                         report['counters']['packages expanded'])
+        self.assertGreater(
+            report['timers']['version index lookup']['calls'], 0)
+        self.assertGreater(
+            report['timers']['dependency metadata parsing']['calls'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()